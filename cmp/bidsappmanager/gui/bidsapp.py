@@ -1233,13 +1233,17 @@ class BIDSAppInterfaceWindow(HasTraits):
             carbonfootprint_msg = create_carbon_footprint_message(
                 bids_dir=self.bids_root,
                 emissions_csv_file=str(Path(self.bids_root) / 'code' / 'emissions.csv'),
-                nb_of_subjects_processed=len(self.list_of_subjects_to_be_processed)
+                nb_of_subjects_processed=len(self.list_of_subjects_to_be_processed),
+                cmp_derivatives_dir=os.path.join(self.output_dir, __cmp_directory__),
+                participant_labels=self.list_of_subjects_to_be_processed
             )
             print(carbonfootprint_msg)
             # Display the carbon footprint report in a Dialog Window
             self.carbon_emission_msg = create_html_carbon_footprint_report(
                 emissions_csv_file=str(Path(self.bids_root) / "code" / "emissions.csv"),
-                nb_of_subjects_processed=len(self.list_of_subjects_to_be_processed)
+                nb_of_subjects_processed=len(self.list_of_subjects_to_be_processed),
+                cmp_derivatives_dir=os.path.join(self.output_dir, __cmp_directory__),
+                participant_labels=self.list_of_subjects_to_be_processed
             )
             self.configure_traits(view='carbon_footprint_view')
 
@@ -14,7 +14,6 @@ from traits.api import *
 from traitsui.qt4.extra.qt_view import QtView
 from pyface.api import ImageResource
 
-from bids import BIDSLayout
 
 # Own imports
 from cmtklib.bids.io import __cmp_directory__, __nipype_directory__
@@ -298,7 +297,6 @@ class DiffusionPipelineUI(DiffusionPipeline):
         subjid = self.subject.split("-")[1]
 
         try:
-            layout = BIDSLayout(self.base_directory)
             print("Valid BIDS dataset with %s subjects" % len(layout.get_subjects()))
             for subj in layout.get_subjects():
                 self.global_conf.subjects.append("sub-" + str(subj))
@@ -47,6 +47,14 @@ class ConnectomeConfigUI(ConnectomeConfig):
             ),
         ),
         Item("output_types", style="custom"),
+        VGroup(
+            Item("dynamic_fc", label="Dynamic (sliding-window) connectivity"),
+            HGroup(
+                Item("window_length", label="Window length (volumes)"),
+                Item("window_step", label="Step (volumes)"),
+                visible_when="dynamic_fc",
+            ),
+        ),
     )
 
 
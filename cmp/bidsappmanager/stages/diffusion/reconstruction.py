@@ -68,9 +68,19 @@ class Dipy_recon_configUI(DipyReconConfig):
                 "shore_positive_constraint",
                 label="Constrain the propagator to be positive.",
             ),
+            Item(
+                "shore_memmap",
+                label="Memory-map the ODF outputs on disk",
+            ),
             label="Parameters of SHORE reconstruction model",
             visible_when='imaging_model == "DSI"',
         ),
+        Item("use_model_cache", label="Reuse models across subjects with the same gradient table"),
+        Item(
+            "number_of_workers",
+            label="Number of worker processes",
+            visible_when='imaging_model == "DSI" or mapmri',
+        ),
         Item("mapmri", visible_when='imaging_model != "DTI"'),
         Group(
             VGroup(
@@ -78,6 +88,14 @@ class Dipy_recon_configUI(DipyReconConfig):
             ),
             HGroup(Item("laplacian_regularization"), Item("laplacian_weighting")),
             Item("positivity_constraint"),
+            HGroup(
+                Item("mapmri_fit_by_blocks", label="Fit by blocks"),
+                Item(
+                    "mapmri_memory_budget",
+                    label="Memory budget (GB)",
+                    enabled_when="mapmri_fit_by_blocks",
+                ),
+            ),
             label="MAP_MRI settings",
             visible_when="mapmri",
         ),
@@ -48,6 +48,21 @@ class Dipy_tracking_configUI(DipyTrackingConfig):
                 visible_when='tracking_mode=="Probabilistic"',
                 orientation="vertical",
             ),
+            Group(
+                Item(
+                    "stream_seeds",
+                    label="Stream seeds by batches",
+                    visible_when="SD is False",
+                ),
+                Item("sharded_tracking", label="Sharded tracking"),
+                Item(
+                    "number_of_workers",
+                    label="Number of worker processes",
+                    enabled_when="sharded_tracking",
+                ),
+                label="Seeding and parallel tracking",
+                orientation="vertical",
+            ),
         ),
     )
 
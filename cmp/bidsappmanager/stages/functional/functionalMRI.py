@@ -42,15 +42,30 @@ class FunctionalMRIConfigUI(FunctionalMRIConfig):
             Item("csf"),
             Item("wm"),
             Item("motion"),
+            Item("acompcor", label="aCompCor"),
+            Item("tcompcor", label="tCompCor"),
+            Item("compcor_n_components", label="Components", visible_when="acompcor or tcompcor"),
             label="Nuisance factors",
             show_border=True,
         ),
         HGroup(
             Item("lowpass_filter", label="Low cutoff (volumes)"),
             Item("highpass_filter", label="High cutoff (volumes)"),
+            Item("bandpass_method", label="Method"),
+            Item(
+                "bandpass_orthogonalize",
+                label="Orthogonalize to nuisance",
+                visible_when='bandpass_method=="Native" or fused_postprocessing',
+            ),
             label="Bandpass filtering",
             show_border=True,
         ),
+        HGroup(
+            Item("fused_postprocessing", label="In memory (single node)"),
+            Item("save_intermediates", visible_when="fused_postprocessing"),
+            label="Execution",
+            show_border=True,
+        ),
     )
 
 
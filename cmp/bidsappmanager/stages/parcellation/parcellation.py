@@ -59,6 +59,15 @@ class ParcellationConfigUI(ParcellationConfig):
                 label="ANTs precision type",
                 enabled_when="include_thalamic_nuclei_parcellation",
             ),
+            Item(
+                "thalamic_nuclei_low_memory",
+                label="Low memory thalamic nuclei correction",
+                enabled_when="include_thalamic_nuclei_parcellation",
+            ),
+            Item(
+                "number_of_threads",
+                label="Number of concurrent FreeSurfer commands",
+            ),
             visible_when='parcellation_scheme=="Lausanne2018"',
         ),
     )
@@ -35,6 +35,7 @@ class PreprocessingConfigUI(PreprocessingConfig):
     traits_view = View(
         "discard_n_volumes",
         "despiking",
+        Item("despiking_method", visible_when="despiking"),
         "slice_timing",
         Item("repetition_time", visible_when='slice_timing!="none"'),
         "motion_correction",
@@ -11,11 +11,9 @@ import argparse
 
 import subprocess
 
-# BIDS import
-from bids import BIDSLayout
-
 # CMP imports
 import cmp.project
+from cmtklib.bids.layout import get_bids_layout
 from cmp.info import __version__, __copyright__
 from cmtklib.util import print_error, print_blue, print_warning
 
@@ -156,6 +154,27 @@ def create_parser():
         "(Set to [Number of available CPUs -1] by default).",
     )
 
+    p.add_argument(
+        "--memory_gb",
+        type=float,
+        help="Maximal memory (in GB) used by Nipype to schedule the nodes "
+        "of the pipelines according to their estimated memory needs (No limit by default).",
+    )
+
+    p.add_argument(
+        "--concurrent_pipelines",
+        action="store_true",
+        help="Process the diffusion and fMRI pipelines concurrently once the "
+        "anatomical pipeline has finished, splitting the number of threads between them.",
+    )
+
+    p.add_argument(
+        "--resource_monitor",
+        action="store_true",
+        help="Enable the Nipype resource monitor to record the peak memory of each node "
+        "in the execution profiles (Disabled by default).",
+    )
+
     p.add_argument(
         "-v",
         "--version",
@@ -191,14 +210,36 @@ def main():
     # Version and copyright message
     info()
 
+    if args.concurrent_pipelines:
+        cmp.project.run_individual(
+            args.bids_dir,
+            args.output_dir,
+            args.participant_label,
+            args.session_label,
+            args.anat_pipeline_config,
+            args.dwi_pipeline_config,
+            args.func_pipeline_config,
+            number_of_threads=(
+                args.number_of_threads if args.number_of_threads is not None else 1
+            ),
+            memory_gb=args.memory_gb if args.memory_gb is not None else 0,
+            concurrent_pipelines=True,
+            resource_monitor=args.resource_monitor,
+        )
+        exit_code = 0
+        return exit_code
+
     project = cmp.project.ProjectInfo()
     project.base_directory = os.path.abspath(args.bids_dir)
     project.output_directory = os.path.abspath(args.output_dir)
     project.subjects = ["{}".format(args.participant_label)]
     project.subject = "{}".format(args.participant_label)
+    if args.memory_gb is not None:
+        project.memory_gb = args.memory_gb
+    project.resource_monitor = args.resource_monitor
 
     try:
-        bids_layout = BIDSLayout(project.base_directory)
+        bids_layout = get_bids_layout(project.base_directory, project.output_directory)
     except Exception:  # pragma: no cover
         print_error("  .. EXCEPTION: Raised at BIDSLayout")
         exit_code = 1
@@ -11,6 +11,7 @@ import sys
 from pathlib import Path
 
 # Own imports
+from cmp.info import __version__
 from cmp.parser import get_docker_wrapper_parser
 from cmtklib.util import check_directory_exists
 from cmtklib.process import run
@@ -87,12 +88,16 @@ def create_docker_cmd(args):
     cmd += f'--fs_license /bids_dir/code/license.txt '
     optional_single_args = (
         "number_of_threads", "number_of_participants_processed_in_parallel",
-        "mrtrix_random_seed", "ants_random_seed", "ants_number_of_threads",
+        "mrtrix_random_seed", "ants_random_seed", "ants_number_of_threads", "memory_gb",
     )
     for arg_name in optional_single_args:
         argument_value = getattr(args, arg_name)
         if argument_value:
             cmd += f'--{arg_name} {argument_value} '
+    if args.concurrent_pipelines:
+        cmd += "--concurrent_pipelines "
+    if args.resource_monitor:
+        cmd += "--resource_monitor "
     if args.notrack:
         cmd += "--notrack "
     if args.coverage:
@@ -143,7 +148,9 @@ def main():
         carbonfootprint_msg = create_carbon_footprint_message(
             bids_dir=args.bids_dir,
             emissions_csv_file=str(Path(args.bids_dir) / 'code' / 'emissions.csv'),
-            nb_of_subjects_processed=len(args.participant_label)
+            nb_of_subjects_processed=len(args.participant_label),
+            cmp_derivatives_dir=str(Path(args.output_dir) / f'cmp-{__version__}'),
+            participant_labels=args.participant_label
         )
         print(carbonfootprint_msg)
 
@@ -91,6 +91,31 @@ def get() -> argparse.ArgumentParser:
         "Freesurfer (Set to [Number of available CPUs -1] by default).",
     )
 
+    p.add_argument(
+        "--memory_gb",
+        type=float,
+        help="Maximal memory (in GB) used by the processing of all the participants. "
+        "It is split between the participants processed in parallel and used by Nipype "
+        "to schedule the nodes of the pipelines according to their estimated memory needs "
+        "(No limit by default).",
+    )
+
+    p.add_argument(
+        "--concurrent_pipelines",
+        help="Process the diffusion and fMRI pipelines of a participant concurrently "
+        "once the anatomical pipeline has finished, splitting the number of threads "
+        "(see `--number_of_threads` option flag) between them.",
+        action="store_true",
+    )
+
+    p.add_argument(
+        "--resource_monitor",
+        help="Enable the Nipype resource monitor to record the peak memory of each node "
+        "in the execution profiles of the participants (Disabled by default as the "
+        "monitoring has an overhead).",
+        action="store_true",
+    )
+
     p.add_argument(
         "--number_of_participants_processed_in_parallel",
         default=1,
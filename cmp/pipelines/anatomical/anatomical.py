@@ -67,6 +67,7 @@ class AnatomicalPipeline(cmp_common.Pipeline):
     now = datetime.datetime.now().strftime("%Y%m%d_%H%M")
     pipeline_name = Str("anatomical_pipeline")
     input_folders = ["anat"]
+    resource_image = ("anat", "T1w")
     process_type = Str
     diffusion_imaging_model = Str
     parcellation_scheme = Str("Lausanne2018")
@@ -1092,13 +1093,8 @@ class AnatomicalPipeline(cmp_common.Pipeline):
             nipype_deriv_subject_directory=nipype_deriv_subject_directory,
         )
         anat_flow.write_graph(graph2use="colored", format="svg", simple_form=True)
-        # Create dictionary of arguments passed to plugin_args
-        plugin_args = {
-            'maxtasksperchild': 1,
-            'n_procs': self.number_of_cores,
-            'raise_insufficient': False,
-        }
-        anat_flow.run(plugin="MultiProc", plugin_args=plugin_args)
+        # Run the workflow and save the profile of its nodes
+        self.run_flow(anat_flow, cmp_deriv_subject_directory)
 
         self._update_parcellation_scheme()
 
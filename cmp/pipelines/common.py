@@ -9,14 +9,20 @@
 import os
 import threading
 import time
+from glob import glob
+
+import nibabel as nib
+import numpy as np
 
 from traits.api import *
 
+from nipype import config
 import nipype.pipeline.engine as pe
 import nipype.interfaces.utility as util
 from nipype.interfaces.base import File, Directory
 
 from cmtklib.bids.io import __nipype_directory__
+from cmtklib.profiling import NodeProfiler, interface_profiling, get_profile_basename
 
 
 class ProgressWindow(HasTraits):
@@ -105,6 +111,16 @@ class Pipeline(HasTraits):
     # num core settings
     number_of_cores = 1
 
+    # Memory (in GB) available to the Nipype MultiProc plugin (0: no limit)
+    memory_gb = 0
+
+    # Record the peak memory of the nodes with the Nipype resource monitor
+    resource_monitor = False
+
+    # BIDS datatype and suffix of the input image used to estimate
+    # the memory needs of the nodes of the stages
+    resource_image = None
+
     anat_flow = None
 
     # -- Property Implementations ---------------------------------------------
@@ -115,6 +131,8 @@ class Pipeline(HasTraits):
     def __init__(self, project_info):
         self.base_directory = project_info.base_directory
         self.number_of_cores = project_info.number_of_cores
+        self.memory_gb = project_info.memory_gb
+        self.resource_monitor = project_info.resource_monitor
 
         for stage in list(self.stages.keys()):
             if project_info.subject_session != "":
@@ -196,8 +214,122 @@ class Pipeline(HasTraits):
         )
         flow.add_nodes([inputnode, outputnode])
         stage.create_workflow(flow, inputnode, outputnode)
+        self.set_node_resources(stage, flow)
         return flow
 
+    def get_input_image_memory_gb(self):
+        """Estimate the memory needed to load the input image of the pipeline.
+
+        The estimate is computed from the header of the largest image of the
+        subject / session matching ``resource_image``, loaded as float64.
+
+        Returns
+        -------
+        memory_gb : float
+            Estimated memory in GB (0 if no input image is found)
+        """
+        if self.resource_image is None:
+            return 0.0
+        datatype, suffix = self.resource_image
+        session = self.global_conf.subject_session
+        files = glob(
+            os.path.join(
+                self.base_directory,
+                self.subject.split("_")[0],
+                session,
+                datatype,
+                f"*_{suffix}.nii*",
+            )
+        )
+        memory_gb = 0.0
+        for f in files:
+            try:
+                shape = nib.load(f).shape
+            except Exception:  # pragma: no cover
+                continue
+            memory_gb = max(memory_gb, float(np.prod(shape)) * 8 / 1024 ** 3)
+        return memory_gb
+
+    def set_node_resources(self, stage, flow):
+        """Annotate the nodes of a stage workflow with their estimated resources.
+
+        The estimates given by :meth:`Stage.get_node_resources` are used by the
+        Nipype MultiProc plugin to avoid co-scheduling nodes that together
+        exceed the memory and CPU budgets.
+
+        Parameters
+        ----------
+        stage : cmp.stages.common.Stage
+            Processing stage
+
+        flow : nipype.pipeline.engine.Workflow
+            Workflow of the stage created by :meth:`create_stage_flow`
+        """
+        input_memory_gb = self.get_input_image_memory_gb()
+        node_names = flow.list_node_names()
+        for node_name, (mem_gb, n_procs) in stage.get_node_resources(input_memory_gb).items():
+            # Nodes depend on the stage configuration
+            if node_name not in node_names:
+                continue
+            node = flow.get_node(node_name)
+            if mem_gb is not None:
+                # Node.mem_gb is a read-only property returning Node._mem_gb, which is
+                # only set by the mem_gb argument of the constructor. The nodes are
+                # created by the stages before the size of the input images is known,
+                # and the public alternative (estimated_memory_gb on the interface) is
+                # deprecated and logs a warning each time MultiProc reads mem_gb.
+                # MapNode also propagates Node._mem_gb to its sub-nodes.
+                node._mem_gb = mem_gb
+            if n_procs is not None:
+                node.n_procs = n_procs
+
+    def get_plugin_args(self):
+        """Return the arguments of the Nipype MultiProc plugin used to run the pipeline.
+
+        Returns
+        -------
+        plugin_args : dict
+            Dictionary of arguments passed to ``plugin_args``
+        """
+        plugin_args = {
+            'maxtasksperchild': 1,
+            'n_procs': self.number_of_cores,
+            'raise_insufficient': False,
+        }
+        if self.memory_gb:
+            plugin_args['memory_gb'] = self.memory_gb
+        return plugin_args
+
+    def run_flow(self, flow, cmp_deriv_subject_directory):
+        """Run the pipeline workflow with the MultiProc plugin and save the profile of its nodes.
+
+        The wall time, CPU time, peak memory and I/O of each node are saved in
+        ``<cmp_deriv_subject_directory>/sub-<label>(_ses-<label>)_desc-<modality>_profile.tsv``
+        (and ``.json``), even if the execution of the workflow fails.
+        The peak memory is only recorded if the Nipype resource monitor
+        is enabled (``resource_monitor``), otherwise it is reported as ``n/a``.
+
+        Parameters
+        ----------
+        flow : nipype.pipeline.engine.Workflow
+            The pipeline workflow
+
+        cmp_deriv_subject_directory : Directory
+            Main CMP output directory of a subject
+            e.g. ``/output_dir/cmp/sub-XX/(ses-YY)``
+        """
+        profiler = NodeProfiler()
+        plugin_args = self.get_plugin_args()
+        plugin_args['status_callback'] = profiler
+        if self.resource_monitor:
+            # Sample the peak memory of the nodes
+            config.enable_resource_monitor()
+        try:
+            with interface_profiling():
+                flow.run(plugin="MultiProc", plugin_args=plugin_args)
+        finally:
+            profiler.save(get_profile_basename(cmp_deriv_subject_directory, self.pipeline_name))
+
     def fill_stages_outputs(self):
         """Update processing stage output list for visual inspection."""
         for stage in list(self.stages.values()):
@@ -11,7 +11,6 @@ import datetime
 import shutil
 
 import nipype.interfaces.io as nio
-from bids import BIDSLayout
 from nipype import config, logging
 from nipype.interfaces.utility import Merge
 
@@ -80,6 +79,7 @@ class DiffusionPipeline(Pipeline):
     now = datetime.datetime.now().strftime("%Y%m%d_%H%M")
     pipeline_name = Str("diffusion_pipeline")
     input_folders = ["anat", "dwi"]
+    resource_image = ("dwi", "dwi")
     process_type = Str
     diffusion_imaging_model = Str
     subject = Str
@@ -398,7 +398,6 @@ class DiffusionPipeline(Pipeline):
         subjid = self.subject.split("-")[1]
 
         try:
-            layout = BIDSLayout(self.base_directory)
             for subj in layout.get_subjects():
                 self.global_conf.subjects.append("sub-" + str(subj))
 
@@ -1285,13 +1284,8 @@ class DiffusionPipeline(Pipeline):
             nipype_deriv_subject_directory=nipype_deriv_subject_directory,
         )
         flow.write_graph(graph2use="colored", format="svg", simple_form=True)
-        # Create dictionary of arguments passed to plugin_args
-        plugin_args = {
-            'maxtasksperchild': 1,
-            'n_procs': self.number_of_cores,
-            'raise_insufficient': False,
-        }
-        flow.run(plugin="MultiProc", plugin_args=plugin_args)
+        # Run the workflow and save the profile of its nodes
+        self.run_flow(flow, cmp_deriv_subject_directory)
 
         iflogger.info("**** Processing finished ****")
 
@@ -461,7 +461,8 @@ class EEGPipeline(Pipeline):
                     (loader_flow, invsol_flow, [('outputnode.src', 'inputnode.src_file'),
                                                 ('outputnode.bem', 'inputnode.bem_file')]),
 
-                    (invsol_flow, sinker, [("outputnode.roi_ts_file", "eeg.@roi_ts_file")]),
+                    (invsol_flow, sinker, [("outputnode.roi_ts_file", "eeg.@roi_ts_file"),
+                                           ("outputnode.roi_ts_npy_file", "eeg.@roi_ts_npy_file")]),
                 ]
             )
             # fmt: on
@@ -511,13 +512,8 @@ class EEGPipeline(Pipeline):
         )
         eeg_flow.write_graph(graph2use="colored", format="svg", simple_form=True)
 
-        # Create dictionary of arguments passed to plugin_args
-        plugin_args = {
-            'maxtasksperchild': 1,
-            'n_procs': self.number_of_cores,
-            'raise_insufficient': False,
-        }
-        eeg_flow.run(plugin="MultiProc", plugin_args=plugin_args)
+        # Run the workflow and save the profile of its nodes
+        self.run_flow(eeg_flow, cmp_deriv_subject_directory)
 
         iflogger.info("**** Processing finished ****")
 
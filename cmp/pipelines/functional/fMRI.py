@@ -64,6 +64,7 @@ class fMRIPipeline(Pipeline):
     now = datetime.datetime.now().strftime("%Y%m%d_%H%M")
     pipeline_name = Str("fMRI_pipeline")
     input_folders = ["anat", "func"]
+    resource_image = ("func", "bold")
     seg_tool = Str
     subject = Str
     subject_directory = Directory
@@ -153,6 +154,12 @@ class fMRIPipeline(Pipeline):
         self.stages["FunctionalMRI"].config.on_trait_change(
             self.update_nuisance_requirements, "wm"
         )
+        self.stages["FunctionalMRI"].config.on_trait_change(
+            self.update_nuisance_requirements, "acompcor"
+        )
+        self.stages["FunctionalMRI"].config.on_trait_change(
+            self.update_nuisance_requirements, "tcompcor"
+        )
         self.stages["Connectome"].config.on_trait_change(
             self.update_scrubbing, "apply_scrubbing"
         )
@@ -190,15 +197,16 @@ class fMRIPipeline(Pipeline):
         Configure the registration to apply the estimated transformation to multiple segmentation masks
         depending on the Nuisance correction steps performed.
         """
-        self.stages["Registration"].config.apply_to_eroded_brain = self.stages[
-            "FunctionalMRI"
-        ].config.global_nuisance
-        self.stages["Registration"].config.apply_to_eroded_csf = self.stages[
-            "FunctionalMRI"
-        ].config.csf
-        self.stages["Registration"].config.apply_to_eroded_wm = self.stages[
-            "FunctionalMRI"
-        ].config.wm
+        func_config = self.stages["FunctionalMRI"].config
+        self.stages["Registration"].config.apply_to_eroded_brain = (
+            func_config.global_nuisance or func_config.tcompcor
+        )
+        self.stages["Registration"].config.apply_to_eroded_csf = (
+            func_config.csf or func_config.acompcor
+        )
+        self.stages["Registration"].config.apply_to_eroded_wm = (
+            func_config.wm or func_config.acompcor
+        )
 
     def update_scrubbing(self):
         """Update to precompute or inputs for scrubbing during the FunctionalMRI stage."""
@@ -606,6 +614,7 @@ class fMRIPipeline(Pipeline):
             ("FD.npy", self.subject + "_desc-scrubbing_FD.npy"),
             ("DVARS.npy", self.subject + "_desc-scrubbing_DVARS.npy"),
             ("fMRI_bandpass.nii.gz", self.subject + "_task-rest_desc-bandpass_bold.nii.gz"),
+            ("fMRI_postprocessing.nii.gz", self.subject + "_task-rest_desc-postprocessed_bold.nii.gz"),
             ("fMRI_discard_mean.nii.gz",  self.subject + "_meanBOLD.nii.gz")
         ]
         # fmt:on
@@ -619,6 +628,8 @@ class fMRIPipeline(Pipeline):
                 ),
                 ("connectome_freesurferaparc", self.subject + "_atlas-Desikan_conndata-network_connectivity"),
                 ("averageTimeseries_freesurferaparc", self.subject + "_atlas-Desikan_timeseries"),
+                ("dynamicConnectome_freesurferaparc",
+                 self.subject + "_atlas-Desikan_desc-dynamic_conndata-network_connectivity"),
             ]
             # fmt:on
         elif self.parcellation_scheme == "Custom":
@@ -632,6 +643,10 @@ class fMRIPipeline(Pipeline):
                 ),
                 (f"connectome_{bids_atlas_name}", self.subject + f"_atlas-{bids_atlas_label}_conndata-network_connectivity"),
                 (f"averageTimeseries_{bids_atlas_name}", self.subject + f"_atlas-{bids_atlas_label}_timeseries"),
+                (
+                    f"dynamicConnectome_{bids_atlas_name}",
+                    self.subject + f"_atlas-{bids_atlas_label}_desc-dynamic_conndata-network_connectivity"
+                ),
             ]
             # fmt:on
         else:
@@ -644,7 +659,9 @@ class fMRIPipeline(Pipeline):
                     ),
                     (f'connectome_{scale}',
                      f'{self.subject}_atlas-{bids_atlas_label}_res-{scale}_conndata-network_connectivity'),
-                    (f'averageTimeseries_{scale}', f'{self.subject}_atlas-{bids_atlas_label}_res-{scale}_timeseries')
+                    (f'averageTimeseries_{scale}', f'{self.subject}_atlas-{bids_atlas_label}_res-{scale}_timeseries'),
+                    (f'dynamicConnectome_{scale}',
+                     f'{self.subject}_atlas-{bids_atlas_label}_res-{scale}_desc-dynamic_conndata-network_connectivity')
                 ]
                 # fmt:on
 
@@ -872,7 +889,9 @@ class fMRIPipeline(Pipeline):
                     (reg_flow, con_flow, [("outputnode.roi_volumes_registered_crop", "inputnode.roi_volumes_registered")]),
                     (con_flow, fMRI_outputnode, [("outputnode.connectivity_matrices", "connectivity_matrices")]),
                     (con_flow, sinker, [("outputnode.connectivity_matrices", "func.@connectivity_matrices"),
-                                        ("outputnode.avg_timeseries", "func.@avg_timeseries")])
+                                        ("outputnode.avg_timeseries", "func.@avg_timeseries"),
+                                        ("outputnode.dynamic_connectivity_matrices",
+                                         "func.@dynamic_connectivity_matrices")])
                 ]
             )
             # fmt:on
@@ -967,13 +986,8 @@ class fMRIPipeline(Pipeline):
             nipype_deriv_subject_directory=nipype_deriv_subject_directory,
         )
         flow.write_graph(graph2use="colored", format="svg", simple_form=False)
-        # Create dictionary of arguments passed to plugin_args
-        plugin_args = {
-            'maxtasksperchild': 1,
-            'n_procs': self.number_of_cores,
-            'raise_insufficient': False,
-        }
-        flow.run(plugin="MultiProc", plugin_args=plugin_args)
+        # Run the workflow and save the profile of its nodes
+        self.run_flow(flow, cmp_deriv_subject_directory)
 
         iflogger.info("**** Processing finished ****")
 
@@ -39,6 +39,7 @@ from cmtklib.bids.io import (
     __nipype_directory__,
     __freesurfer_directory__
 )
+from cmtklib.bids.layout import get_bids_layout
 from cmtklib.bids.utils import write_derivative_description
 
 # Ignore some warnings
@@ -201,6 +202,16 @@ class ProjectInfo(HasTraits):
         Number of cores used by Nipype workflow execution engine
         to distribute independent processing nodes
         (Must be in the range of your local resources)
+
+    memory_gb : float
+        Memory (in GB) available to the Nipype workflow execution engine
+        to schedule processing nodes according to their estimated memory needs
+        (Default: 0, i.e. no limit)
+
+    resource_monitor : bool
+        Enable the Nipype resource monitor to record the peak memory
+        of the nodes in the execution profiles
+        (Default: False)
     """
 
     base_directory = Directory
@@ -290,6 +301,8 @@ class ProjectInfo(HasTraits):
     eeg_custom_last_stage = Str
 
     number_of_cores = Enum(1, list(range(1, multiprocessing.cpu_count() + 1)))
+    memory_gb = Float(0)
+    resource_monitor = Bool(False)
 
 
 def refresh_folder(
@@ -960,6 +973,150 @@ def update_eeg_last_processed(project_info, pipeline):  # pragma: no cover
     project_info.atlas_info = pipeline.atlas_info
 
 
+def split_number_of_threads(number_of_threads, number_of_pipelines):
+    """Split a budget of threads between pipelines run concurrently.
+
+    Each pipeline receives at least one thread and the remainder of the
+    division is given to the first pipelines.
+
+    Parameters
+    ----------
+    number_of_threads : int
+        Total number of threads
+
+    number_of_pipelines : int
+        Number of pipelines run concurrently
+
+    Returns
+    -------
+    threads : list of int
+        Number of threads allocated to each pipeline
+    """
+    share, remainder = divmod(max(number_of_threads, number_of_pipelines), number_of_pipelines)
+    return [share + 1 if i < remainder else share for i in range(number_of_pipelines)]
+
+
+def init_modality_pipeline(modality, project, bids_layout, anat_pipeline):
+    """Initialize a diffusion, fMRI or EEG pipeline from the outputs of the anatomical pipeline.
+
+    Parameters
+    ----------
+    modality : {"dMRI", "fMRI", "EEG"}
+        Pipeline to initialize
+
+    project : cmp.project.ProjectInfo
+        Instance of ``cmp.project.ProjectInfo`` object
+
+    bids_layout : bids.BIDSLayout
+        Instance of ``BIDSLayout`` object
+
+    anat_pipeline : cmp.pipelines.anatomical.anatomical.AnatomicalPipeline
+        Anatomical pipeline already processed
+
+    Returns
+    -------
+    pipeline : cmp.pipelines.common.Pipeline
+        The initialized pipeline or `None` if it could not be initialized
+    """
+    init_project = {
+        "dMRI": init_dmri_project,
+        "fMRI": init_fmri_project,
+        "EEG": init_eeg_project,
+    }[modality]
+    res = init_project(project, bids_layout, False)
+    if res is None:
+        return None
+    valid_inputs, pipeline = res
+    if pipeline is None:
+        return None
+
+    pipeline.parcellation_scheme = anat_pipeline.parcellation_scheme
+    pipeline.atlas_info = anat_pipeline.atlas_info
+    if modality == "fMRI":
+        pipeline.subjects_dir = anat_pipeline.stages["Segmentation"].config.freesurfer_subjects_dir
+        pipeline.subject_id = anat_pipeline.stages["Segmentation"].config.freesurfer_subject_id
+        print("Freesurfer subjects dir: {}".format(pipeline.subjects_dir))
+        print("Freesurfer subject id: {}".format(pipeline.subject_id))
+    if modality != "EEG" and anat_pipeline.parcellation_scheme == "Custom":
+        pipeline.custom_atlas_name = anat_pipeline.stages["Parcellation"].config.custom_parcellation.atlas
+        pipeline.custom_atlas_res = anat_pipeline.stages["Parcellation"].config.custom_parcellation.res
+
+    if not valid_inputs:  # pragma: no cover
+        print("   ... ERROR : Invalid inputs")
+        sys.exit(1)
+
+    return pipeline
+
+
+def process_modality_pipeline(modality, pipeline, number_of_threads=None, memory_gb=None):
+    """Process a diffusion, fMRI or EEG pipeline and collect its stage outputs.
+
+    Parameters
+    ----------
+    modality : {"dMRI", "fMRI", "EEG"}
+        Name of the pipeline
+
+    pipeline : cmp.pipelines.common.Pipeline
+        Pipeline initialized by :func:`init_modality_pipeline`
+
+    number_of_threads : int
+        If specified, number of processes used by the Nipype `MultiProc` plugin
+        to execute the pipeline
+
+    memory_gb : float
+        If specified, memory (in GB) available to the Nipype `MultiProc` plugin
+    """
+    if memory_gb is not None:
+        pipeline.memory_gb = memory_gb
+    if number_of_threads is not None:
+        pipeline.number_of_cores = number_of_threads
+        print(f">> Process {modality} pipeline ({number_of_threads} threads)")
+    else:
+        print(f">> Process {modality} pipeline")
+    pipeline.process()
+    pipeline.check_stages_execution()
+    pipeline.fill_stages_outputs()
+
+
+def process_modality_pipelines_concurrently(pipelines, number_of_threads=1, memory_gb=0):
+    """Process the diffusion, fMRI and EEG pipelines of a subject concurrently.
+
+    Each pipeline is executed in its own forked process as Nipype changes the
+    working directory of the process when executing a node. The budgets of
+    threads and memory are split between the pipelines.
+
+    Parameters
+    ----------
+    pipelines : list of tuple
+        List of ``(modality, pipeline)`` initialized by :func:`init_modality_pipeline`
+
+    number_of_threads : int
+        Total number of threads shared by the pipelines
+
+    memory_gb : float
+        Total memory (in GB) shared by the pipelines (0: no limit)
+
+    Returns
+    -------
+    exit_codes : dict
+        Exit code of the process of each pipeline, indexed by modality
+    """
+    ctx = multiprocessing.get_context("fork")
+    threads = split_number_of_threads(number_of_threads, len(pipelines))
+    processes = {}
+    for (modality, pipeline), pipeline_threads in zip(pipelines, threads):
+        proc = ctx.Process(
+            target=process_modality_pipeline,
+            args=(modality, pipeline, pipeline_threads, memory_gb / len(pipelines)),
+            name=f"{modality}-pipeline",
+        )
+        proc.start()
+        processes[modality] = proc
+    for proc in processes.values():
+        proc.join()
+    return {modality: proc.exitcode for modality, proc in processes.items()}
+
+
 def run_individual(
     bids_dir,
     output_dir,
@@ -969,6 +1126,10 @@ def run_individual(
     dwi_pipeline_config,
     func_pipeline_config,
     number_of_threads=1,
+    eeg_pipeline_config=None,
+    concurrent_pipelines=False,
+    memory_gb=0,
+    resource_monitor=False,
 ):
     """Function that creates the processing pipeline for complete coverage.
 
@@ -997,15 +1158,33 @@ def run_individual(
 
     number_of_threads : int
         Number of threads used by programs relying on the OpenMP library
+
+    eeg_pipeline_config : string
+        Path to EEG pipeline configuration file
+
+    concurrent_pipelines : bool
+        If `True`, the diffusion, fMRI and EEG pipelines are processed concurrently
+        once the anatomical pipeline has finished, sharing the ``number_of_threads``
+        budget. Otherwise they are processed one after the other.
+
+    memory_gb : float
+        Memory (in GB) available to the Nipype `MultiProc` plugin to schedule
+        the nodes of the pipelines (0: no limit)
+
+    resource_monitor : bool
+        If `True`, enable the Nipype resource monitor to record the peak memory
+        of the nodes in the execution profiles
     """
     project = ProjectInfo()
     project.base_directory = os.path.abspath(bids_dir)
     project.output_directory = os.path.abspath(output_dir)
     project.subjects = ["{}".format(participant_label)]
     project.subject = "{}".format(participant_label)
+    project.memory_gb = memory_gb
+    project.resource_monitor = resource_monitor
 
     try:
-        bids_layout = BIDSLayout(project.base_directory)
+        bids_layout = get_bids_layout(project.base_directory, project.output_directory)
     except Exception:
         print("Exception : Raised at BIDSLayout")
         sys.exit(1)
@@ -1021,190 +1200,66 @@ def run_individual(
 
     project.anat_config_file = os.path.abspath(anat_pipeline_config)
 
-    # Perform only the anatomical pipeline
-    if dwi_pipeline_config is None and func_pipeline_config is None:
-
-        anat_pipeline = init_anat_project(project, False)
-        if anat_pipeline is not None:
-            anat_valid_inputs = anat_pipeline.check_input(bids_layout, gui=False)
-
-            print(f"--- Set Freesurfer and ANTs to use {number_of_threads} threads by the means of OpenMP")
-            anat_pipeline.stages["Segmentation"].config.number_of_threads = number_of_threads
-
-            if anat_valid_inputs:
-                print(">> Process anatomical pipeline")
-                anat_pipeline.process()
-            else:  # pragma: no cover
-                print("ERROR : Invalid inputs")
-                sys.exit(1)
-
-            anat_pipeline.check_stages_execution()
-            anat_pipeline.fill_stages_outputs()
-
-    # Perform the anatomical and the diffusion pipelines
-    elif dwi_pipeline_config is not None and func_pipeline_config is None:
-
+    modalities = []
+    if dwi_pipeline_config is not None:
         project.dmri_config_file = os.path.abspath(dwi_pipeline_config)
-
-        anat_pipeline = init_anat_project(project, False)
-        if anat_pipeline is not None:
-            anat_valid_inputs = anat_pipeline.check_input(bids_layout, gui=False)
-
-            print(f"--- Set Freesurfer and ANTs to use {number_of_threads} threads by the means of OpenMP")
-            anat_pipeline.stages[ "Segmentation"].config.number_of_threads = number_of_threads
-
-            if anat_valid_inputs:
-                print(">> Process anatomical pipeline")
-                anat_pipeline.process()
-            else:  # pragma: no cover
-                print("ERROR : Invalid inputs")
-                sys.exit(1)
-
-        anat_valid_outputs, msg = anat_pipeline.check_output()
-        anat_pipeline.check_stages_execution()
-        anat_pipeline.fill_stages_outputs()
-
-        project.freesurfer_subjects_dir = anat_pipeline.stages["Segmentation"].config.freesurfer_subjects_dir
-        project.freesurfer_subject_id = anat_pipeline.stages["Segmentation"].config.freesurfer_subject_id
-
-        if anat_valid_outputs:
-            dmri_valid_inputs, dmri_pipeline = init_dmri_project(
-                project, bids_layout, False
-            )
-            if dmri_pipeline is not None:
-                dmri_pipeline.parcellation_scheme = anat_pipeline.parcellation_scheme
-                dmri_pipeline.atlas_info = anat_pipeline.atlas_info
-                if anat_pipeline.parcellation_scheme == "Custom":
-                    dmri_pipeline.custom_atlas_name = anat_pipeline.stages["Parcellation"].config.custom_parcellation.atlas
-                    dmri_pipeline.custom_atlas_res = anat_pipeline.stages["Parcellation"].config.custom_parcellation.res
-                if dmri_valid_inputs:
-                    dmri_pipeline.process()
-                else:  # pragma: no cover
-                    print("   ... ERROR : Invalid inputs")
-                    sys.exit(1)
-                dmri_pipeline.check_stages_execution()
-                dmri_pipeline.fill_stages_outputs()
-        else:
-            print(msg)
-            sys.exit(1)
-
-    # Perform the anatomical and the fMRI pipelines
-    elif dwi_pipeline_config is None and func_pipeline_config is not None:
-
+        modalities.append("dMRI")
+    if func_pipeline_config is not None:
         project.fmri_config_file = os.path.abspath(func_pipeline_config)
-
-        anat_pipeline = init_anat_project(project, False)
-        if anat_pipeline is not None:
-            anat_valid_inputs = anat_pipeline.check_input(bids_layout, gui=False)
-
-            print(f"--- Set Freesurfer and ANTs to use {number_of_threads} threads by the means of OpenMP")
-            anat_pipeline.stages[ "Segmentation"].config.number_of_threads = number_of_threads
-
-            if anat_valid_inputs:
-                print(">> Process anatomical pipeline")
-                anat_pipeline.process()
-            else:  # pragma: no cover
-                print("ERROR : Invalid inputs")
-                sys.exit(1)
-
-        anat_valid_outputs, msg = anat_pipeline.check_output()
-        anat_pipeline.check_stages_execution()
-        anat_pipeline.fill_stages_outputs()
-
-        project.freesurfer_subjects_dir = anat_pipeline.stages["Segmentation"].config.freesurfer_subjects_dir
-        project.freesurfer_subject_id = anat_pipeline.stages["Segmentation"].config.freesurfer_subject_id
-
-        if anat_valid_outputs:
-            fmri_valid_inputs, fmri_pipeline = init_fmri_project(
-                project, bids_layout, False
-            )
-            if fmri_pipeline is not None:
-                fmri_pipeline.parcellation_scheme = anat_pipeline.parcellation_scheme
-                fmri_pipeline.atlas_info = anat_pipeline.atlas_info
-                if anat_pipeline.parcellation_scheme == "Custom":
-                    fmri_pipeline.custom_atlas_name = anat_pipeline.stages["Parcellation"].config.custom_parcellation.atlas
-                    fmri_pipeline.custom_atlas_res = anat_pipeline.stages["Parcellation"].config.custom_parcellation.res
-                if fmri_valid_inputs:
-                    print(">> Process fmri pipeline")
-                    fmri_pipeline.process()
-                else:  # pragma: no cover
-                    print("   ... ERROR : Invalid inputs")
-                    sys.exit(1)
-                fmri_pipeline.check_stages_execution()
-                fmri_pipeline.fill_stages_outputs()
-        else:
-            print(msg)
+        modalities.append("fMRI")
+    if eeg_pipeline_config is not None:
+        project.eeg_config_file = os.path.abspath(eeg_pipeline_config)
+        modalities.append("EEG")
+
+    anat_pipeline = init_anat_project(project, False)
+    if anat_pipeline is not None:
+        anat_valid_inputs = anat_pipeline.check_input(bids_layout, gui=False)
+
+        print(f"--- Set Freesurfer and ANTs to use {number_of_threads} threads by the means of OpenMP")
+        anat_pipeline.stages["Segmentation"].config.number_of_threads = number_of_threads
+        anat_pipeline.stages["Parcellation"].config.number_of_threads = number_of_threads
+
+        if anat_valid_inputs:
+            print(">> Process anatomical pipeline")
+            anat_pipeline.process()
+        else:  # pragma: no cover
+            print("ERROR : Invalid inputs")
             sys.exit(1)
 
-    # Perform all pipelines (anatomical/diffusion/fMRI)
-    elif dwi_pipeline_config is not None and func_pipeline_config is not None:
-
-        project.dmri_config_file = os.path.abspath(dwi_pipeline_config)
-        project.fmri_config_file = os.path.abspath(func_pipeline_config)
-
-        anat_pipeline = init_anat_project(project, False)
+    # Perform only the anatomical pipeline
+    if not modalities:
         if anat_pipeline is not None:
-            anat_valid_inputs = anat_pipeline.check_input(bids_layout, gui=False)
-
-            print(f"--- Set Freesurfer and ANTs to use {number_of_threads} threads by the means of OpenMP")
-            anat_pipeline.stages[ "Segmentation"].config.number_of_threads = number_of_threads
+            anat_pipeline.check_stages_execution()
+            anat_pipeline.fill_stages_outputs()
+        return
 
-            if anat_valid_inputs:
-                print(">> Process anatomical pipeline")
-                anat_pipeline.process()
-            else:  # pragma: no cover
-                print("   ... ERROR : Invalid inputs")
-                sys.exit(1)
+    anat_valid_outputs, msg = anat_pipeline.check_output()
+    anat_pipeline.check_stages_execution()
+    anat_pipeline.fill_stages_outputs()
 
-        anat_valid_outputs, msg = anat_pipeline.check_output()
-        anat_pipeline.check_stages_execution()
-        anat_pipeline.fill_stages_outputs()
+    project.freesurfer_subjects_dir = anat_pipeline.stages["Segmentation"].config.freesurfer_subjects_dir
+    project.freesurfer_subject_id = anat_pipeline.stages["Segmentation"].config.freesurfer_subject_id
 
-        project.freesurfer_subjects_dir = anat_pipeline.stages["Segmentation"].config.freesurfer_subjects_dir
-        project.freesurfer_subject_id = anat_pipeline.stages["Segmentation"].config.freesurfer_subject_id
+    if not anat_valid_outputs:
+        print(msg)
+        sys.exit(1)
 
-        if anat_valid_outputs:
-            dmri_valid_inputs, dmri_pipeline = init_dmri_project(
-                project, bids_layout, False
-            )
-            if dmri_pipeline is not None:
-                dmri_pipeline.parcellation_scheme = anat_pipeline.parcellation_scheme
-                dmri_pipeline.atlas_info = anat_pipeline.atlas_info
-                if anat_pipeline.parcellation_scheme == "Custom":
-                    dmri_pipeline.custom_atlas_name = anat_pipeline.stages["Parcellation"].config.custom_parcellation.atlas
-                    dmri_pipeline.custom_atlas_res = anat_pipeline.stages["Parcellation"].config.custom_parcellation.res
-                if dmri_valid_inputs:
-                    print(">> Process diffusion pipeline")
-                    dmri_pipeline.process()
-                else:  # pragma: no cover
-                    print("   ... ERROR : Invalid inputs")
-                    sys.exit(1)
-                dmri_pipeline.check_stages_execution()
-                dmri_pipeline.fill_stages_outputs()
-
-            fmri_valid_inputs, fmri_pipeline = init_fmri_project(
-                project, bids_layout, False
-            )
-            if fmri_pipeline is not None:
-                fmri_pipeline.parcellation_scheme = anat_pipeline.parcellation_scheme
-                fmri_pipeline.atlas_info = anat_pipeline.atlas_info
-                fmri_pipeline.subjects_dir = anat_pipeline.stages["Segmentation"].config.freesurfer_subjects_dir
-                fmri_pipeline.subject_id = anat_pipeline.stages[ "Segmentation"].config.freesurfer_subject_id
-                if anat_pipeline.parcellation_scheme == "Custom":
-                    fmri_pipeline.custom_atlas_name = anat_pipeline.stages["Parcellation"].config.custom_parcellation.atlas
-                    fmri_pipeline.custom_atlas_res = anat_pipeline.stages["Parcellation"].config.custom_parcellation.res
-                print("Freesurfer subjects dir: {}".format(fmri_pipeline.subjects_dir))
-                print("Freesurfer subject id: {}".format(fmri_pipeline.subject_id))
-
-                # print sys.argv[offset+9]
-                if fmri_valid_inputs:
-                    print(">> Process fmri pipeline")
-                    fmri_pipeline.process()
-                else:  # pragma: no cover
-                    print("   ... ERROR : Invalid inputs")
-                    sys.exit(1)
-                fmri_pipeline.check_stages_execution()
-                fmri_pipeline.fill_stages_outputs()
-        else:
-            print(msg)
+    # Perform the diffusion, fMRI and EEG pipelines that only depend on the anatomical outputs
+    pipelines = []
+    for modality in modalities:
+        pipeline = init_modality_pipeline(modality, project, bids_layout, anat_pipeline)
+        if pipeline is not None:
+            pipelines.append((modality, pipeline))
+
+    if concurrent_pipelines and len(pipelines) > 1:
+        print(f">> Process {', '.join(m for m, _ in pipelines)} pipelines concurrently")
+        exit_codes = process_modality_pipelines_concurrently(
+            pipelines, number_of_threads, memory_gb
+        )
+        failed = [modality for modality, code in exit_codes.items() if code != 0]
+        if failed:
+            print(f"ERROR : {', '.join(failed)} pipeline(s) failed (exit codes: {exit_codes})")
             sys.exit(1)
+    else:
+        for modality, pipeline in pipelines:
+            process_modality_pipeline(modality, pipeline)
@@ -67,6 +67,27 @@ class Stage(HasTraits):
     enabled = True
     config = Instance(HasTraits)
 
+    def get_node_resources(self, input_memory_gb):
+        """Return the estimated resources of the most demanding nodes of the stage.
+
+        Stages override this method to annotate their nodes with the memory
+        and the number of threads they need, such that the Nipype MultiProc
+        plugin does not co-schedule nodes that together exceed the budgets.
+
+        Parameters
+        ----------
+        input_memory_gb : float
+            Memory (in GB) needed to load the input image of the pipeline as float64
+
+        Returns
+        -------
+        node_resources : dict
+            Dictionary of ``(mem_gb, n_procs)`` tuples indexed by the name of the nodes
+            in the stage workflow (nodes that are not created are skipped and
+            `None` leaves the Nipype default)
+        """
+        return {}
+
     def is_running(self):
         """Return the number of unfinished files in the stage.
 
@@ -171,6 +171,16 @@ class ConnectomeStage(Stage):
         )
         # fmt: on
 
+    def get_node_resources(self, input_memory_gb):
+        """Return the estimated resources of the most demanding nodes of the stage.
+
+        See Also
+        --------
+        cmp.stages.common.Stage.get_node_resources
+        """
+        # Dominated by the streamlines loaded in memory
+        return {"compute_matrice": (4.0 + input_memory_gb, None)}
+
     def define_inspect_outputs(self):  # pragma: no cover
         """Update the `inspect_outputs` class attribute.
 
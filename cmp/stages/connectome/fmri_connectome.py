@@ -49,6 +49,20 @@ class ConnectomeConfig(HasTraits):
     output_types : ['gPickle', 'mat', 'cff', 'graphml']
         Output connectome format
 
+    dynamic_fc : traits.Bool
+        Compute also the dynamic functional connectivity as a stack of
+        correlation matrices in sliding windows, saved as a `.npy` array
+        of shape (windows, nodes, nodes)
+        (Default: False)
+
+    window_length : traits.Int
+        Number of volumes in a sliding window
+        (Default: 40)
+
+    window_step : traits.Int
+        Number of volumes between the starts of two consecutive windows
+        (Default: 5)
+
     log_visualization : traits.Bool
         Log visualization that might be obsolete as this has been detached
         after creation of the bidsappmanager (Default: True)
@@ -70,6 +84,9 @@ class ConnectomeConfig(HasTraits):
     FD_thr = Float(0.2)
     DVARS_thr = Float(4.0)
     output_types = List(["gPickle", "mat", "cff", "graphml"])
+    dynamic_fc = Bool(False)
+    window_length = Int(40)
+    window_step = Int(5)
     log_visualization = Bool(True)
     circular_layout = Bool(False)
     subject = Str()
@@ -105,7 +122,7 @@ class ConnectomeStage(Stage):
             "atlas_info",
             "roi_graphMLs",
         ]
-        self.outputs = ["connectivity_matrices", "avg_timeseries"]
+        self.outputs = ["connectivity_matrices", "avg_timeseries", "dynamic_connectivity_matrices"]
 
     def create_workflow(self, flow, inputnode, outputnode):
         """Create the stage worflow.
@@ -130,6 +147,10 @@ class ConnectomeStage(Stage):
         cmtk_cmat.inputs.FD_th = self.config.FD_thr
         cmtk_cmat.inputs.DVARS_th = self.config.DVARS_thr
 
+        cmtk_cmat.inputs.dynamic_fc = self.config.dynamic_fc
+        cmtk_cmat.inputs.window_length = self.config.window_length
+        cmtk_cmat.inputs.window_step = self.config.window_step
+
         if not isdefined(inputnode.inputs.FD) or not isdefined(inputnode.inputs.DVARS):
             cmtk_cmat.inputs.apply_scrubbing = False
 
@@ -144,11 +165,21 @@ class ConnectomeStage(Stage):
                                        ("roi_volumes_registered", "roi_volumes"),
                                        ("roi_graphMLs", "roi_graphmls"),],),
                 (cmtk_cmat, outputnode, [("connectivity_matrices", "connectivity_matrices"),
-                                         ("avg_timeseries", "avg_timeseries"),],),
+                                         ("avg_timeseries", "avg_timeseries"),
+                                         ("dynamic_connectivity_matrices", "dynamic_connectivity_matrices"),],),
             ]
         )
         # fmt: on
 
+    def get_node_resources(self, input_memory_gb):
+        """Return the estimated resources of the most demanding nodes of the stage.
+
+        See Also
+        --------
+        cmp.stages.common.Stage.get_node_resources
+        """
+        return {"compute_matrice": (0.5 + 2 * input_memory_gb, None)}
+
     def define_inspect_outputs(self):  # pragma: no cover
         """Update the `inspect_outputs` class attribute.
 
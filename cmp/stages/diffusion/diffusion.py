@@ -14,6 +14,7 @@ import nipype.interfaces.fsl as fsl
 
 # Own imports
 from cmp.stages.common import Stage
+from cmtklib.bids.io import __nipype_directory__
 from cmtklib.interfaces.misc import ExtractImageVoxelSizes
 from .reconstruction import *
 from .tracking import *
@@ -431,7 +432,10 @@ class DiffusionStage(Stage):
             # fmt: on
 
         if self.config.recon_processing_tool == "Dipy":
-            recon_flow = create_dipy_recon_flow(self.config.dipy_recon_config)
+            recon_flow = create_dipy_recon_flow(
+                self.config.dipy_recon_config,
+                model_cache_dir=os.path.join(self.output_dir, __nipype_directory__, "dipy_model_cache")
+            )
             # fmt: off
             flow.connect(
                 [
@@ -679,6 +683,34 @@ class DiffusionStage(Stage):
         #         print(
         #             "Invalid tractography input format. Valid formats are .tck (MRtrix) and .trk (DTK/Trackvis)")
 
+    def get_node_resources(self, input_memory_gb):
+        """Return the estimated resources of the most demanding nodes of the stage.
+
+        See Also
+        --------
+        cmp.stages.common.Stage.get_node_resources
+        """
+        recon_mem_gb = 1.0 + 4 * input_memory_gb
+        tracking_mem_gb = 2.0 + 2 * input_memory_gb
+        dipy_recon_workers = self.config.dipy_recon_config.number_of_workers
+        dipy_tracking_workers = (
+            self.config.dipy_tracking_config.number_of_workers
+            if self.config.dipy_tracking_config.sharded_tracking
+            else 1
+        )
+        return {
+            "reconstruction.dipy_tensor": (recon_mem_gb, None),
+            "reconstruction.dipy_CSD": (recon_mem_gb, None),
+            "reconstruction.dipy_SHORE": (recon_mem_gb, dipy_recon_workers),
+            "reconstruction.dipy_mapmri": (recon_mem_gb, dipy_recon_workers),
+            "reconstruction.mrtrix_CSD": (recon_mem_gb, None),
+            "tracking.dipy_dtieudx_tracking": (tracking_mem_gb, None),
+            "tracking.dipy_deterministic_tracking": (tracking_mem_gb, dipy_tracking_workers),
+            "tracking.dipy_probabilistic_tracking": (tracking_mem_gb, dipy_tracking_workers),
+            "tracking.mrtrix_deterministic_tracking": (tracking_mem_gb, None),
+            "tracking.mrtrix_probabilistic_tracking": (tracking_mem_gb, None),
+        }
+
     def define_inspect_outputs(self):  # pragma: no cover
         """Update the `inspect_outputs` class attribute.
 
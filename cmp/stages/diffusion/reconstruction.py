@@ -126,6 +126,30 @@ class DipyReconConfig(HasTraits):
     shore_positive_constraint : traits.Bool
         Constrain the SHORE propagator to be positive
         (Default: False)
+
+    shore_memmap : traits.Bool
+        Preallocate the SHORE ODF outputs as memory-mapped arrays on disk
+        (Default: False)
+
+    use_model_cache : traits.Bool
+        Reuse the Dipy models (and their precomputed matrices) across
+        subjects sharing the same gradient table and across reruns
+        with an on-disk cache in the derivatives directory
+        (Default: False)
+
+    mapmri_fit_by_blocks : traits.Bool
+        Fit MAP-MRI on blocks of voxels of the brain mask
+        (Default: False)
+
+    mapmri_memory_budget : traits.Float
+        Approximate total memory in GB of the MAP-MRI fit by blocks
+        (masked signal, output maps and blocks in flight)
+        (Default: 2.0)
+
+    number_of_workers : traits.Int
+        Number of worker processes used to fit the models
+        on blocks of voxels of the brain mask
+        (Default: 1)
     """
 
     imaging_model = Str
@@ -194,6 +218,25 @@ class DipyReconConfig(HasTraits):
     shore_positive_constraint = traits.Bool(
         False, usedefault=True, desc="Constrain the propagator to be positive."
     )
+    shore_memmap = traits.Bool(
+        False, usedefault=True, desc="Preallocate the ODF outputs as memory-mapped arrays on disk."
+    )
+
+    use_model_cache = traits.Bool(
+        False, usedefault=True, desc="Reuse models across subjects sharing the same gradient table and reruns."
+    )
+
+    mapmri_fit_by_blocks = traits.Bool(
+        False, usedefault=True, desc="Fit MAP-MRI on blocks of voxels of the brain mask."
+    )
+
+    mapmri_memory_budget = traits.Float(
+        2.0, usedefault=True, desc="Total memory (in GB) of the MAP-MRI fit by blocks."
+    )
+
+    number_of_workers = traits.Int(
+        1, usedefault=True, desc="Number of worker processes fitting the models on blocks of voxels."
+    )
 
     def _imaging_model_changed(self, new):
         """Update ``local_model_editor`` and ``self.local_model`` when ``imaging_model`` is updated.
@@ -305,7 +348,7 @@ class MRtrixReconConfig(HasTraits):
             }
 
 
-def create_dipy_recon_flow(config):
+def create_dipy_recon_flow(config, model_cache_dir=None):
     """Create the reconstruction sub-workflow of the `DiffusionStage` using Dipy.
 
     Parameters
@@ -313,6 +356,9 @@ def create_dipy_recon_flow(config):
     config : DipyReconConfig
         Workflow configuration
 
+    model_cache_dir : string
+        Directory of the model cache used if ``config.use_model_cache``
+
     Returns
     -------
     flow : nipype.pipeline.engine.Workflow
@@ -382,6 +428,8 @@ def create_dipy_recon_flow(config):
     if config.imaging_model != "DSI":
         # Tensor -> EigenVectors / FA, AD, MD, RD maps
         dipy_tensor = pe.Node(interface=DTIEstimateResponseSH(), name="dipy_tensor")
+        if config.use_model_cache and model_cache_dir is not None:
+            dipy_tensor.inputs.model_cache_dir = model_cache_dir
         dipy_tensor.inputs.auto = True
         dipy_tensor.inputs.roi_radius = 10
         dipy_tensor.inputs.fa_thresh = config.single_fib_thr
@@ -415,6 +463,8 @@ def create_dipy_recon_flow(config):
         else:
             # Perform spherical deconvolution
             dipy_CSD = pe.Node(interface=CSD(), name="dipy_CSD")
+            if config.use_model_cache and model_cache_dir is not None:
+                dipy_CSD.inputs.model_cache_dir = model_cache_dir
 
             dipy_CSD.inputs.save_shm_coeff = True
             dipy_CSD.inputs.out_shm_coeff = "diffusion_shm_coeff.nii.gz"
@@ -455,6 +505,8 @@ def create_dipy_recon_flow(config):
     else:
         # Perform SHORE reconstruction (DSI)
         dipy_SHORE = pe.Node(interface=SHORE(), name="dipy_SHORE")
+        if config.use_model_cache and model_cache_dir is not None:
+            dipy_SHORE.inputs.model_cache_dir = model_cache_dir
 
         if config.tracking_processing_tool == "MRtrix":
             dipy_SHORE.inputs.tracking_processing_tool = "mrtrix"
@@ -468,6 +520,8 @@ def create_dipy_recon_flow(config):
         dipy_SHORE.inputs.tau = config.shore_tau
         dipy_SHORE.inputs.constrain_e0 = config.shore_constrain_e0
         dipy_SHORE.inputs.positive_constraint = config.shore_positive_constraint
+        dipy_SHORE.inputs.number_of_workers = config.number_of_workers
+        dipy_SHORE.inputs.use_memmap = config.shore_memmap
 
         shore_maps_merge = pe.Node(interface=util.Merge(3), name="merge_shore_maps")
         # fmt:off
@@ -489,6 +543,8 @@ def create_dipy_recon_flow(config):
 
     if config.mapmri:
         dipy_MAPMRI = pe.Node(interface=MAPMRI(), name="dipy_mapmri")
+        if config.use_model_cache and model_cache_dir is not None:
+            dipy_MAPMRI.inputs.model_cache_dir = model_cache_dir
 
         dipy_MAPMRI.inputs.laplacian_regularization = config.laplacian_regularization
         dipy_MAPMRI.inputs.laplacian_weighting = config.laplacian_weighting
@@ -496,6 +552,9 @@ def create_dipy_recon_flow(config):
         dipy_MAPMRI.inputs.radial_order = config.radial_order
         dipy_MAPMRI.inputs.small_delta = config.small_delta
         dipy_MAPMRI.inputs.big_delta = config.big_delta
+        dipy_MAPMRI.inputs.fit_by_blocks = config.mapmri_fit_by_blocks
+        dipy_MAPMRI.inputs.number_of_workers = config.number_of_workers
+        dipy_MAPMRI.inputs.memory_budget = config.mapmri_memory_budget
 
         mapmri_maps_merge = pe.Node(interface=util.Merge(8), name="merge_mapmri_maps")
 
@@ -505,6 +564,7 @@ def create_dipy_recon_flow(config):
                 (inputnode, dipy_MAPMRI, [("diffusion_resampled", "in_file")]),
                 (inputnode, dipy_MAPMRI, [("bvals", "in_bval")]),
                 (flip_bvecs, dipy_MAPMRI, [("bvecs_flipped", "in_bvec")]),
+                (inputnode, dipy_MAPMRI, [("brain_mask_resampled", "in_mask")]),
                 (dipy_MAPMRI, mapmri_maps_merge, [("rtop_file", "in1"),
                                                   ("rtap_file", "in2"),
                                                   ("rtpp_file", "in3"),
@@ -76,6 +76,19 @@ class DipyTrackingConfig(HasTraits):
         Seed from Grey Matter / White Matter interface
         (requires Anatomically-Constrained Tractography (ACT))
         (Default: False)
+
+    sharded_tracking : traits.Bool
+        Track shards of seeds in worker processes and merge them on disk
+        (Default: False)
+
+    number_of_workers : traits.Int
+        Number of worker processes used by sharded tracking
+        (Default: 1)
+
+    stream_seeds : traits.Bool
+        Generate the seeds of the tensor-informed EuDX tractography
+        by batches passed directly to the tracker
+        (Default: False)
     """
 
     imaging_model = Str
@@ -101,6 +114,16 @@ class DipyTrackingConfig(HasTraits):
         desc="Seed from Grey Matter / White Matter interface (requires Anatomically-Constrained Tractography (ACT))",
     )
 
+    sharded_tracking = traits.Bool(
+        False,
+        desc="Track shards of seeds in worker processes and merge them on disk",
+    )
+    number_of_workers = Int(1, desc="Number of worker processes used by sharded tracking")
+    stream_seeds = traits.Bool(
+        False,
+        desc="Generate the seeds of the tensor-informed EuDX tractography by batches passed directly to the tracker",
+    )
+
     # fast_number_of_classes = Int(3)
 
     def _SD_changed(self, new):
@@ -345,6 +368,7 @@ def create_dipy_tracking_flow(config):
         dipy_tracking.inputs.fa_thresh = config.fa_thresh
         dipy_tracking.inputs.max_angle = config.max_angle
         dipy_tracking.inputs.step_size = config.step_size
+        dipy_tracking.inputs.stream_seeds = config.stream_seeds
 
         # fmt:off
         flow.connect(
@@ -374,6 +398,8 @@ def create_dipy_tracking_flow(config):
             dipy_tracking.inputs.use_act = config.use_act
             dipy_tracking.inputs.use_act = config.seed_from_gmwmi
             dipy_tracking.inputs.seed_density = config.seed_density
+            dipy_tracking.inputs.sharded_tracking = config.sharded_tracking
+            dipy_tracking.inputs.number_of_workers = config.number_of_workers
             # dipy_tracking.inputs.fast_number_of_classes = config.fast_number_of_classes
 
             if config.imaging_model == "DSI":
@@ -419,6 +445,8 @@ def create_dipy_tracking_flow(config):
             dipy_tracking.inputs.use_act = config.use_act
             dipy_tracking.inputs.seed_from_gmwmi = config.seed_from_gmwmi
             dipy_tracking.inputs.seed_density = config.seed_density
+            dipy_tracking.inputs.sharded_tracking = config.sharded_tracking
+            dipy_tracking.inputs.number_of_workers = config.number_of_workers
             # dipy_tracking.inputs.fast_number_of_classes = config.fast_number_of_classes
 
             if config.imaging_model == "DSI":
@@ -8,7 +8,7 @@
 
 # General imports
 import os
-from traits.api import HasTraits, Enum
+from traits.api import HasTraits, Enum, Bool, Int
 
 # Nipype imports
 import nipype.pipeline.engine as pe
@@ -28,6 +28,15 @@ class EEGInverseSolutionConfig(HasTraits):
         Specify the inverse solution algorithm
         (Default: Cartool-LAURA)
 
+    mne_streaming : traits.Bool
+        Apply the MNE inverse operator epoch by epoch and extract the
+        ROI time courses per batch of epochs to bound the memory usage
+        (Default: True)
+
+    mne_epochs_batch_size : traits.Int
+        Number of epochs per batch in streaming mode
+        (Default: 32)
+
     See Also
     --------
     cmp.stages.eeg.inverse_solution.EEGInverseSolutionStage
@@ -38,6 +47,13 @@ class EEGInverseSolutionConfig(HasTraits):
         desc="Specify the inverse solution algorithm"
     )
 
+    mne_streaming = Bool(
+        True,
+        desc="Apply the MNE inverse operator epoch by epoch and extract the ROI time courses per batch of epochs"
+    )
+
+    mne_epochs_batch_size = Int(32, desc="Number of epochs per batch in streaming mode")
+
 
 class EEGInverseSolutionStage(Stage):
     """Class that represents the reconstruction of the inverse solutions stage of a :class:`~cmp.pipelines.functional.eeg.EEGPipeline`.
@@ -85,7 +101,7 @@ class EEGInverseSolutionStage(Stage):
             "inv_fname",
             "parcellation",
         ]
-        self.outputs = ["roi_ts_file", "fwd_fname"]
+        self.outputs = ["roi_ts_file", "roi_ts_npy_file", "fwd_fname"]
 
     def create_workflow(self, flow, inputnode, outputnode):
         """Create the stage workflow.
@@ -121,6 +137,8 @@ class EEGInverseSolutionStage(Stage):
             covmat_node = pe.Node(CreateCov(), name="createcov")  # compute the noise covariance
             fwd_node = pe.Node(CreateFwd(), name="createfwd")  # compute the forward solution
             invsol_node = pe.Node(MNEInverseSolution(), name="invsol")  # compute the inverse operator
+            invsol_node.inputs.streaming = self.config.mne_streaming
+            invsol_node.inputs.epochs_batch_size = self.config.mne_epochs_batch_size
 
             # fmt: off
             flow.connect(
@@ -154,7 +172,8 @@ class EEGInverseSolutionStage(Stage):
                                                 ("noise_cov_fname", "noise_cov_fname")]),
                     (fwd_node, invsol_node, [("has_run", "fwd_has_run")]),
                     (invsol_node, outputnode, [("fwd_fname", "fwd_fname"),
-                                               ("roi_ts_file", "roi_ts_file")])
+                                               ("roi_ts_file", "roi_ts_file"),
+                                               ("roi_ts_npy_file", "roi_ts_npy_file")])
                 ]
             )
             # fmt: on
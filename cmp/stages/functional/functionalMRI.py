@@ -13,6 +13,7 @@ from traits.api import *
 
 
 # Nipype imports
+from nipype import logging
 import nipype.pipeline.engine as pe
 from nipype.interfaces.base import isdefined
 import nipype.interfaces.utility as util
@@ -20,7 +21,15 @@ from nipype.interfaces import afni
 
 # Own imports
 from cmp.stages.common import Stage
-from cmtklib.functionalMRI import Scrubbing, Detrending, NuisanceRegression
+from cmtklib.functionalMRI import (
+    Scrubbing,
+    Detrending,
+    NuisanceRegression,
+    BandpassFiltering,
+    FunctionalPostProcessing,
+)
+
+iflogger = logging.getLogger("nipype.interface")
 
 
 class FunctionalMRIConfig(HasTraits):
@@ -44,6 +53,20 @@ class FunctionalMRIConfig(HasTraits):
         Perform motion nuisance regression
         (Default: True)
 
+    acompcor : traits.Bool
+        Regress out the principal components of the signals
+        in the WM and CSF masks (aCompCor)
+        (Default: False)
+
+    tcompcor : traits.Bool
+        Regress out the principal components of the signals of the
+        brain voxels with the highest temporal variance (tCompCor)
+        (Default: False)
+
+    compcor_n_components : traits.Int
+        Number of aCompCor / tCompCor components
+        (Default: 5)
+
     detrending = Bool
         Perform detrending
         (Default: True)
@@ -60,10 +83,33 @@ class FunctionalMRIConfig(HasTraits):
         Highpass filter frequency
         (Default: 0.1)
 
+    bandpass_method = Enum(["AFNI", "Native"])
+        Filter with AFNI ``3dBandpass`` or with the in-memory
+        NumPy FFT implementation (:class:`~cmtklib.functionalMRI.BandpassFiltering`)
+        (Default: "AFNI")
+
+    bandpass_orthogonalize = Bool
+        Orthogonalize the filtered signal to the filtered nuisance regressors
+        such that filtering does not reintroduce them. Only available with the
+        "Native" method or `fused_postprocessing`, it is ignored with a warning
+        when filtering with AFNI
+        (Default: False)
+
     scrubbing = Bool
         Perform scrubbing
         (Default: True)
 
+    fused_postprocessing = Bool
+        Perform detrending, nuisance regression, bandpass filtering and scrubbing
+        in memory in a single node (:class:`~cmtklib.functionalMRI.FunctionalPostProcessing`)
+        instead of a chain of nodes that each read and write the fMRI volume
+        (Default: False)
+
+    save_intermediates = Bool
+        Save the detrended and nuisance regressed fMRI volumes when
+        `fused_postprocessing` is enabled
+        (Default: False)
+
     See Also
     --------
     cmp.stages.functional.functionalMRI.FunctionalMRIStage
@@ -76,15 +122,23 @@ class FunctionalMRIConfig(HasTraits):
     csf = Bool(True)
     wm = Bool(True)
     motion = Bool(True)
+    acompcor = Bool(False)
+    tcompcor = Bool(False)
+    compcor_n_components = Int(5)
 
     detrending = Bool(True)
     detrending_mode = Enum("linear", "quadratic")
 
     lowpass_filter = Float(0.01)
     highpass_filter = Float(0.1)
+    bandpass_method = Enum("AFNI", ["AFNI", "Native"])
+    bandpass_orthogonalize = Bool(False)
 
     scrubbing = Bool(True)
 
+    fused_postprocessing = Bool(False)
+    save_intermediates = Bool(False)
+
 
 class FunctionalMRIStage(Stage):
     """Class that represents the post-registration preprocessing stage of the `fMRIPipeline`.
@@ -132,6 +186,10 @@ class FunctionalMRIStage(Stage):
         outputnode : nipype.interfaces.utility.IdentityInterface
             Identity interface describing the outputs of the stage
         """
+        if self.config.fused_postprocessing:
+            self.create_fused_workflow(flow, inputnode, outputnode)
+            return
+
         if self.config.scrubbing and isdefined(inputnode.inputs.motion_par_file):
             scrubbing = pe.Node(interface=Scrubbing(), name="scrubbing")
             # fmt:off
@@ -176,12 +234,15 @@ class FunctionalMRIStage(Stage):
             interface=util.IdentityInterface(fields=["nuisance_output"]),
             name="nuisance_output",
         )
-        if (
+        has_nuisance = (
             self.config.wm
             or self.config.global_nuisance
             or self.config.csf
             or self.config.motion
-        ):
+            or self.config.acompcor
+            or self.config.tcompcor
+        )
+        if has_nuisance:
             nuisance = pe.Node(
                 interface=NuisanceRegression(), name="nuisance_regression"
             )
@@ -189,6 +250,11 @@ class FunctionalMRIStage(Stage):
             nuisance.inputs.csf_nuisance = self.config.csf
             nuisance.inputs.wm_nuisance = self.config.wm
             nuisance.inputs.motion_nuisance = self.config.motion
+            # The 6 motion parameters, their squares and those of the two previous volumes
+            nuisance.inputs.nuisance_motion_nb_reg = 36
+            nuisance.inputs.acompcor = self.config.acompcor
+            nuisance.inputs.tcompcor = self.config.tcompcor
+            nuisance.inputs.n_compcor_components = self.config.compcor_n_components
             nuisance.inputs.n_discard = self.config.discard_n_volumes
             # fmt:off
             flow.connect(
@@ -216,9 +282,33 @@ class FunctionalMRIStage(Stage):
             interface=util.IdentityInterface(fields=["filter_output"]),
             name="filter_output",
         )
-        if self.config.lowpass_filter > 0 or self.config.highpass_filter > 0:
+        if (
+            self.config.lowpass_filter > 0 or self.config.highpass_filter > 0
+        ) and self.config.bandpass_method == "Native":
+            filtering = pe.Node(interface=BandpassFiltering(), name="temporal_filter")
+            # lowpass_filter and highpass_filter are the lower and upper cutoff frequencies
+            filtering.inputs.highpass = self.config.lowpass_filter
+            filtering.inputs.lowpass = self.config.highpass_filter
+            # fmt:off
+            flow.connect(
+                [
+                    (nuisance_output, filtering, [("nuisance_output", "in_file")]),
+                    (filtering, filter_output, [("out_file", "filter_output")]),
+                ]
+            )
+            # fmt:on
+            if self.config.bandpass_orthogonalize and has_nuisance:
+                self._connect_orthogonalize_regressors(flow, nuisance, filtering)
+        elif self.config.lowpass_filter > 0 or self.config.highpass_filter > 0:
             from cmtklib.interfaces.afni import Bandpass
 
+            if self.config.bandpass_orthogonalize:
+                iflogger.warning(
+                    "Orthogonalization to the nuisance regressors (bandpass_orthogonalize) is only "
+                    "available with the Native band-pass filter or the fused post-processing: "
+                    "it is ignored with AFNI 3dBandpass"
+                )
+
             filtering = pe.Node(interface=Bandpass(), name="temporal_filter")
             # filtering = pe.Node(interface=afni.Bandpass(),name='temporal_filter')
             converter = pe.Node(
@@ -257,16 +347,136 @@ class FunctionalMRIStage(Stage):
         flow.connect([(filter_output, outputnode, [("filter_output", "func_file")])])
         # fmt:on
 
+    def _connect_orthogonalize_regressors(self, flow, nuisance, filtering):
+        """Connect the nuisance regressors to the orthogonalization input of the native band-pass filter.
+
+        The regressors are the ones regressed out by the nuisance regression node,
+        including the expansion of the motion parameters.
+        """
+        regressors = [
+            ("averageGlobal_npy", self.config.global_nuisance),
+            ("averageCSF_npy", self.config.csf),
+            ("averageWM_npy", self.config.wm),
+            ("motion_npy", self.config.motion),
+            ("acompcor_npy", self.config.acompcor),
+            ("tcompcor_npy", self.config.tcompcor),
+        ]
+        regressors = [field for field, enabled in regressors if enabled]
+        merge = pe.Node(interface=util.Merge(len(regressors)), name="orthogonalize_regressors")
+        for i, field in enumerate(regressors):
+            flow.connect([(nuisance, merge, [(field, f"in{i + 1}")])])
+        # fmt:off
+        flow.connect([(merge, filtering, [("out", "orthogonalize_file")])])
+        # fmt:on
+
+    def create_fused_workflow(self, flow, inputnode, outputnode):
+        """Create the stage workflow with a single node that post-processes the fMRI volume in memory.
+
+        Parameters
+        ----------
+        flow : nipype.pipeline.engine.Workflow
+            The nipype.pipeline.engine.Workflow instance of the fMRI pipeline
+
+        inputnode : nipype.interfaces.utility.IdentityInterface
+            Identity interface describing the inputs of the stage
+
+        outputnode : nipype.interfaces.utility.IdentityInterface
+            Identity interface describing the outputs of the stage
+        """
+        postprocessing = pe.Node(interface=FunctionalPostProcessing(), name="postprocessing")
+        postprocessing.inputs.detrending = self.config.detrending
+        postprocessing.inputs.detrending_mode = self.config.detrending_mode
+        postprocessing.inputs.global_nuisance = self.config.global_nuisance
+        postprocessing.inputs.csf_nuisance = self.config.csf
+        postprocessing.inputs.wm_nuisance = self.config.wm
+        postprocessing.inputs.motion_nuisance = self.config.motion
+        # The 6 motion parameters, their squares and those of the two previous volumes
+        postprocessing.inputs.nuisance_motion_nb_reg = 36
+        postprocessing.inputs.acompcor = self.config.acompcor
+        postprocessing.inputs.tcompcor = self.config.tcompcor
+        postprocessing.inputs.n_compcor_components = self.config.compcor_n_components
+        # lowpass_filter and highpass_filter are the lower and upper cutoff frequencies
+        postprocessing.inputs.highpass = self.config.lowpass_filter
+        postprocessing.inputs.lowpass = self.config.highpass_filter
+        postprocessing.inputs.orthogonalize = self.config.bandpass_orthogonalize
+        postprocessing.inputs.scrubbing = (
+            self.config.scrubbing and isdefined(inputnode.inputs.motion_par_file)
+        )
+        postprocessing.inputs.save_intermediates = self.config.save_intermediates
+        # fmt:off
+        flow.connect(
+            [
+                (inputnode, postprocessing, [("preproc_file", "in_file"),
+                                             ("eroded_brain", "brainfile"),
+                                             ("eroded_csf", "csf_file"),
+                                             ("registered_wm", "wm_file"),
+                                             ("motion_par_file", "motion_file"),
+                                             ("registered_roi_volumes", "gm_file")]),
+                (postprocessing, outputnode, [("out_file", "func_file")]),
+            ]
+        )
+        # fmt:on
+        if postprocessing.inputs.scrubbing:
+            # fmt:off
+            flow.connect(
+                [
+                    (postprocessing, outputnode, [("fd_npy", "FD"),
+                                                  ("dvars_npy", "DVARS")]),
+                ]
+            )
+            # fmt:on
+
+    def get_node_resources(self, input_memory_gb):
+        """Return the estimated resources of the most demanding nodes of the stage.
+
+        See Also
+        --------
+        cmp.stages.common.Stage.get_node_resources
+        """
+        # Time-series are loaded with several float64 working copies
+        mem_gb = 0.5 + 3 * input_memory_gb
+        return {
+            # The volume and the time-series of the masked voxels as float32
+            "postprocessing": (0.5 + 1.5 * input_memory_gb, None),
+            "detrending": (mem_gb, None),
+            "nuisance_regression": (mem_gb, None),
+            "temporal_filter": (mem_gb, None),
+            "scrubbing": (mem_gb, None),
+        }
+
     def define_inspect_outputs(self):  # pragma: no cover
         """Update the `inspect_outputs` class attribute.
 
         It contains a dictionary of stage outputs with corresponding commands for visual inspection.
         """
+        if self.config.fused_postprocessing:
+            res_dir = os.path.join(self.stage_dir, "postprocessing")
+            for key, filename in [
+                ("Detrending output", "fMRI_detrending.nii.gz"),
+                ("Regression output", "fMRI_nuisance.nii.gz"),
+                ("Post-processing output", "fMRI_postprocessing.nii.gz"),
+            ]:
+                out_file = os.path.join(res_dir, filename)
+                if os.path.exists(out_file):
+                    self.inspect_outputs_dict[key] = [
+                        "fsleyes",
+                        "-sdefault",
+                        out_file,
+                        "-cm",
+                        "brain_colours_blackbdy_iso",
+                    ]
+            self.inspect_outputs = sorted(
+                [key for key in list(self.inspect_outputs_dict.keys())], key=str.lower
+            )
+            return
+
         if (
             self.config.wm
             or self.config.global_nuisance
             or self.config.csf
             or self.config.motion
+            or self.config.acompcor
+            or self.config.tcompcor
         ):
             res_dir = os.path.join(self.stage_dir, "nuisance_regression")
             nuis = os.path.join(res_dir, "fMRI_nuisance.nii.gz")
@@ -290,7 +500,9 @@ class FunctionalMRIStage(Stage):
                 ]
 
         if self.config.lowpass_filter > 0 or self.config.highpass_filter > 0:
-            res_dir = os.path.join(self.stage_dir, "converter")
+            res_dir = os.path.join(
+                self.stage_dir, "temporal_filter" if self.config.bandpass_method == "Native" else "converter"
+            )
             filt = os.path.join(res_dir, "fMRI_bandpass.nii.gz")
             if os.path.exists(filt):
                 self.inspect_outputs_dict["Filter output"] = [
@@ -312,7 +524,13 @@ class FunctionalMRIStage(Stage):
         -------
         `True` if the stage has been run successfully
         """
-        if self.config.lowpass_filter > 0 or self.config.highpass_filter > 0:
+        if self.config.fused_postprocessing:
+            return os.path.exists(
+                os.path.join(
+                    self.stage_dir, "postprocessing", "result_postprocessing.pklz"
+                )
+            )
+        elif self.config.lowpass_filter > 0 or self.config.highpass_filter > 0:
             return os.path.exists(
                 os.path.join(
                     self.stage_dir, "temporal_filter", "result_temporal_filter.pklz"
@@ -327,6 +545,8 @@ class FunctionalMRIStage(Stage):
             or self.config.global_nuisance
             or self.config.csf
             or self.config.motion
+            or self.config.acompcor
+            or self.config.tcompcor
         ):
             return os.path.exists(
                 os.path.join(
@@ -66,6 +66,12 @@ class ParcellationConfig(HasTraits):
         memory usage.
         (Default: 'double')
 
+    thalamic_nuclei_low_memory : traits.Bool
+        Correct the thalamic nuclei probability maps in single
+        precision within their bounding box only to reduce
+        memory usage.
+        (Default: False)
+
     segment_hippocampal_subfields : traits.Bool
         Perform and include FreeSurfer hippocampal subfields segmentation in
         'Lausanne2018' parcellation
@@ -76,6 +82,11 @@ class ParcellationConfig(HasTraits):
         'Lausanne2018' parcellation
         (Default: True)
 
+    number_of_threads : traits.Int
+        Maximal number of FreeSurfer commands run concurrently
+        to create the 'Lausanne2018' parcellation
+        (Default: 1)
+
     atlas_info : traits.Dict
         Dictionary storing information of atlases in the form
         >>> atlas_info = {
@@ -101,8 +112,10 @@ class ParcellationConfig(HasTraits):
     )
     include_thalamic_nuclei_parcellation = Bool(True)
     ants_precision_type = Enum(["double", "float"])
+    thalamic_nuclei_low_memory = Bool(False)
     segment_hippocampal_subfields = Bool(True)
     segment_brainstem = Bool(True)
+    number_of_threads = Int(1, desc="Maximal number of FreeSurfer commands run concurrently")
     # csf_file = File(exists=True)
     # brain_file = File(exists=True)
     graphml_file = File(exists=True)
@@ -183,6 +196,7 @@ class ParcellationStage(Stage):
             )
             parc_node.inputs.parcellation_scheme = self.config.parcellation_scheme
             parc_node.inputs.erode_masks = True
+            parc_node.inputs.number_of_threads = self.config.number_of_threads
             # fmt: off
             flow.connect(
                 [
@@ -275,6 +289,9 @@ class ParcellationStage(Stage):
                     parcThal.inputs.ants_precision_type = (
                         self.config.ants_precision_type
                     )
+                    parcThal.inputs.low_memory = (
+                        self.config.thalamic_nuclei_low_memory
+                    )
                     # fmt: off
                     flow.connect(
                         [
@@ -510,6 +527,20 @@ class ParcellationStage(Stage):
         )
         # fmt: on
 
+    def get_node_resources(self, input_memory_gb):
+        """Return the estimated resources of the most demanding nodes of the stage.
+
+        See Also
+        --------
+        cmp.stages.common.Stage.get_node_resources
+        """
+        return {
+            f"{self.config.parcellation_scheme}_parcellation": (2.0, self.config.number_of_threads),
+            "parcBrainStem": (4.0, None),
+            "parcHippo": (4.0, None),
+            "parcThal": (4.0 if self.config.thalamic_nuclei_low_memory else 8.0, None),
+        }
+
     def define_inspect_outputs(self):  # pragma: no cover
         """Update the `inspect_outputs` class attribute.
 
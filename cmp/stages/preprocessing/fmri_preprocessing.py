@@ -20,7 +20,7 @@ import nipype.interfaces.utility as util
 # Own imports
 from cmtklib.interfaces.afni import Despike
 from cmp.stages.common import Stage
-from cmtklib.functionalMRI import DiscardTP
+from cmtklib.functionalMRI import DiscardTP, Despiking
 
 
 class PreprocessingConfig(HasTraits):
@@ -36,6 +36,11 @@ class PreprocessingConfig(HasTraits):
 
         (Default: True)
 
+    despiking_method : traits.Enum(["AFNI", "Native"])
+        Despike with AFNI ``3dDespike`` or with the in-memory
+        NumPy implementation (:class:`~cmtklib.functionalMRI.Despiking`)
+        (Default: "AFNI")
+
     slice_timing : traits.Enum
         Slice acquisition order for slice timing correction that can be:
         "bottom-top interleaved", "bottom-top interleaved", "top-bottom interleaved",
@@ -57,6 +62,7 @@ class PreprocessingConfig(HasTraits):
 
     discard_n_volumes = Int("5")
     despiking = Bool(True)
+    despiking_method = Enum("AFNI", ["AFNI", "Native"])
     slice_timing = Enum(
         "none",
         [
@@ -138,7 +144,17 @@ class PreprocessingStage(Stage):
             interface=util.IdentityInterface(fields=["despiking_output"]),
             name="despkiking_output",
         )
-        if self.config.despiking:
+        if self.config.despiking and self.config.despiking_method == "Native":
+            despike = pe.Node(interface=Despiking(), name="despike")
+            # fmt:off
+            flow.connect(
+                [
+                    (discard_output, despike, [("discard_output", "in_file")]),
+                    (despike, despiking_output, [("out_file", "despiking_output")]),
+                ]
+            )
+            # fmt:on
+        elif self.config.despiking:
             despike = pe.Node(interface=Despike(), name="afni_despike")
             converter = pe.Node(
                 interface=afni.AFNItoNIFTI(out_file="fMRI_despike.nii.gz"),
@@ -242,6 +258,21 @@ class PreprocessingStage(Stage):
                 )
                 # fmt:on
 
+    def get_node_resources(self, input_memory_gb):
+        """Return the estimated resources of the most demanding nodes of the stage.
+
+        See Also
+        --------
+        cmp.stages.common.Stage.get_node_resources
+        """
+        return {
+            "afni_despike": (0.5 + 2 * input_memory_gb, None),
+            # The volume and the time-series of the non-zero voxels as float32
+            "despike": (0.5 + input_memory_gb, None),
+            "slice_timing": (0.5 + 2 * input_memory_gb, None),
+            "motion_correction": (0.5 + 2 * input_memory_gb, None),
+        }
+
     def define_inspect_outputs(self):  # pragma: no cover
         """Update the `inspect_outputs` class attribute.
 
@@ -249,7 +280,9 @@ class PreprocessingStage(Stage):
         """
         # print('Stage (inspect_outputs): '.format(self.stage_dir))
         if self.config.despiking:
-            despike_dir = os.path.join(self.stage_dir, "converter")
+            despike_dir = os.path.join(
+                self.stage_dir, "despike" if self.config.despiking_method == "Native" else "converter"
+            )
             despike = os.path.join(despike_dir, "fMRI_despike.nii.gz")
             if os.path.exists(despike):
                 self.inspect_outputs_dict["Spike corrected image"] = [
@@ -303,6 +336,10 @@ class PreprocessingStage(Stage):
             return os.path.exists(
                 os.path.join(self.stage_dir, "slice_timing", "result_slice_timing.pklz")
             )
+        elif self.config.despiking and self.config.despiking_method == "Native":
+            return os.path.exists(
+                os.path.join(self.stage_dir, "despike", "result_despike.pklz")
+            )
         elif self.config.despiking:
             return os.path.exists(
                 os.path.join(self.stage_dir, "converter", "result_converter.pklz")
@@ -1058,6 +1058,21 @@ class PreprocessingStage(Stage):
             )
             # fmt: on
 
+    def get_node_resources(self, input_memory_gb):
+        """Return the estimated resources of the most demanding nodes of the stage.
+
+        See Also
+        --------
+        cmp.stages.common.Stage.get_node_resources
+        """
+        return {
+            "dwi_denoise": (1.0 + 3 * input_memory_gb, None),
+            "dwi_biascorrect": (1.0 + 2 * input_memory_gb, None),
+            "eddy": (2.0 + 4 * input_memory_gb, None),
+            "eddy_correct": (1.0 + 2 * input_memory_gb, None),
+            "mrtrix_5tt": (2.0, None),
+        }
+
     def define_inspect_outputs(self):  # pragma: no cover
         """Update the `inspect_outputs` class attribute.
 
@@ -1274,6 +1274,20 @@ class RegistrationStage(Stage):
 
         return flow
 
+    def get_node_resources(self, input_memory_gb):
+        """Return the estimated resources of the most demanding nodes of the stage.
+
+        See Also
+        --------
+        cmp.stages.common.Stage.get_node_resources
+        """
+        # The number of threads of the ANTs registrations is fixed in create_workflow()
+        return {
+            "linear_registration": (2.0, 8 if self.config.registration_mode == "ANTs" else None),
+            "SyN_registration": (4.0, 8),
+            "bbregister": (2.0, None),
+        }
+
     def define_inspect_outputs(self):  # pragma: no cover
         """Update the `inspect_outputs` class attribute.
 
@@ -561,6 +561,21 @@ class SegmentationStage(Stage):
         )
         # fmt: on
 
+    def get_node_resources(self, input_memory_gb):
+        """Return the estimated resources of the most demanding nodes of the stage.
+
+        See Also
+        --------
+        cmp.stages.common.Stage.get_node_resources
+        """
+        n_threads = self.config.number_of_threads
+        return {
+            "reconall": (3.0, n_threads),
+            "autorecon1": (2.0, n_threads),
+            "reconall23": (3.0, n_threads),
+            "antsBET": (2.0 + 4 * input_memory_gb, n_threads),
+        }
+
     def define_inspect_outputs(self, debug=False):
         """Update the `inspect_outputs` class attribute.
 
@@ -0,0 +1,13 @@
+# Copyright (C) 2009-2022, Ecole Polytechnique Federale de Lausanne (EPFL) and
+# Hospital Center and University of Lausanne (UNIL-CHUV), Switzerland, and CMP3 contributors
+# All rights reserved.
+#
+#  This software is distributed under the open-source license Modified BSD.
+
+"""Benchmarks of the CMTK hot paths on synthetic data.
+
+The synthetic data generators are defined in :mod:`cmtklib.benchmark.synthetic`
+and the benchmarks in :mod:`cmtklib.benchmark.suite`, which can be run with::
+
+    $ python -m cmtklib.benchmark.suite --output benchmark.json
+"""
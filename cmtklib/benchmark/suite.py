@@ -0,0 +1,471 @@
+# Copyright (C) 2009-2022, Ecole Polytechnique Federale de Lausanne (EPFL) and
+# Hospital Center and University of Lausanne (UNIL-CHUV), Switzerland, and CMP3 contributors
+# All rights reserved.
+#
+#  This software is distributed under the open-source license Modified BSD.
+
+"""Module that defines the benchmarks of the CMTK hot paths and the script to run them.
+
+Each benchmark generates its synthetic inputs (not timed) and times the
+processing at several sizes (``small``, ``medium`` and ``large``). Each case is
+run in a separate process so that its peak memory can be measured. Results are
+saved as JSON and can be compared with the results of another version::
+
+    $ python -m cmtklib.benchmark.suite --output v3.1.0.json
+    $ python -m cmtklib.benchmark.suite --output dev.json --compare v3.1.0.json
+
+The script exits with code 1 if one case is slower than in the compared results
+by more than the given threshold.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from cmp.info import __version__
+from cmtklib.benchmark import synthetic
+
+BENCHMARKS = {}
+
+
+def register(name, sizes):
+    """Decorator that registers a benchmark.
+
+    The decorated function is called with the working directory of the case and the
+    parameters of the size. It generates the inputs and returns the function to time.
+
+    Parameters
+    ----------
+    name : string
+        Name of the benchmark
+
+    sizes : dict
+        Parameters of the benchmark for each size
+    """
+    def decorator(setup):
+        BENCHMARKS[name] = {"setup": setup, "sizes": sizes}
+        return setup
+    return decorator
+
+
+@register("cmat", sizes={
+    "small": {"shape": (48, 48, 48), "n_labels": (16, 32, 64, 128, 256), "n_fibers": 5000, "n_points": 50},
+    "medium": {"shape": (64, 64, 64), "n_labels": (32, 64, 128, 256, 512), "n_fibers": 50000, "n_points": 80},
+    "large": {"shape": (96, 96, 96), "n_labels": (95, 141, 246, 475, 1027), "n_fibers": 200000, "n_points": 100},
+})
+def bench_cmat(work_dir, shape, n_labels, n_fibers, n_points):
+    """Structural connectome of a random-walk tractogram (:func:`cmtklib.connectome.cmat`)."""
+    from cmtklib.connectome import cmat
+
+    parcellation = synthetic.make_parcellation(work_dir, shape=shape, n_labels=n_labels)
+    trk_file = synthetic.make_tractogram(
+        os.path.join(work_dir, "tractogram.trk"), parcellation["roi_volumes"][0],
+        n_fibers=n_fibers, n_points=n_points
+    )
+    return lambda: cmat(
+        intrk=trk_file,
+        roi_volumes=parcellation["roi_volumes"],
+        roi_graphmls=parcellation["roi_graphmls"],
+        parcellation_scheme="Lausanne2018",
+        compute_curvature=False,
+        output_types=["gPickle"],
+    )
+
+
+@register("rsfmri_cmat", sizes={
+    "small": {"shape": (32, 32, 32), "n_labels": (16, 32, 64, 128, 256), "n_timepoints": 150},
+    "medium": {"shape": (48, 48, 48), "n_labels": (32, 64, 128, 256, 512), "n_timepoints": 300},
+    "large": {"shape": (64, 64, 64), "n_labels": (95, 141, 246, 475, 1027), "n_timepoints": 600},
+})
+def bench_rsfmri_cmat(work_dir, shape, n_labels, n_timepoints):
+    """Functional connectome of a synthetic BOLD volume (:class:`cmtklib.connectome.RsfmriCmat`)."""
+    from cmtklib.connectome import RsfmriCmat
+
+    parcellation = synthetic.make_parcellation(work_dir, shape=shape, n_labels=n_labels, voxel_size=3.0)
+    bold = synthetic.make_bold(work_dir, parcellation, n_timepoints=n_timepoints)
+    interface = RsfmriCmat(
+        func_file=bold["bold"],
+        roi_volumes=parcellation["roi_volumes"],
+        roi_graphmls=parcellation["roi_graphmls"],
+        parcellation_scheme="Lausanne2018",
+        output_types=["gPickle"],
+    )
+    return interface.run
+
+
+@register("sliding_window_correlation", sizes={
+    "small": {"n_nodes": 128, "n_timepoints": 300},
+    "medium": {"n_nodes": 512, "n_timepoints": 600},
+    "large": {"n_nodes": 1024, "n_timepoints": 1200},
+})
+def bench_sliding_window_correlation(work_dir, n_nodes, n_timepoints):
+    """Dynamic functional connectivity (:func:`cmtklib.connectome.sliding_window_correlation`)."""
+    from cmtklib.connectome import sliding_window_correlation
+
+    rng = np.random.RandomState(0)
+    ts = synthetic.smooth_signals(rng, n_nodes, n_timepoints).astype(np.float32)
+    out_file = os.path.join(work_dir, "dynamic_fc.npy")
+    return lambda: sliding_window_correlation(ts, window_length=40, step=5, out_file=out_file)
+
+
+@register("nuisance_regression", sizes={
+    "small": {"shape": (12, 12, 12), "n_timepoints": 100},
+    "medium": {"shape": (20, 20, 20), "n_timepoints": 150},
+    "large": {"shape": (32, 32, 32), "n_timepoints": 200},
+})
+def bench_nuisance_regression(work_dir, shape, n_timepoints):
+    """Regression of the WM, CSF and motion signals (:class:`cmtklib.functionalMRI.NuisanceRegression`)."""
+    from cmtklib.functionalMRI import NuisanceRegression
+
+    parcellation = synthetic.make_parcellation(work_dir, shape=shape, n_labels=(2, 4, 8, 16, 32), voxel_size=3.0)
+    bold = synthetic.make_bold(work_dir, parcellation, n_timepoints=n_timepoints)
+    interface = NuisanceRegression(
+        in_file=bold["bold"],
+        brainfile=bold["brain_mask"],
+        csf_file=bold["csf_mask"],
+        wm_file=bold["wm_mask"],
+        motion_file=bold["motion"],
+        gm_file=parcellation["roi_volumes"],
+        global_nuisance=False,
+        csf_nuisance=True,
+        wm_nuisance=True,
+        motion_nuisance=True,
+        nuisance_motion_nb_reg=36,
+        n_discard=0,
+    )
+    return interface.run
+
+
+@register("detrending", sizes={
+    "small": {"shape": (32, 32, 32), "n_timepoints": 150},
+    "medium": {"shape": (48, 48, 48), "n_timepoints": 300},
+    "large": {"shape": (64, 64, 64), "n_timepoints": 600},
+})
+def bench_detrending(work_dir, shape, n_timepoints):
+    """Quadratic detrending of a BOLD volume (:class:`cmtklib.functionalMRI.Detrending`)."""
+    from cmtklib.functionalMRI import Detrending
+
+    parcellation = synthetic.make_parcellation(work_dir, shape=shape, n_labels=(8, 16, 32, 64, 128), voxel_size=3.0)
+    bold = synthetic.make_bold(work_dir, parcellation, n_timepoints=n_timepoints)
+    interface = Detrending(in_file=bold["bold"], gm_file=parcellation["roi_volumes"], mode="quadratic")
+    return interface.run
+
+
+@register("scrubbing", sizes={
+    "small": {"shape": (32, 32, 32), "n_timepoints": 150},
+    "medium": {"shape": (48, 48, 48), "n_timepoints": 300},
+    "large": {"shape": (64, 64, 64), "n_timepoints": 600},
+})
+def bench_scrubbing(work_dir, shape, n_timepoints):
+    """Computation of FD and DVARS (:class:`cmtklib.functionalMRI.Scrubbing`)."""
+    from cmtklib.functionalMRI import Scrubbing
+
+    parcellation = synthetic.make_parcellation(work_dir, shape=shape, n_labels=(8, 16, 32, 64, 128), voxel_size=3.0)
+    bold = synthetic.make_bold(work_dir, parcellation, n_timepoints=n_timepoints)
+    interface = Scrubbing(
+        in_file=bold["bold"],
+        wm_mask=bold["wm_mask"],
+        gm_file=parcellation["roi_volumes"],
+        motion_parameters=bold["motion"],
+    )
+    return interface.run
+
+
+@register("functional_postprocessing", sizes={
+    "small": {"shape": (32, 32, 32), "n_timepoints": 150},
+    "medium": {"shape": (48, 48, 48), "n_timepoints": 300},
+    "large": {"shape": (64, 64, 64), "n_timepoints": 600},
+})
+def bench_functional_postprocessing(work_dir, shape, n_timepoints):
+    """In-memory post-processing of a BOLD volume (:class:`cmtklib.functionalMRI.FunctionalPostProcessing`)."""
+    from cmtklib.functionalMRI import FunctionalPostProcessing
+
+    parcellation = synthetic.make_parcellation(work_dir, shape=shape, n_labels=(8, 16, 32, 64, 128), voxel_size=3.0)
+    bold = synthetic.make_bold(work_dir, parcellation, n_timepoints=n_timepoints)
+    interface = FunctionalPostProcessing(
+        in_file=bold["bold"],
+        brainfile=bold["brain_mask"],
+        csf_file=bold["csf_mask"],
+        wm_file=bold["wm_mask"],
+        motion_file=bold["motion"],
+        gm_file=parcellation["roi_volumes"],
+        detrending_mode="quadratic",
+        csf_nuisance=True,
+        wm_nuisance=True,
+        motion_nuisance=True,
+        highpass=0.01,
+        lowpass=0.1,
+    )
+    return interface.run
+
+
+@register("create_roi_dilation", sizes={
+    "small": {"shape": (48, 48, 48), "n_labels": (16, 32, 64, 128, 256), "n_voxels": 1000},
+    "medium": {"shape": (96, 96, 96), "n_labels": (32, 64, 128, 256, 512), "n_voxels": 5000},
+    "large": {"shape": (128, 128, 128), "n_labels": (95, 141, 246, 475, 1027), "n_voxels": 20000},
+})
+def bench_create_roi_dilation(work_dir, shape, n_labels, n_voxels):
+    """Dilation of the cortical labels of `create_roi` (:func:`cmtklib.parcellation.dilate_labels`)."""
+    from cmtklib.parcellation import dilate_labels, neighbourhood_distances
+
+    labels, _ = synthetic.nested_labels(synthetic.ellipsoid_mask(shape), n_labels)
+    vol = labels[-1]
+    # Unlabel a random subset of the labeled voxels, which are then dilated
+    rng = np.random.RandomState(0)
+    voxels = np.argwhere(vol > 0)
+    voxels = tuple(voxels[rng.choice(len(voxels), size=n_voxels, replace=False)].T)
+    vol[voxels] = 0
+    dist = neighbourhood_distances((25, 25, 25))
+    return lambda: dilate_labels(vol.copy(), vol, voxels, dist)
+
+
+@register("parcellation_roi_volumes", sizes={
+    "small": {"shape": (64, 64, 64), "n_labels": (16, 32, 64, 128, 256)},
+    "medium": {"shape": (128, 128, 128), "n_labels": (32, 64, 128, 256, 512)},
+    "large": {"shape": (192, 192, 192), "n_labels": (95, 141, 246, 475, 1027)},
+})
+def bench_parcellation_roi_volumes(work_dir, shape, n_labels):
+    """Volumetry of the parcellation scales (:class:`cmtklib.parcellation.ComputeParcellationRoiVolumes`)."""
+    from cmtklib.parcellation import ComputeParcellationRoiVolumes
+
+    parcellation = synthetic.make_parcellation(work_dir, shape=shape, n_labels=n_labels)
+    interface = ComputeParcellationRoiVolumes(
+        roi_volumes=parcellation["roi_volumes"],
+        roi_graphMLs=parcellation["roi_graphmls"],
+        parcellation_scheme="Lausanne2018",
+    )
+    return interface.run
+
+
+@register("cartool_inverse_roi_extraction", sizes={
+    "small": {"n_epochs": 20, "n_channels": 64, "n_solution_points": 1000, "n_rois": 68},
+    "medium": {"n_epochs": 50, "n_channels": 128, "n_solution_points": 3000, "n_rois": 114},
+    "large": {"n_epochs": 100, "n_channels": 256, "n_solution_points": 5000, "n_rois": 219},
+})
+def bench_cartool_inverse_roi_extraction(work_dir, n_epochs, n_channels, n_solution_points, n_rois):
+    """ROI time courses of EEG epochs with a Cartool inverse solution.
+
+    See :meth:`cmtklib.interfaces.pycartool.CartoolInverseSolutionROIExtraction.extract_roi_time_courses`.
+    """
+    from types import SimpleNamespace
+    import mne
+    from cmtklib.interfaces.pycartool import CartoolInverseSolutionROIExtraction
+
+    eeg = synthetic.make_eeg_epochs(
+        n_epochs=n_epochs, n_channels=n_channels, n_solution_points=n_solution_points, n_rois=n_rois
+    )
+    info = mne.create_info(n_channels, eeg["sfreq"], ch_types="eeg")
+    epochs = mne.EpochsArray(eeg["data"], info, tmin=eeg["tmin"], verbose=False)
+    rois = SimpleNamespace(names=eeg["roi_names"], groups_of_indexes=eeg["groups_of_indexes"])
+    return lambda: CartoolInverseSolutionROIExtraction.extract_roi_time_courses(
+        epochs, eeg["K"], rois, {"toi_begin": 0, "toi_end": 0.25}
+    )
+
+
+def _peak_rss_mb():
+    """Return the peak resident memory of the process in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+
+def _run_case(name, size, work_dir, repeat):
+    """Set up and time one benchmark case. Run in a dedicated process."""
+    benchmark = BENCHMARKS[name]
+    params = benchmark["sizes"][size]
+    case_dir = tempfile.mkdtemp(prefix=f"{name}_{size}_", dir=work_dir)
+    cwd = os.getcwd()
+    try:
+        os.chdir(case_dir)
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            func = benchmark["setup"](case_dir, **params)
+            setup_rss_mb = _peak_rss_mb()
+            wall_times = []
+            cpu_times = []
+            for _ in range(repeat):
+                wall_start, cpu_start = time.perf_counter(), time.process_time()
+                func()
+                wall_times.append(time.perf_counter() - wall_start)
+                cpu_times.append(time.process_time() - cpu_start)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(case_dir, ignore_errors=True)
+    return {
+        "benchmark": name,
+        "size": size,
+        "params": params,
+        "wall_time_s": wall_times,
+        "cpu_time_s": cpu_times,
+        "best_s": min(wall_times),
+        "median_s": float(np.median(wall_times)),
+        "setup_peak_rss_mb": setup_rss_mb,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def run_benchmarks(names=None, sizes=None, repeat=3, work_dir=None):
+    """Run the benchmarks and return their results.
+
+    Parameters
+    ----------
+    names : list of string
+        Names of the benchmarks to run (Default: all)
+
+    sizes : list of string
+        Sizes to run (Default: ``["small", "medium"]``)
+
+    repeat : int
+        Number of times each case is timed
+
+    work_dir : string
+        Directory where the synthetic data are generated (Default: temporary directory)
+
+    Returns
+    -------
+    results : dict
+        Results with the fields `'cmp_version'`, `'created'`, `'machine'`, `'repeat'`
+        and `'results'` (one entry per case, or with an `'error'` field if it failed)
+    """
+    names = names or list(BENCHMARKS.keys())
+    sizes = sizes or ["small", "medium"]
+    work_dir = work_dir or tempfile.gettempdir()
+    os.makedirs(work_dir, exist_ok=True)
+
+    results = []
+    for name in names:
+        for size in sizes:
+            print(f"  * {name} ({size})... ", end="", flush=True)
+            # A new process per case isolates the peak memory of the cases
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("fork")) as executor:
+                try:
+                    result = executor.submit(_run_case, name, size, os.path.abspath(work_dir), repeat).result()
+                    print(f"{result['median_s']:.3f} s (peak memory: {result['peak_rss_mb']:.0f} MB)")
+                except Exception as e:  # pylint: disable=W0703
+                    result = {"benchmark": name, "size": size, "error": f"{type(e).__name__}: {e}"}
+                    print(f"FAILED ({result['error']})")
+            results.append(result)
+
+    return {
+        "cmp_version": __version__,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": {
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+        },
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def compare_results(results, reference, threshold=1.2):
+    """Compare the median times of two sets of results.
+
+    Parameters
+    ----------
+    results : dict
+        Results returned by :func:`run_benchmarks`
+
+    reference : dict
+        Reference results, e.g. of a previous version
+
+    threshold : float
+        Ratio of the median times above which a case is reported as a regression
+
+    Returns
+    -------
+    comparison : list of dict
+        One entry per case present in both results, with the fields `'benchmark'`, `'size'`,
+        `'reference_s'`, `'median_s'`, `'ratio'` and `'regression'`
+    """
+    reference_times = {
+        (r["benchmark"], r["size"]): r["median_s"] for r in reference["results"] if "median_s" in r
+    }
+    comparison = []
+    for r in results["results"]:
+        key = (r["benchmark"], r["size"])
+        if "median_s" not in r or key not in reference_times:
+            continue
+        ratio = r["median_s"] / reference_times[key]
+        comparison.append({
+            "benchmark": r["benchmark"],
+            "size": r["size"],
+            "reference_s": reference_times[key],
+            "median_s": r["median_s"],
+            "ratio": ratio,
+            "regression": ratio > threshold,
+        })
+    return comparison
+
+
+def get_parser():
+    """Return the parser of the benchmark script."""
+    p = argparse.ArgumentParser(description="Benchmarks of the CMTK hot paths on synthetic data.")
+    p.add_argument("-o", "--output", required=True, help="Output JSON file")
+    p.add_argument(
+        "-b", "--benchmarks", nargs="+", choices=list(BENCHMARKS.keys()),
+        help="Benchmarks to run (Default: all)"
+    )
+    p.add_argument(
+        "-s", "--sizes", nargs="+", choices=["small", "medium", "large"], default=["small", "medium"],
+        help="Sizes of the synthetic data (Default: small medium)"
+    )
+    p.add_argument("-r", "--repeat", type=int, default=3, help="Number of times each case is timed (Default: 3)")
+    p.add_argument("--work_dir", help="Directory where the synthetic data are generated")
+    p.add_argument("--compare", help="JSON file with reference results to compare with")
+    p.add_argument(
+        "--threshold", type=float, default=1.2,
+        help="Ratio of the median times above which a case is reported as a regression (Default: 1.2)"
+    )
+    return p
+
+
+def main():
+    """Run the benchmarks, save the results and compare them to reference results.
+
+    Returns
+    -------
+    exit_code : {0, 1}
+        1 if a regression was detected or a case failed, 0 otherwise
+    """
+    args = get_parser().parse_args()
+
+    print(f"> Run CMTK benchmarks (cmp {__version__})")
+    results = run_benchmarks(names=args.benchmarks, sizes=args.sizes, repeat=args.repeat, work_dir=args.work_dir)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=4)
+    print(f"> Results saved to {args.output}")
+
+    exit_code = int(any("error" in r for r in results["results"]))
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            reference = json.load(f)
+        print(f"> Comparison with {args.compare} (cmp {reference.get('cmp_version')})")
+        for c in compare_results(results, reference, threshold=args.threshold):
+            status = "REGRESSION" if c["regression"] else "ok"
+            print(
+                f"  * {c['benchmark']:<32} {c['size']:<7} {c['reference_s']:9.3f} s -> {c['median_s']:9.3f} s"
+                f"  (x{c['ratio']:.2f}) {status}"
+            )
+            if c["regression"]:
+                exit_code = 1
+
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,426 @@
+# Copyright (C) 2009-2022, Ecole Polytechnique Federale de Lausanne (EPFL) and
+# Hospital Center and University of Lausanne (UNIL-CHUV), Switzerland, and CMP3 contributors
+# All rights reserved.
+#
+#  This software is distributed under the open-source license Modified BSD.
+
+"""Module that defines generators of synthetic data used by the CMTK benchmarks.
+
+All the generators are seeded so that a given set of parameters always
+produces the same data, which makes the timings comparable between versions.
+"""
+
+import os
+
+import networkx as nx
+import nibabel as nib
+import numpy as np
+from nibabel.streamlines import Field
+from scipy.spatial import cKDTree
+
+# Names of the scales of the Lausanne2018 parcellation scheme, used to name
+# the label volumes so that they can be processed as a Lausanne2018 parcellation
+SCALES = ["scale1", "scale2", "scale3", "scale4", "scale5"]
+
+
+def ellipsoid_mask(shape, radius=0.8):
+    """Return a boolean mask of an ellipsoid centered in a grid.
+
+    Parameters
+    ----------
+    shape : tuple
+        Shape of the grid
+
+    radius : float
+        Radius of the ellipsoid relative to the half-size of the grid along each axis
+
+    Returns
+    -------
+    mask : numpy.ndarray
+        Boolean mask of shape `shape`
+    """
+    center = (np.asarray(shape) - 1) / 2.0
+    coords = np.indices(shape, dtype=np.float64)
+    dist = sum(((coords[i] - center[i]) / (radius * (center[i] + 0.5))) ** 2 for i in range(3))
+    return dist <= 1.0
+
+
+def make_affine(voxel_size, shape):
+    """Return a RAS+ affine with isotropic voxels centered on the grid."""
+    affine = np.diag([voxel_size, voxel_size, voxel_size, 1.0])
+    affine[:3, 3] = -voxel_size * (np.asarray(shape[:3]) - 1) / 2.0
+    return affine
+
+
+def nested_labels(mask, n_labels, seed=0):
+    """Partition a mask into nested multi-scale labels.
+
+    The finest scale is the Voronoi partition of the mask defined by
+    ``n_labels[-1]`` random seeds. Each coarser scale groups the seeds of the
+    finest scale around its own first ``n_labels[i]`` seeds, so that every
+    label of a fine scale is included in exactly one label of each coarser scale.
+
+    Parameters
+    ----------
+    mask : numpy.ndarray
+        Boolean mask to partition
+
+    n_labels : list of int
+        Number of labels of each scale, in increasing order
+
+    seed : int
+        Seed of the random generator
+
+    Returns
+    -------
+    label_volumes : list of numpy.ndarray
+        One int16 label volume (labels from 1 to ``n_labels[i]``) per scale
+
+    seeds : numpy.ndarray
+        ``(n_labels[-1], 3)`` voxel coordinates of the seeds
+    """
+    rng = np.random.RandomState(seed)
+    voxels = np.argwhere(mask)
+    seeds = voxels[rng.choice(len(voxels), size=n_labels[-1], replace=False)].astype(np.float64)
+    _, fine = cKDTree(seeds).query(voxels)
+
+    label_volumes = []
+    for n in n_labels:
+        _, seed_to_label = cKDTree(seeds[:n]).query(seeds)
+        labels = np.zeros(mask.shape, dtype=np.int16)
+        labels[tuple(voxels.T)] = seed_to_label[fine] + 1
+        label_volumes.append(labels)
+    return label_volumes, seeds
+
+
+def write_node_description_graphml(graphml_file, seeds, shape, n_cortical=None):
+    """Write a GraphML file describing the nodes of a synthetic parcellation.
+
+    Parameters
+    ----------
+    graphml_file : string
+        Path to the output GraphML file
+
+    seeds : numpy.ndarray
+        ``(n_labels, 3)`` voxel coordinates of the seeds of the labels
+
+    shape : tuple
+        Shape of the grid, used to assign a hemisphere to each label
+
+    n_cortical : int
+        Number of labels considered as cortical (the remaining ones are subcortical).
+        If `None`, 90% of the labels are cortical.
+    """
+    if n_cortical is None:
+        n_cortical = int(0.9 * len(seeds))
+    G = nx.Graph()
+    for i, seed in enumerate(seeds):
+        label = i + 1
+        hemisphere = "left" if seed[0] < (shape[0] - 1) / 2.0 else "right"
+        name = f"synthetic_{hemisphere}_{label}"
+        G.add_node(
+            label,
+            dn_multiscaleID=label,
+            dn_correspondence_id=label,
+            dn_name=name,
+            dn_fsname=name,
+            dn_hemisphere=hemisphere,
+            dn_region="cortical" if i < n_cortical else "subcortical",
+        )
+    nx.write_graphml(G, graphml_file)
+
+
+def make_parcellation(out_dir, shape=(64, 64, 64), n_labels=(16, 32, 64, 128, 256),
+                      voxel_size=1.0, seed=0, prefix="sub-bench"):
+    """Create a synthetic multi-scale parcellation with five nested scales.
+
+    Label volumes and node descriptions are named after the scales of the
+    Lausanne2018 parcellation (``scale1`` ... ``scale5``) so that they can be
+    given to the interfaces expecting this parcellation scheme.
+
+    Parameters
+    ----------
+    out_dir : string
+        Output directory
+
+    shape : tuple
+        Shape of the label volumes
+
+    n_labels : list of int
+        Number of labels of the five scales, in increasing order
+
+    voxel_size : float
+        Isotropic voxel size in mm
+
+    seed : int
+        Seed of the random generator
+
+    prefix : string
+        Prefix of the output files
+
+    Returns
+    -------
+    parcellation : dict
+        Dictionary with the fields `'roi_volumes'` and `'roi_graphmls'` (lists of paths),
+        `'labels'` (list of label arrays), `'mask'` (brain mask) and `'affine'`
+    """
+    if len(n_labels) != len(SCALES):
+        raise ValueError(f"Expected {len(SCALES)} scales, got {len(n_labels)}")
+    os.makedirs(out_dir, exist_ok=True)
+    mask = ellipsoid_mask(shape)
+    affine = make_affine(voxel_size, shape)
+    label_volumes, seeds = nested_labels(mask, n_labels, seed=seed)
+
+    roi_volumes = []
+    roi_graphmls = []
+    for scale, n, labels in zip(SCALES, n_labels, label_volumes):
+        roi_volume = os.path.join(out_dir, f"{prefix}_atlas-synthetic_res-{scale}_dseg.nii.gz")
+        nib.save(nib.Nifti1Image(labels, affine), roi_volume)
+        roi_graphml = os.path.join(out_dir, f"{prefix}_atlas-synthetic_res-{scale}_dseg.graphml")
+        write_node_description_graphml(roi_graphml, seeds[:n], shape)
+        roi_volumes.append(roi_volume)
+        roi_graphmls.append(roi_graphml)
+
+    return {
+        "roi_volumes": roi_volumes,
+        "roi_graphmls": roi_graphmls,
+        "labels": label_volumes,
+        "mask": mask,
+        "affine": affine,
+    }
+
+
+def random_walk_streamlines(mask, n_fibers, n_points, step_size=0.5, curvature=0.3, seed=0):
+    """Generate random-walk streamlines inside a mask.
+
+    Parameters
+    ----------
+    mask : numpy.ndarray
+        Boolean mask in which the streamlines are seeded and kept
+
+    n_fibers : int
+        Number of streamlines
+
+    n_points : int
+        Number of points of each streamline
+
+    step_size : float
+        Step size in voxels
+
+    curvature : float
+        Amplitude of the random perturbation of the direction at each step
+
+    seed : int
+        Seed of the random generator
+
+    Returns
+    -------
+    streamlines : numpy.ndarray
+        ``(n_fibers, n_points, 3)`` array of voxel coordinates
+    """
+    rng = np.random.RandomState(seed)
+    voxels = np.argwhere(mask)
+    upper = np.asarray(mask.shape, dtype=np.float64) - 1
+
+    points = np.empty((n_fibers, n_points, 3), dtype=np.float64)
+    points[:, 0] = voxels[rng.randint(len(voxels), size=n_fibers)]
+    direction = rng.normal(size=(n_fibers, 3))
+    for i in range(1, n_points):
+        direction += curvature * rng.normal(size=(n_fibers, 3))
+        direction /= np.linalg.norm(direction, axis=1, keepdims=True)
+        step = points[:, i - 1] + step_size * direction
+        # Reflect the streamlines on the borders of the grid
+        outside = (step < 0) | (step > upper)
+        direction[outside] *= -1
+        points[:, i] = np.clip(step, 0, upper)
+    return points.astype(np.float32)
+
+
+def make_tractogram(trk_file, ref_file, n_fibers=10000, n_points=50, step_size=0.5, seed=0):
+    """Create a synthetic TrackVis tractogram of random-walk streamlines.
+
+    Parameters
+    ----------
+    trk_file : string
+        Path to the output `.trk` file
+
+    ref_file : string
+        Reference image defining the voxel grid (e.g. a label volume)
+
+    n_fibers : int
+        Number of streamlines
+
+    n_points : int
+        Number of points of each streamline, which controls the fiber length
+        (``(n_points - 1) * step_size`` voxels)
+
+    step_size : float
+        Step size in voxels
+
+    seed : int
+        Seed of the random generator
+
+    Returns
+    -------
+    trk_file : string
+        Path to the output `.trk` file
+    """
+    ref_img = nib.load(ref_file)
+    mask = np.asanyarray(ref_img.dataobj) > 0
+    streamlines = random_walk_streamlines(mask, n_fibers, n_points, step_size=step_size, seed=seed)
+    streamlines_rasmm = nib.affines.apply_affine(ref_img.affine, streamlines)
+    tractogram = nib.streamlines.Tractogram(list(streamlines_rasmm), affine_to_rasmm=np.eye(4))
+    header = {
+        Field.VOXEL_TO_RASMM: ref_img.affine.copy(),
+        Field.VOXEL_SIZES: ref_img.header.get_zooms()[:3],
+        Field.DIMENSIONS: ref_img.shape[:3],
+        Field.VOXEL_ORDER: "".join(nib.aff2axcodes(ref_img.affine)),
+    }
+    nib.streamlines.save(tractogram, trk_file, header=header)
+    return trk_file
+
+
+def smooth_signals(rng, n_signals, n_timepoints, alpha=0.9):
+    """Return AR(1) signals of unit variance, of shape ``(n_signals, n_timepoints)``."""
+    noise = rng.normal(size=(n_signals, n_timepoints))
+    signals = np.empty_like(noise)
+    signals[:, 0] = noise[:, 0]
+    for t in range(1, n_timepoints):
+        signals[:, t] = alpha * signals[:, t - 1] + np.sqrt(1 - alpha ** 2) * noise[:, t]
+    return signals
+
+
+def make_bold(out_dir, parcellation, n_timepoints=150, noise=0.5, seed=0, prefix="sub-bench"):
+    """Create a synthetic 4D BOLD volume with motion parameters and tissue masks.
+
+    The BOLD signal of each voxel is the sum of a baseline, a slow signal shared
+    by the voxels of the same region (coarsest scale of `parcellation`), a
+    quadratic drift, a motion-related component and white noise.
+
+    Parameters
+    ----------
+    out_dir : string
+        Output directory
+
+    parcellation : dict
+        Synthetic parcellation returned by :func:`make_parcellation`
+
+    n_timepoints : int
+        Number of volumes
+
+    noise : float
+        Standard deviation of the white noise, relative to the region signals
+
+    seed : int
+        Seed of the random generator
+
+    prefix : string
+        Prefix of the output files
+
+    Returns
+    -------
+    bold : dict
+        Dictionary with the paths `'bold'`, `'motion'` (FSL `.par` text file with 6 columns),
+        `'brain_mask'`, `'wm_mask'`, `'csf_mask'` and `'gm_mask'`
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.RandomState(seed)
+    mask = parcellation["mask"]
+    affine = parcellation["affine"]
+    labels = parcellation["labels"][0]
+    shape = mask.shape
+
+    # Motion parameters: random walk of 3 rotations (rad) and 3 translations (mm)
+    motion = np.cumsum(rng.normal(scale=[1e-3] * 3 + [5e-2] * 3, size=(n_timepoints, 6)), axis=0)
+
+    t = np.linspace(-1, 1, n_timepoints)
+    region_signals = smooth_signals(rng, labels.max() + 1, n_timepoints)
+    drift = 5 * t + 3 * t ** 2
+    data = np.zeros(shape + (n_timepoints,), dtype=np.float32)
+    data[mask] = (
+        1000
+        + 10 * region_signals[labels[mask]]
+        + drift
+        + 20 * (motion[:, 3:] @ rng.normal(size=(3, mask.sum()))).T
+        + 10 * noise * rng.normal(size=(mask.sum(), n_timepoints))
+    )
+
+    files = {
+        "bold": os.path.join(out_dir, f"{prefix}_task-rest_bold.nii.gz"),
+        "motion": os.path.join(out_dir, f"{prefix}_task-rest_motion.par"),
+        "brain_mask": os.path.join(out_dir, f"{prefix}_task-rest_desc-brain_mask.nii.gz"),
+        "wm_mask": os.path.join(out_dir, f"{prefix}_task-rest_label-WM_mask.nii.gz"),
+        "csf_mask": os.path.join(out_dir, f"{prefix}_task-rest_label-CSF_mask.nii.gz"),
+        "gm_mask": os.path.join(out_dir, f"{prefix}_task-rest_label-GM_mask.nii.gz"),
+    }
+    header = nib.Nifti1Header()
+    header.set_xyzt_units("mm", "sec")
+    header["pixdim"][4] = 2.0
+    nib.save(nib.Nifti1Image(data, affine, header), files["bold"])
+    np.savetxt(files["motion"], motion, fmt="%.6f")
+
+    wm = ellipsoid_mask(shape, radius=0.4)
+    csf = ellipsoid_mask(shape, radius=0.15)
+    for key, tissue in [
+        ("brain_mask", mask),
+        ("wm_mask", wm & ~csf),
+        ("csf_mask", csf),
+        ("gm_mask", mask & ~wm),
+    ]:
+        nib.save(nib.Nifti1Image(tissue.astype(np.uint8), affine), files[key])
+    return files
+
+
+def make_eeg_epochs(n_epochs=50, n_channels=128, n_times=200, n_solution_points=2000, n_rois=68,
+                    sfreq=250.0, n_baseline=50, seed=0):
+    """Create synthetic EEG epochs with a Cartool-like inverse solution and ROIs.
+
+    Parameters
+    ----------
+    n_epochs : int
+        Number of epochs
+
+    n_channels : int
+        Number of EEG channels
+
+    n_times : int
+        Number of samples per epoch
+
+    n_solution_points : int
+        Number of solution points of the inverse solution
+
+    n_rois : int
+        Number of ROIs grouping the solution points
+
+    sfreq : float
+        Sampling frequency in Hz
+
+    n_baseline : int
+        Number of samples before the stimulus onset (``t = 0``)
+
+    seed : int
+        Seed of the random generator
+
+    Returns
+    -------
+    eeg : dict
+        Dictionary with the fields `'data'` (``(n_epochs, n_channels, n_times)`` array in V),
+        `'sfreq'`, `'tmin'`, `'K'` (``(3, n_solution_points, n_channels)`` inverse solution matrix),
+        `'roi_names'` and `'groups_of_indexes'` (solution point indices of each ROI)
+    """
+    rng = np.random.RandomState(seed)
+    data = 1e-6 * smooth_signals(rng, n_epochs * n_channels, n_times, alpha=0.8)
+    data = data.reshape(n_epochs, n_channels, n_times)
+    K = rng.normal(size=(3, n_solution_points, n_channels))
+    # Assign each solution point to a ROI, every ROI having at least one point
+    roi_of_point = np.concatenate([np.arange(n_rois), rng.randint(n_rois, size=n_solution_points - n_rois)])
+    rng.shuffle(roi_of_point)
+    groups_of_indexes = [np.flatnonzero(roi_of_point == r) for r in range(n_rois)]
+    return {
+        "data": data,
+        "sfreq": sfreq,
+        "tmin": -n_baseline / sfreq,
+        "K": K,
+        "roi_names": [f"roi_{r + 1}" for r in range(n_rois)],
+        "groups_of_indexes": groups_of_indexes,
+    }
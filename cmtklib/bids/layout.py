@@ -0,0 +1,139 @@
+# Copyright (C) 2009-2022, Ecole Polytechnique Federale de Lausanne (EPFL) and
+# Hospital Center and University of Lausanne (UNIL-CHUV), Switzerland, and CMP3 contributors
+# All rights reserved.
+#
+#  This software is distributed under the open-source license Modified BSD.
+
+"""This module provides functions to share a persistent pybids index between subjects.
+
+Indexing a BIDS dataset with :class:`bids.BIDSLayout` walks and parses every
+file of the dataset. Instead of re-indexing the dataset in each subject
+process, the index is built once into an SQLite database stored in the output
+directory and loaded from there by all the subjects. The database is rebuilt
+only when the content of the dataset changes, which is detected with a
+fingerprint of the paths, sizes and modification times of the indexed files.
+"""
+
+import os
+import fcntl
+import hashlib
+
+from bids import BIDSLayout
+
+from cmtklib.bids.io import __nipype_directory__
+
+# Top-level directories not indexed by default by pybids
+IGNORED_DIRECTORIES = ("code", "derivatives", "models", "sourcedata", "stimuli")
+
+LAYOUT_DATABASE_DIRNAME = "bids_layout_db"
+FINGERPRINT_FILENAME = "dataset_fingerprint.txt"
+
+
+def layout_database_path(output_dir):
+    """Return the path of the pybids database directory in the output directory.
+
+    Parameters
+    ----------
+    output_dir : string
+        Output (BIDS derivatives) directory
+
+    Returns
+    -------
+    database_path : string
+        Path to the database directory
+    """
+    return os.path.join(
+        os.path.abspath(output_dir), __nipype_directory__, LAYOUT_DATABASE_DIRNAME
+    )
+
+
+def dataset_fingerprint(bids_dir):
+    """Compute a fingerprint of the files of a BIDS dataset indexed by pybids.
+
+    The fingerprint only requires a `stat` call per file and changes
+    whenever a file is added, removed, renamed or modified.
+
+    Parameters
+    ----------
+    bids_dir : string
+        BIDS root directory
+
+    Returns
+    -------
+    fingerprint : string
+        Hexadecimal SHA-1 digest of the relative paths, sizes and modification times
+    """
+    bids_dir = os.path.abspath(bids_dir)
+    sha = hashlib.sha1()
+    for root, dirs, files in os.walk(bids_dir):
+        dirs[:] = sorted(
+            d for d in dirs
+            if not d.startswith(".") and not (root == bids_dir and d in IGNORED_DIRECTORIES)
+        )
+        for name in sorted(files):
+            if name.startswith("."):
+                continue
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            sha.update(
+                f"{os.path.relpath(path, bids_dir)}\t{stat.st_size}\t{stat.st_mtime_ns}\n".encode()
+            )
+    return sha.hexdigest()
+
+
+def get_bids_layout(bids_dir, output_dir=None):
+    """Return a :class:`bids.BIDSLayout` loaded from the database persisted in the output directory.
+
+    The database is (re)built only if it does not exist yet or if the dataset
+    changed since it was built. A lock file serializes the check and the build
+    so that concurrent subject processes wait for the first one to index the
+    dataset and then load the database read-only.
+
+    Parameters
+    ----------
+    bids_dir : string
+        BIDS root directory
+
+    output_dir : string
+        Output directory where the database is stored.
+        If `None`, the dataset is indexed in memory.
+
+    Returns
+    -------
+    layout : bids.BIDSLayout
+        The layout of the BIDS dataset
+    """
+    bids_dir = os.path.abspath(bids_dir)
+    if output_dir is None:
+        return BIDSLayout(bids_dir)
+
+    database_path = layout_database_path(output_dir)
+    fingerprint_file = os.path.join(database_path, FINGERPRINT_FILENAME)
+    os.makedirs(database_path, exist_ok=True)
+
+    with open(database_path + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            fingerprint = dataset_fingerprint(bids_dir)
+            stored_fingerprint = None
+            if os.path.exists(fingerprint_file):
+                with open(fingerprint_file, "r") as f:
+                    stored_fingerprint = f.read().strip()
+
+            if stored_fingerprint == fingerprint:
+                print(f"  .. INFO: Load BIDS layout from {database_path}")
+                return BIDSLayout(bids_dir, database_path=database_path)
+
+            print(f"  .. INFO: Index BIDS dataset into {database_path}")
+            # Invalidate the database until it is completely rebuilt
+            if os.path.exists(fingerprint_file):
+                os.remove(fingerprint_file)
+            layout = BIDSLayout(bids_dir, database_path=database_path, reset_database=True)
+            with open(fingerprint_file, "w") as f:
+                f.write(fingerprint)
+            return layout
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
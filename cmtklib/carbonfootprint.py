@@ -81,12 +81,74 @@ def get_emission_tv_time_equivalent(emissions):
     return tv_time
 
 
-def load_and_compute_carbon_footprint_metrics(emissions_csv_file, nb_of_subjects_processed) -> dict:
+def compute_stage_carbon_footprint(cmp_derivatives_dir, energy_consumed, emissions, participant_labels=None):
+    """Attribute the energy consumed and the CO2 emitted during a run to the stages of the pipelines.
+
+    The tracker of `codecarbon` measures the whole run of the BIDS App container
+    from the host. The energy and emissions are split between the stages in
+    proportion of the CPU time of their nodes, as recorded in the node profiles
+    saved by the pipelines (see :mod:`cmtklib.profiling`). Cached nodes, which
+    were not run again, are ignored.
+
+    Parameters
+    ----------
+    cmp_derivatives_dir : string
+        Path to ``<output_dir>/cmp-<version>``
+
+    energy_consumed : float
+        Total energy consumed (kWh)
+
+    emissions : float
+        Total CO2 emissions (kg)
+
+    participant_labels : list of string
+        Labels of the subjects processed during the run. If `None`, the
+        profiles of all the subjects are used.
+
+    Returns
+    -------
+    stage_footprints : list of dict
+        One dictionary per stage, sorted by decreasing energy, with the fields
+        `'pipeline'`, `'stage'`, `'cpu_time'`, `'fraction'`, `'energy_consumed'` and `'emissions'`.
+        The list is empty if no profile is available.
+    """
+    from cmtklib.profiling import load_profiles
+
+    profiles = load_profiles(cmp_derivatives_dir)
+    if profiles is None:
+        return []
+    if participant_labels:
+        subjects = {f'sub-{label.replace("sub-", "")}' for label in participant_labels}
+        profiles = profiles[profiles["subject"].str.split("_").str[0].isin(subjects)]
+    profiles = profiles[profiles["status"] != "cached"]
+
+    cpu_times = profiles.groupby(["pipeline", "stage"], sort=False)["cpu_time_s"].sum()
+    total_cpu_time = cpu_times.sum()
+    if not total_cpu_time > 0:
+        return []
+
+    stage_footprints = []
+    for (pipeline, stage), cpu_time in cpu_times.sort_values(ascending=False).items():
+        fraction = cpu_time / total_cpu_time
+        stage_footprints.append({
+            'pipeline': pipeline,
+            'stage': stage,
+            'cpu_time': float(cpu_time),
+            'fraction': float(fraction),
+            'energy_consumed': float(fraction * energy_consumed),
+            'emissions': float(fraction * emissions),
+        })
+    return stage_footprints
+
+
+def load_and_compute_carbon_footprint_metrics(
+    emissions_csv_file, nb_of_subjects_processed, cmp_derivatives_dir=None, participant_labels=None
+) -> dict:
     """Return a dictionary storing the different metrics and variables displayed in the carbon footprint report.
 
     The dictionary has the different fields:  `'country_name'`, `'region_name'`, `'country_emissions_per_kwh'`,
     `'duration'`, `'energy_consumed'`, `'emissions'`, `'car_kms'`, `'tv_time'`, `'pred_energy_consumed'`,
-    `'pred_emissions'`, `'pred_car_kms'`, `'pred_tv_time'`.
+    `'pred_emissions'`, `'pred_car_kms'`, `'pred_tv_time'`, `'stage_footprints'`.
 
     Parameters
     ----------
@@ -96,6 +158,14 @@ def load_and_compute_carbon_footprint_metrics(emissions_csv_file, nb_of_subjects
     nb_of_subjects_processed : int
         Number of subject processed.
 
+    cmp_derivatives_dir : string
+        Path to ``<output_dir>/cmp-<version>``. If provided, the energy and
+        emissions are broken down per stage in `'stage_footprints'`
+        (see :func:`compute_stage_carbon_footprint`).
+
+    participant_labels : list of string
+        Labels of the subjects processed, used to select their node profiles.
+
     """
     emissions_df = pd.read_csv(emissions_csv_file)
     last_index = len(emissions_df) - 1
@@ -129,11 +199,21 @@ def load_and_compute_carbon_footprint_metrics(emissions_csv_file, nb_of_subjects
         'pred_emissions': f'{pred_emissions}',
         'pred_car_kms': f'{pred_car_kms}',
         'pred_tv_time': f'{pred_tv_time}',
+        'stage_footprints': [],
     }
+    if cmp_derivatives_dir is not None:
+        carbon_footprint_metrics['stage_footprints'] = compute_stage_carbon_footprint(
+            cmp_derivatives_dir=cmp_derivatives_dir,
+            energy_consumed=energy_consumed,
+            emissions=emissions,
+            participant_labels=participant_labels,
+        )
     return carbon_footprint_metrics
 
 
-def create_carbon_footprint_message(bids_dir, emissions_csv_file, nb_of_subjects_processed):
+def create_carbon_footprint_message(
+    bids_dir, emissions_csv_file, nb_of_subjects_processed, cmp_derivatives_dir=None, participant_labels=None
+):
     """Return a string containg the carbon footprint print message to be passed to `print()`.
 
     Parameters
@@ -147,6 +227,13 @@ def create_carbon_footprint_message(bids_dir, emissions_csv_file, nb_of_subjects
     nb_of_subjects_processed : int
         Number of subject processed.
 
+    cmp_derivatives_dir : string
+        Path to ``<output_dir>/cmp-<version>``. If provided, the carbon
+        footprint of each stage is reported.
+
+    participant_labels : list of string
+        Labels of the subjects processed, used to select their node profiles.
+
     Returns
     -------
     carbon_footprint_msg : string
@@ -155,7 +242,9 @@ def create_carbon_footprint_message(bids_dir, emissions_csv_file, nb_of_subjects
     """
     carbon_footprint_metrics = load_and_compute_carbon_footprint_metrics(
         emissions_csv_file=emissions_csv_file,
-        nb_of_subjects_processed=nb_of_subjects_processed
+        nb_of_subjects_processed=nb_of_subjects_processed,
+        cmp_derivatives_dir=cmp_derivatives_dir,
+        participant_labels=participant_labels
     )
     carbon_footprint_msg = "#" * 80 + "\n"
     carbon_footprint_msg += f"CARBON FOOTPRINT REPORT\n"
@@ -174,6 +263,14 @@ def create_carbon_footprint_message(bids_dir, emissions_csv_file, nb_of_subjects
     carbon_footprint_msg += "\t* Equivalent in amount of time watching a 32-inch LCD flat "
     carbon_footprint_msg += f"screen TV: {carbon_footprint_metrics['tv_time']}\n"
     carbon_footprint_msg += "#" * 80 + "\n"
+    if carbon_footprint_metrics['stage_footprints']:
+        carbon_footprint_msg += "Carbon footprint per stage (attributed by CPU time)\n"
+        carbon_footprint_msg += "-" * 80 + "\n"
+        for stage in carbon_footprint_metrics['stage_footprints']:
+            carbon_footprint_msg += f"\t* {stage['pipeline']} {stage['stage']}: "
+            carbon_footprint_msg += f"{100 * stage['fraction']:.1f} % - {stage['energy_consumed']} kWh - "
+            carbon_footprint_msg += f"{stage['emissions']} kg\n"
+        carbon_footprint_msg += "#" * 80 + "\n"
     carbon_footprint_msg += f"Carbon footprint prediction for 100 subjects in the same conditions\n"
     carbon_footprint_msg += "-" * 80 + "\n"
     carbon_footprint_msg += f"\t* Predicted duration: {carbon_footprint_metrics['pred_duration']} s\n"
@@ -190,7 +287,9 @@ def create_carbon_footprint_message(bids_dir, emissions_csv_file, nb_of_subjects
     return carbon_footprint_msg
 
 
-def create_html_carbon_footprint_report(emissions_csv_file, nb_of_subjects_processed):
+def create_html_carbon_footprint_report(
+    emissions_csv_file, nb_of_subjects_processed, cmp_derivatives_dir=None, participant_labels=None
+):
     """Return a string containing the content of html report to be passed to traits `Str` with `HTMLEditor`.
 
     Parameters
@@ -201,11 +300,59 @@ def create_html_carbon_footprint_report(emissions_csv_file, nb_of_subjects_proce
     nb_of_subjects_processed : int
         Number of subject processed.
 
+    cmp_derivatives_dir : string
+        Path to ``<output_dir>/cmp-<version>``. If provided, the carbon footprint
+        of each stage and a summary of the node profiles saved by the pipelines
+        are added to the report.
+
+    participant_labels : list of string
+        Labels of the subjects processed, used to select their node profiles.
+
     """
     carbon_footprint_metrics = load_and_compute_carbon_footprint_metrics(
         emissions_csv_file=emissions_csv_file,
-        nb_of_subjects_processed=nb_of_subjects_processed
+        nb_of_subjects_processed=nb_of_subjects_processed,
+        cmp_derivatives_dir=cmp_derivatives_dir,
+        participant_labels=participant_labels
     )
+    stage_footprint_report = ""
+    if carbon_footprint_metrics['stage_footprints']:
+        stage_rows = "".join(
+            f"""
+          <tr>
+            <td>{stage['pipeline']}</td>
+            <td>{stage['stage']}</td>
+            <td>{100 * stage['fraction']:.1f}</td>
+            <td>{stage['energy_consumed']:.6f}</td>
+            <td>{stage['emissions']:.6f}</td>
+          </tr>"""
+            for stage in carbon_footprint_metrics['stage_footprints']
+        )
+        stage_footprint_report = f"""
+      <h4>
+          Carbon footprint per stage
+      </h4>
+      <p>
+          The energy consumed and the CO<sub>2</sub> emissions are attributed to the stages
+          in proportion of the CPU time of their nodes.
+      </p>
+      <table class="table table-striped table-condensed">
+          <thead>
+            <tr>
+              <th>Pipeline</th>
+              <th>Stage</th>
+              <th>CPU time (%)</th>
+              <th>Energy consumed (kWh)</th>
+              <th>CO<sub>2</sub> emissions (kg)</th>
+            </tr>
+          </thead>
+          <tbody>{stage_rows}
+          </tbody>
+      </table>"""
+    profile_summary = ""
+    if cmp_derivatives_dir is not None:
+        from cmtklib.profiling import create_html_profile_summary
+        profile_summary = create_html_profile_summary(cmp_derivatives_dir)
     # Get path to different resources used in the <head> of the HTML document
     resources_dir = os.path.join('data', 'report', 'carbonfootprint')
     jquery_js_file = resource_filename('cmtklib', os.path.join(resources_dir, 'js', 'jquery.3.3.1.min.js'))
@@ -307,6 +454,7 @@ def create_html_carbon_footprint_report(emissions_csv_file, nb_of_subjects_proce
             <a href="https://github.com/mlco2/codecarbon">CodeCarbon emissions tracker</a>.
         </em>
       </p>
+      {stage_footprint_report}
       <h4>
           Carbon footprint prediction for 100 subjects
       </h4>
@@ -327,6 +475,7 @@ def create_html_carbon_footprint_report(emissions_csv_file, nb_of_subjects_proce
           </li>
       </ul>
     </div>
+    {profile_summary}
 </body>
 <footer>
   <div id="footer">
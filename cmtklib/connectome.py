@@ -786,6 +786,80 @@ class DmriCmat(BaseInterface):
         return outputs
 
 
+def sliding_window_correlation(ts, window_length, step=1, out_file=None):
+    """Compute the Pearson's correlation matrices of time-series in sliding windows.
+
+    The sums and cross-products of the time-series in the window are updated
+    incrementally when the window slides, by adding the time points that enter
+    the window and subtracting those that leave it, instead of being recomputed
+    for each window.
+
+    Parameters
+    ----------
+    ts : numpy.ndarray
+        Array of shape ``(n_nodes, n_timepoints)`` with the node time-series
+
+    window_length : int
+        Number of time points in a window
+
+    step : int
+        Number of time points between the starts of two consecutive windows
+
+    out_file : string
+        If given, the correlation matrices are written to this `.npy` file,
+        which can be loaded as a memory-map with ``numpy.load(out_file, mmap_mode="r")``
+
+    Returns
+    -------
+    dynamic_fc : numpy.ndarray or numpy.memmap
+        Array of shape ``(n_windows, n_nodes, n_nodes)`` of float32 where the window
+        ``k`` spans the time points ``k * step`` to ``k * step + window_length - 1``
+    """
+    n_nodes, tp = ts.shape
+    if window_length < 2 or window_length > tp:
+        raise ValueError(
+            f"Window length ({window_length}) must be between 2 and the number of time points ({tp})"
+        )
+    if step < 1:
+        raise ValueError(f"Window step ({step}) must be at least 1")
+    n_windows = (tp - window_length) // step + 1
+
+    # Standardize the time-series over the whole run to limit the round-off
+    # errors accumulated by the updates of the windowed sums
+    x = np.asarray(ts, dtype=np.float64)
+    x = x - x.mean(axis=1, keepdims=True)
+    scale = x.std(axis=1, keepdims=True)
+    scale[scale == 0] = 1
+    x /= scale
+
+    if out_file is not None:
+        dynamic_fc = np.lib.format.open_memmap(
+            out_file, mode="w+", dtype=np.float32, shape=(n_windows, n_nodes, n_nodes)
+        )
+    else:
+        dynamic_fc = np.empty((n_windows, n_nodes, n_nodes), dtype=np.float32)
+
+    window = x[:, :window_length]
+    sums = window.sum(axis=1)
+    products = window @ window.T
+    for k in range(n_windows):
+        if k > 0:
+            start = k * step
+            previous = start - step
+            leaving = x[:, previous: min(start, previous + window_length)]
+            entering = x[:, max(start, previous + window_length): start + window_length]
+            sums += entering.sum(axis=1) - leaving.sum(axis=1)
+            products += entering @ entering.T - leaving @ leaving.T
+        cov = products - np.outer(sums, sums) / window_length
+        std = np.sqrt(np.clip(np.diag(cov), 0, None))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            dynamic_fc[k] = cov / np.outer(std, std)
+
+    if out_file is not None:
+        dynamic_fc.flush()
+    return dynamic_fc
+
+
 class RsfmriCmatInputSpec(BaseInterfaceInputSpec):
     func_file = File(exists=True, mandatory=True, desc="fMRI volume")
 
@@ -819,10 +893,22 @@ class RsfmriCmatInputSpec(BaseInterfaceInputSpec):
 
     output_types = traits.List(Str, desc="Output types of the connectivity matrices")
 
+    dynamic_fc = Bool(False, desc="Compute the dynamic (sliding-window) functional connectivity")
+
+    window_length = Int(40, usedefault=True, desc="Number of time points in a sliding window")
+
+    window_step = Int(5, usedefault=True, desc="Number of time points between two consecutive windows")
+
 
 class RsfmriCmatOutputSpec(TraitedSpec):
     avg_timeseries = OutputMultiPath(File(exists=True), desc="ROI average timeseries")
 
+    dynamic_connectivity_matrices = OutputMultiPath(
+        File(exists=True),
+        desc="Stacks of sliding-window functional connectivity matrices "
+             "(`.npy` arrays of shape (windows, nodes, nodes))",
+    )
+
     scrubbed_idx = File(exists=True, desc="Scrubbed indices")
 
     connectivity_matrices = OutputMultiPath(
@@ -835,6 +921,9 @@ class RsfmriCmat(BaseInterface):
 
     It applies scrubbing (if enabled), computes the average GM ROI time-series and computes
         the Pearson's correlation coefficient between each GM ROI time-series poir.
+        If `dynamic_fc` is enabled, it also computes the correlation matrices in sliding
+        windows (see :func:`sliding_window_correlation`), saved as ``dynamicConnectome_<scale>.npy``
+        where the node ``i`` corresponds to the ROI label ``i + 1``.
 
     Examples
     --------
@@ -977,6 +1066,27 @@ class RsfmriCmat(BaseInterface):
                 )
                 ts = ts_after_scrubbing
 
+            if self.inputs.dynamic_fc:
+                print("  ************************************************")
+                print(
+                    "  >> Compute sliding-window ROI time-series correlation "
+                    f"(window: {self.inputs.window_length}, step: {self.inputs.window_step})"
+                )
+                if ts.shape[1] < self.inputs.window_length:
+                    print(
+                        f"  .. WARNING: Only {ts.shape[1]} time points for a window "
+                        f"of {self.inputs.window_length}: skip dynamic connectivity"
+                    )
+                else:
+                    dynamic_fc = sliding_window_correlation(
+                        ts,
+                        self.inputs.window_length,
+                        self.inputs.window_step,
+                        out_file=os.path.abspath("dynamicConnectome_%s.npy" % parkey),
+                    )
+                    print("    - dynamicConnectome_%s.npy (%d windows)" % (parkey, dynamic_fc.shape[0]))
+                    del dynamic_fc
+
             # Compute pairwise ROI time-series correlation
             print("  ************************************************")
             print("  >> Compute pairwise ROI time-series correlation")
@@ -1080,6 +1190,8 @@ class RsfmriCmat(BaseInterface):
         outputs = self._outputs().get()
         outputs["connectivity_matrices"] = glob.glob(os.path.abspath("connectome*"))
         outputs["avg_timeseries"] = glob.glob(os.path.abspath("averageTimeseries_*"))
+        if self.inputs.dynamic_fc:
+            outputs["dynamic_connectivity_matrices"] = glob.glob(os.path.abspath("dynamicConnectome_*"))
         if self.inputs.apply_scrubbing:
             outputs["scrubbed_idx"] = os.path.abspath("tp_after_scrubbing.npy")
         return outputs
@@ -7,7 +7,6 @@
 """Module that defines CMTK utility functions for the diffusion pipeline."""
 
 import os
-import subprocess
 
 import nibabel as nib
 import numpy as np
@@ -22,9 +21,12 @@ from nipype.interfaces.base import (
     InputMultiPath,
 )
 
-from traits.trait_types import List, Str, Int, Enum
+from traits.trait_types import List, Str, Int, Enum, Bool
+
+from scipy import ndimage
 
 from .util import length
+from .parcellation import labels_mask
 
 
 def compute_length_array(trkfile=None, streams=None, savefname="lengths.npy"):
@@ -201,6 +203,76 @@ class FlipTable(BaseInterface):
         return outputs
 
 
+def sphere_footprint(radius, zooms):
+    """Return the boolean footprint of a sphere of a given radius in mm.
+
+    Parameters
+    ----------
+    radius : float
+        Radius of the sphere in mm
+
+    zooms : array_like
+        Voxel sizes in mm along the three axes
+
+    Returns
+    -------
+    footprint : numpy.ndarray
+        Boolean 3D array where voxels whose center lies in the sphere are ``True``
+    """
+    zooms = np.asarray(zooms, dtype=np.float32)
+    half = np.floor(radius / zooms).astype(int)
+    grid = np.ogrid[tuple(slice(-h, h + 1) for h in half)]
+    dist2 = sum((g * z) ** 2 for g, z in zip(grid, zooms))
+    return dist2 <= radius ** 2
+
+
+def modal_dilation(data, footprint, chunk_size=100000):
+    """Dilate the non-zero voxels of a 3D image with the mode of their neighbourhood.
+
+    This is the dilation of `fslmaths -dilD`: each zero voxel with at least
+    one non-zero voxel in its neighbourhood takes the most frequent non-zero
+    value of the neighbourhood (the smallest one in case of ties). The
+    non-zero voxels are left unchanged.
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        3D image
+
+    footprint : numpy.ndarray
+        Boolean 3D array defining the neighbourhood, centered on the voxel
+
+    chunk_size : int
+        Number of dilated voxels processed at once
+
+    Returns
+    -------
+    out : numpy.ndarray
+        Dilated image
+    """
+    footprint = np.asarray(footprint, dtype=bool)
+    half = np.array(footprint.shape) // 2
+    offsets = np.argwhere(footprint) - half
+    padded = np.pad(data, [(h, h) for h in half], mode="constant")
+    targets = np.argwhere((data == 0) & ndimage.binary_dilation(data != 0, structure=footprint))
+
+    out = data.copy()
+    for start in range(0, len(targets), chunk_size):
+        voxels = targets[start:start + chunk_size] + half
+        values = np.stack(
+            [padded[tuple((voxels + offset).T)] for offset in offsets], axis=1
+        ).astype(np.float64)
+        # Zeros are sorted last and never counted
+        values[values == 0] = np.inf
+        values.sort(axis=1)
+        counts = (values[:, :, np.newaxis] == values[:, np.newaxis, :]).sum(axis=2)
+        counts[np.isinf(values)] = 0
+        # argmax returns the first, i.e. smallest, of the most frequent values
+        mode = values[np.arange(len(values)), counts.argmax(axis=1)]
+        out[tuple((voxels - half).T)] = mode
+    return out
+
+
 class ExtractPVEsFrom5TTInputSpec(BaseInterfaceInputSpec):
     in_5tt = File(desc="Input 5TT (4D) image", exists=True, mandatory=True)
 
@@ -234,6 +306,10 @@ class ExtractPVEsFrom5TTOutputSpec(TraitedSpec):
 class ExtractPVEsFrom5TT(BaseInterface):
     """Create Partial Volume Estimation maps for CSF, GM, WM tissues from `mrtrix3` 5TT image.
 
+    The three maps are dilated with a spherical kernel (modal dilation, as
+    `fslmaths -dilD`), smoothed with a Gaussian kernel and normalized to 1
+    in memory, in single precision.
+
     Examples
     --------
     >>> from cmtklib.diffusion import ExtractPVEsFrom5TT
@@ -270,117 +346,51 @@ class ExtractPVEsFrom5TT(BaseInterface):
         #
         # Extract from https://mrtrix.readthedocs.io/en/latest/quantitative_structural_connectivity/act.html
 
-        # Create and save PVE for CSF
-        pve_csf = data_5tt[:, :, :, 3].squeeze()
-        pve_csf_img = nib.Nifti1Image(pve_csf.astype(np.float), affine)
-        nib.save(pve_csf_img, os.path.abspath(self.inputs.pve_csf_file))
-
-        # Create and save PVE for WM
-        pve_wm = data_5tt[:, :, :, 2].squeeze()
-        pve_wm_img = nib.Nifti1Image(pve_wm.astype(np.float), affine)
-        nib.save(pve_wm_img, os.path.abspath(self.inputs.pve_wm_file))
-
-        # Create and save PVE for GM
-        pve_gm = data_5tt[:, :, :, 0].squeeze() + data_5tt[:, :, :, 1].squeeze()
-        pve_gm_img = nib.Nifti1Image(pve_gm.astype(np.float), affine)
-        nib.save(pve_gm_img, os.path.abspath(self.inputs.pve_gm_file))
+        # PVEs of CSF, WM and GM stacked in this order along the first axis
+        pves = np.stack(
+            [
+                data_5tt[:, :, :, 3],
+                data_5tt[:, :, :, 2],
+                data_5tt[:, :, :, 0] + data_5tt[:, :, :, 1],
+            ]
+        ).astype(np.float32)
 
         # Dilate PVEs and normalize to 1
         fwhm = 2.0
-        radius = np.float(0.5 * fwhm)
-        sigma = np.float(fwhm / 2.3548)
+        radius = 0.5 * fwhm
+        sigma = fwhm / 2.3548
 
         print("sigma : %s" % sigma)
 
-        fslmaths_cmd = "fslmaths %s -kernel sphere %s -dilD %s" % (
-            os.path.abspath(self.inputs.pve_csf_file),
-            radius,
-            os.path.abspath(self.inputs.pve_csf_file),
-        )
-        print("Dilate CSF PVE")
-        print(fslmaths_cmd)
-        process = subprocess.Popen(
-            fslmaths_cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT
-        )
-        _ = process.communicate()[0].strip()
-
-        fslmaths_cmd = "fslmaths %s -kernel sphere %s -dilD %s" % (
-            os.path.abspath(self.inputs.pve_wm_file),
-            radius,
-            os.path.abspath(self.inputs.pve_wm_file),
-        )
-        print("Dilate WM PVE")
-        print(fslmaths_cmd)
-        process = subprocess.Popen(
-            fslmaths_cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT
-        )
-        _ = process.communicate()[0].strip()
-
-        fslmaths_cmd = "fslmaths %s -kernel sphere %s -dilD %s" % (
-            os.path.abspath(self.inputs.pve_gm_file),
-            radius,
-            os.path.abspath(self.inputs.pve_gm_file),
-        )
-        print("Dilate GM PVE")
-        print(fslmaths_cmd)
-        process = subprocess.Popen(
-            fslmaths_cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT
-        )
-        _ = process.communicate()[0].strip()
-
-        fslmaths_cmd = "fslmaths %s -kernel gauss %s -fmean %s" % (
-            os.path.abspath(self.inputs.pve_csf_file),
-            sigma,
-            os.path.abspath(self.inputs.pve_csf_file),
-        )
-        print("Gaussian smoothing : CSF PVE")
-        print(fslmaths_cmd)
-        process = subprocess.Popen(
-            fslmaths_cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT
-        )
-        _ = process.communicate()[0].strip()
-
-        fslmaths_cmd = "fslmaths %s -kernel gauss %s -fmean %s" % (
-            os.path.abspath(self.inputs.pve_wm_file),
-            sigma,
-            os.path.abspath(self.inputs.pve_wm_file),
-        )
-        print("Gaussian smoothing : WM PVE")
-        print(fslmaths_cmd)
-        process = subprocess.Popen(
-            fslmaths_cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT
+        # Equivalent of `fslmaths -kernel sphere <radius> -dilD`:
+        # only the zero voxels take the mode of their neighbourhood
+        zooms = nib.affines.voxel_sizes(affine).astype(np.float32)
+        footprint = sphere_footprint(radius, zooms)
+        print("Dilate CSF / WM / GM PVEs")
+        pves = np.stack([modal_dilation(pve, footprint) for pve in pves])
+
+        # Gaussian smoothing as `fslmaths -kernel gauss <sigma> -fmean`,
+        # except at the borders of the field of view where the edge voxels
+        # are replicated (mode="nearest") instead of restricting the kernel
+        # to the voxels inside the image. This only differs within a few
+        # sigma of the borders, usually background where the PVEs are zero.
+        print("Gaussian smoothing : CSF / WM / GM PVEs")
+        pves = ndimage.gaussian_filter(
+            pves, sigma=np.concatenate([[0], sigma / zooms]), mode="nearest"
         )
-        _ = process.communicate()[0].strip()
 
-        fslmaths_cmd = "fslmaths %s -kernel gauss %s -fmean %s" % (
-            os.path.abspath(self.inputs.pve_gm_file),
-            sigma,
-            os.path.abspath(self.inputs.pve_gm_file),
-        )
-        print("Gaussian smoothing : GM PVE")
-        print(fslmaths_cmd)
-        process = subprocess.Popen(
-            fslmaths_cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT
+        pve_sum = pves.sum(axis=0)
+        pves = np.divide(
+            pves, pve_sum, out=np.zeros_like(pves), where=pve_sum > 0
         )
-        _ = process.communicate()[0].strip()
-
-        pve_csf = nib.load(os.path.abspath(self.inputs.pve_csf_file)).get_data()
-        pve_wm = nib.load(os.path.abspath(self.inputs.pve_wm_file)).get_data()
-        pve_gm = nib.load(os.path.abspath(self.inputs.pve_gm_file)).get_data()
-
-        pve_sum = pve_csf + pve_wm + pve_gm
-        pve_csf = np.divide(pve_csf, pve_sum)
-        pve_wm = np.divide(pve_wm, pve_sum)
-        pve_gm = np.divide(pve_gm, pve_sum)
 
-        pve_csf_img = nib.Nifti1Image(pve_csf.astype(np.float), affine)
-        nib.save(pve_csf_img, os.path.abspath(self.inputs.pve_csf_file))
-
-        pve_wm_img = nib.Nifti1Image(pve_wm.astype(np.float), affine)
-        nib.save(pve_wm_img, os.path.abspath(self.inputs.pve_wm_file))
-
-        pve_gm_img = nib.Nifti1Image(pve_gm.astype(np.float), affine)
-        nib.save(pve_gm_img, os.path.abspath(self.inputs.pve_gm_file))
+        for pve, pve_file in zip(
+            pves,
+            [self.inputs.pve_csf_file, self.inputs.pve_wm_file, self.inputs.pve_gm_file],
+        ):
+            pve_img = nib.Nifti1Image(pve, affine)
+            pve_img.set_data_dtype(np.float32)
+            nib.save(pve_img, os.path.abspath(pve_file))
 
         return runtime
 
@@ -394,6 +404,98 @@ class ExtractPVEsFrom5TT(BaseInterface):
         return outputs
 
 
+def stream_tck_to_trk(
+    in_tracks, out_tracks, header, points_file=None, offsets_file=None, chunk_size=1000000
+):
+    """Convert a TCK tractogram to TRK without loading all streamlines in memory.
+
+    The TCK file is read lazily, streamline by streamline, and the TRK file is
+    written incrementally by `nibabel`, which patches the streamline count of
+    the TRK header once the last streamline has been written. If ``points_file``
+    and ``offsets_file`` are given, the streamline points (in RAS+ mm) and the
+    offsets of the first point of each streamline are written alongside as
+    ``.npy`` files that can be memory-mapped with ``np.load(..., mmap_mode="r")``.
+
+    Parameters
+    ----------
+    in_tracks : string
+        Path to the input tractogram in MRtrix TCK format
+
+    out_tracks : string
+        Path to the output tractogram in TrackVis TRK format
+
+    header : dict
+        TRK header fields indexed by :class:`nibabel.streamlines.Field`
+
+    points_file : string
+        Optional path to the ``(n_points, 3)`` float32 ``.npy`` point array
+
+    offsets_file : string
+        Optional path to the ``(n_streamlines + 1,)`` int64 ``.npy`` offset array
+
+    chunk_size : int
+        Number of points copied at a time when finalizing the point array
+
+    Returns
+    -------
+    n_streamlines : int
+        Number of streamlines converted
+    """
+    from nibabel.streamlines import TrkFile
+
+    tck = nib.streamlines.load(in_tracks, lazy_load=True)
+
+    write_points = points_file is not None and offsets_file is not None
+    counts = {"streamlines": 0, "points": 0}
+
+    if write_points:
+        # Points and offsets are appended to raw buffers as they are streamed
+        # since their total number is only known once the whole tractogram
+        # has been read
+        raw_points = open(points_file + ".raw", "wb")
+        raw_offsets = open(offsets_file + ".raw", "wb")
+        raw_offsets.write(np.int64(0).tobytes())
+
+    def _streamlines():
+        for streamline in tck.tractogram.streamlines:
+            counts["streamlines"] += 1
+            counts["points"] += len(streamline)
+            if write_points:
+                raw_points.write(np.asarray(streamline, dtype=np.float32).tobytes())
+                raw_offsets.write(np.int64(counts["points"]).tobytes())
+            yield streamline
+
+    tractogram = nib.streamlines.LazyTractogram(
+        _streamlines, affine_to_rasmm=tck.tractogram.affine_to_rasmm
+    )
+    TrkFile(tractogram, header=header).save(out_tracks)
+
+    if write_points:
+        raw_points.close()
+        raw_offsets.close()
+        _raw_to_npy(
+            points_file + ".raw", points_file, np.float32, (counts["points"], 3), chunk_size
+        )
+        _raw_to_npy(
+            offsets_file + ".raw", offsets_file, np.int64, (counts["streamlines"] + 1,), chunk_size
+        )
+
+    return counts["streamlines"]
+
+
+def _raw_to_npy(raw_file, npy_file, dtype, shape, chunk_size):
+    """Copy a raw binary buffer into a ``.npy`` file chunk by chunk and remove it."""
+    out = np.lib.format.open_memmap(npy_file, mode="w+", dtype=dtype, shape=shape)
+    if shape[0] > 0:
+        raw = np.memmap(raw_file, dtype=dtype, mode="r", shape=shape)
+        for start in range(0, shape[0], chunk_size):
+            out[start:start + chunk_size] = raw[start:start + chunk_size]
+        del raw
+    out.flush()
+    del out
+    os.remove(raw_file)
+
+
 class Tck2TrkInputSpec(BaseInterfaceInputSpec):
     in_tracks = File(
         exists=True, mandatory=True, desc="Input track file in MRtrix .tck format"
@@ -405,10 +507,20 @@ class Tck2TrkInputSpec(BaseInterfaceInputSpec):
 
     out_tracks = File(mandatory=True, desc="Output track file in Trackvis .trk format")
 
+    write_points = Bool(
+        False,
+        usedefault=True,
+        desc="Also write the streamline points and offsets as memory-mappable .npy files",
+    )
+
 
 class Tck2TrkOutputSpec(TraitedSpec):
     out_tracks = File(exists=True, desc="Output track file in Trackvis .trk format")
 
+    out_points = File(desc="Streamline points (in RAS+ mm) in .npy format")
+
+    out_offsets = File(desc="Offsets of the first point of each streamline in .npy format")
+
 
 class Tck2Trk(BaseInterface):
     """Convert a tractogram in `mrtrix` TCK format to `trackvis` TRK format.
@@ -448,15 +560,32 @@ class Tck2Trk(BaseInterface):
         ):
             print("Skipping non TCK file: '{}'".format(self.inputs.in_tracks))
         else:
-            tck = nib.streamlines.load(self.inputs.in_tracks)
             self.out_tracks = self.inputs.out_tracks
-            nib.streamlines.save(tck.tractogram, self.out_tracks, header=header)
+            points_file = offsets_file = None
+            if self.inputs.write_points:
+                base = os.path.abspath(self.out_tracks)
+                base = base[:-4] if base.endswith(".trk") else base
+                points_file = base + "_points.npy"
+                offsets_file = base + "_offsets.npy"
+            n_streamlines = stream_tck_to_trk(
+                self.inputs.in_tracks,
+                self.out_tracks,
+                header,
+                points_file=points_file,
+                offsets_file=offsets_file,
+            )
+            print(f"-> {n_streamlines} streamlines written to {self.out_tracks}")
+            self.out_points = points_file
+            self.out_offsets = offsets_file
 
         return runtime
 
     def _list_outputs(self):
         outputs = self._outputs().get()
         outputs["out_tracks"] = os.path.abspath(self.out_tracks)
+        if self.inputs.write_points:
+            outputs["out_points"] = self.out_points
+            outputs["out_offsets"] = self.out_offsets
         return outputs
 
 
@@ -590,53 +719,15 @@ class UpdateGMWMInterfaceSeeding(BaseInterface):
         new_gmwmi_data = gmwmi_data.copy()
 
         if roi_data.max() > 83:
-            # Thalamic nuclei
-            new_gmwmi_data[roi_data == 35] = maxv
-            new_gmwmi_data[roi_data == 36] = maxv
-            new_gmwmi_data[roi_data == 37] = maxv
-            new_gmwmi_data[roi_data == 38] = maxv
-            new_gmwmi_data[roi_data == 39] = maxv
-            new_gmwmi_data[roi_data == 40] = maxv
-            new_gmwmi_data[roi_data == 41] = maxv
-            new_gmwmi_data[roi_data == 96] = maxv
-            new_gmwmi_data[roi_data == 97] = maxv
-            new_gmwmi_data[roi_data == 98] = maxv
-            new_gmwmi_data[roi_data == 99] = maxv
-            new_gmwmi_data[roi_data == 100] = maxv
-            new_gmwmi_data[roi_data == 101] = maxv
-            new_gmwmi_data[roi_data == 102] = maxv
-
-            # Hippocampal subfields
-            new_gmwmi_data[roi_data == 48] = maxv
-            new_gmwmi_data[roi_data == 49] = maxv
-            new_gmwmi_data[roi_data == 50] = maxv
-            new_gmwmi_data[roi_data == 51] = maxv
-            new_gmwmi_data[roi_data == 52] = maxv
-            new_gmwmi_data[roi_data == 53] = maxv
-            new_gmwmi_data[roi_data == 54] = maxv
-            new_gmwmi_data[roi_data == 55] = maxv
-            new_gmwmi_data[roi_data == 56] = maxv
-            new_gmwmi_data[roi_data == 57] = maxv
-            new_gmwmi_data[roi_data == 58] = maxv
-            new_gmwmi_data[roi_data == 59] = maxv
-            new_gmwmi_data[roi_data == 109] = maxv
-            new_gmwmi_data[roi_data == 110] = maxv
-            new_gmwmi_data[roi_data == 111] = maxv
-            new_gmwmi_data[roi_data == 112] = maxv
-            new_gmwmi_data[roi_data == 113] = maxv
-            new_gmwmi_data[roi_data == 114] = maxv
-            new_gmwmi_data[roi_data == 115] = maxv
-            new_gmwmi_data[roi_data == 116] = maxv
-            new_gmwmi_data[roi_data == 117] = maxv
-            new_gmwmi_data[roi_data == 118] = maxv
-            new_gmwmi_data[roi_data == 119] = maxv
-            new_gmwmi_data[roi_data == 120] = maxv
-
-            # Brain stem
-            new_gmwmi_data[roi_data == 123] = maxv
-            new_gmwmi_data[roi_data == 124] = maxv
-            new_gmwmi_data[roi_data == 125] = maxv
-            new_gmwmi_data[roi_data == 126] = maxv
+            extra_labels = np.concatenate([
+                # Thalamic nuclei
+                np.arange(35, 42), np.arange(96, 103),
+                # Hippocampal subfields
+                np.arange(48, 60), np.arange(109, 121),
+                # Brain stem
+                np.arange(123, 127)
+            ])
+            new_gmwmi_data[labels_mask(roi_data, extra_labels)] = maxv
 
         new_gmwmi_img = nib.Nifti1Pair(new_gmwmi_data, gmwmi_img.affine)
         nib.save(new_gmwmi_img, self.inputs.out_gmwmi_file)
@@ -17,6 +17,7 @@ from nipype.interfaces.base import (
     BaseInterfaceInputSpec,
     TraitedSpec,
     InputMultiPath,
+    isdefined,
 )
 
 
@@ -96,8 +97,24 @@ class NuisanceRegressionInputSpec(BaseInterfaceInputSpec):
 
     motion_nuisance = Bool(desc="If `True` perform motion nuisance regression")
 
-    nuisance_motion_nb_reg = Int(
-        "36", desc="Number of reg to use in motion nuisance regression"
+    nuisance_motion_nb_reg = Enum(
+        36, 24, 12, 6, usedefault=True, desc="Number of reg to use in motion nuisance regression"
+    )
+
+    acompcor = Bool(
+        False, desc="If `True` regress out the principal components of the WM and CSF signals (aCompCor)"
+    )
+
+    tcompcor = Bool(
+        False,
+        desc="If `True` regress out the principal components of the brain voxels "
+             "with the highest temporal variance (tCompCor)",
+    )
+
+    n_compcor_components = Int(5, usedefault=True, desc="Number of aCompCor / tCompCor components")
+
+    tcompcor_fraction = Float(
+        0.02, usedefault=True, desc="Fraction of the brain voxels with the highest temporal variance used by tCompCor"
     )
 
     n_discard = Int(
@@ -120,9 +137,21 @@ class NuisanceRegressionOutputSpec(TraitedSpec):
 
     averageWM_mat = File(desc="Output matrix of WM regression")
 
+    motion_npy = File(desc="Motion regressors in `.npy` format")
+
+    motion_mat = File(desc="Output matrix of motion regression")
+
+    acompcor_npy = File(desc="aCompCor components in `.npy` format")
+
+    tcompcor_npy = File(desc="tCompCor components in `.npy` format")
+
 
 class NuisanceRegression(BaseInterface):
-    """Regress out nuisance signals (WM, CSF, movements) through GLM.
+    """Regress out nuisance signals (WM, CSF, movements, CompCor components) through GLM.
+
+    The residuals of all the voxels are obtained at once by projecting the
+    time-series on the orthogonal complement of the regressors
+    (see :func:`cmtklib.functionalMRI.regress_out`).
 
     Examples
     --------
@@ -143,6 +172,8 @@ class NuisanceRegression(BaseInterface):
     >>> nuisance.inputs.wm_nuisance = True
     >>> nuisance.inputs.motion_nuisance = True
     >>> nuisance.inputs.nuisance_motion_nb_reg = 36
+    >>> nuisance.inputs.acompcor = True
+    >>> nuisance.inputs.n_compcor_components = 5
     >>> nuisance.inputs.n_discard = 5
     >>> nuisance.run()  # doctest: +SKIP
 
@@ -189,119 +220,61 @@ class NuisanceRegression(BaseInterface):
 
         # Import parameters from head motion estimation
         if self.inputs.motion_nuisance:
-            move = np.genfromtxt(self.inputs.motion_file)
-            move = move - np.mean(move, 0)
-
-            # Update
-            move_der1 = np.concatenate((np.zeros([1, 6]), move[0:-1, :]), axis=0)
-            move_der2 = np.concatenate((np.zeros([2, 6]), move[0:-2, :]), axis=0)
-            move_sq = np.square(move)
-            move_der1_sq = np.square(move_der1)
-            move_der2_sq = np.square(move_der2)
-
-            move_der1 = move_der1 - np.mean(move_der1)
-            move_der2 = move_der2 - np.mean(move_der2)
-            move_der1_sq = move_der1_sq - np.mean(move_der1_sq)
-            move_der2_sq = move_der2_sq - np.mean(move_der2_sq)
-            move_sq = move_sq - np.mean(move_sq)
-
-            if (
-                self.inputs.nuisance_motion_nb_reg == "12"
-                or self.inputs.nuisance_motion_nb_reg == "24"
-                or self.inputs.nuisance_motion_nb_reg == "36"
-            ):
-                move = np.hstack((move, move_sq))
-            if (
-                self.inputs.nuisance_motion_nb_reg == "24"
-                or self.inputs.nuisance_motion_nb_reg == "36"
-            ):
-                move = np.hstack((move, move_der1))
-                move = np.hstack((move, move_der1_sq))
-            if self.inputs.nuisance_motion_nb_reg == "36":
-                move = np.hstack((move, move_der2))
-                move = np.hstack((move, move_der2_sq))
-
-        # GLM: regress out nuisance covariates
-        new_data = data.copy()
-
-        # s = gconf.parcellation.keys()[0]
-
-        gm = nib.load(self.inputs.gm_file[0]).get_data().astype(np.uint32)
-        # if float(self.inputs.n_discard) > 0:
-        #     n_discard = int(self.inputs.n_discard) - 1
-        #     if self.inputs.motion_nuisance:
-        #         move = move[n_discard:-1,:]
+            move = motion_regressors(self.inputs.motion_file, self.inputs.nuisance_motion_nb_reg)
+            np.save(os.path.abspath("motionRegressors.npy"), move)
+            sio.savemat(os.path.abspath("motionRegressors.mat"), {"motionRegressors": move})
 
         # build regressors matrix
+        regressors = []
         if self.inputs.global_nuisance:
-            X = np.hstack(global_values.reshape(tp, 1))
             print("> Detrend global average signal")
-            if self.inputs.csf_nuisance:
-                X = np.hstack((X.reshape(tp, 1), csf_values.reshape(tp, 1)))
-                print("... Detrend CSF average signal")
-                if self.inputs.wm_nuisance:
-                    X = np.hstack((X, wm_values.reshape(tp, 1)))
-                    print("... ... Detrend WM average signal")
-                    if self.inputs.motion_nuisance:
-                        print("... ... ... pre-Detrend motion average signals")
-                        X = np.hstack((X, move))
-                        print("... ... ... Detrend motion average signals")
-                elif self.inputs.motion_nuisance:
-                    X = np.hstack((X, move))
-                    print("... ... Detrend motion average signals")
-            elif self.inputs.wm_nuisance:
-                X = np.hstack((X.reshape(tp, 1), wm_values.reshape(tp, 1)))
-                print("... Detrend WM average signal")
-                if self.inputs.motion_nuisance:
-                    X = np.hstack((X, move))
-                    print("... ... Detrend motion average signals")
-            elif self.inputs.motion_nuisance:
-                X = np.hstack((X.reshape(tp, 1), move))
-                print("... Detrend motion average signals")
-        elif self.inputs.csf_nuisance:
-            X = np.hstack((csf_values.reshape(tp, 1)))
+            regressors.append(global_values.reshape(tp, 1))
+        if self.inputs.csf_nuisance:
             print("> Detrend CSF average signal")
-            if self.inputs.wm_nuisance:
-                X = np.hstack((X.reshape(tp, 1), wm_values.reshape(tp, 1)))
-                print("... Detrend WM average signal")
-                if self.inputs.motion_nuisance:
-                    X = np.hstack((X, move))
-                    print("... ... Detrend motion average signals")
-            elif self.inputs.motion_nuisance:
-                X = np.hstack((X.reshape(tp, 1), move))
-                print("... Detrend motion average signals")
-        elif self.inputs.wm_nuisance:
-            X = np.hstack((wm_values.reshape(tp, 1)))
+            regressors.append(csf_values.reshape(tp, 1))
+        if self.inputs.wm_nuisance:
             print("> Detrend WM average signal")
-            if self.inputs.motion_nuisance:
-                print("... pre-Detrend motion average signals")
-                # print('... move shape :',move.shape)
-                # print('... X shape :',X.shape)
-                Y = X.reshape(tp, 1)
-                # print('... Y shape :',Y.shape)
-                X = np.hstack((Y, move))
-                print("... Detrend motion average signals")
-        elif self.inputs.motion_nuisance:
-            X = move
-            print("> Detrend motion average signals")
-
-        import statsmodels.api as sm
-
-        X = sm.add_constant(X)
-        # print('Shape X GLM')
-        # print(X.shape)
-
-        # loop throughout all GM voxels
-        for index, _ in np.ndenumerate(gm):
-            Y = data[index[0], index[1], index[2], :].reshape(tp, 1)
-            gls_model = sm.GLS(Y, X)
-            gls_results = gls_model.fit()
-            # new_data[index[0],index[1],index[2],:] = gls_results.resid
-            new_data[
-                index[0], index[1], index[2], :
-            ] = gls_results.resid  # + gls_results.params[8]
-
-        img = nib.Nifti1Image(new_data, dataimg.get_affine(), dataimg.get_header())
+            regressors.append(wm_values.reshape(tp, 1))
+        if self.inputs.motion_nuisance:
+            print(f"> Detrend {move.shape[1]} motion signals")
+            regressors.append(move)
+
+        # Extract the principal components of the WM and CSF signals
+        if self.inputs.acompcor:
+            print(f"> Detrend {self.inputs.n_compcor_components} aCompCor components")
+            csf = nib.load(self.inputs.csf_file).get_data().astype(np.uint32)
+            WM = nib.load(self.inputs.wm_file).get_data().astype(np.uint32)
+            acompcor = compcor_components(
+                data[(csf == 1) | (WM == 1)], self.inputs.n_compcor_components
+            )
+            np.save(os.path.abspath("aCompCor.npy"), acompcor)
+            sio.savemat(os.path.abspath("aCompCor.mat"), {"aCompCor": acompcor})
+            regressors.append(acompcor)
+
+        # Extract the principal components of the brain voxels with the highest temporal variance
+        if self.inputs.tcompcor:
+            print(f"> Detrend {self.inputs.n_compcor_components} tCompCor components")
+            brain = nib.load(self.inputs.brainfile).get_data().astype(np.uint32)
+            brain_values = data[brain == 1]
+            tcompcor = compcor_components(
+                brain_values[tcompcor_voxels(brain_values, self.inputs.tcompcor_fraction)],
+                self.inputs.n_compcor_components,
+                standardize=True,
+            )
+            del brain_values
+            np.save(os.path.abspath("tCompCor.npy"), tcompcor)
+            sio.savemat(os.path.abspath("tCompCor.mat"), {"tCompCor": tcompcor})
+            regressors.append(tcompcor)
+
+        # GLM: regress out nuisance covariates from all the voxels at once
+        new_data = np.asarray(data, dtype=np.float32).reshape(-1, tp)
+        if regressors:
+            regress_out(new_data, np.hstack(regressors))
+        new_data = new_data.reshape(data.shape)
+
+        hdr = dataimg.get_header().copy()
+        hdr.set_data_dtype(np.float32)
+        img = nib.Nifti1Image(new_data, dataimg.get_affine(), hdr)
         nib.save(img, os.path.abspath("fMRI_nuisance.nii.gz"))
 
         return runtime
@@ -318,6 +291,13 @@ class NuisanceRegression(BaseInterface):
         if self.inputs.wm_nuisance:
             outputs["averageWM_npy"] = os.path.abspath("averageWM.npy")
             outputs["averageWM_mat"] = os.path.abspath("averageWM.mat")
+        if self.inputs.motion_nuisance:
+            outputs["motion_npy"] = os.path.abspath("motionRegressors.npy")
+            outputs["motion_mat"] = os.path.abspath("motionRegressors.mat")
+        if self.inputs.acompcor:
+            outputs["acompcor_npy"] = os.path.abspath("aCompCor.npy")
+        if self.inputs.tcompcor:
+            outputs["tcompcor_npy"] = os.path.abspath("tCompCor.npy")
         return outputs
 
 
@@ -536,3 +516,732 @@ class Scrubbing(BaseInterface):
         outputs["fd_npy"] = os.path.abspath("FD.npy")
         outputs["dvars_npy"] = os.path.abspath("DVARS.npy")
         return outputs
+
+
+def motion_regressors(motion_file, nb_reg=36):
+    """Build the motion nuisance regressors from the motion parameters.
+
+    The regressors are the 6 motion parameters, their squares (12), the
+    parameters shifted by one volume and their squares (24), and the
+    parameters shifted by two volumes and their squares (36).
+
+    Parameters
+    ----------
+    motion_file : string
+        Path to the motion parameters (one line of 6 parameters per volume)
+
+    nb_reg : {6, 12, 24, 36}
+        Number of motion regressors
+
+    Returns
+    -------
+    regressors : numpy.ndarray
+        Array of shape ``(n_timepoints, nb_reg)`` with centered regressors
+    """
+    move = np.genfromtxt(motion_file)
+    move = move - np.mean(move, 0)
+    move_der1 = np.concatenate((np.zeros([1, 6]), move[0:-1, :]), axis=0)
+    move_der2 = np.concatenate((np.zeros([2, 6]), move[0:-2, :]), axis=0)
+
+    regressors = [move]
+    if nb_reg >= 12:
+        regressors.append(np.square(move))
+    if nb_reg >= 24:
+        regressors += [move_der1, np.square(move_der1)]
+    if nb_reg >= 36:
+        regressors += [move_der2, np.square(move_der2)]
+    regressors = np.hstack(regressors)
+    return regressors - np.mean(regressors, 0)
+
+
+def _orthonormal_basis(X):
+    """Return an orthonormal basis of the space spanned by the columns of `X`."""
+    u, s, _ = np.linalg.svd(X, full_matrices=False)
+    # Drop the directions of (numerically) collinear or null regressors
+    return u[:, s > s.max() * max(X.shape) * np.finfo(np.float64).eps]
+
+
+def regress_out(data, regressors, constant=True, chunk_size=8192):
+    """Replace in place time-series by the residuals of their regression on nuisance regressors.
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        Array of shape ``(n_voxels, n_timepoints)``, modified in place
+
+    regressors : numpy.ndarray
+        Array of shape ``(n_timepoints, n_regressors)``
+
+    constant : bool
+        If `True`, a constant regressor is included, such that the residuals have zero mean
+
+    chunk_size : int
+        Number of voxels processed at once
+    """
+    tp = data.shape[1]
+    X = np.asarray(regressors, dtype=np.float64).reshape(tp, -1)
+    if constant:
+        X = np.hstack((np.ones((tp, 1)), X))
+    # Projection on an orthonormal basis of the regressors (equivalent to the OLS fit),
+    # computed in double precision to avoid cancellation errors with large signal means
+    q = _orthonormal_basis(X)
+    for start in range(0, data.shape[0], chunk_size):
+        block = np.asarray(data[start:start + chunk_size], dtype=np.float64)
+        data[start:start + chunk_size] = block - (block @ q) @ q.T
+
+
+def polynomial_trends(n_timepoints, order):
+    """Return the polynomial trends (without the constant) regressed out by the detrending.
+
+    Parameters
+    ----------
+    n_timepoints : int
+        Number of time points
+
+    order : int
+        Order of the polynomial (1 for linear, 2 for quadratic, 3 for cubic)
+
+    Returns
+    -------
+    trends : numpy.ndarray
+        Array of shape ``(n_timepoints, order)``
+    """
+    t = np.linspace(-1, 1, n_timepoints)
+    return np.vstack([t ** k for k in range(1, order + 1)]).T
+
+
+def compcor_components(data, n_components=5, standardize=False, chunk_size=8192):
+    """Return the principal temporal components of a set of time-series (CompCor).
+
+    The time-series are centered (and optionally variance-normalized) and the
+    right singular vectors of the (voxels x time) matrix are obtained by a
+    truncated eigen-decomposition of its (time x time) Gram matrix, which is
+    accumulated over chunks of voxels.
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        Array of shape ``(n_voxels, n_timepoints)``
+
+    n_components : int
+        Number of components
+
+    standardize : bool
+        If `True`, normalize the variance of the time-series (as in tCompCor)
+
+    chunk_size : int
+        Number of voxels processed at once
+
+    Returns
+    -------
+    components : numpy.ndarray
+        Array of shape ``(n_timepoints, n_components)`` with the components
+        ordered by decreasing explained variance
+    """
+    tp = data.shape[1]
+    gram = np.zeros((tp, tp))
+    for start in range(0, data.shape[0], chunk_size):
+        block = np.asarray(data[start:start + chunk_size], dtype=np.float64)
+        block = block - block.mean(axis=1, keepdims=True)
+        if standardize:
+            std = block.std(axis=1, keepdims=True)
+            std[std == 0] = 1
+            block /= std
+        gram += block.T @ block
+    n_components = min(n_components, tp)
+    _, vectors = np.linalg.eigh(gram, UPLO="L")
+    return vectors[:, ::-1][:, :n_components]
+
+
+def tcompcor_voxels(data, fraction=0.02):
+    """Return the indices of the time-series with the highest temporal standard deviation (tCompCor).
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        Array of shape ``(n_voxels, n_timepoints)``
+
+    fraction : float
+        Fraction of the time-series to select
+
+    Returns
+    -------
+    indices : numpy.ndarray
+        Indices of the selected time-series
+    """
+    std = np.std(data, axis=1)
+    n_voxels = max(1, int(round(fraction * data.shape[0])))
+    return np.argsort(std)[::-1][:n_voxels]
+
+
+def bandpass_filter(data, tr, highpass, lowpass, regressors=None, chunk_size=8192):
+    """Filter in place time-series with an ideal FFT band-pass filter.
+
+    Frequencies below `highpass` and above `lowpass` are zeroed in the
+    real FFT of each time-series, as done by AFNI ``3dBandpass``.
+    Nuisance regressors can be filtered the same way and projected out
+    of the filtered time-series (``-ort`` option of ``3dBandpass``), which
+    prevents the filter from reintroducing nuisance signals previously
+    regressed out.
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        Array of shape ``(n_voxels, n_timepoints)``, modified in place
+
+    tr : float
+        Repetition time in seconds
+
+    highpass : float
+        Frequency (Hz) below which the signal is removed (0 keeps the mean)
+
+    lowpass : float
+        Frequency (Hz) above which the signal is removed (0 or less disables the low-pass)
+
+    regressors : numpy.ndarray
+        Array of shape ``(n_timepoints, n_regressors)`` with the nuisance
+        regressors to orthogonalize the filtered time-series to (Default: None)
+
+    chunk_size : int
+        Number of voxels processed at once
+    """
+    tp = data.shape[1]
+    freqs = np.fft.rfftfreq(tp, d=tr)
+    stopband = freqs < highpass
+    if lowpass > 0:
+        stopband |= freqs > lowpass
+    for start in range(0, data.shape[0], chunk_size):
+        block = data[start:start + chunk_size]
+        spectrum = np.fft.rfft(block, axis=1)
+        spectrum[:, stopband] = 0
+        block[:] = np.fft.irfft(spectrum, n=tp, axis=1)
+
+    if regressors is not None:
+        regressors = np.asarray(regressors, dtype=np.float64).reshape(tp, -1).T.copy()
+        bandpass_filter(regressors, tr, highpass, lowpass)
+        regress_out(data, regressors.T, constant=False, chunk_size=chunk_size)
+
+
+def despike(data, cut=(2.5, 4.0), corder=None, window=9, chunk_size=8192):
+    """Remove in place the spikes of time-series.
+
+    A smooth curve made of quadratic and sinusoidal trends (as in AFNI ``3dDespike``)
+    is fitted to the running median of each time-series, which makes the fit robust
+    to the spikes, like the L1 fit of ``3dDespike``. The residuals are normalized
+    by their median absolute deviation (MAD) and values deviating by more than
+    ``cut[0]`` MADs are compressed to at most ``cut[1]`` MADs with a hyperbolic tangent.
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        Array of shape ``(n_voxels, n_timepoints)``, modified in place
+
+    cut : (float, float)
+        Deviations (in MADs) above which a value is a spike and to which spikes are compressed
+
+    corder : int
+        Number of sinusoidal trends. If `None`, one per 30 time points
+
+    window : int
+        Length of the running median
+
+    chunk_size : int
+        Number of voxels processed at once
+
+    Returns
+    -------
+    n_spikes : int
+        Number of values that were compressed
+    """
+    from scipy.ndimage import median_filter
+
+    tp = data.shape[1]
+    corder = tp // 30 if corder is None else corder
+    t = np.arange(tp) / tp
+    basis = [np.ones(tp), t - 0.5, (t - 0.5) ** 2]
+    for k in range(1, corder + 1):
+        basis += [np.sin(2 * np.pi * k * t), np.cos(2 * np.pi * k * t)]
+    q = _orthonormal_basis(np.vstack(basis).T).astype(data.dtype)
+
+    c1, c2 = cut
+    n_spikes = 0
+    for start in range(0, data.shape[0], chunk_size):
+        block = data[start:start + chunk_size]
+        smooth = median_filter(block, size=(1, window), mode="mirror")
+        fit = (smooth @ q) @ q.T
+        residuals = block - fit
+        mad = np.sqrt(np.pi / 2) * np.median(np.absolute(residuals), axis=1, keepdims=True)
+        mad[mad == 0] = 1
+        deviations = residuals / mad
+        spikes = np.absolute(deviations) > c1
+        n_spikes += int(spikes.sum())
+        compressed = np.sign(deviations) * (
+            c1 + (c2 - c1) * np.tanh((np.absolute(deviations) - c1) / (c2 - c1))
+        )
+        block[spikes] = (fit + compressed * mad)[spikes]
+    return n_spikes
+
+
+def scrubbing_metrics(data, motion):
+    """Compute the framewise displacement (FD) and the DVARS used for scrubbing.
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        Array of shape ``(n_voxels, n_timepoints)`` with the time-series of the voxels in the WM and GM
+
+    motion : numpy.ndarray
+        Array of shape ``(n_timepoints, 6)`` with the motion parameters
+
+    Returns
+    -------
+    FD : numpy.ndarray
+        Array of shape ``(n_timepoints - 1, 1)``
+
+    DVARS : numpy.ndarray
+        Array of shape ``(n_timepoints - 1, 1)``
+    """
+    tp = data.shape[1]
+    FD = np.zeros((tp - 1, 1))
+    DVARS = np.zeros((tp - 1, 1))
+    FD[1:, 0] = np.absolute(np.diff(motion[: tp - 1], axis=0)).sum(axis=1)
+    DVARS[1:, 0] = np.sqrt(
+        np.mean(np.square(np.diff(data[:, : tp - 1], axis=1)), axis=0, dtype=np.float64)
+    )
+    return FD, DVARS
+
+
+def _get_repetition_time(img):
+    """Return the repetition time in seconds stored in the header of a 4D image."""
+    tr = float(img.header.get_zooms()[3])
+    if img.header.get_xyzt_units()[1] == "msec":
+        tr /= 1000.0
+    return tr
+
+
+def _load_mask(mask_file, threshold_on_label=False):
+    """Load a mask as a boolean array (voxels equal to 1 or, for label volumes, greater than 0)."""
+    mask = np.asanyarray(nib.load(mask_file).dataobj).astype(np.uint32)
+    return mask > 0 if threshold_on_label else mask == 1
+
+
+def _save_masked_timeseries(data, mask, ref_img, out_file):
+    """Save time-series of the voxels in a mask as a float32 4D NIfTI image."""
+    out = np.zeros(mask.shape + (data.shape[1],), dtype=np.float32)
+    out[mask] = data
+    hdr = ref_img.header.copy()
+    hdr.set_data_dtype(np.float32)
+    nib.save(nib.Nifti1Image(out, ref_img.affine, hdr), out_file)
+
+
+class FunctionalPostProcessingInputSpec(BaseInterfaceInputSpec):
+    in_file = File(exists=True, mandatory=True, desc="Input 4D fMRI image")
+
+    brainfile = File(desc="Eroded brain mask registered to fMRI space")
+
+    csf_file = File(desc="Eroded CSF mask registered to fMRI space")
+
+    wm_file = File(desc="WM mask registered to fMRI space")
+
+    motion_file = File(desc="Motion parameters from preprocessing stage")
+
+    gm_file = InputMultiPath(File(exists=True), mandatory=True, desc="GM atlas files registered to fMRI space")
+
+    detrending = Bool(True, usedefault=True, desc="If `True` perform detrending")
+
+    detrending_mode = Enum(
+        ["linear", "quadratic", "cubic"], usedefault=True, desc="Order of the polynomial detrending"
+    )
+
+    global_nuisance = Bool(desc="If `True` perform global nuisance regression (requires `brainfile`)")
+
+    csf_nuisance = Bool(desc="If `True` perform CSF nuisance regression (requires `csf_file`)")
+
+    wm_nuisance = Bool(desc="If `True` perform WM nuisance regression (requires `wm_file`)")
+
+    motion_nuisance = Bool(desc="If `True` perform motion nuisance regression (requires `motion_file`)")
+
+    nuisance_motion_nb_reg = Enum(
+        36, 24, 12, 6, usedefault=True, desc="Number of reg to use in motion nuisance regression"
+    )
+
+    acompcor = Bool(
+        False,
+        desc="If `True` regress out the principal components of the WM and CSF signals (aCompCor) "
+             "(requires `csf_file` and `wm_file`)",
+    )
+
+    tcompcor = Bool(
+        False,
+        desc="If `True` regress out the principal components of the brain voxels "
+             "with the highest temporal variance (tCompCor) (requires `brainfile`)",
+    )
+
+    n_compcor_components = Int(5, usedefault=True, desc="Number of aCompCor / tCompCor components")
+
+    tcompcor_fraction = Float(
+        0.02, usedefault=True, desc="Fraction of the brain voxels with the highest temporal variance used by tCompCor"
+    )
+
+    highpass = Float(0.0, usedefault=True, desc="Frequency (Hz) below which the signal is removed")
+
+    lowpass = Float(0.0, usedefault=True, desc="Frequency (Hz) above which the signal is removed (0 to disable)")
+
+    orthogonalize = Bool(
+        False, desc="If `True` orthogonalize the filtered time-series to the filtered nuisance regressors"
+    )
+
+    scrubbing = Bool(
+        True, usedefault=True, desc="If `True` compute FD and DVARS for scrubbing (requires `motion_file`)"
+    )
+
+    save_intermediates = Bool(
+        False, desc="If `True` save the detrended and nuisance regressed fMRI volumes"
+    )
+
+
+class FunctionalPostProcessingOutputSpec(TraitedSpec):
+    out_file = File(exists=True, desc="Post-processed fMRI volume")
+
+    detrending_file = File(desc="Detrended fMRI volume (if `save_intermediates`)")
+
+    nuisance_file = File(desc="Nuisance regressed fMRI volume (if `save_intermediates`)")
+
+    fd_mat = File(desc="FD matrix for scrubbing")
+
+    dvars_mat = File(desc="DVARS matrix for scrubbing")
+
+    fd_npy = File(desc="FD in .npy format")
+
+    dvars_npy = File(desc="DVARS in .npy format")
+
+
+class FunctionalPostProcessing(BaseInterface):
+    """Apply detrending, nuisance regression, band-pass filtering and scrubbing in memory.
+
+    The fMRI volume is loaded once as a float32 matrix of the time-series of the
+    voxels in the brain, GM, WM and CSF masks, which is processed in place by
+    each step. Only the final volume (and optionally the intermediate volumes)
+    is written. Voxels outside the masks are set to zero.
+
+    Examples
+    --------
+    >>> from cmtklib.functionalMRI import FunctionalPostProcessing
+    >>> postproc = FunctionalPostProcessing()
+    >>> postproc.inputs.base_dir = '/my_directory'
+    >>> postproc.inputs.in_file = '/path/to/sub-01_task-rest_desc-preproc_bold.nii.gz'
+    >>> postproc.inputs.brainfile = '/path/to/sub-01_space-meanBOLD_desc-eroded_label-brain_dseg.nii.gz'
+    >>> postproc.inputs.wm_file = '/path/to/sub-01_space-meanBOLD_label-WM_dseg.nii.gz'
+    >>> postproc.inputs.csf_file = '/path/to/sub-01_space-meanBOLD_desc-eroded_label-CSF_dseg.nii.gz'
+    >>> postproc.inputs.motion_file = '/path/to/sub-01_motions.par'
+    >>> postproc.inputs.gm_file = ['/path/to/sub-01_space-meanBOLD_atlas-L2018_desc-scale1_dseg.nii.gz']
+    >>> postproc.inputs.detrending_mode = 'quadratic'
+    >>> postproc.inputs.csf_nuisance = True
+    >>> postproc.inputs.wm_nuisance = True
+    >>> postproc.inputs.motion_nuisance = True
+    >>> postproc.inputs.highpass = 0.01
+    >>> postproc.inputs.lowpass = 0.1
+    >>> postproc.run()  # doctest: +SKIP
+
+    """
+
+    input_spec = FunctionalPostProcessingInputSpec
+    output_spec = FunctionalPostProcessingOutputSpec
+
+    # Input files required by each processing step when it is enabled
+    _step_requires = [
+        ("global_nuisance", ["brainfile"]),
+        ("csf_nuisance", ["csf_file"]),
+        ("wm_nuisance", ["wm_file"]),
+        ("motion_nuisance", ["motion_file"]),
+        ("acompcor", ["csf_file", "wm_file"]),
+        ("tcompcor", ["brainfile"]),
+        ("scrubbing", ["motion_file"]),
+    ]
+
+    def _check_step_requires(self):
+        """Raise a `ValueError` before loading the data if an enabled step misses an input file.
+
+        The ``requires`` metadata of the traits cannot be used as it is also
+        checked when the steps are disabled (set to `False`).
+        """
+        for step, requires in self._step_requires:
+            missing = [name for name in requires if not isdefined(getattr(self.inputs, name))]
+            if getattr(self.inputs, step) and missing:
+                raise ValueError(
+                    f"{self.__class__.__name__} requires a value for input(s) "
+                    f"{', '.join(repr(name) for name in missing)} because {step!r} is set to True. "
+                    f"For a list of required inputs, see {self.__class__.__name__}.help()"
+                )
+
+    def _run_interface(self, runtime):
+        self._check_step_requires()
+
+        print("Post-process fMRI time-series in memory")
+        print("=======================================")
+
+        dataimg = nib.load(self.inputs.in_file)
+
+        masks = {"gm": _load_mask(self.inputs.gm_file[0], threshold_on_label=True)}
+        for name, mask_file in [
+            ("brain", self.inputs.brainfile),
+            ("csf", self.inputs.csf_file),
+            ("wm", self.inputs.wm_file),
+        ]:
+            if isdefined(mask_file):
+                masks[name] = _load_mask(mask_file)
+        mask = np.logical_or.reduce(list(masks.values()))
+
+        # Time-series of the voxels in the mask as a (voxels x time) float32 matrix
+        data = dataimg.get_fdata(dtype=np.float32)[mask]
+        tp = data.shape[1]
+        print(f"  * {data.shape[0]} voxels x {tp} time points")
+
+        def submask(name):
+            return masks[name][mask]
+
+        if self.inputs.scrubbing:
+            print("  * Compute FD and DVARS")
+            scrubbing_mask = submask("gm") | submask("wm") if "wm" in masks else submask("gm")
+            FD, DVARS = scrubbing_metrics(
+                data[scrubbing_mask], np.genfromtxt(self.inputs.motion_file)
+            )
+            np.save(os.path.abspath("FD.npy"), FD)
+            np.save(os.path.abspath("DVARS.npy"), DVARS)
+            sio.savemat(os.path.abspath("FD.mat"), {"FD": FD})
+            sio.savemat(os.path.abspath("DVARS.mat"), {"DVARS": DVARS})
+
+        if self.inputs.detrending:
+            order = {"linear": 1, "quadratic": 2, "cubic": 3}[self.inputs.detrending_mode]
+            print(f"  * Detrend ({self.inputs.detrending_mode})")
+            regress_out(data, polynomial_trends(tp, order))
+            if self.inputs.save_intermediates:
+                _save_masked_timeseries(data, mask, dataimg, os.path.abspath("fMRI_detrending.nii.gz"))
+
+        nuisance = None
+        regressors = []
+        for name, enabled in [
+            ("brain", self.inputs.global_nuisance),
+            ("csf", self.inputs.csf_nuisance),
+            ("wm", self.inputs.wm_nuisance),
+        ]:
+            if enabled:
+                print(f"  * Regress out {name} average signal")
+                regressors.append(data[submask(name)].mean(axis=0, dtype=np.float64).reshape(tp, 1))
+        if self.inputs.motion_nuisance:
+            print(f"  * Regress out {self.inputs.nuisance_motion_nb_reg} motion signals")
+            regressors.append(
+                motion_regressors(self.inputs.motion_file, self.inputs.nuisance_motion_nb_reg)
+            )
+        if self.inputs.acompcor:
+            print(f"  * Regress out {self.inputs.n_compcor_components} aCompCor components")
+            regressors.append(
+                compcor_components(data[submask("csf") | submask("wm")], self.inputs.n_compcor_components)
+            )
+        if self.inputs.tcompcor:
+            print(f"  * Regress out {self.inputs.n_compcor_components} tCompCor components")
+            brain_values = data[submask("brain")]
+            regressors.append(
+                compcor_components(
+                    brain_values[tcompcor_voxels(brain_values, self.inputs.tcompcor_fraction)],
+                    self.inputs.n_compcor_components,
+                    standardize=True,
+                )
+            )
+            del brain_values
+        if regressors:
+            nuisance = np.hstack(regressors)
+            regress_out(data, nuisance)
+            if self.inputs.save_intermediates:
+                _save_masked_timeseries(data, mask, dataimg, os.path.abspath("fMRI_nuisance.nii.gz"))
+
+        if self.inputs.highpass > 0 or self.inputs.lowpass > 0:
+            print(f"  * Band-pass filter ({self.inputs.highpass} - {self.inputs.lowpass} Hz)")
+            bandpass_filter(
+                data, _get_repetition_time(dataimg), self.inputs.highpass, self.inputs.lowpass,
+                regressors=nuisance if self.inputs.orthogonalize else None,
+            )
+
+        _save_masked_timeseries(data, mask, dataimg, os.path.abspath("fMRI_postprocessing.nii.gz"))
+
+        print("[ DONE ]")
+        return runtime
+
+    def _list_outputs(self):
+        outputs = self._outputs().get()
+        outputs["out_file"] = os.path.abspath("fMRI_postprocessing.nii.gz")
+        if self.inputs.save_intermediates:
+            if self.inputs.detrending:
+                outputs["detrending_file"] = os.path.abspath("fMRI_detrending.nii.gz")
+            if (
+                self.inputs.global_nuisance
+                or self.inputs.csf_nuisance
+                or self.inputs.wm_nuisance
+                or self.inputs.motion_nuisance
+                or self.inputs.acompcor
+                or self.inputs.tcompcor
+            ):
+                outputs["nuisance_file"] = os.path.abspath("fMRI_nuisance.nii.gz")
+        if self.inputs.scrubbing:
+            outputs["fd_mat"] = os.path.abspath("FD.mat")
+            outputs["dvars_mat"] = os.path.abspath("DVARS.mat")
+            outputs["fd_npy"] = os.path.abspath("FD.npy")
+            outputs["dvars_npy"] = os.path.abspath("DVARS.npy")
+        return outputs
+
+
+def _load_timeseries(in_file, mask_file=None):
+    """Load a 4D image as float32 with the (voxels x time) matrix of the voxels to process.
+
+    If no mask is given, voxels with only zero values are not processed.
+    """
+    img = nib.load(in_file)
+    volume = img.get_fdata(dtype=np.float32)
+    if mask_file is not None:
+        mask = np.asanyarray(nib.load(mask_file).dataobj) > 0
+    else:
+        mask = volume.any(axis=-1)
+    return img, volume, mask, volume[mask]
+
+
+def _save_timeseries(img, volume, mask, data, out_file):
+    """Save a float32 4D image where the voxels in the mask are replaced by the processed time-series."""
+    volume[mask] = data
+    hdr = img.header.copy()
+    hdr.set_data_dtype(np.float32)
+    nib.save(nib.Nifti1Image(volume, img.affine, hdr), out_file)
+
+
+class DespikingInputSpec(BaseInterfaceInputSpec):
+    in_file = File(exists=True, mandatory=True, desc="Input 4D fMRI image")
+
+    mask = File(exists=True, desc="Mask of the voxels to despike (Default: voxels with non-zero values)")
+
+    cut = Tuple(
+        Float(2.5),
+        Float(4.0),
+        usedefault=True,
+        desc="Deviations (in MADs) above which a value is a spike and to which spikes are compressed",
+    )
+
+    corder = Int(desc="Number of sinusoidal trends fitted to the time-series (Default: one per 30 volumes)")
+
+
+class DespikingOutputSpec(TraitedSpec):
+    out_file = File(exists=True, desc="Despiked fMRI volume")
+
+
+class Despiking(BaseInterface):
+    """Remove spikes from the fMRI time-series in memory.
+
+    Native alternative to the AFNI ``3dDespike`` interface (:class:`cmtklib.interfaces.afni.Despike`).
+    See :func:`cmtklib.functionalMRI.despike` for the algorithm.
+
+    Examples
+    --------
+    >>> from cmtklib.functionalMRI import Despiking
+    >>> despike = Despiking()
+    >>> despike.inputs.base_dir = '/my_directory'
+    >>> despike.inputs.in_file = '/path/to/sub-01_task-rest_bold.nii.gz'
+    >>> despike.run()  # doctest: +SKIP
+
+    """
+
+    input_spec = DespikingInputSpec
+    output_spec = DespikingOutputSpec
+
+    def _run_interface(self, runtime):
+        print("Despiking")
+        print("=========")
+        img, volume, mask, data = _load_timeseries(
+            self.inputs.in_file, self.inputs.mask if isdefined(self.inputs.mask) else None
+        )
+        n_spikes = despike(
+            data,
+            cut=self.inputs.cut,
+            corder=self.inputs.corder if isdefined(self.inputs.corder) else None,
+        )
+        print(f"  * {n_spikes} spikes compressed in {data.shape[0]} voxels")
+        _save_timeseries(img, volume, mask, data, os.path.abspath("fMRI_despike.nii.gz"))
+        print("[ DONE ]")
+        return runtime
+
+    def _list_outputs(self):
+        outputs = self._outputs().get()
+        outputs["out_file"] = os.path.abspath("fMRI_despike.nii.gz")
+        return outputs
+
+
+class BandpassFilteringInputSpec(BaseInterfaceInputSpec):
+    in_file = File(exists=True, mandatory=True, desc="Input 4D fMRI image")
+
+    mask = File(exists=True, desc="Mask of the voxels to filter (Default: voxels with non-zero values)")
+
+    highpass = Float(mandatory=True, desc="Frequency (Hz) below which the signal is removed")
+
+    lowpass = Float(mandatory=True, desc="Frequency (Hz) above which the signal is removed (0 to disable)")
+
+    tr = Float(desc="Repetition time in seconds (Default: read from the image header)")
+
+    orthogonalize_file = InputMultiPath(
+        File(exists=True),
+        desc="Files (`.npy` or text) with nuisance regressors (one row per volume) "
+             "to orthogonalize the filtered time-series to",
+    )
+
+
+class BandpassFilteringOutputSpec(TraitedSpec):
+    out_file = File(exists=True, desc="Band-pass filtered fMRI volume")
+
+
+class BandpassFiltering(BaseInterface):
+    """Apply an FFT band-pass filter to the fMRI time-series in memory.
+
+    Native alternative to the AFNI ``3dBandpass`` interface (:class:`cmtklib.interfaces.afni.Bandpass`).
+    See :func:`cmtklib.functionalMRI.bandpass_filter` for the algorithm.
+
+    Examples
+    --------
+    >>> from cmtklib.functionalMRI import BandpassFiltering
+    >>> bandpass = BandpassFiltering()
+    >>> bandpass.inputs.base_dir = '/my_directory'
+    >>> bandpass.inputs.in_file = '/path/to/sub-01_task-rest_desc-preproc_bold.nii.gz'
+    >>> bandpass.inputs.highpass = 0.01
+    >>> bandpass.inputs.lowpass = 0.1
+    >>> bandpass.inputs.orthogonalize_file = ['/path/to/averageWM.npy', '/path/to/averageCSF.npy']
+    >>> bandpass.run()  # doctest: +SKIP
+
+    """
+
+    input_spec = BandpassFilteringInputSpec
+    output_spec = BandpassFilteringOutputSpec
+
+    def _run_interface(self, runtime):
+        print("Band-pass filtering")
+        print("===================")
+        img, volume, mask, data = _load_timeseries(
+            self.inputs.in_file, self.inputs.mask if isdefined(self.inputs.mask) else None
+        )
+        tp = data.shape[1]
+        tr = self.inputs.tr if isdefined(self.inputs.tr) else _get_repetition_time(img)
+
+        regressors = None
+        if isdefined(self.inputs.orthogonalize_file) and self.inputs.orthogonalize_file:
+            regressors = np.hstack(
+                [
+                    (np.load(f) if f.endswith(".npy") else np.genfromtxt(f)).reshape(tp, -1)
+                    for f in self.inputs.orthogonalize_file
+                ]
+            )
+            print(f"  * Orthogonalize to {regressors.shape[1]} nuisance regressors")
+
+        print(f"  * Filter {data.shape[0]} voxels ({self.inputs.highpass} - {self.inputs.lowpass} Hz, TR = {tr} s)")
+        bandpass_filter(data, tr, self.inputs.highpass, self.inputs.lowpass, regressors=regressors)
+        _save_timeseries(img, volume, mask, data, os.path.abspath("fMRI_bandpass.nii.gz"))
+        print("[ DONE ]")
+        return runtime
+
+    def _list_outputs(self):
+        outputs = self._outputs().get()
+        outputs["out_file"] = os.path.abspath("fMRI_bandpass.nii.gz")
+        return outputs
@@ -5,9 +5,7 @@
 #  This software is distributed under the open-source license Modified BSD.
 
 """The ANTs module provides Nipype interfaces for the ANTs registration toolbox missing in nipype or modified."""
-import os
-import glob
-
+import nibabel as nib
 from traits.api import *
 
 from nipype.interfaces.base import traits, \
@@ -15,6 +13,11 @@ from nipype.interfaces.base import traits, \
     BaseInterface, BaseInterfaceInputSpec
 
 from nipype.interfaces.ants.resampling import ApplyTransforms
+from nipype.utils.filemanip import split_filename
+
+from cmtklib.resampling import (
+    ants_voxel_map, is_supported_ants_transform, resample_labels, run_interfaces, same_grid
+)
 
 
 class MultipleANTsApplyTransformsInputSpec(BaseInterfaceInputSpec):
@@ -42,6 +45,14 @@ class MultipleANTsApplyTransformsInputSpec(BaseInterfaceInputSpec):
 
     out_postfix = traits.Str("_transformed", usedefault=True)
 
+    in_process = traits.Bool(True, usedefault=True,
+                             desc='Resample all the images in-process with a single coordinate map '
+                                  'when the interpolation is NearestNeighbor')
+
+    number_of_workers = traits.Int(1, usedefault=True,
+                                   desc='Number of concurrent antsApplyTransforms processes '
+                                        'when not resampling in-process')
+
 
 class MultipleANTsApplyTransformsOutputSpec(TraitedSpec):
     output_images = OutputMultiPath(File())
@@ -74,14 +85,31 @@ class MultipleANTsApplyTransforms(BaseInterface):
     output_spec = MultipleANTsApplyTransformsOutputSpec
 
     def _run_interface(self, runtime):
-        for input_image in self.inputs.input_images:
-            ax = ApplyTransforms(input_image=input_image, reference_image=self.inputs.reference_image,
-                                 interpolation=self.inputs.interpolation, transforms=self.inputs.transforms,
-                                 out_postfix=self.inputs.out_postfix, default_value=self.inputs.default_value)
-            ax.run()
+        input_images = list(self.inputs.input_images)
+        if (self.inputs.in_process and self.inputs.interpolation == 'NearestNeighbor'
+                and all(is_supported_ants_transform(t) for t in self.inputs.transforms)
+                and same_grid(input_images)):
+            ref_img = nib.load(self.inputs.reference_image)
+            in_img = nib.load(input_images[0])
+            coords = ants_voxel_map(self.inputs.transforms, in_img, ref_img)
+            out_files = []
+            for input_image in input_images:
+                _, name, ext = split_filename(input_image)
+                out_files.append(name + self.inputs.out_postfix + ext)
+            self.output_images = resample_labels(input_images, out_files, ref_img, coords,
+                                                 in_img.shape, self.inputs.default_value)
+        else:
+            interfaces = [
+                ApplyTransforms(input_image=input_image, reference_image=self.inputs.reference_image,
+                                interpolation=self.inputs.interpolation, transforms=self.inputs.transforms,
+                                out_postfix=self.inputs.out_postfix, default_value=self.inputs.default_value)
+                for input_image in input_images
+            ]
+            self.output_images = run_interfaces(interfaces, 'output_image',
+                                                self.inputs.number_of_workers)
         return runtime
 
     def _list_outputs(self):
         outputs = self._outputs().get()
-        outputs['output_images'] = glob.glob(os.path.abspath("*.nii.gz"))
+        outputs['output_images'] = self.output_images
         return outputs
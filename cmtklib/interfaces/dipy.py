@@ -6,15 +6,24 @@
 #  This software is distributed under the open-source license Modified BSD.
 """The Dipy module provides Nipype interfaces to the algorithms in dipy."""
 
+import os
 import os.path as op
+import shutil
+from itertools import chain
 from future import standard_library
 import time
 import gzip
+import json
+import hashlib
+import fcntl
+import pickle
+from concurrent.futures import ProcessPoolExecutor, wait, as_completed, FIRST_COMPLETED
 import nibabel as nib
 import numpy as np
 
 from nipype.interfaces.dipy.base import DipyDiffusionInterface, DipyBaseInterface, DipyBaseInterfaceInputSpec
-from nipype.interfaces.base import TraitedSpec, File, traits, isdefined, BaseInterfaceInputSpec, InputMultiPath
+from nipype.interfaces.base import TraitedSpec, File, Directory, traits, isdefined, BaseInterfaceInputSpec, \
+    InputMultiPath
 from nipype import logging
 
 
@@ -22,6 +31,194 @@ standard_library.install_aliases()
 IFLOGGER = logging.getLogger('nipype.interface')
 
 
+def model_cache_key(name, gtab, params):
+    """Return the key of a model in the model cache.
+
+    Parameters
+    ----------
+    name : string
+        Name of the model
+
+    gtab : dipy.core.gradients.GradientTable
+        Gradient table of the model
+
+    params : dict
+        Parameters of the model, serializable to JSON
+        (numpy arrays are converted to lists)
+
+    Returns
+    -------
+    key : string
+        SHA-256 hex digest of the name, the b-values, the b-vectors,
+        the diffusion times, the parameters and the version of dipy
+    """
+    import dipy
+
+    h = hashlib.sha256()
+    h.update(f'{name}-dipy-{dipy.__version__}'.encode())
+    h.update(np.round(np.asarray(gtab.bvals, dtype=np.float64), 4).tobytes())
+    h.update(np.round(np.asarray(gtab.bvecs, dtype=np.float64), 6).tobytes())
+    h.update(str((getattr(gtab, 'small_delta', None), getattr(gtab, 'big_delta', None))).encode())
+    h.update(json.dumps(params, sort_keys=True, default=lambda o: np.asarray(o).tolist()).encode())
+    return h.hexdigest()
+
+
+def load_or_create_model(create_model, out_file, cache_dir=None, name=None, gtab=None, params=None):
+    """Create a dipy model, or load it from the on-disk model cache, and save it to a ``.pklz`` file.
+
+    The cache stores the gzip-pickled models in ``cache_dir`` under
+    a key computed by :func:`model_cache_key`, such that models, including
+    their precomputed matrices, are shared by the subjects with
+    identical gradient tables and by reruns. Access to a cache entry
+    is serialized with an exclusive lock on a ``.lock`` file and entries
+    are written atomically.
+
+    Parameters
+    ----------
+    create_model : function
+        Function without argument returning the model
+
+    out_file : string
+        Output ``.pklz`` file of the model
+
+    cache_dir : string
+        Directory of the model cache. If ``None``, the model is created.
+
+    name : string
+        Name of the model
+
+    gtab : dipy.core.gradients.GradientTable
+        Gradient table of the model
+
+    params : dict
+        Parameters of the model
+
+    Returns
+    -------
+    model : object
+        The dipy model
+    """
+    if cache_dir is None:
+        model = create_model()
+        with gzip.open(out_file, 'wb') as f:
+            pickle.dump(model, f, -1)
+        return model
+
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_file = op.join(cache_dir, f'{name}-{model_cache_key(name, gtab, params)}.pklz')
+    with open(cache_file + '.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            if op.exists(cache_file):
+                IFLOGGER.info(f'Load {name} model from cache ({cache_file})')
+                with gzip.open(cache_file, 'rb') as f:
+                    model = pickle.load(f)
+            else:
+                IFLOGGER.info(f'Create {name} model and save it to cache ({cache_file})')
+                model = create_model()
+                tmp_file = f'{cache_file}.{os.getpid()}.tmp'
+                with gzip.open(tmp_file, 'wb') as f:
+                    pickle.dump(model, f, -1)
+                os.replace(tmp_file, cache_file)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+    shutil.copyfile(cache_file, out_file)
+    return model
+
+
+def _model_cache_dir(inputs):
+    """Return the ``model_cache_dir`` input of an interface or ``None`` if it is not defined."""
+    return inputs.model_cache_dir if isdefined(inputs.model_cache_dir) else None
+
+
+def iter_voxel_blocks(n_voxels, block_size):
+    """Iterate over consecutive blocks of voxels.
+
+    Parameters
+    ----------
+    n_voxels : int
+        Total number of voxels
+
+    block_size : int
+        Maximal number of voxels per block
+
+    Yields
+    ------
+    block : slice
+        Slice of the voxels of the block
+    """
+    block_size = max(1, int(block_size))
+    for start in range(0, n_voxels, block_size):
+        yield slice(start, min(start + block_size, n_voxels))
+
+
+def map_blocks(func, tasks, number_of_workers=1):
+    """Apply a function to a sequence of tasks, possibly on a pool of worker processes.
+
+    At most twice as many tasks as workers are submitted at a time such that
+    the data of the tasks, which can be generated lazily, are not all held in memory.
+
+    Parameters
+    ----------
+    func : function
+        Function, which must be picklable, called as ``func(*task)``
+
+    tasks : iterable of tuple
+        Arguments of each call to ``func``
+
+    number_of_workers : int
+        Number of worker processes. If ``1``, tasks are run in the current process.
+
+    Yields
+    ------
+    index : int
+        Index of the task in ``tasks``
+
+    result : object
+        Value returned by ``func`` for this task
+
+    Notes
+    -----
+    Results are yielded in completion order, not in the order of the tasks.
+    """
+    if number_of_workers <= 1:
+        for index, task in enumerate(tasks):
+            yield index, func(*task)
+        return
+
+    with ProcessPoolExecutor(max_workers=number_of_workers) as executor:
+        futures = {}
+        for index, task in enumerate(tasks):
+            futures[executor.submit(func, *task)] = index
+            if len(futures) >= 2 * number_of_workers:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield futures.pop(future), future.result()
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+
+def allocate_output(shape, filename=None):
+    """Allocate a float32 output array filled with zeros.
+
+    Parameters
+    ----------
+    shape : tuple
+        Shape of the array
+
+    filename : string
+        If given, the array is memory-mapped to this ``.npy`` file
+
+    Returns
+    -------
+    out : numpy.ndarray or numpy.memmap
+        Array of zeros
+    """
+    if filename is None:
+        return np.zeros(shape, dtype=np.float32)
+    return np.lib.format.open_memmap(filename, mode='w+', dtype=np.float32, shape=shape)
+
+
 class DTIEstimateResponseSHInputSpec(DipyBaseInterfaceInputSpec):
     in_mask = File(
         exists=True, desc='input mask in which we find single fibers')
@@ -36,6 +233,8 @@ class DTIEstimateResponseSHInputSpec(DipyBaseInterfaceInputSpec):
     response = File(
         'response.txt', usedefault=True, desc='the output response file')
     out_mask = File('wm_mask.nii.gz', usedefault=True, desc='computed wm mask')
+    model_cache_dir = Directory(
+        desc='Directory of the model cache shared across subjects and reruns')
 
 
 class DTIEstimateResponseSHOutputSpec(TraitedSpec):
@@ -73,8 +272,6 @@ class DTIEstimateResponseSH(DipyDiffusionInterface):
         from dipy.reconst.dti import fractional_anisotropy, mean_diffusivity, TensorModel
         from dipy.reconst.csdeconv import recursive_response, auto_response
 
-        import pickle as pickle
-
         img = nib.load(self.inputs.in_file)
         imref = nib.four_to_three(img)[0]
         affine = img.affine
@@ -89,14 +286,15 @@ class DTIEstimateResponseSH(DipyDiffusionInterface):
         data = img.get_data().astype(np.float32)
         gtab = self._get_gradient_table()
 
+        tenmodel = load_or_create_model(
+            lambda: TensorModel(gtab, fit_method='WLS'),
+            self._gen_filename('tenmodel', ext='.pklz'),
+            cache_dir=_model_cache_dir(self.inputs), name='tensor',
+            gtab=gtab, params=dict(fit_method='WLS'))
+
         # Fit it
-        tenmodel = TensorModel(gtab, fit_method='WLS')
         ten_fit = tenmodel.fit(data, msk)
 
-        f = gzip.open(self._gen_filename('tenmodel', ext='.pklz'), 'wb')
-        pickle.dump(tenmodel, f, -1)
-        f.close()
-
         FA = np.nan_to_num(fractional_anisotropy(ten_fit.evals)) * msk
         indices = np.where(FA > self.inputs.fa_thresh)
         S0s = data[indices][:, np.nonzero(gtab.b0s_mask)[0]]
@@ -189,6 +387,8 @@ class CSDInputSpec(DipyBaseInterfaceInputSpec):
     out_fods = File(desc='fODFs output file name')
     out_shm_coeff = File(
         desc='Spherical Harmonics Coefficients output file name')
+    model_cache_dir = Directory(
+        desc='Directory of the model cache shared across subjects and reruns')
 
 
 class CSDOutputSpec(TraitedSpec):
@@ -228,8 +428,6 @@ class CSD(DipyDiffusionInterface):
         from dipy.reconst.csdeconv import ConstrainedSphericalDeconvModel, auto_response_ssst
         from dipy.data import get_sphere
         # import marshal as pickle
-        import pickle as pickle
-        # import gzip
 
         img = nib.load(self.inputs.in_file)
         imref = nib.four_to_three(img)[0]
@@ -280,11 +478,16 @@ class CSD(DipyDiffusionInterface):
                                'Ratio=%0.3f.') % ratio)
 
         sphere = get_sphere('symmetric724')
-        csd_model = ConstrainedSphericalDeconvModel(gtab,
+        csd_model = load_or_create_model(
+            lambda: ConstrainedSphericalDeconvModel(gtab,
                                                     response,
                                                     sh_order=self.inputs.sh_order,
                                                     reg_sphere=sphere,
-                                                    lambda_=np.sqrt(1. / 2))
+                                                    lambda_=np.sqrt(1. / 2)),
+            self._gen_filename('csdmodel', ext='.pklz'),
+            cache_dir=_model_cache_dir(self.inputs), name='csd', gtab=gtab,
+            params=dict(response=[response[0], response[1]], sh_order=self.inputs.sh_order,
+                        reg_sphere='symmetric724', lambda_=np.sqrt(1. / 2)))
         # IFLOGGER.info('Fitting CSD model')
         # csd_fit = csd_model.fit(data, msk)
 
@@ -293,9 +496,6 @@ class CSD(DipyDiffusionInterface):
         elif self.inputs.tracking_processing_tool == 'dipy':
             sh_basis_type = 'descoteaux07'
 
-        with gzip.open(self._gen_filename('csdmodel', ext='.pklz'), 'wb') as f:
-            pickle.dump(csd_model, f, -1)
-
         if self.inputs.save_shm_coeff:
             # isphere = get_sphere('symmetric724')
             from dipy.direction import peaks_from_model
@@ -345,6 +545,55 @@ class CSD(DipyDiffusionInterface):
         return outputs
 
 
+def _fit_shore_block(shore_model, data, sphere, sh_order, basis):
+    """Fit the SHORE model on a block of voxels and compute its ODFs and scalar maps.
+
+    Parameters
+    ----------
+    shore_model : dipy.reconst.shore.ShoreModel
+        SHORE model
+
+    data : numpy.ndarray
+        Diffusion signal of the voxels of the block, of shape ``(n_voxels, n_directions)``
+
+    sphere : dipy.core.sphere.Sphere
+        Sphere on which the ODFs are evaluated
+
+    sh_order : int
+        Maximal order of the spherical harmonics
+
+    basis : string
+        Spherical harmonics basis
+
+    Returns
+    -------
+    dodf, fodf, gfa, msd, rtop : numpy.ndarray
+        Spherical harmonics coefficients of the diffusion and fiber ODFs,
+        GFA, MSD and RTOP of the voxels of the block, in single precision
+
+    duration : float
+        Fitting time of the block in seconds
+    """
+    from dipy.reconst.odf import gfa
+    from dipy.reconst.csdeconv import odf_sh_to_sharp
+    from dipy.reconst.shm import sf_to_sh
+
+    start_time = time.time()
+    shorefit = shore_model.fit(data)
+    odf = shorefit.odf(sphere)
+    dodf = sf_to_sh(odf, sphere, sh_order=sh_order, basis_type=basis)
+    fodf = odf_sh_to_sharp(dodf, sphere, basis=basis, ratio=0.2, sh_order=sh_order, lambda_=1.0, tau=0.1,
+                           r2_term=True)
+    return (
+        dodf.astype(np.float32),
+        fodf.astype(np.float32),
+        np.nan_to_num(gfa(odf)).astype(np.float32),
+        np.nan_to_num(shorefit.msd()).astype(np.float32),
+        np.nan_to_num(shorefit.rtop_signal()).astype(np.float32),
+        time.time() - start_time
+    )
+
+
 class SHOREInputSpec(DipyBaseInterfaceInputSpec):
     in_mask = File(exists=True, desc=(
         'input mask in which compute SHORE solution'))
@@ -365,6 +614,15 @@ class SHOREInputSpec(DipyBaseInterfaceInputSpec):
     positive_constraint = traits.Bool(False, usedefault=True, desc=(
         'Constrain the optimization such that E(0) = 1.'))
 
+    number_of_workers = traits.Int(1, usedefault=True, desc=(
+        'Number of worker processes fitting the model on blocks of voxels'))
+    block_size = traits.Int(5000, usedefault=True, desc=(
+        'Number of voxels of the mask fitted per block'))
+    use_memmap = traits.Bool(False, usedefault=True, desc=(
+        'Preallocate the ODF outputs as memory-mapped arrays on disk'))
+    model_cache_dir = Directory(
+        desc='Directory of the model cache shared across subjects and reruns')
+
 
 class SHOREOutputSpec(TraitedSpec):
     model = File(desc='Python pickled object of the SHORE model fitted.')
@@ -388,6 +646,12 @@ class SHORE(DipyDiffusionInterface):
     .. [Merlet2013]	Merlet S. et. al, Medical Image Analysis, 2013.
         “Continuous diffusion signal, EAP and ODF estimation via Compressive Sensing in diffusion MRI”
 
+    Notes
+    -----
+    The model is fitted only on the voxels of the mask, by blocks of
+    ``block_size`` voxels that can be distributed on ``number_of_workers``
+    processes. Outputs are computed in single precision.
+
     Example
     -------
     >>> from cmtklib.interfaces.dipy import SHORE
@@ -405,16 +669,10 @@ class SHORE(DipyDiffusionInterface):
     def _run_interface(self, runtime):
         # import nibabel as nib
 
-        import pickle as pickle
-
         from dipy.data import get_sphere
         from dipy.io import read_bvals_bvecs
         from dipy.core.gradients import gradient_table
         from dipy.reconst.shore import ShoreModel
-        from dipy.reconst.odf import gfa
-        from dipy.reconst.csdeconv import odf_sh_to_sharp
-        from dipy.reconst.shm import sf_to_sh
-        from dipy.core.ndindex import ndindex
 
         img = nib.load(self.inputs.in_file)
         imref = nib.four_to_three(img)[0]
@@ -436,8 +694,7 @@ class SHORE(DipyDiffusionInterface):
         else:
             msk = clipMask(np.ones(imref.shape).astype('float32'))
 
-        data = img.get_data().astype(np.float32)
-        data[msk == 0] *= 0
+        data = img.get_data()
 
         # hdr = imref.header.copy()
 
@@ -447,21 +704,33 @@ class SHORE(DipyDiffusionInterface):
         gtab = gradient_table(bvals, bvecs)
 
         sphere = get_sphere('symmetric724')
-        shore_model = ShoreModel(gtab, radial_order=self.inputs.radial_order, zeta=self.inputs.zeta,
-                                 lambdaN=self.inputs.lambda_n, lambdaL=self.inputs.lambda_l)
 
-        f = gzip.open(op.abspath('shoremodel.pklz'), 'wb')
-        pickle.dump(shore_model, f, -1)
-        f.close()
+        def create_shore_model():
+            model = ShoreModel(gtab, radial_order=self.inputs.radial_order, zeta=self.inputs.zeta,
+                               lambdaN=self.inputs.lambda_n, lambdaL=self.inputs.lambda_l)
+            if isdefined(self.inputs.model_cache_dir):
+                # Fit a dummy voxel such that the SHORE basis matrix is computed and cached by the model
+                model.fit(np.ones(len(gtab.bvals)))
+            return model
+
+        shore_model = load_or_create_model(
+            create_shore_model, op.abspath('shoremodel.pklz'),
+            cache_dir=_model_cache_dir(self.inputs), name='shore', gtab=gtab,
+            params=dict(radial_order=self.inputs.radial_order, zeta=self.inputs.zeta,
+                        lambda_n=self.inputs.lambda_n, lambda_l=self.inputs.lambda_l))
 
         lmax = self.inputs.radial_order
-        datashape = data.shape
-        dimsODF = list(datashape)
-        dimsODF[3] = int((lmax + 1) * (lmax + 2) / 2)
-        shODF = np.zeros(dimsODF)
-        GFA = np.zeros(dimsODF[:3])
-        RTOP = np.zeros(dimsODF[:3])
-        MSD = np.zeros(dimsODF[:3])
+        dimsODF = data.shape[:3] + (int((lmax + 1) * (lmax + 2) / 2),)
+        memmap_files = (
+            [op.abspath('shore_dodf.npy'), op.abspath('shore_fodf.npy')]
+            if self.inputs.use_memmap
+            else [None, None]
+        )
+        shODF = allocate_output(dimsODF, memmap_files[0])
+        shFODF = allocate_output(dimsODF, memmap_files[1])
+        GFA = allocate_output(dimsODF[:3])
+        RTOP = allocate_output(dimsODF[:3])
+        MSD = allocate_output(dimsODF[:3])
 
         # Dipy >= 0.16 - basis : {None, ‘tournier07’, ‘descoteaux07’}
         if self.inputs.tracking_processing_tool == "mrtrix":
@@ -469,26 +738,28 @@ class SHORE(DipyDiffusionInterface):
         else:
             basis = 'descoteaux07'
 
-        # calculate odf per slice
-        IFLOGGER.info('Fitting SHORE model')
-        for i in ndindex(data.shape[:1]):
-            print("Processing slice #%i " % i)
-            start_time = time.time()
-            shorefit = shore_model.fit(data[i])
-            sliceODF = shorefit.odf(sphere)
-            sliceGMSD = shorefit.msd()
-            sliceRTOP = shorefit.rtop_signal()
-            sliceGFA = gfa(sliceODF)
-            shODF[i] = sf_to_sh(
-                sliceODF, sphere, sh_order=lmax, basis_type=basis)
-            GFA[i] = np.nan_to_num(sliceGFA)
-            MSD[i] = np.nan_to_num(sliceGMSD)
-            RTOP[i] = np.nan_to_num(sliceRTOP)
-            print("Computation Time (slice %s): " %
-                  str(i) + str(time.time() - start_time) + " seconds")
-
-        shFODF = odf_sh_to_sharp(shODF, sphere, basis=basis, ratio=0.2, sh_order=lmax, lambda_=1.0, tau=0.1,
-                                 r2_term=True)
+        # Fit the model only on the voxels of the mask, by blocks
+        voxels = np.nonzero(msk)
+        masked_data = data[voxels].astype(np.float32)
+        blocks = list(iter_voxel_blocks(masked_data.shape[0], self.inputs.block_size))
+        tasks = ((shore_model, masked_data[block], sphere, lmax, basis) for block in blocks)
+
+        IFLOGGER.info(
+            'Fitting SHORE model on %i voxels (%i blocks, %i workers)' %
+            (masked_data.shape[0], len(blocks), self.inputs.number_of_workers))
+        start_time = time.time()
+        for i, (dodf, fodf, gfa_, msd, rtop, duration) in map_blocks(
+                _fit_shore_block, tasks, self.inputs.number_of_workers):
+            index = tuple(v[blocks[i]] for v in voxels)
+            shODF[index] = dodf
+            shFODF[index] = fodf
+            GFA[index] = gfa_
+            MSD[index] = msd
+            RTOP[index] = rtop
+            IFLOGGER.info('Computation Time (block %i/%i, %i voxels): %.2f seconds' %
+                          (i + 1, len(blocks), dodf.shape[0], duration))
+        IFLOGGER.info('SHORE model fitted in %.2f seconds' % (time.time() - start_time))
+        del masked_data
 
         IFLOGGER.info('Save Spherical Harmonics / MSD / GFA images')
 
@@ -503,6 +774,11 @@ class SHORE(DipyDiffusionInterface):
         nib.Nifti1Image(shFODF, affine).to_filename(
             op.abspath('shore_fodf.nii.gz'))
 
+        del shODF, shFODF
+        for memmap_file in memmap_files:
+            if memmap_file is not None:
+                os.remove(memmap_file)
+
         return runtime
 
     def _list_outputs(self):
@@ -516,6 +792,66 @@ class SHORE(DipyDiffusionInterface):
         return outputs
 
 
+def iter_seeds_from_mask(mask, affine, density, batch_size=100000, out_file=None):
+    """Generate the seeds of a binary mask by batches.
+
+    The seeds and their order are the same as the ones of
+    :func:`dipy.tracking.utils.seeds_from_mask`, which
+    creates all of them at once.
+
+    Parameters
+    ----------
+    mask : numpy.ndarray
+        Binary 3D seed mask
+
+    affine : numpy.ndarray
+        Voxel to world coordinates affine
+
+    density : int or list of int
+        Number of seeds along each dimension of a voxel
+
+    batch_size : int
+        Approximate number of seeds per batch
+
+    out_file : string
+        If given, the seeds are also written, batch by batch,
+        to this ``.npy`` file of shape ``(n_seeds, 3)``
+
+    Yields
+    ------
+    seeds : numpy.ndarray
+        Batch of seeds in world coordinates of shape ``(n, 3)``
+    """
+    density = np.broadcast_to(np.asarray(density, dtype=int), (3,))
+    # Grid of points between -.5 and .5, centered at 0, with given density
+    grid = np.mgrid[0:density[0], 0:density[1], 0:density[2]]
+    grid = grid.T.reshape((-1, 3))
+    grid = grid / density
+    grid += (.5 / density - .5)
+
+    where = np.argwhere(mask)
+    n_seeds = where.shape[0] * grid.shape[0]
+    voxels_per_batch = max(1, batch_size // grid.shape[0])
+
+    saved = None
+    if out_file is not None:
+        saved = np.lib.format.open_memmap(out_file, mode='w+', dtype=np.float64, shape=(n_seeds, 3))
+
+    start = 0
+    for block in iter_voxel_blocks(where.shape[0], voxels_per_batch):
+        seeds = (where[block, np.newaxis, :] + grid[np.newaxis, :, :]).reshape((-1, 3))
+        seeds = np.dot(seeds, affine[:3, :3].T)
+        seeds += affine[:3, 3]
+        if saved is not None:
+            saved[start:start + seeds.shape[0]] = seeds
+            start += seeds.shape[0]
+        yield seeds
+
+    if saved is not None:
+        saved.flush()
+        del saved
+
+
 class TensorInformedEudXTractographyInputSpec(BaseInterfaceInputSpec):
     in_file = File(exists=True, mandatory=True, desc='input diffusion data')
     in_fa = File(exists=True, mandatory=True, desc='input FA')
@@ -538,6 +874,11 @@ class TensorInformedEudXTractographyInputSpec(BaseInterfaceInputSpec):
     num_seeds = traits.Int(10000, mandatory=True, usedefault=True,
                            desc='desired number of tracks in tractography')
     out_prefix = traits.Str(desc='output prefix for file names')
+    stream_seeds = traits.Bool(False, usedefault=True,
+                               desc='Generate the seeds of the seed mask by batches passed directly '
+                                    'to the tracker, and save them in binary .npy format')
+    seed_batch_size = traits.Int(100000, usedefault=True,
+                                 desc='Number of seeds per batch when streaming seeds')
 
 
 class TensorInformedEudXTractographyOutputSpec(TraitedSpec):
@@ -628,7 +969,18 @@ class TensorInformedEudXTractography(DipyBaseInterface):
             nsperv = (seeds // vseeds) + 1
             IFLOGGER.info(f'Seed mask is provided ({vseeds} voxels inside '
                           f'mask), computing seeds ({nsperv} seeds/voxel).')
-            if nsperv > 1:
+            if self.inputs.stream_seeds:
+                IFLOGGER.info(f'Stream seeds for fiber tracking from the binary seed mask (density: {nsperv}, '
+                              f'{self.inputs.seed_batch_size} seeds per batch)')
+                tseeds = chain.from_iterable(
+                    iter_seeds_from_mask(seedmsk,
+                                         affine=affine,
+                                         density=[nsperv, nsperv, nsperv],
+                                         batch_size=self.inputs.seed_batch_size,
+                                         out_file=(self._gen_filename('seeds', ext='.npy')
+                                                   if self.inputs.save_seeds else None))
+                )
+            elif nsperv > 1:
                 IFLOGGER.info(f'Needed {nsperv} seeds per selected voxel (total {vseeds}).')
                 seedps = np.vstack(np.array([seedps] * nsperv))
                 voxcoord = seedps + np.random.uniform(-1, 1, size=seedps.shape)
@@ -638,12 +990,13 @@ class TensorInformedEudXTractography(DipyBaseInterface):
                 if self.inputs.save_seeds:
                     np.savetxt(self._gen_filename('seeds', ext='.txt'), seeds)
 
-            IFLOGGER.info(f'Create seeds for fiber tracking from the binary seed mask (density: {nsperv})')
+            if not self.inputs.stream_seeds:
+                IFLOGGER.info(f'Create seeds for fiber tracking from the binary seed mask (density: {nsperv})')
 
-            tseeds = utils.seeds_from_mask(seedmsk,
-                                           affine=affine,
-                                           density=[nsperv, nsperv, nsperv]  # FIXME: density should be customizable
-                                           )
+                tseeds = utils.seeds_from_mask(seedmsk,
+                                               affine=affine,
+                                               density=[nsperv, nsperv, nsperv]  # FIXME: density should be customizable
+                                               )
 
         IFLOGGER.info('Loading and masking FA')
         img_fa = nib.load(self.inputs.in_fa)
@@ -692,7 +1045,8 @@ class TensorInformedEudXTractography(DipyBaseInterface):
         outputs = self._outputs().get()
         outputs['tracks'] = self._gen_filename('tracked', ext='.trk')
         if self.inputs.save_seeds:
-            outputs['out_seeds'] = self._gen_filename('seeds', ext='.txt')
+            outputs['out_seeds'] = self._gen_filename(
+                'seeds', ext='.npy' if self.inputs.stream_seeds else '.txt')
 
         return outputs
 
@@ -713,6 +1067,124 @@ class TensorInformedEudXTractography(DipyBaseInterface):
         return out_prefix + '_' + name + ext
 
 
+def _track_shard(seeds, shard_file, sh_file, stopping_files, params, random_seed):
+    """Track the streamlines of a shard of seeds and save them to disk.
+
+    The direction getter and the stopping criterion are rebuilt in the worker
+    process from the arrays saved in ``.npy`` files, which are memory-mapped.
+
+    Parameters
+    ----------
+    seeds : numpy.ndarray
+        Seeds of the shard in world coordinates, of shape ``(n_seeds, 3)``
+
+    shard_file : string
+        Output ``.npz`` file storing the ``points`` of the streamlines
+        concatenated and their ``lengths``
+
+    sh_file : string
+        ``.npy`` file of the spherical harmonics coefficients of the fODFs
+
+    stopping_files : list of string
+        ``.npy`` file of the tracking mask, or files of the
+        WM / GM / CSF partial volume maps if ``params['use_act']``
+
+    params : dict
+        Tracking parameters (``algo``, ``max_angle``, ``step_size``,
+        ``use_act``, ``voxel_size`` and ``affine``)
+
+    random_seed : int
+        Seed of the random number generator of the shard
+
+    Returns
+    -------
+    shard_file : string
+        Output ``.npz`` file
+
+    n_streamlines : int
+        Number of streamlines of the shard
+
+    duration : float
+        Tracking time of the shard in seconds
+    """
+    from dipy.data import get_sphere
+    from dipy.direction import DeterministicMaximumDirectionGetter, ProbabilisticDirectionGetter
+    from dipy.tracking.stopping_criterion import BinaryStoppingCriterion, CmcStoppingCriterion
+    from dipy.tracking.local_tracking import LocalTracking, ParticleFilteringTracking
+
+    start_time = time.time()
+    sphere = get_sphere('symmetric724')
+    shcoeff = np.load(sh_file, mmap_mode='c')
+    if params['algo'] == 'deterministic':
+        dg = DeterministicMaximumDirectionGetter.from_shcoeff(shcoeff,
+                                                              max_angle=params['max_angle'],
+                                                              sphere=sphere)
+    else:
+        dg = ProbabilisticDirectionGetter.from_shcoeff(shcoeff,
+                                                       max_angle=params['max_angle'],
+                                                       sphere=sphere)
+
+    if params['use_act']:
+        pve_wm, pve_gm, pve_csf = [np.load(f, mmap_mode='c') for f in stopping_files]
+        cmc_classifier = CmcStoppingCriterion.from_pve(pve_wm, pve_gm, pve_csf,
+                                                       step_size=params['step_size'],
+                                                       average_voxel_size=params['voxel_size'])
+        streamlines = ParticleFilteringTracking(dg,
+                                                cmc_classifier,
+                                                seeds,
+                                                params['affine'],
+                                                max_cross=1,
+                                                step_size=params['step_size'],
+                                                maxlen=200,
+                                                pft_back_tracking_dist=2,
+                                                pft_front_tracking_dist=1,
+                                                particle_count=15,
+                                                return_all=False,
+                                                random_seed=random_seed)
+    else:
+        classifier = BinaryStoppingCriterion(np.load(stopping_files[0]))
+        streamlines = LocalTracking(dg,
+                                    classifier,
+                                    seeds,
+                                    params['affine'],
+                                    step_size=params['step_size'],
+                                    max_cross=1,
+                                    random_seed=random_seed)
+
+    points = []
+    lengths = []
+    for streamline in streamlines:
+        points.append(np.asarray(streamline, dtype=np.float32))
+        lengths.append(len(streamline))
+
+    np.savez(shard_file,
+             points=np.concatenate(points) if points else np.zeros((0, 3), dtype=np.float32),
+             lengths=np.array(lengths, dtype=np.int64))
+    return shard_file, len(lengths), time.time() - start_time
+
+
+def iter_shard_streamlines(shard_files):
+    """Iterate over the streamlines saved in shard files by :func:`_track_shard`.
+
+    Parameters
+    ----------
+    shard_files : list of string
+        ``.npz`` shard files, read in this order
+
+    Yields
+    ------
+    streamline : numpy.ndarray
+        Points of the streamline of shape ``(n_points, 3)``
+    """
+    for shard_file in shard_files:
+        with np.load(shard_file) as shard:
+            points, lengths = shard['points'], shard['lengths']
+        if lengths.size == 0:
+            continue
+        for streamline in np.split(points, np.cumsum(lengths)[:-1]):
+            yield streamline
+
+
 class DirectionGetterTractographyInputSpec(BaseInterfaceInputSpec):
     algo = traits.Enum(["deterministic", "probabilistic"],
                        usedefault=True,
@@ -767,6 +1239,15 @@ class DirectionGetterTractographyInputSpec(BaseInterfaceInputSpec):
                            mandatory=True, usedefault=True,
                            desc='desired number of tracks in tractography')
     out_prefix = traits.Str(desc='output prefix for file names')
+    sharded_tracking = traits.Bool(False, usedefault=True,
+                                   desc='Track shards of seeds in worker processes '
+                                        'and merge them on disk into the output tractogram')
+    number_of_workers = traits.Int(1, usedefault=True,
+                                   desc='Number of worker processes used by sharded tracking')
+    shard_size = traits.Int(50000, usedefault=True,
+                            desc='Maximal number of seeds per shard')
+    random_seed = traits.Int(1234, usedefault=True,
+                             desc='Seed from which the random seeds of the shards are derived')
 
 
 class DirectionGetterTractographyOutputSpec(TraitedSpec):
@@ -985,6 +1466,7 @@ class DirectionGetterTractography(DipyBaseInterface):
                                    normalize_peaks=False,  # changed
                                    parallel=True)
 
+            shcoeff = pfm.shm_coeff
             if self.inputs.algo == 'deterministic':
                 dg = DeterministicMaximumDirectionGetter.from_shcoeff(pfm.shm_coeff,
                                                                       max_angle=self.inputs.max_angle,
@@ -998,6 +1480,7 @@ class DirectionGetterTractography(DipyBaseInterface):
             sh = nib.load(self.inputs.fod_file).get_data()
             sh = np.nan_to_num(sh)
             IFLOGGER.info('Generating peaks from SHORE model')
+            shcoeff = sh
             if self.inputs.algo == 'deterministic':
                 dg = DeterministicMaximumDirectionGetter.from_shcoeff(sh,
                                                                       max_angle=self.inputs.max_angle,
@@ -1007,7 +1490,18 @@ class DirectionGetterTractography(DipyBaseInterface):
                                                                max_angle=self.inputs.max_angle,
                                                                sphere=sphere)
 
-        if not self.inputs.use_act:
+        if self.inputs.sharded_tracking:
+            if self.inputs.use_act:
+                stopping_maps = [img_pve_wm.get_data(), img_pve_gm.get_data(), img_pve_csf.get_data()]
+                params = dict(voxel_size=voxel_size)
+            else:
+                stopping_maps = [tmsk]
+                params = dict(voxel_size=None)
+            params.update(algo=self.inputs.algo, max_angle=self.inputs.max_angle,
+                          step_size=self.inputs.step_size, use_act=self.inputs.use_act,
+                          affine=affine)
+            self._track_sharded(tseeds, shcoeff, stopping_maps, params, imref)
+        elif not self.inputs.use_act:
             IFLOGGER.info('Performing %s tractography' % self.inputs.algo)
 
             streamlines = LocalTracking(dg,
@@ -1056,6 +1550,73 @@ class DirectionGetterTractography(DipyBaseInterface):
 
         return runtime
 
+    def _track_sharded(self, seeds, shcoeff, stopping_maps, params, imref):
+        """Track shards of seeds on a pool of worker processes and merge them into the output TRK file.
+
+        Parameters
+        ----------
+        seeds : numpy.ndarray
+            Seeds in world coordinates, of shape ``(n_seeds, 3)``
+
+        shcoeff : numpy.ndarray
+            Spherical harmonics coefficients of the fODFs
+
+        stopping_maps : list of numpy.ndarray
+            Tracking mask, or WM / GM / CSF partial volume maps if ``params['use_act']``
+
+        params : dict
+            Tracking parameters passed to the workers
+
+        imref : nibabel.Nifti1Image
+            Reference image used to create the header of the TRK file
+        """
+        from nibabel.streamlines import Field, LazyTractogram, TrkFile
+        from nibabel.orientations import aff2axcodes
+
+        shard_dir = op.abspath('tracking_shards')
+        os.makedirs(shard_dir, exist_ok=True)
+
+        # Save the arrays shared by the shards once, to be memory-mapped by the workers
+        sh_file = op.join(shard_dir, 'shcoeff.npy')
+        np.save(sh_file, np.ascontiguousarray(shcoeff, dtype=np.float64))
+        stopping_files = []
+        for i, stopping_map in enumerate(stopping_maps):
+            stopping_files.append(op.join(shard_dir, f'stopping_{i}.npy'))
+            np.save(stopping_files[-1], np.ascontiguousarray(stopping_map, dtype=np.float64))
+
+        seeds = np.asarray(seeds)
+        n_shards = max(self.inputs.number_of_workers,
+                       int(np.ceil(seeds.shape[0] / max(1, self.inputs.shard_size))))
+        n_shards = max(1, min(n_shards, seeds.shape[0]))
+        shard_seeds = np.array_split(seeds, n_shards)
+        # Deterministic random seeds of the shards
+        random_seeds = [int(child.generate_state(1)[0] % (2 ** 31))
+                        for child in np.random.SeedSequence(self.inputs.random_seed).spawn(n_shards)]
+        shard_files = [op.join(shard_dir, f'shard-{i:05d}.npz') for i in range(n_shards)]
+        tasks = ((shard_seeds[i], shard_files[i], sh_file, stopping_files, params, random_seeds[i])
+                 for i in range(n_shards))
+
+        IFLOGGER.info('Performing %s tractography from %i seeds (%i shards, %i workers)' %
+                      (self.inputs.algo, seeds.shape[0], n_shards, self.inputs.number_of_workers))
+        n_streamlines = 0
+        for i, (_, n, duration) in map_blocks(_track_shard, tasks, self.inputs.number_of_workers):
+            n_streamlines += n
+            IFLOGGER.info('Computation Time (shard %i/%i, %i streamlines): %.2f seconds' %
+                          (i + 1, n_shards, n, duration))
+
+        IFLOGGER.info('Merging %i streamlines of the shards' % n_streamlines)
+        header = {
+            Field.VOXEL_TO_RASMM: imref.affine.copy(),
+            Field.VOXEL_SIZES: imref.header.get_zooms()[:3],
+            Field.DIMENSIONS: imref.shape[:3],
+            Field.VOXEL_ORDER: "".join(aff2axcodes(imref.affine)),
+        }
+        tractogram = LazyTractogram(lambda: iter_shard_streamlines(shard_files),
+                                    affine_to_rasmm=np.eye(4))
+        TrkFile(tractogram, header).save(self._gen_filename('tracked', ext='.trk'))
+
+        shutil.rmtree(shard_dir)
+
     def _list_outputs(self):
         outputs = self._outputs().get()
         outputs['streamlines'] = self._gen_filename('streamlines', ext='.npy')
@@ -1084,6 +1645,85 @@ class DirectionGetterTractography(DipyBaseInterface):
         return out_prefix + '_' + name + ext
 
 
+MAPMRI_METRICS = ["rtop", "rtap", "rtpp", "msd", "qiv", "ng", "ng_perp", "ng_para"]
+
+
+def _fit_mapmri_block(mapmri_model, data):
+    """Fit the MAP-MRI model on a block of voxels and compute its scalar maps.
+
+    Parameters
+    ----------
+    mapmri_model : dipy.reconst.mapmri.MapmriModel
+        MAP-MRI model
+
+    data : numpy.ndarray
+        Diffusion signal of the voxels of the block, of shape ``(n_voxels, n_directions)``
+
+    Returns
+    -------
+    maps : list of numpy.ndarray
+        Maps of the voxels of the block, in single precision,
+        in the order of ``MAPMRI_METRICS``
+
+    duration : float
+        Fitting time of the block in seconds
+    """
+    start_time = time.time()
+    mapfit = mapmri_model.fit(data)
+    maps = [
+        mapfit.rtop(),
+        mapfit.rtap(),
+        mapfit.rtpp(),
+        mapfit.msd(),
+        mapfit.qiv(),
+        mapfit.ng(),
+        mapfit.ng_perpendicular(),
+        mapfit.ng_parallel()
+    ]
+    return [np.asarray(m, dtype=np.float32) for m in maps], time.time() - start_time
+
+
+def mapmri_block_size(n_directions, radial_order, memory_budget, number_of_workers=1, reserved=0):
+    """Return the number of voxels per block fitting in a memory budget.
+
+    The estimate accounts, per voxel, for the signal, the coefficients and
+    the fit object of dipy kept until the maps of the block are computed.
+    With several workers, :func:`map_blocks` keeps up to twice as many blocks
+    as workers in flight, which all count against the budget, as well as the
+    `reserved` memory held for the whole fit (masked signal and output maps).
+
+    Parameters
+    ----------
+    n_directions : int
+        Number of diffusion-weighted volumes
+
+    radial_order : int
+        Radial order of the MAP-MRI basis
+
+    memory_budget : float
+        Total memory budget in GB of the fit
+
+    number_of_workers : int
+        Number of worker processes fitting blocks at the same time
+
+    reserved : int
+        Memory in bytes held outside of the blocks and subtracted from the budget
+
+    Returns
+    -------
+    block_size : int
+        Number of voxels per block
+    """
+    f = radial_order // 2
+    n_coef = int(round((f + 1) * (f + 2) * (4 * f + 3) / 6))
+    # signal, coefficients and design matrix rows in double precision,
+    # plus the python fit object and the maps of each voxel
+    bytes_per_voxel = 8 * (n_directions * (n_coef + 2) + n_coef) + 4096
+    blocks_in_flight = 1 if number_of_workers <= 1 else 2 * number_of_workers
+    available = memory_budget * 1024 ** 3 - reserved
+    return max(1, int(available / (blocks_in_flight * bytes_per_voxel)))
+
+
 class MAPMRIInputSpec(DipyBaseInterfaceInputSpec):
     laplacian_regularization = traits.Bool(
         True, usedefault=True, desc='Apply laplacian regularization')
@@ -1103,6 +1743,22 @@ class MAPMRIInputSpec(DipyBaseInterfaceInputSpec):
     big_delta = traits.Float(0.5, mandatory=True,
                              desc='Small data for gradient table')
 
+    in_mask = File(exists=True,
+                   desc='Mask of the voxels fitted when fitting by blocks')
+
+    fit_by_blocks = traits.Bool(False, usedefault=True,
+                                desc='Fit the model on blocks of voxels of the mask')
+
+    number_of_workers = traits.Int(1, usedefault=True,
+                                   desc='Number of worker processes fitting blocks of voxels')
+
+    memory_budget = traits.Float(2.0, usedefault=True,
+                                 desc='Approximate total memory (in GB) of the fit by blocks, including the '
+                                      'masked signal, the output maps and the blocks in flight')
+
+    model_cache_dir = Directory(
+        desc='Directory of the model cache shared across subjects and reruns')
+
 
 class MAPMRIOutputSpec(TraitedSpec):
     model = File(desc='Python pickled object of the MAP-MRI model fitted.')
@@ -1121,6 +1777,11 @@ class MAPMRI(DipyDiffusionInterface):
 
     .. check http://nipy.org/dipy/examples_built/reconst_mapmri.html#example-reconst-mapmri for reference on the settings
 
+    With ``fit_by_blocks``, the model is fitted on blocks of voxels of the mask
+    that can be distributed on ``number_of_workers`` processes, and the maps are
+    computed per block in single precision. The number of voxels per block is
+    derived from ``memory_budget``.
+
     Example
     -------
     >>> from cmtklib.interfaces.dipy import MAPMRI
@@ -1138,13 +1799,10 @@ class MAPMRI(DipyDiffusionInterface):
     def _run_interface(self, runtime):
         from dipy.reconst import mapmri
         from dipy.core.gradients import gradient_table
-        import pickle as pickle
-        import gzip
 
         img = nib.load(self.inputs.in_file)
         affine = img.affine
 
-        data = img.get_data().astype(np.float32)
         gtab = self._get_gradient_table()
         gtab = gradient_table(
             bvals=gtab.bvals, bvecs=gtab.bvecs,
@@ -1152,29 +1810,40 @@ class MAPMRI(DipyDiffusionInterface):
             big_delta=self.inputs.big_delta
         )
 
-        map_model_both_aniso = mapmri.MapmriModel(
-            gtab,
-            radial_order=self.inputs.radial_order,
-            anisotropic_scaling=True,
-            laplacian_regularization=self.inputs.laplacian_regularization,
-            laplacian_weighting=self.inputs.laplacian_weighting,
-            positivity_constraint=self.inputs.positivity_constraint
-        )
-
-        IFLOGGER.info('Fitting MAP-MRI model')
-        mapfit_both_aniso = map_model_both_aniso.fit(data)
-
-        '''maps'''
-        maps = {
-            "rtop": mapfit_both_aniso.rtop(),
-            "rtap": mapfit_both_aniso.rtap(),
-            "rtpp": mapfit_both_aniso.rtpp(),
-            "msd": mapfit_both_aniso.msd(),
-            "qiv": mapfit_both_aniso.qiv(),
-            "ng": mapfit_both_aniso.ng(),
-            "ng_perp": mapfit_both_aniso.ng_perpendicular(),
-            "ng_para": mapfit_both_aniso.ng_parallel()
-        }
+        map_model_both_aniso = load_or_create_model(
+            lambda: mapmri.MapmriModel(
+                gtab,
+                radial_order=self.inputs.radial_order,
+                anisotropic_scaling=True,
+                laplacian_regularization=self.inputs.laplacian_regularization,
+                laplacian_weighting=self.inputs.laplacian_weighting,
+                positivity_constraint=self.inputs.positivity_constraint
+            ),
+            self._gen_filename('mapmri', ext='.pklz'),
+            cache_dir=_model_cache_dir(self.inputs), name='mapmri', gtab=gtab,
+            params=dict(radial_order=self.inputs.radial_order,
+                        anisotropic_scaling=True,
+                        laplacian_regularization=self.inputs.laplacian_regularization,
+                        laplacian_weighting=self.inputs.laplacian_weighting,
+                        positivity_constraint=self.inputs.positivity_constraint))
+
+        if self.inputs.fit_by_blocks:
+            maps = self._fit_by_blocks(map_model_both_aniso, img)
+        else:
+            IFLOGGER.info('Fitting MAP-MRI model')
+            mapfit_both_aniso = map_model_both_aniso.fit(img.get_data().astype(np.float32))
+
+            '''maps'''
+            maps = {
+                "rtop": mapfit_both_aniso.rtop(),
+                "rtap": mapfit_both_aniso.rtap(),
+                "rtpp": mapfit_both_aniso.rtpp(),
+                "msd": mapfit_both_aniso.msd(),
+                "qiv": mapfit_both_aniso.qiv(),
+                "ng": mapfit_both_aniso.ng(),
+                "ng_perp": mapfit_both_aniso.ng_perpendicular(),
+                "ng_para": mapfit_both_aniso.ng_parallel()
+            }
 
         ''' The most related to white matter anisotropy are:
             rtpp, for anisotropy
@@ -1183,10 +1852,6 @@ class MAPMRI(DipyDiffusionInterface):
             length/VOLUME = RTOP/RTPP
         '''
 
-        f = gzip.open(self._gen_filename('mapmri', ext='.pklz'), 'wb')
-        pickle.dump(map_model_both_aniso, f, -1)
-        f.close()
-
         # "rtop", "rtap", "rtpp", "msd", "qiv", "ng", "ng_perp", "ng_para"
         for metric, data in list(maps.items()):
             out_name = self._gen_filename(metric)
@@ -1198,9 +1863,49 @@ class MAPMRI(DipyDiffusionInterface):
 
         return runtime
 
+    def _fit_by_blocks(self, mapmri_model, img):
+        """Fit the model on blocks of voxels of the mask and return the eight maps in single precision."""
+        if isdefined(self.inputs.in_mask):
+            msk = nib.load(self.inputs.in_mask).get_data() > 0
+        else:
+            msk = np.ones(img.shape[:3], dtype=bool)
+
+        voxels = np.nonzero(msk)
+        # Read the signal through the array proxy: unlike get_data(), it does not cache
+        # the full 4D array on the image, which would be held during the whole fit
+        masked_data = np.asanyarray(img.dataobj)[voxels].astype(np.float32)
+        img.uncache()
+        # The masked signal and the float32 output maps are held during the whole fit
+        reserved = masked_data.nbytes + 4 * len(MAPMRI_METRICS) * int(np.prod(img.shape[:3]))
+        if reserved >= self.inputs.memory_budget * 1024 ** 3:
+            IFLOGGER.warning(
+                'The masked signal and the output maps (%.2f GB) exceed the MAP-MRI memory budget (%.2f GB)' %
+                (reserved / 1024 ** 3, self.inputs.memory_budget))
+        block_size = mapmri_block_size(
+            masked_data.shape[1], self.inputs.radial_order,
+            self.inputs.memory_budget, self.inputs.number_of_workers, reserved)
+        blocks = list(iter_voxel_blocks(masked_data.shape[0], block_size))
+        tasks = ((mapmri_model, masked_data[block]) for block in blocks)
+
+        maps = {metric: allocate_output(img.shape[:3]) for metric in MAPMRI_METRICS}
+
+        IFLOGGER.info(
+            'Fitting MAP-MRI model on %i voxels (%i blocks of %i voxels, %i workers)' %
+            (masked_data.shape[0], len(blocks), block_size, self.inputs.number_of_workers))
+        start_time = time.time()
+        for i, (block_maps, duration) in map_blocks(
+                _fit_mapmri_block, tasks, self.inputs.number_of_workers):
+            index = tuple(v[blocks[i]] for v in voxels)
+            for metric, block_map in zip(MAPMRI_METRICS, block_maps):
+                maps[metric][index] = np.nan_to_num(block_map)
+            IFLOGGER.info('Computation Time (block %i/%i): %.2f seconds' %
+                          (i + 1, len(blocks), duration))
+        IFLOGGER.info('MAP-MRI model fitted in %.2f seconds' % (time.time() - start_time))
+        return maps
+
     def _list_outputs(self):
         outputs = self._outputs().get()
         outputs['model'] = self._gen_filename('mapmri', ext='.pklz')
-        for metric in ["rtop", "rtap", "rtpp", "msd", "qiv", "ng", "ng_perp", "ng_para"]:
+        for metric in MAPMRI_METRICS:
             outputs["{}_file".format(metric)] = self._gen_filename(metric)
         return outputs
@@ -7,17 +7,23 @@
 """The FSL module provides Nipype interfaces for FSL functions missing in Nipype or modified."""
 
 import os
-from glob import glob
 import warnings
 
+import nibabel as nib
+
 from nipype.interfaces.fsl.base import FSLCommand, FSLCommandInputSpec
 from nipype.interfaces.base import (traits, BaseInterface, BaseInterfaceInputSpec,
                                     TraitedSpec, CommandLineInputSpec, CommandLine,
                                     InputMultiPath, OutputMultiPath, File,
                                     isdefined)
 import nipype.interfaces.fsl as fsl
+from nipype.utils.filemanip import split_filename
 from traits.trait_types import Float, Enum
 
+from cmtklib.resampling import (
+    flirt_voxel_map, reference_grid, resample_labels, run_interfaces, same_grid
+)
+
 warn = warnings.warn
 warnings.filterwarnings('always', category=UserWarning)
 
@@ -444,6 +450,15 @@ class ApplymultipleXfmInputSpec(BaseInterfaceInputSpec):
     interp = Enum('nearestneighbour', 'spline',
                   desc='Interpolation used')
 
+    in_process = traits.Bool(
+        True, usedefault=True,
+        desc='Resample all the images in-process with a single coordinate map '
+             'when the interpolation is nearestneighbour')
+
+    number_of_workers = traits.Int(
+        1, usedefault=True,
+        desc='Number of concurrent flirt processes when not resampling in-process')
+
 
 class ApplymultipleXfmOutputSpec(TraitedSpec):
     out_files = OutputMultiPath(File(), desc="Transformed files")
@@ -471,19 +486,34 @@ class ApplymultipleXfm(BaseInterface):
     output_spec = ApplymultipleXfmOutputSpec
 
     def _run_interface(self, runtime):
-        for in_file in self.inputs.in_files:
-            ax = fsl.ApplyXFM(
-                in_file=in_file,
-                in_matrix_file=self.inputs.xfm_file,
-                apply_xfm=True,
-                interp=self.inputs.interp,
-                reference=self.inputs.reference)
-            ax.run()
+        in_files = list(self.inputs.in_files)
+        if (self.inputs.in_process and self.inputs.interp == 'nearestneighbour'
+                and same_grid(in_files)):
+            ref_img = nib.load(self.inputs.reference)
+            in_img = nib.load(in_files[0])
+            vox2vox = flirt_voxel_map(self.inputs.xfm_file, in_img, ref_img)
+            coords = nib.affines.apply_affine(vox2vox, reference_grid(ref_img.shape[:3]))
+            self.out_files = resample_labels(
+                in_files,
+                [split_filename(f)[1] + '_flirt.nii.gz' for f in in_files],
+                ref_img, coords, in_img.shape)
+        else:
+            interfaces = [
+                fsl.ApplyXFM(
+                    in_file=in_file,
+                    in_matrix_file=self.inputs.xfm_file,
+                    apply_xfm=True,
+                    interp=self.inputs.interp,
+                    reference=self.inputs.reference)
+                for in_file in in_files
+            ]
+            self.out_files = run_interfaces(
+                interfaces, 'out_file', self.inputs.number_of_workers)
         return runtime
 
     def _list_outputs(self):
         outputs = self._outputs().get()
-        outputs['out_files'] = glob(os.path.abspath("*.nii.gz"))
+        outputs['out_files'] = self.out_files
         return outputs
 
 
@@ -499,6 +529,9 @@ class ApplymultipleWarpInputSpec(BaseInterfaceInputSpec):
         'nn', 'trilinear', 'sinc', 'spline', argstr='--interp=%s', position=-2,
         desc="Interpolation method")
 
+    number_of_workers = traits.Int(
+        1, usedefault=True, desc='Number of concurrent applywarp processes')
+
 
 class ApplymultipleWarpOutputSpec(TraitedSpec):
     out_files = OutputMultiPath(File(), desc="Warped files")
@@ -526,19 +559,22 @@ class ApplymultipleWarp(BaseInterface):
     output_spec = ApplymultipleWarpOutputSpec
 
     def _run_interface(self, runtime):
-        for in_file in self.inputs.in_files:
-            ax = fsl.ApplyWarp(
+        interfaces = [
+            fsl.ApplyWarp(
                 in_file=in_file,
                 interp=self.inputs.interp,
                 field_file=self.inputs.field_file,
                 ref_file=self.inputs.ref_file
             )
-            ax.run()
+            for in_file in self.inputs.in_files
+        ]
+        self.out_files = run_interfaces(
+            interfaces, 'out_file', self.inputs.number_of_workers)
         return runtime
 
     def _list_outputs(self):
         outputs = self._outputs().get()
-        outputs['out_files'] = glob(os.path.abspath("*.nii.gz"))
+        outputs['out_files'] = self.out_files
         return outputs
 
 
@@ -8,6 +8,7 @@
 import os
 import pickle
 import warnings
+import itertools
 import subprocess
 
 import mne
@@ -446,6 +447,73 @@ class EEGLAB2fif(BaseInterface):
         return outputs
 
 
+def extract_label_time_courses(
+    stcs, labels, src, n_epochs, batch_size=32, out_file=None, dtype=np.float64, mode="pca_flip"
+):
+    """Extract the ROI time courses of the source estimates of the epochs per batch of epochs.
+
+    The time courses are written in a pre-allocated ``(epochs x rois x times)``
+    array, memory-mapped to `out_file` if provided, such that only the source
+    estimates of `batch_size` epochs are in memory when `stcs` is a generator.
+
+    Parameters
+    ----------
+    stcs : list or generator of mne.SourceEstimate
+        Source estimates of the epochs, as returned by
+        :func:`mne.minimum_norm.apply_inverse_epochs`
+
+    labels : list of mne.Label
+        Labels of the ROIs
+
+    src : mne.SourceSpaces
+        Source space of the source estimates
+
+    n_epochs : int
+        Number of epochs
+
+    batch_size : int
+        Number of epochs whose ROI time courses are extracted at once
+
+    out_file : string
+        Output file in .npy format. If `None`, the array is kept in memory.
+
+    dtype : numpy.dtype
+        Data type of the ROI time courses
+
+    mode : string
+        Extraction mode passed to :func:`mne.extract_label_time_course`
+
+    Returns
+    -------
+    roi_tcs : numpy.ndarray
+        Array of shape ``(epochs x rois x times)``
+    """
+    stcs = iter(stcs)
+    roi_tcs = None
+    start = 0
+    while start < n_epochs:
+        batch = list(itertools.islice(stcs, batch_size))
+        if not batch:
+            break
+        batch_tcs = mne.extract_label_time_course(
+            batch, labels, src, mode=mode, allow_empty=True, return_generator=False
+        )
+        if roi_tcs is None:
+            shape = (n_epochs,) + np.shape(batch_tcs[0])
+            if out_file is None:
+                roi_tcs = np.empty(shape, dtype=dtype)
+            else:
+                roi_tcs = np.lib.format.open_memmap(out_file, mode="w+", dtype=dtype, shape=shape)
+        roi_tcs[start:start + len(batch_tcs)] = batch_tcs
+        start += len(batch_tcs)
+        del batch, batch_tcs
+    if start != n_epochs:
+        raise ValueError(f"Expected source estimates for {n_epochs} epochs, got {start}")
+    if isinstance(roi_tcs, np.memmap):
+        roi_tcs.flush()
+    return roi_tcs
+
+
 class MNEInverseSolutionInputSpec(BaseInterfaceInputSpec):
     subject = traits.Str(desc="Subject", mandatory=True)
 
@@ -471,9 +539,25 @@ class MNEInverseSolutionInputSpec(BaseInterfaceInputSpec):
 
     roi_ts_file = traits.File(exists=False, desc="rois * time series in .npy format")
 
+    streaming = traits.Bool(
+        True, usedefault=True,
+        desc="Apply the inverse operator epoch by epoch and extract the ROI time courses "
+             "per batch of epochs, instead of keeping the source estimates of all the epochs in memory"
+    )
+
+    epochs_batch_size = traits.Int(
+        32, usedefault=True, desc="Number of epochs per batch in streaming mode"
+    )
+
+    roi_ts_dtype = traits.Enum(
+        "float64", "float32", usedefault=True, desc="Data type of the rois * time series"
+    )
+
 
 class MNEInverseSolutionOutputSpec(TraitedSpec):
-    roi_ts_file = traits.File(exists=True, desc="rois * time series in .npy format")
+    roi_ts_file = traits.File(exists=True, desc="rois * time series and labels in .pkl format")
+
+    roi_ts_npy_file = traits.File(exists=True, desc="epochs * rois * time series in .npy format")
 
     fwd_fname = traits.File(exists=True, desc="Forward solution in fif format", mandatory=True)
 
@@ -497,6 +581,8 @@ class MNEInverseSolution(BaseInterface):
     >>> inv_sol.inputs.inv_fname = 'sub-01_inv.fif'
     >>> inv_sol.inputs.parcellation = 'lausanne2018.scale1'
     >>> inv_sol.inputs.roi_ts_file = 'sub-01_atlas-L2018_res-scale1_desc-epo_timeseries.npy'
+    >>> inv_sol.inputs.streaming = True
+    >>> inv_sol.inputs.epochs_batch_size = 32
     >>> inv_sol.run()  # doctest: +SKIP
 
     References
@@ -527,25 +613,31 @@ class MNEInverseSolution(BaseInterface):
         parcellation = self.inputs.parcellation
         self.roi_ts_file = self.inputs.roi_ts_file
 
-        # temporary workaround until harmonized with invsol (cartool):
-        # want to use pickle so labels can be saved alongside time courses
+        # The (epochs x rois x times) array is saved in .npy format
+        # (as for invsol cartool) and the labels alongside the time courses
+        # in a pickle, kept for compatibility
+        self.roi_ts_npy_file = os.path.splitext(self.roi_ts_file)[0] + ".npy"
         if self.roi_ts_file[-3:] == "npy":
             self.roi_ts_file = self.roi_ts_file[:-3] + "pkl"
 
-        if not os.path.exists(self.roi_ts_file):
+        if not os.path.exists(self.roi_ts_file) or not os.path.exists(self.roi_ts_npy_file):
             roi_tcs = self._createInv_MNE(
-                bids_dir, subject, epochs_file, self.fwd_fname, noise_cov_fname, src_file, parcellation, inv_fname
+                bids_dir, subject, epochs_file, self.fwd_fname, noise_cov_fname, src_file, parcellation, inv_fname,
+                roi_ts_npy_file=self.roi_ts_npy_file,
+                streaming=self.inputs.streaming,
+                epochs_batch_size=self.inputs.epochs_batch_size,
+                dtype=np.dtype(self.inputs.roi_ts_dtype),
             )
 
             with open(self.roi_ts_file, "wb") as f:
                 pickle.dump(roi_tcs, f, pickle.HIGHEST_PROTOCOL)
-            # np.save(self.roi_ts_file, roi_tcs)
 
         return runtime
 
     @staticmethod
     def _createInv_MNE(
-        bids_dir, subject, epochs_file, fwd_fname, noise_cov_fname, src_file, parcellation, inv_fname
+        bids_dir, subject, epochs_file, fwd_fname, noise_cov_fname, src_file, parcellation, inv_fname,
+        roi_ts_npy_file=None, streaming=True, epochs_batch_size=32, dtype=np.float64
     ):
         epochs = mne.read_epochs(epochs_file)
         fwd = mne.read_forward_solution(fwd_fname)
@@ -567,20 +659,25 @@ class MNEInverseSolution(BaseInterface):
         # stcs, inverse_matrix = my_mne_minimum_norm_inverse.apply_inverse_epochs(
         #   epochs, inverse_operator, lambda2, method, pick_ori="normal", nave=evoked.nave,return_generator=False
         # )
+        # in streaming mode, the source estimates are computed lazily
+        # and only the ones of a batch of epochs are held in memory
         stcs = mne.minimum_norm.apply_inverse_epochs(
-            epochs, inverse_operator, lambda2, method, pick_ori=None, nave=evoked.nave, return_generator=False
+            epochs, inverse_operator, lambda2, method, pick_ori=None, nave=evoked.nave,
+            return_generator=streaming
         )
         # get ROI time courses
         # read the labels of the source points
         subjects_dir = os.path.join(bids_dir, "derivatives", __freesurfer_directory__)
         labels_parc = mne.read_labels_from_annot(subject, parc=parcellation, subjects_dir=subjects_dir)
         # get the ROI time courses
-        data = mne.extract_label_time_course(
-            stcs, labels_parc, src, mode="pca_flip", allow_empty=True, return_generator=False
+        data = extract_label_time_courses(
+            stcs, labels_parc, src, n_epochs=len(epochs),
+            batch_size=epochs_batch_size if streaming else len(epochs),
+            out_file=roi_ts_npy_file, dtype=dtype
         )
 
         roi_tcs = dict()
-        roi_tcs["data"] = data
+        roi_tcs["data"] = [np.array(tc) for tc in data]
         roi_tcs["labels"] = labels_parc
 
         return roi_tcs
@@ -589,4 +686,5 @@ class MNEInverseSolution(BaseInterface):
         outputs = self._outputs().get()
         outputs["fwd_fname"] = self.fwd_fname
         outputs["roi_ts_file"] = self.roi_ts_file
+        outputs["roi_ts_npy_file"] = self.roi_ts_npy_file
         return outputs
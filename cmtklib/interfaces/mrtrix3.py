@@ -10,12 +10,17 @@ import os
 import os.path as op
 import glob
 
+import nibabel as nib
+import numpy as np
+
 import nipype.interfaces.base as nibase
 from nipype.interfaces.base import BaseInterface, BaseInterfaceInputSpec, CommandLineInputSpec, \
     CommandLine, traits, TraitedSpec, File, Directory, InputMultiPath, OutputMultiPath, isdefined
 from nipype.utils import logger
 from nipype.utils.filemanip import split_filename, fname_presuffix
 
+from cmtklib.resampling import reference_grid, resample_labels, run_interfaces, same_grid
+
 
 class MRtrix_mul_InputSpec(CommandLineInputSpec):
     input1 = nibase.File(desc='Input1 file', position=1,
@@ -783,6 +788,18 @@ class ApplymultipleMRTransformsInputSpec(BaseInterfaceInputSpec):
 
     template_image = File(mandatory=True, exists=True, desc='Template image')
 
+    interp = traits.Enum('nearest', 'linear', 'cubic', 'sinc',
+                         desc='Interpolation method used when reslicing (Default: cubic). '
+                              'It must be set to nearest for the images to be resliced in-process')
+
+    in_process = traits.Bool(True, usedefault=True,
+                             desc='Reslice all the images in-process with a single coordinate map '
+                                  'when `interp` is explicitly set to nearest')
+
+    number_of_workers = traits.Int(1, usedefault=True,
+                                   desc='Number of concurrent mrtransform processes '
+                                        'when not reslicing in-process')
+
 
 class ApplymultipleMRTransformsOutputSpec(TraitedSpec):
     out_files = OutputMultiPath(File(), desc='Transformed files')
@@ -801,6 +818,7 @@ class ApplymultipleMRTransforms(BaseInterface):
     >>>                                    'sub-01_atlas-L2018_desc-scale4_dseg.nii.gz',
     >>>                                    'sub-01_atlas-L2018_desc-scale5_dseg.nii.gz']
     >>> multi_transform.inputs.template_image = 'sub-01_T1w.nii.gz'
+    >>> multi_transform.inputs.interp = 'nearest'
     >>> multi_transform.run()  # doctest: +SKIP
 
 
@@ -813,15 +831,31 @@ class ApplymultipleMRTransforms(BaseInterface):
     output_spec = ApplymultipleMRTransformsOutputSpec
 
     def _run_interface(self, runtime):
-        for in_file in self.inputs.in_files:
-            mt = MRTransform(in_files=in_file,
-                             template_image=self.inputs.template_image)
-            mt.run()
+        in_files = list(self.inputs.in_files)
+        if (self.inputs.in_process and self.inputs.interp == 'nearest'
+                and same_grid(in_files)):
+            ref_img = nib.load(self.inputs.template_image)
+            in_img = nib.load(in_files[0])
+            vox2vox = np.linalg.inv(in_img.affine) @ ref_img.affine
+            coords = nib.affines.apply_affine(vox2vox, reference_grid(ref_img.shape[:3]))
+            self.out_files = resample_labels(
+                in_files,
+                [split_filename(f)[1] + '_crop.nii.gz' for f in in_files],
+                ref_img, coords, in_img.shape)
+        else:
+            interfaces = [
+                MRTransform(in_files=in_file,
+                            template_image=self.inputs.template_image,
+                            interp=self.inputs.interp)
+                for in_file in in_files
+            ]
+            self.out_files = run_interfaces(
+                interfaces, 'out_file', self.inputs.number_of_workers)
         return runtime
 
     def _list_outputs(self):
         outputs = self._outputs().get()
-        outputs['out_files'] = glob.glob(os.path.abspath("*.nii.gz"))
+        outputs['out_files'] = self.out_files
         return outputs
 
 
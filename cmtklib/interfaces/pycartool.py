@@ -33,6 +33,9 @@ class CartoolInverseSolutionROIExtractionInputSpec(BaseInterfaceInputSpec):
     roi_ts_file = traits.File(
         exists=False, desc="rois * time series in .npy format")
 
+    roi_ts_dtype = traits.Enum(
+        "float64", "float32", usedefault=True, desc="Data type of the rois * time series")
+
 
 class CartoolInverseSolutionROIExtractionOutputSpec(TraitedSpec):
     roi_ts_file = traits.File(
@@ -71,50 +74,79 @@ class CartoolInverseSolutionROIExtraction(BaseInterface):
         svd_params = self.inputs.invsol_params['svd_params']
         self.roi_ts_file = self.inputs.roi_ts_file
 
-        roi_tcs = self.apply_inverse_epochs_cartool(epochs_file, invsol_file, lamda, rois_file, svd_params)
+        roi_tcs = self.apply_inverse_epochs_cartool(
+            epochs_file, invsol_file, lamda, rois_file, svd_params, dtype=np.dtype(self.inputs.roi_ts_dtype)
+        )
         np.save(self.roi_ts_file, roi_tcs)
 
         return runtime
 
     @staticmethod
-    def apply_inverse_epochs_cartool(epochs_file, invsol_file, lamda, rois_file, svd_params):
+    def apply_inverse_epochs_cartool(epochs_file, invsol_file, lamda, rois_file, svd_params, dtype=np.float64):
         epochs = mne.read_epochs(epochs_file)
         invsol = cart.io.inverse_solution.read_is(invsol_file)
         pickle_in = open(rois_file, "rb")
         rois = pickle.load(pickle_in)
         K = invsol['regularisation_solutions'][lamda]
+        return CartoolInverseSolutionROIExtraction.extract_roi_time_courses(epochs, K, rois, svd_params, dtype=dtype)
+
+    @staticmethod
+    def extract_roi_time_courses(epochs, K, rois, svd_params, dtype=np.float64):
+        """Extract the ROI time courses of epochs with a Cartool inverse solution.
+
+        The time course of a ROI is the mean over its solution points of the
+        source activity projected on the main dipole orientation of the ROI,
+        given by the first left singular vector of the epoch-averaged source
+        activity in the `svd_params` time window. As the projection and the
+        average are linear, they are folded into one weight per channel and ROI,
+        and the time courses of all the epochs and ROIs are obtained with a single
+        matrix product.
+
+        Parameters
+        ----------
+        epochs : mne.Epochs
+            EEG epochs
+
+        K : numpy.ndarray
+            Inverse solution matrix of shape ``(3, n_solution_points, n_channels)``
+
+        rois : object
+            Cartool ROIs with the attributes `names` and `groups_of_indexes`
+
+        svd_params : dict
+            Time window (``'toi_begin'``, ``'toi_end'`` in seconds) used to estimate
+            the main dipole orientation of each ROI
+
+        dtype : numpy.dtype
+            Data type of the time courses, e.g. `numpy.float32` to halve the memory
+            used by the epochs (the dipole orientations are estimated in double precision)
+
+        Returns
+        -------
+        roi_tcs : numpy.ndarray
+            ROI time courses of shape ``(n_epochs, n_rois, n_times)``
+        """
         n_rois = len(rois.names)
         times = epochs.times
         tstep = times[1] - times[0]
-        roi_tcs = np.zeros((n_rois, len(times), len(epochs.events)))
-        n_spi = np.zeros(n_rois, dtype=int)
-        for r in range(n_rois):
-            spis_this_roi = rois.groups_of_indexes[r]
-            n_spi[r] = int(len(spis_this_roi))
-            roi_stc = np.zeros((3, n_spi[r], len(times), len(epochs.events)))
-
-            for k, e in enumerate(epochs):
-                # logger.info('Processing epoch : %d%s' % (k + 1, total))
-                roi_stc[0, :, :, k] = K[0, spis_this_roi] @ e
-                roi_stc[1, :, :, k] = K[1, spis_this_roi] @ e
-                roi_stc[2, :, :, k] = K[2, spis_this_roi] @ e
+        stim_onset = np.where(times == 0)[0][0]
+        svd_t_begin = stim_onset + int(svd_params['toi_begin'] / tstep)
+        svd_t_end = stim_onset + int(svd_params['toi_end'] / tstep)
 
-            stim_onset = np.where(times == 0)[0][0]
-            svd_t_begin = stim_onset + int(svd_params['toi_begin'] / tstep)
-            svd_t_end = stim_onset + int(svd_params['toi_end'] / tstep)
+        # Epochs of shape (n_epochs, n_channels, n_times)
+        data = epochs.get_data()
+        # The source activity averaged over the epochs is the inverse of the averaged epochs
+        mean_data = np.mean(data[:, :, svd_t_begin:svd_t_end], axis=0, dtype=np.float64)
 
-            mean_roi_stc = np.mean(roi_stc[:, :, svd_t_begin:svd_t_end, :], axis=3)
-            u1, _, _ = np.linalg.svd(mean_roi_stc.reshape(3, -1))
-
-            tc_loc = np.zeros((len(times), n_spi[r], len(epochs.events)))
-
-            for k in range(n_spi[r]):
-                for e in range(len(epochs.events)):
-                    tc_loc[:, k, e] = u1[:, 0].reshape(1, 3) @ roi_stc[:, k, :, e]
-
-            roi_tcs[r, :, :] = np.mean(tc_loc, axis=1)
+        weights = np.zeros((n_rois, K.shape[2]))
+        for r in range(n_rois):
+            K_roi = np.asarray(K[:, rois.groups_of_indexes[r]], dtype=np.float64)
+            mean_roi_stc = K_roi @ mean_data
+            u1, _, _ = np.linalg.svd(mean_roi_stc.reshape(3, -1), full_matrices=False)
+            # Projection on the dipole orientation, averaged over the solution points
+            weights[r] = np.tensordot(u1[:, 0], K_roi, axes=1).mean(axis=0)
 
-        return roi_tcs.transpose(2, 0, 1)
+        return np.matmul(weights.astype(dtype), data.astype(dtype, copy=False))
 
     def _list_outputs(self):
         outputs = self._outputs().get()
@@ -8,13 +8,13 @@
 
 # Common libraries import
 import os
-from time import localtime, strftime
+from time import localtime, strftime, perf_counter
 import os.path as op
 from pathlib import Path
 import pkg_resources
 import subprocess
 import shutil
-import math
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 import nibabel as ni
 import networkx as nx
@@ -241,15 +241,15 @@ def erode_mask(fsdir, mask_file):
     mask[mask > 0] = 1
     mask = mask.astype(np.uint32)
 
-    er_mask = np.zeros(mask.shape)
-    idx = np.where((mask == 1))
-    er_mask[idx] = 1
+    er_mask = mask == 1
     print(er_mask.sum())
     er_mask = imerode(er_mask, se)
     print(er_mask.sum())
     er_mask = imerode(er_mask, se)
     print(er_mask.sum())
-    img = ni.Nifti1Image(er_mask, img.get_affine(), img.get_header())
+    hdr = img.get_header().copy()
+    hdr.set_data_dtype(np.uint8)
+    img = ni.Nifti1Image(er_mask.astype(np.uint8), img.get_affine(), hdr)
     out_fname = os.path.join(fsdir, 'mri',
                              '{}_eroded.nii.gz'.format(os.path.splitext(op.splitext(op.basename(mask_file))[0])[0]))
     print('    > Save eroded mask to: {}'.format(out_fname))
@@ -435,6 +435,302 @@ class ParcellateBrainstemStructures(BaseInterface):
         return outputs
 
 
+# Structures that CombineParcellations adds to the cortical Lausanne2018 parcellation.
+# Each structure is described as (label in the source image, name, (R, G, B)).
+L2018_SUBCORTICAL_STRUCTURES = {
+    'right': [(49, 'Right-Thalamus_Proper', (0, 118, 14)),
+              (50, 'Right-Caudate', (122, 186, 220)),
+              (51, 'Right-Putamen', (236, 13, 176)),
+              (52, 'Right-Pallidum', (12, 48, 255)),
+              (58, 'Right-Accumbens_area', (255, 165, 0)),
+              (54, 'Right-Amygdala', (103, 255, 255)),
+              (53, 'Right-Hippocampus', (220, 216, 20))],
+    'left': [(10, 'Left-Thalamus_Proper', (0, 118, 14)),
+             (11, 'Left-Caudate', (122, 186, 220)),
+             (12, 'Left-Putamen', (236, 13, 176)),
+             (13, 'Left-Pallidum', (12, 48, 255)),
+             (26, 'Left-Accumbens_area', (255, 165, 0)),
+             (18, 'Left-Amygdala', (103, 255, 255)),
+             (17, 'Left-Hippocampus', (220, 216, 20))]
+}
+
+# Amygdala and hippocampus swapped between Lausanne2008 and Lausanne2018
+L2008_SUBCORTICAL_ORDER = [0, 1, 2, 3, 4, 6, 5]
+
+L2018_THALAMIC_NUCLEI = {
+    'right': [(8, 'Right-Pulvinar', (255, 0, 0)),
+              (9, 'Right-Anterior', (0, 255, 0)),
+              (10, 'Right-Medio_Dorsal', (255, 255, 0)),
+              (11, 'Right-Ventral_Latero_Dorsal', (255, 123, 0)),
+              (12, 'Right-Central_Lateral-Lateral_Posterior-Medial_Pulvinar', (0, 255, 255)),
+              (13, 'Right-Ventral_Anterior', (255, 0, 255)),
+              (14, 'Right-Ventral_Latero_Ventral', (0, 0, 255))],
+    'left': [(1, 'Left-Pulvinar', (255, 0, 0)),
+             (2, 'Left-Anterior', (0, 255, 0)),
+             (3, 'Left-Medio_Dorsal', (255, 255, 0)),
+             (4, 'Left-Ventral_Latero_Dorsal', (255, 123, 0)),
+             (5, 'Left-Central_Lateral-Lateral_Posterior-Medial_Pulvinar', (0, 255, 255)),
+             (6, 'Left-Ventral_Anterior', (255, 0, 255)),
+             (7, 'Left-Ventral_Latero_Ventral', (0, 0, 255))]
+}
+
+L2018_HIPPOCAMPAL_SUBFIELDS = [(203, 'Hippocampus_Parasubiculum', (255, 255, 0)),
+                               (204, 'Hippocampus_Presubiculum', (64, 0, 64)),
+                               (205, 'Hippocampus_Subiculum', (0, 0, 255)),
+                               (206, 'Hippocampus_CA1', (255, 0, 0)),
+                               (208, 'Hippocampus_CA3', (0, 128, 0)),
+                               (209, 'Hippocampus_CA4', (196, 160, 128)),
+                               (210, 'Hippocampus_GCDG', (32, 200, 255)),
+                               (211, 'Hippocampus_HATA', (128, 255, 128)),
+                               (212, 'Hippocampus_Fimbria', (204, 153, 204)),
+                               (214, 'Hippocampus_Molecular_layer_HP', (128, 0, 0)),
+                               (215, 'Hippocampus_Hippocampal_fissure', (128, 32, 255)),
+                               (226, 'Hippocampus_Tail', (170, 170, 255))]
+
+L2018_VENTRAL_DIENCEPHALON = {
+    'right': (60, 'Right-VentralDC', (165, 42, 42)),
+    'left': (28, 'Left-VentralDC', (165, 42, 42))
+}
+
+# Hypothalamus labels in the image computed from the dilated third ventricle
+L2018_HYPOTHALAMUS = {
+    'right': (1, 'Right-Hypothalamus', (204, 182, 142)),
+    'left': (2, 'Left-Hypothalamus', (204, 182, 142))
+}
+
+L2018_BRAINSTEM_STRUCTURES = [(173, 'Brain_Stem-Midbrain', (242, 104, 76)),
+                              (174, 'Brain_Stem-Pons', (206, 195, 58)),
+                              (175, 'Brain_Stem-Medulla', (119, 159, 176)),
+                              (178, 'Brain_Stem-SCP', (142, 182, 0))]
+
+L2018_BRAINSTEM = (16, 'brainstem', (119, 159, 176))
+
+
+def _label_table_section(title, source, region, hemisphere, structures, fs_name=None, fs_id=None):
+    """Return a section of the label table built by :func:`get_lausanne2018_label_table`."""
+    return {
+        'title': title,
+        'source': source,
+        'region': region,
+        'hemisphere': hemisphere,
+        'structures': [
+            {
+                'source_label': int(source_label),
+                'name': name,
+                'color': tuple(int(c) for c in color),
+                'fs_name': fs_name if fs_name is not None else name,
+                'fs_id': int(fs_id) if fs_id is not None else int(source_label),
+            }
+            for source_label, name, color in structures
+        ]
+    }
+
+
+def get_lausanne2018_label_table(rh_annot, lh_annot, thalamus_nuclei=True, lh_hippocampal_subfields=True,
+                                 rh_hippocampal_subfields=True, brainstem_structures=True):
+    """Return the declarative description of a Lausanne2018 parcellation scale.
+
+    The table is an ordered list of sections (right hemisphere, left hemisphere and brainstem
+    structures). Each section describes from which source image (``'aseg'`` for the cortical
+    and subcortical parcellation, ``'thalamus'``, ``'lh_subfields'``, ``'rh_subfields'``,
+    ``'hypothalamus'`` or ``'brainstem'``) and which source labels its structures are taken.
+    The final labels are assigned consecutively following the order of the table, and a
+    structure overrides the voxels of the structures defined in previous sections.
+
+    Parameters
+    ----------
+    rh_annot : tuple
+        Right hemisphere annotation of the scale as returned by :func:`nibabel.freesurfer.io.read_annot`
+
+    lh_annot : tuple
+        Left hemisphere annotation of the scale as returned by :func:`nibabel.freesurfer.io.read_annot`
+
+    thalamus_nuclei : bool
+        Include the thalamic nuclei
+
+    lh_hippocampal_subfields : bool
+        Include the hippocampal subfields of the left hemisphere
+
+    rh_hippocampal_subfields : bool
+        Include the hippocampal subfields of the right hemisphere
+
+    brainstem_structures : bool
+        Include the brainstem structures
+
+    Returns
+    -------
+    table : list of dict
+        List of sections where each structure has been given its final ``label``
+    """
+    full = thalamus_nuclei and brainstem_structures and lh_hippocampal_subfields and rh_hippocampal_subfields
+    extra = thalamus_nuclei or brainstem_structures or (lh_hippocampal_subfields and rh_hippocampal_subfields)
+
+    table = []
+    for hemi, hemisphere, annot, offset in [('rh', 'right', rh_annot, 2000), ('lh', 'left', lh_annot, 1000)]:
+        title = '{} Hemisphere.'.format(hemisphere.capitalize())
+
+        rgb_table = annot[1][1:, 0:3]
+        cortical_structures = [
+            (offset + k + 1, 'ctx-{}-{}'.format(hemi, name.decode()), (0, 0, 0) if k == 0 else rgb_table[k])
+            for k, name in enumerate(annot[2][1:])
+        ]
+        table.append(_label_table_section('{} Cortical Structures'.format(title), 'aseg', 'cortical',
+                                          hemisphere, cortical_structures))
+
+        if thalamus_nuclei:
+            table.append(_label_table_section('{} Subcortical Structures (Thalamic Nuclei)'.format(title),
+                                              'thalamus', 'subcortical', hemisphere,
+                                              L2018_THALAMIC_NUCLEI[hemisphere], fs_name='thalamus',
+                                              fs_id=L2018_SUBCORTICAL_STRUCTURES[hemisphere][0][0]))
+
+        if full:
+            subcortical_structures = L2018_SUBCORTICAL_STRUCTURES[hemisphere][1:]
+        else:
+            subcortical_structures = [L2018_SUBCORTICAL_STRUCTURES[hemisphere][k] for k in L2008_SUBCORTICAL_ORDER]
+        table.append(_label_table_section('{} Subcortical Structures'.format(title), 'aseg', 'subcortical',
+                                          hemisphere, subcortical_structures, fs_name='subcortical'))
+
+        if (hemi == 'rh' and rh_hippocampal_subfields) or (hemi == 'lh' and lh_hippocampal_subfields):
+            subfields = [(lab, '{}-{}'.format(hemisphere.capitalize(), name), color)
+                         for lab, name, color in L2018_HIPPOCAMPAL_SUBFIELDS]
+            table.append(_label_table_section('{} Subcortical Structures (Hippocampal Subfields)'.format(title),
+                                              '{}_subfields'.format(hemi), 'subcortical', hemisphere,
+                                              subfields, fs_name='hippocampus'))
+
+        if extra:
+            table.append(_label_table_section('{} Ventral Diencephalon'.format(title), 'aseg', 'subcortical',
+                                              hemisphere, [L2018_VENTRAL_DIENCEPHALON[hemisphere]],
+                                              fs_name='ventral-diencephalon'))
+            table.append(_label_table_section('{} Hypothalamus'.format(title), 'hypothalamus', 'subcortical',
+                                              hemisphere, [L2018_HYPOTHALAMUS[hemisphere]],
+                                              fs_name='hypothalamus', fs_id=-1))
+
+    if brainstem_structures:
+        table.append(_label_table_section('Brain Stem Structures', 'brainstem', 'subcortical', 'central',
+                                          L2018_BRAINSTEM_STRUCTURES, fs_name='brainstem'))
+    else:
+        table.append(_label_table_section('Brain Stem', 'aseg', 'subcortical', 'central',
+                                          [L2018_BRAINSTEM], fs_name='brainstem'))
+
+    label = 0
+    for section in table:
+        for structure in section['structures']:
+            label += 1
+            structure['label'] = label
+
+    return table
+
+
+def apply_label_table(table, sources, dtype=np.int16):
+    """Create the parcellation image described by a label table.
+
+    Each source image is relabeled with a single lookup-table pass and the
+    voxels are resolved according to the order of the sections of the table.
+
+    Parameters
+    ----------
+    table : list of dict
+        Label table returned by :func:`get_lausanne2018_label_table`
+
+    sources : dict
+        Dictionary of source label images indexed by the source names used in `table`
+
+    dtype : numpy.dtype
+        Data type of the output image (Default: ``numpy.int16``)
+
+    Returns
+    -------
+    out : numpy.ndarray
+        The output parcellation image
+    """
+    label_maps = {}
+    rank_maps = {}
+    for rank, section in enumerate(table):
+        label_map = label_maps.setdefault(section['source'], {})
+        rank_map = rank_maps.setdefault(section['source'], {})
+        for structure in section['structures']:
+            label_map[structure['source_label']] = structure['label']
+            rank_map[structure['source_label']] = rank + 1
+
+    shape = next(iter(sources.values())).shape
+    out = np.zeros(shape, dtype=dtype)
+    out_rank = np.zeros(shape, dtype=np.uint16)
+    for source, label_map in label_maps.items():
+        source_ranks = relabel(sources[source], rank_maps[source], dtype=np.uint16)
+        update = source_ranks > out_rank
+        if not update.any():
+            continue
+        source_labels = relabel(sources[source], label_map, dtype=dtype)
+        out[update] = source_labels[update]
+        out_rank[update] = source_ranks[update]
+
+    return out
+
+
+def write_freesurfer_colorlut(table, color_lut_file):
+    """Write the color lookup table in FreeSurfer format of a label table.
+
+    Parameters
+    ----------
+    table : list of dict
+        Label table returned by :func:`get_lausanne2018_label_table`
+
+    color_lut_file : string
+        Path of the output color lookup table
+    """
+    time_now = strftime("%a, %d %b %Y %H:%M:%S", localtime())
+    lines = ['#$Id: {} {} \n \n'.format(op.basename(color_lut_file), time_now),
+             '{:<4} {:<55} {:>3} {:>3} {:>3} {} \n \n'.format("#No.", "Label Name:", "R", "G", "B", "A")]
+    for section in table:
+        lines.append('# {} \n'.format(section['title']))
+        for structure in section['structures']:
+            r, g, b = structure['color']
+            lines.append('{:<4} {:<55} {:>3} {:>3} {:>3} 0 \n'.format(structure['label'], structure['name'], r, g, b))
+        lines.append('\n')
+    with open(color_lut_file, 'w+') as f_color_lut:
+        f_color_lut.writelines(lines)
+
+
+def write_node_description_graphml(table, graphml_file):
+    """Write the parcellation node description file in `graphml` format of a label table.
+
+    Parameters
+    ----------
+    table : list of dict
+        Label table returned by :func:`get_lausanne2018_label_table`
+
+    graphml_file : string
+        Path of the output `graphml` file
+    """
+    lines = ['{} \n'.format('<?xml version="1.0" encoding="utf-8"?>'),
+             '{} \n'.format(
+                 '<graphml xmlns="http://graphml.graphdrawing.org/xmlns" '
+                 'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+                 'xsi:schemaLocation="http://graphml.graphdrawing.org/xmlns '
+                 'http://graphml.graphdrawing.org/xmlns/1.0/graphml.xsd">'),
+             '{} \n'.format('  <key attr.name="dn_region" attr.type="string" for="node" id="d0" />'),
+             '{} \n'.format('  <key attr.name="dn_fsname" attr.type="string" for="node" id="d1" />'),
+             '{} \n'.format('  <key attr.name="dn_hemisphere" attr.type="string" for="node" id="d2" />'),
+             '{} \n'.format('  <key attr.name="dn_multiscaleID" attr.type="int" for="node" id="d3" />'),
+             '{} \n'.format('  <key attr.name="dn_name" attr.type="string" for="node" id="d4" />'),
+             '{} \n'.format('  <key attr.name="dn_fsID" attr.type="int" for="node" id="d5" />'),
+             '{} \n'.format('  <graph edgedefault="undirected" id="">')]
+    for section in table:
+        for structure in section['structures']:
+            lines += ['{} \n'.format('    <node id="%i">' % structure['label']),
+                      '{} \n'.format('      <data key="d0">%s</data>' % section['region']),
+                      '{} \n'.format('      <data key="d1">%s</data>' % structure['fs_name']),
+                      '{} \n'.format('      <data key="d2">%s</data>' % section['hemisphere']),
+                      '{} \n'.format('      <data key="d3">%i</data>' % structure['label']),
+                      '{} \n'.format('      <data key="d4">%s</data>' % structure['name']),
+                      '{} \n'.format('      <data key="d5">%i</data>' % structure['fs_id']),
+                      '{} \n'.format('    </node>')]
+    lines += ['{} \n'.format('  </graph>'),
+              '{} \n'.format('</graphml>')]
+    with open(graphml_file, 'w+') as f_graphml:
+        f_graphml.writelines(lines)
+
+
 class CombineParcellationsInputSpec(BaseInterfaceInputSpec):
     input_rois = InputMultiPath(File(exists=True), desc="Input parcellation files")
 
@@ -454,6 +750,9 @@ class CombineParcellationsInputSpec(BaseInterfaceInputSpec):
 
     subject_id = traits.Str(desc='Freesurfer subject id')
 
+    number_of_threads = traits.Int(5, usedefault=True,
+                                   desc='Maximal number of parcellation scales processed concurrently')
+
     verbose_level = traits.Enum(
         1, 2, desc='verbose level (1: partial (default) / 2: full)')
 
@@ -480,6 +779,10 @@ class CombineParcellations(BaseInterface):
     It also generates by defaults the corresponding (1) description of the nodes in `graphml`
     format and (2) color lookup tables in FreeSurfer format that can be displayed in `freeview`.
 
+    The structures of each scale are described by a label table
+    (see :func:`get_lausanne2018_label_table`) that is applied with a single
+    lookup-table pass per source image. The scales are processed concurrently.
+
     Examples
     --------
     >>> parc_combine = CombineParcellations()
@@ -519,109 +822,20 @@ class CombineParcellations(BaseInterface):
         fs_dir = op.join(self.inputs.subjects_dir, self.inputs.subject_id)
         print("Freesurfer subject directory: {}".format(fs_dir))
 
-        # Freesurfer IDs for subcortical structures
-        left_subc_ids = np.array([10, 11, 12, 13, 26, 18, 17])
-        left_subc_ids_2018_colors_r = np.array([0, 122, 236, 12, 255, 103, 220])
-        left_subc_ids_2018_colors_g = np.array([118, 186, 13, 48, 165, 255, 216])
-        left_subc_ids_2018_colors_b = np.array([14, 220, 176, 255, 0, 255, 20])
-        left_subcort_names = ["Left-Thalamus_Proper", "Left-Caudate", "Left-Putamen", "Left-Pallidum",
-                              "Left-Accumbens_area", "Left-Amygdala", "Left-Hippocampus"]
-
-        right_subc_ids = np.array([49, 50, 51, 52, 58, 54, 53])
-        right_subc_ids_2018_colors_r = np.array([0, 122, 236, 12, 255, 103, 220])
-        right_subc_ids_2018_colors_g = np.array([118, 186, 13, 48, 165, 255, 216])
-        right_subc_ids_2018_colors_b = np.array([14, 220, 176, 255, 0, 255, 20])
-        right_subcort_names = ["Right-Thalamus_Proper", "Right-Caudate", "Right-Putamen", "Right-Pallidum",
-                               "Right-Accumbens_area", "Right-Amygdala", "Right-Hippocampus"]
-
-        # Amygdala and hippocampus swapped between Lausanne2008 and Lausanne2018
-        left_subc_ids_2008 = np.array([10, 11, 12, 13, 26, 17, 18])
-        # left_subc_ids_2008_colors_r = np.array([0, 122, 236, 12, 255, 220, 103])
-        # left_subc_ids_2008_colors_g = np.array([118, 186, 13, 48, 165, 216, 255])
-        # left_subc_ids_2008_colors_b = np.array([14, 220, 176, 255, 0, 20, 255])
-        left_subcort_2008_names = ["Left-Thalamus_Proper", "Left-Caudate", "Left-Putamen", "Left-Pallidum",
-                                   "Left-Accumbens_area", "Left-Hippocampus", "Left-Amygdala"]
-
-        right_subc_ids_2008 = np.array([49, 50, 51, 52, 58, 53, 54])
-        # right_subc_ids_2008_colors_r = np.array([0, 122, 236, 12, 255, 220, 103])
-        # right_subc_ids_2008_colors_g = np.array([118, 186, 13, 48, 165, 216, 255])
-        # right_subc_ids_2008_colors_b = np.array([14, 220, 176, 255, 0, 20, 255])
-        right_subcort_2008_names = ["Right-Thalamus_Proper", "Right-Caudate", "Right-Putamen", "Right-Pallidum",
-                                    "Right-Accumbens_area", "Right-Hippocampus", "Right-Amygdala"]
-
-        # Thalamic Nuclei
-        left_thalNuclei = np.array([1, 2, 3, 4, 5, 6, 7])
-        left_thalNuclei_colors_r = np.array([255, 0, 255, 255, 0, 255, 0])
-        left_thalNuclei_colors_g = np.array([0, 255, 255, 123, 255, 0, 0])
-        left_thalNuclei_colors_b = np.array([0, 0, 0, 0, 255, 255, 255])
-        left_thalNuclei_names = ["Left-Pulvinar", "Left-Anterior", "Left-Medio_Dorsal", "Left-Ventral_Latero_Dorsal",
-                                 "Left-Central_Lateral-Lateral_Posterior-Medial_Pulvinar",
-                                 "Left-Ventral_Anterior", "Left-Ventral_Latero_Ventral"]
-
-        right_thalNuclei = np.array([8, 9, 10, 11, 12, 13, 14])
-        right_thalNuclei_colors_r = np.array([255, 0, 255, 255, 0, 255, 0])
-        right_thalNuclei_colors_g = np.array([0, 255, 255, 123, 255, 0, 0])
-        right_thalNuclei_colors_b = np.array([0, 0, 0, 0, 255, 255, 255])
-        right_thalNuclei_names = ["Right-Pulvinar", "Right-Anterior", "Right-Medio_Dorsal",
-                                  "Right-Ventral_Latero_Dorsal",
-                                  "Right-Central_Lateral-Lateral_Posterior-Medial_Pulvinar",
-                                  "Right-Ventral_Anterior", "Right-Ventral_Latero_Ventral"]
-
-        # Hippocampus subfields
-        hippo_subf = np.array([203, 204, 205, 206, 208, 209, 210, 211, 212, 214, 215, 226])
-        hippo_subf_colors_r = np.array([255, 64, 0, 255, 0, 196, 32, 128, 204, 128, 128, 170])
-        hippo_subf_colors_g = np.array([255, 0, 0, 0, 128, 160, 200, 255, 153, 0, 32, 170])
-        hippo_subf_colors_b = np.array([0, 64, 255, 0, 0, 128, 255, 128, 204, 0, 255, 255])
-        left_hippo_subf_names = ["Left-Hippocampus_Parasubiculum", "Left-Hippocampus_Presubiculum",
-                                 "Left-Hippocampus_Subiculum", "Left-Hippocampus_CA1", "Left-Hippocampus_CA3",
-                                 "Left-Hippocampus_CA4",
-                                 "Left-Hippocampus_GCDG", "Left-Hippocampus_HATA", "Left-Hippocampus_Fimbria",
-                                 "Left-Hippocampus_Molecular_layer_HP", "Left-Hippocampus_Hippocampal_fissure",
-                                 "Left-Hippocampus_Tail"]
-        right_hippo_subf_names = ["Right-Hippocampus_Parasubiculum", "Right-Hippocampus_Presubiculum",
-                                  "Right-Hippocampus_Subiculum", "Right-Hippocampus_CA1", "Right-Hippocampus_CA3",
-                                  "Right-Hippocampus_CA4",
-                                  "Right-Hippocampus_GCDG", "Right-Hippocampus_HATA", "Right-Hippocampus_Fimbria",
-                                  "Right-Hippocampus_Molecular_layer_HP", "Right-Hippocampus_Hippocampal_fissure",
-                                  "Right-Hippocampus_Tail"]
-
-        # Left Ventral Diencephalon
-        left_ventral = 28
-        left_ventral_colors_r = 165
-        left_ventral_colors_g = 42
-        left_ventral_colors_b = 42
-        left_ventral_names = ["Left-VentralDC"]
-
-        # Right Ventral Diencephalon
-        right_ventral = 60
-        right_ventral_colors_r = 165
-        right_ventral_colors_g = 42
-        right_ventral_colors_b = 42
-        right_ventral_names = ["Right-VentralDC"]
+        left_thalNuclei = np.array([lab for lab, _, _ in L2018_THALAMIC_NUCLEI['left']])
+        right_thalNuclei = np.array([lab for lab, _, _ in L2018_THALAMIC_NUCLEI['right']])
 
         # Third Ventricle
         ventricle3 = 14
 
-        # Hypothalamus
-        hypothal_colors_r = 204
-        hypothal_colors_g = 182
-        hypothal_colors_b = 142
-        left_hypothal_names = ["Left-Hypothalamus"]
-        right_hypothal_names = ["Right-Hypothalamus"]
-
-        # BrainStem Parcellation
-        brainstem = np.array([173, 174, 175, 178])
-        brainstem_colors_r = np.array([242, 206, 119, 142])
-        brainstem_colors_g = np.array([104, 195, 159, 182])
-        brainstem_colors_b = np.array([76, 58, 176, 0])
-        brainstem_names = ["Brain_Stem-Midbrain",
-                           "Brain_Stem-Pons", "Brain_Stem-Medulla", "Brain_Stem-SCP"]
+        # Source images shared by all the scales
+        sources = {}
 
         lh_subfield_defined = False
         # Reading Subfields Images
         try:
             img_sublh = ni.load(self.inputs.lh_hippocampal_subfields)
-            img_data_sublh = img_sublh.get_data()
+            sources['lh_subfields'] = img_sublh.get_data()
             lh_subfield_defined = True
         except TypeError:
             print('Subfields image (Left hemisphere) not provided')
@@ -629,7 +843,7 @@ class CombineParcellations(BaseInterface):
         rh_subfield_defined = False
         try:
             img_subrh = ni.load(self.inputs.rh_hippocampal_subfields)
-            img_data_subrh = img_subrh.get_data()
+            sources['rh_subfields'] = img_subrh.get_data()
             rh_subfield_defined = True
         except TypeError:
             print('Subfields image (Right hemisphere) not provided')
@@ -639,7 +853,7 @@ class CombineParcellations(BaseInterface):
         try:
             Vthal = ni.load(self.inputs.thalamus_nuclei)
             img_data_thal = Vthal.get_data()
-
+            sources['thalamus'] = img_data_thal
             thalamus_nuclei_defined = True
         except TypeError:
             print('Thalamic nuclei image not provided')
@@ -649,27 +863,12 @@ class CombineParcellations(BaseInterface):
         try:
             img_stem = ni.load(self.inputs.brainstem_structures)
             img_data_stem = img_stem.get_data()
+            sources['brainstem'] = img_data_stem
             indstem = np.where(img_data_stem > 0)
             brainstem_defined = True
         except TypeError:
             print('Brain stem image not provided')
 
-        if not (thalamus_nuclei_defined and brainstem_defined and (lh_subfield_defined and rh_subfield_defined)):
-            left_subc_labels = left_subc_ids_2008
-            left_subcort_names = left_subcort_2008_names
-            right_subc_labels = right_subc_ids_2008
-            right_subcort_names = right_subcort_2008_names
-
-        elif thalamus_nuclei_defined:
-            left_subc_labels = left_subc_ids[1:]
-            left_subcort_names = left_subcort_names[1:]
-            right_subc_labels = right_subc_ids[1:]
-            right_subcort_names = right_subcort_names[1:]
-
-        else:
-            left_subc_labels = left_subc_ids
-            right_subc_labels = right_subc_ids
-
         # Get the first parcellation scale for ventricule image
         roi1_fname = None
         for roi_fname in self.inputs.input_rois:
@@ -682,9 +881,7 @@ class CombineParcellations(BaseInterface):
         iflogger.info("  > Create ventricule image")
         img_v = ni.load(roi1_fname)
         img_data = img_v.get_data()
-        tmp = np.zeros(img_data.shape)
-        ind_v = np.where(img_data == ventricle3)
-        tmp[ind_v] = 1
+        tmp = (img_data == ventricle3).astype(np.uint8)
 
         third_vent_fn = op.abspath('ventricle3.nii.gz')
         hdr = img_v.get_header()
@@ -705,779 +902,27 @@ class CombineParcellations(BaseInterface):
         if self.inputs.verbose_level == 2:
             print(proc_stdout)
 
-        tmp = ni.load(third_vent_dil)
-        indrhypothal = np.where((tmp == 1) & (img_data == right_ventral))
-        indlhypothal = np.where((tmp == 1) & (img_data == left_ventral))
+        tmp = ni.load(third_vent_dil).get_data() == 1
+        img_data_hypothal = np.zeros(img_data.shape, dtype=np.uint8)
+        for hemisphere in ['right', 'left']:
+            ventral_label = L2018_VENTRAL_DIENCEPHALON[hemisphere][0]
+            img_data_hypothal[tmp & (img_data == ventral_label)] = L2018_HYPOTHALAMUS[hemisphere][0]
+        sources['hypothalamus'] = img_data_hypothal
         del tmp
 
-        f_color_lut = None
-        f_graphml = None
-
-        print("create color look up table : ", self.inputs.create_colorLUT)
-
-        for _, roi in enumerate(self.inputs.input_rois):
-            # colorLUT creation if enabled
-            if self.inputs.create_colorLUT:
-                outprefix_name = Path(roi).name.split(".")[0]
-                color_lut_file = op.abspath(
-                    '{}_FreeSurferColorLUT.txt'.format(outprefix_name))
-                print("Create colorLUT file as %s" % color_lut_file)
-                f_color_lut = open(color_lut_file, 'w+')
-                time_now = strftime("%a, %d %b %Y %H:%M:%S", localtime())
-                hdr_lines = ['#$Id: {}_FreeSurferColorLUT.txt {} \n \n'.format(outprefix_name, time_now),
-                             '{:<4} {:<55} {:>3} {:>3} {:>3} {} \n \n'.format("#No.", "Label Name:", "R", "G", "B",
-                                                                              "A")]
-                f_color_lut.writelines(hdr_lines)
-                del hdr_lines
-
-            # Create GraphML if enabled
-            if self.inputs.create_graphml:
-                outprefix_name = Path(roi).name.split(".")[0]
-                graphml_file = op.abspath('{}.graphml'.format(outprefix_name))
-                print("Create graphml_file as %s" % graphml_file)
-                f_graphml = open(graphml_file, 'w+')
-
-                hdr_lines = ['{} \n'.format('<?xml version="1.0" encoding="utf-8"?>'),
-                             '{} \n'.format(
-                                 '<graphml xmlns="http://graphml.graphdrawing.org/xmlns" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
-                                 'xsi:schemaLocation="http://graphml.graphdrawing.org/xmlns http://graphml.graphdrawing.org/xmlns/1.0/graphml.xsd">'),
-                             '{} \n'.format(
-                                 '  <key attr.name="dn_region" attr.type="string" for="node" id="d0" />'),
-                             '{} \n'.format(
-                                 '  <key attr.name="dn_fsname" attr.type="string" for="node" id="d1" />'),
-                             '{} \n'.format(
-                                 '  <key attr.name="dn_hemisphere" attr.type="string" for="node" id="d2" />'),
-                             '{} \n'.format(
-                                 '  <key attr.name="dn_multiscaleID" attr.type="int" for="node" id="d3" />'),
-                             '{} \n'.format(
-                                 '  <key attr.name="dn_name" attr.type="string" for="node" id="d4" />'),
-                             '{} \n'.format(
-                                 '  <key attr.name="dn_fsID" attr.type="int" for="node" id="d5" />'),
-                             '{} \n'.format('  <graph edgedefault="undirected" id="">'), ]
-                f_graphml.writelines(hdr_lines)
-                del hdr_lines
-
-            # Reading Cortical Parcellation
-            img_v = ni.load(roi)
-            img_data = img_v.get_data()
-
-            # Replacing the brain stem (Stem is replaced by its own parcellation.
-            # Mismatch between both global volumes, mainly due to partial volume
-            # effect in the global stem parcellation)
-            indrep = np.where(img_data == 16)
-            img_data[indrep] = 0
-
-        for _, roi in sorted(enumerate(self.inputs.input_rois)):
-            # colorLUT creation if enabled
-            if self.inputs.create_colorLUT:
-                outprefix_name = Path(roi).name.split(".")[0]
-                color_lut_file = op.abspath(
-                    '{}_FreeSurferColorLUT.txt'.format(outprefix_name))
-                iflogger.info("  > Create colorLUT file as %s" % color_lut_file)
-                f_color_lut = open(color_lut_file, 'w+')
-                time_now = strftime("%a, %d %b %Y %H:%M:%S", localtime())
-                hdr_lines = ['#$Id: {}_FreeSurferColorLUT.txt {} \n \n'.format(outprefix_name, time_now),
-                             '{:<4} {:<55} {:>3} {:>3} {:>3} {} \n \n'.format("#No.", "Label Name:", "R", "G", "B",
-                                                                              "A")]
-                f_color_lut.writelines(hdr_lines)
-                del hdr_lines
-
-            # Create GraphML if enabled
-            if self.inputs.create_graphml:
-                outprefix_name = Path(roi).name.split(".")[0]
-                graphml_file = op.abspath('{}.graphml'.format(outprefix_name))
-                iflogger.info(
-                    "  > Create graphml_file as {}".format(graphml_file))
-                f_graphml = open(graphml_file, 'w+')
-
-                hdr_lines = ['{} \n'.format('<?xml version="1.0" encoding="utf-8"?>'),
-                             '{} \n'.format(
-                                 '<graphml xmlns="http://graphml.graphdrawing.org/xmlns" '
-                                 'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
-                                 'xsi:schemaLocation="http://graphml.graphdrawing.org/xmlns '
-                                 'http://graphml.graphdrawing.org/xmlns/1.0/graphml.xsd">'),
-                             '{} \n'.format(
-                                 '  <key attr.name="dn_region" attr.type="string" for="node" id="d0" />'),
-                             '{} \n'.format(
-                                 '  <key attr.name="dn_fsname" attr.type="string" for="node" id="d1" />'),
-                             '{} \n'.format(
-                                 '  <key attr.name="dn_hemisphere" attr.type="string" for="node" id="d2" />'),
-                             '{} \n'.format(
-                                 '  <key attr.name="dn_multiscaleID" attr.type="int" for="node" id="d3" />'),
-                             '{} \n'.format(
-                                 '  <key attr.name="dn_name" attr.type="string" for="node" id="d4" />'),
-                             '{} \n'.format(
-                                 '  <key attr.name="dn_fsID" attr.type="int" for="node" id="d5" />'),
-                             '{} \n'.format('  <graph edgedefault="undirected" id="">'), ]
-                f_graphml.writelines(hdr_lines)
-                del hdr_lines
-
-            # Reading Cortical Parcellation
-            img_v = ni.load(roi)
-            img_data = img_v.get_data()
-
-            # Replacing the brain stem (Stem is replaced by its own parcellation.
-            # Mismatch between both global volumes, mainly due to partial volume
-            # effect in the global stem parcellation)
-            indrep = np.where(img_data == 16)
-            img_data[indrep] = 0
-
-            # Processing Right Hemisphere
-
-            # Relabelling Right hemisphere
-            img_data_out = np.zeros(img_data.shape, dtype=np.int16)
-            ind = np.where((img_data >= 2000) & (img_data < 3000))
-            img_data_out[ind] = (img_data[ind] - 2000)
-            nlabel = img_data_out.max()
-
-            # ColorLUT (cortical)
-            if self.inputs.create_colorLUT or self.inputs.create_graphml:
-                f_color_lut.write("# Right Hemisphere. Cortical Structures \n")
-                outprefix_name = Path(roi).name.split(".")[0]
-                for elem in outprefix_name.split("_"):
-                    if "scale" in elem:
-                        scale = elem
-                rh_annot_file = 'rh.lausanne2018.%s.annot' % scale
-                iflogger.info("  > Load {}".format(rh_annot_file))
-                rh_annot = ni.freesurfer.io.read_annot(
-                    op.join(self.inputs.subjects_dir, self.inputs.subject_id, 'label', rh_annot_file))
-                rgb_table = rh_annot[1][1:, 0:3]
-                roi_names = rh_annot[2][1:]
-                # roi_labels = rh_annot[0][1:]
-
-                for label, name in enumerate(roi_names):
-                    name = 'ctx-rh-{}'.format(name.decode())
-                    if self.inputs.create_colorLUT:
-                        r = rgb_table[label, 0]
-                        g = rgb_table[label, 1]
-                        b = rgb_table[label, 2]
-
-                        if label == 0:
-                            r = 0
-                            g = 0
-                            b = 0
-
-                        f_color_lut.write('{:<4} {:<55} {:>3} {:>3} {:>3} 0 \n'.format(
-                            label + 1, name, r, g, b))
-
-                    if self.inputs.create_graphml:
-                        node_lines = ['{} \n'.format('    <node id="%i">' % (label + 1)),
-                                      '{} \n'.format(
-                                          '      <data key="d0">%s</data>' % "cortical"),
-                                      '{} \n'.format(
-                                          '      <data key="d1">%s</data>' % name),
-                                      '{} \n'.format(
-                                          '      <data key="d2">%s</data>' % "right"),
-                                      '{} \n'.format(
-                                          '      <data key="d3">%i</data>' % (label + 1)),
-                                      '{} \n'.format(
-                                          '      <data key="d4">%s</data>' % name),
-                                      '{} \n'.format(
-                                          '      <data key="d5">%i</data>' % (int(label + 2000 + 1))),
-                                      '{} \n'.format('    </node>')]
-                        f_graphml.writelines(node_lines)
-
-                if self.inputs.create_colorLUT:
-                    f_color_lut.write("\n")
-
-            # Relabelling Thalamic Nuclei
-            if thalamus_nuclei_defined:
-                if self.inputs.create_colorLUT:
-                    f_color_lut.write(
-                        "# Right Hemisphere. Subcortical Structures (Thalamic Nuclei) \n")
-
-                new_labels = np.arange(
-                    nlabel + 1, nlabel + 1 + right_thalNuclei.shape[0])
-
-                i = 0
-                for lab in right_thalNuclei:
-                    if self.inputs.verbose_level == 2:
-                        iflogger.info(
-                            "  > Update right thalamic nucleus label ({} -> {})".format(lab, new_labels[i]))
-
-                    if self.inputs.create_colorLUT:
-                        r = right_thalNuclei_colors_r[i]
-                        g = right_thalNuclei_colors_g[i]
-                        b = right_thalNuclei_colors_b[i]
-                        f_color_lut.write(
-                            '{:<4} {:<55} {:>3} {:>3} {:>3} 0 \n'.format(int(new_labels[i]), right_thalNuclei_names[i],
-                                                                         r, g, b))
-
-                    if self.inputs.create_graphml:
-                        node_lines = ['{} \n'.format('    <node id="%i">' % (int(new_labels[i]))),
-                                      '{} \n'.format(
-                                          '      <data key="d0">%s</data>' % "subcortical"),
-                                      '{} \n'.format(
-                                          '      <data key="d1">%s</data>' % "thalamus"),
-                                      '{} \n'.format(
-                                          '      <data key="d2">%s</data>' % "right"),
-                                      '{} \n'.format(
-                                          '      <data key="d3">%i</data>' % (int(new_labels[i]))),
-                                      '{} \n'.format(
-                                          '      <data key="d4">%s</data>' % (right_thalNuclei_names[i])),
-                                      '{} \n'.format(
-                                          '      <data key="d5">%i</data>' % (int(49))),
-                                      '{} \n'.format('    </node>')]
-                        f_graphml.writelines(node_lines)
-
-                    ind = np.where(img_data_thal == lab)
-                    img_data_out[ind] = new_labels[i]
-                    i += 1
-                nlabel = img_data_out.max()
-
-                if self.inputs.create_colorLUT:
-                    f_color_lut.write("\n")
-
-            # Relabelling Subcortical Structures
-            if self.inputs.create_colorLUT:
-                f_color_lut.write(
-                    "# Right Hemisphere. Subcortical Structures \n")
-
-            new_labels = np.arange(nlabel + 1, nlabel + 1 + left_subc_labels.shape[0])
-
-            i = 0
-            for lab in right_subc_labels:
-                if self.inputs.verbose_level == 2:
-                    iflogger.info(
-                        "  > Update right subcortical label ({} -> {})".format(lab, new_labels[i]))
-
-                if self.inputs.create_colorLUT:
-                    r = right_subc_ids_2018_colors_r[i]
-                    g = right_subc_ids_2018_colors_g[i]
-                    b = right_subc_ids_2018_colors_b[i]
-                    f_color_lut.write(
-                        '{:<4} {:<55} {:>3} {:>3} {:>3} 0 \n'.format(int(new_labels[i]), right_subcort_names[i], r, g,
-                                                                     b))
-
-                if self.inputs.create_graphml:
-                    node_lines = ['{} \n'.format('    <node id="%i">' % (int(new_labels[i]))),
-                                  '{} \n'.format(
-                                      '      <data key="d0">%s</data>' % "subcortical"),
-                                  '{} \n'.format(
-                                      '      <data key="d1">%s</data>' % "subcortical"),
-                                  '{} \n'.format(
-                                      '      <data key="d2">%s</data>' % "right"),
-                                  '{} \n'.format(
-                                      '      <data key="d3">%i</data>' % (int(new_labels[i]))),
-                                  '{} \n'.format(
-                                      '      <data key="d4">%s</data>' % (right_subcort_names[i])),
-                                  '{} \n'.format(
-                                      '      <data key="d5">%i</data>' % (int(lab))),
-                                  '{} \n'.format('    </node>')]
-                    f_graphml.writelines(node_lines)
-
-                ind = np.where(img_data == lab)
-                img_data_out[ind] = new_labels[i]
-                i += 1
-            nlabel = img_data_out.max()
-
-            if self.inputs.create_colorLUT:
-                f_color_lut.write("\n")
-
-            # Relabelling Subfields
-            if rh_subfield_defined:
-                if self.inputs.create_colorLUT:
-                    f_color_lut.write(
-                        "# Right Hemisphere. Subcortical Structures (Hippocampal Subfields) \n")
-
-                new_labels = np.arange(
-                    nlabel + 1, nlabel + 1 + hippo_subf.shape[0])
-                i = 0
-                for lab in hippo_subf:
-                    if self.inputs.verbose_level == 2:
-                        iflogger.info(
-                            "  > Update right hippo subfield label ({} -> {})".format(lab, new_labels[i]))
-
-                    if self.inputs.create_colorLUT:
-                        # if len(ind) > 0:
-                        r = hippo_subf_colors_r[i]
-                        g = hippo_subf_colors_g[i]
-                        b = hippo_subf_colors_b[i]
-                        f_color_lut.write(
-                            '{:<4} {:<55} {:>3} {:>3} {:>3} 0 \n'.format(int(new_labels[i]), right_hippo_subf_names[i],
-                                                                         r, g, b))
-
-                    if self.inputs.create_graphml:
-                        node_lines = ['{} \n'.format('    <node id="%i">' % (int(new_labels[i]))),
-                                      '{} \n'.format(
-                                          '      <data key="d0">%s</data>' % "subcortical"),
-                                      '{} \n'.format(
-                                          '      <data key="d1">%s</data>' % "hippocampus"),
-                                      '{} \n'.format(
-                                          '      <data key="d2">%s</data>' % "right"),
-                                      '{} \n'.format(
-                                          '      <data key="d3">%i</data>' % (int(new_labels[i]))),
-                                      '{} \n'.format(
-                                          '      <data key="d4">%s</data>' % (right_hippo_subf_names[i])),
-                                      '{} \n'.format(
-                                          '      <data key="d5">%i</data>' % (int(lab))),
-                                      '{} \n'.format('    </node>')]
-                        f_graphml.writelines(node_lines)
-
-                    ind = np.where(img_data_subrh == lab)
-                    img_data_out[ind] = new_labels[i]
-                    i += 1
-                nlabel = img_data_out.max()
-
-                if self.inputs.create_colorLUT:
-                    f_color_lut.write("\n")
-
-            if thalamus_nuclei_defined or brainstem_defined or (lh_subfield_defined and rh_subfield_defined):
-                # Relabelling Right VentralDC
-                new_labels = np.arange(nlabel + 1, nlabel + 2)
-                if self.inputs.verbose_level == 2:
-                    iflogger.info(
-                        "  > Update right ventral DC label ({} -> {})".format(right_ventral, new_labels[0]))
-                ind = np.where(img_data == right_ventral)
-                img_data_out[ind] = new_labels[0]
-                nlabel = img_data_out.max()
-
-                # ColorLUT (right ventral DC)
-                if self.inputs.create_colorLUT:
-                    f_color_lut.write(
-                        "# Right Hemisphere. Ventral Diencephalon \n")
-                    r = right_ventral_colors_r
-                    g = right_ventral_colors_g
-                    b = right_ventral_colors_b
-                    f_color_lut.write(
-                        '{:<4} {:<55} {:>3} {:>3} {:>3} 0 \n'.format(int(new_labels[0]), right_ventral_names[0], r, g,
-                                                                     b))
-                    f_color_lut.write("\n")
-
-                if self.inputs.create_graphml:
-                    node_lines = ['{} \n'.format('    <node id="%i">' % (int(new_labels[0]))),
-                                  '{} \n'.format(
-                                      '      <data key="d0">%s</data>' % "subcortical"),
-                                  '{} \n'.format(
-                                      '      <data key="d1">%s</data>' % "ventral-diencephalon"),
-                                  '{} \n'.format(
-                                      '      <data key="d2">%s</data>' % "right"),
-                                  '{} \n'.format(
-                                      '      <data key="d3">%i</data>' % (int(new_labels[0]))),
-                                  '{} \n'.format(
-                                      '      <data key="d4">%s</data>' % (right_ventral_names[0])),
-                                  '{} \n'.format(
-                                      '      <data key="d5">%i</data>' % (int(right_ventral))),
-                                  '{} \n'.format('    </node>')]
-                    f_graphml.writelines(node_lines)
-
-            if thalamus_nuclei_defined or brainstem_defined or (lh_subfield_defined and rh_subfield_defined):
-                # Relabelling Right Hypothalamus
-                new_labels = np.arange(nlabel + 1, nlabel + 2)
-                if self.inputs.verbose_level == 2:
-                    iflogger.info(
-                        "  > Update right hypothalamus label ({} -> {})".format(right_ventral, new_labels[0]))
-                img_data_out[indrhypothal] = new_labels[0]
-                nlabel = img_data_out.max()
-
-                # ColorLUT (right hypothalamus)
-                if self.inputs.create_colorLUT:
-                    f_color_lut.write("# Right Hemisphere. Hypothalamus \n")
-                    r = hypothal_colors_r
-                    g = hypothal_colors_g
-                    b = hypothal_colors_b
-                    f_color_lut.write(
-                        '{:<4} {:<55} {:>3} {:>3} {:>3} 0 \n'.format(int(new_labels[0]), right_hypothal_names[0], r, g,
-                                                                     b))
-                    f_color_lut.write("\n")
-
-                if self.inputs.create_graphml:
-                    node_lines = ['{} \n'.format('    <node id="%i">' % (int(new_labels[0]))),
-                                  '{} \n'.format(
-                                      '      <data key="d0">%s</data>' % "subcortical"),
-                                  '{} \n'.format(
-                                      '      <data key="d1">%s</data>' % "hypothalamus"),
-                                  '{} \n'.format(
-                                      '      <data key="d2">%s</data>' % "right"),
-                                  '{} \n'.format(
-                                      '      <data key="d3">%i</data>' % (int(new_labels[0]))),
-                                  '{} \n'.format(
-                                      '      <data key="d4">%s</data>' % (right_hypothal_names[0])),
-                                  '{} \n'.format(
-                                      '      <data key="d5">%i</data>' % (-1)),
-                                  '{} \n'.format('    </node>')]
-                    f_graphml.writelines(node_lines)
-
-            # Processing Left Hemisphere
-            # Relabelling Left hemisphere
-            ind = np.where((img_data > 1000) & (img_data < 2000))
-            img_data_out[ind] = (img_data[ind] - 1000 + nlabel)
-            old_nlabel = nlabel
-            nlabel = img_data_out.max()
-
-            # ColorLUT (cortical)
-            if self.inputs.create_colorLUT or self.inputs.create_graphml:
-                f_color_lut.write("# Left Hemisphere. Cortical Structures \n")
-                outprefix_name = Path(roi).name.split(".")[0]
-                for elem in outprefix_name.split("_"):
-                    if "scale" in elem:
-                        scale = elem
-                lh_annot_file = 'lh.lausanne2018.%s.annot' % scale
-                iflogger.info("  > Load {}".format(lh_annot_file))
-                lh_annot = ni.freesurfer.io.read_annot(
-                    op.join(self.inputs.subjects_dir, self.inputs.subject_id, 'label', lh_annot_file))
-                rgb_table = lh_annot[1][1:, 0:3]
-                roi_names = lh_annot[2][1:]
-
-                for label, name in enumerate(roi_names):
-                    name = 'ctx-lh-{}'.format(name.decode())
-
-                    if self.inputs.create_colorLUT:
-                        r = rgb_table[label, 0]
-                        g = rgb_table[label, 1]
-                        b = rgb_table[label, 2]
-
-                        if label == 0:
-                            r = 0
-                            g = 0
-                            b = 0
-
-                        f_color_lut.write(
-                            '{:<4} {:<55} {:>3} {:>3} {:>3} 0 \n'.format(int(label + old_nlabel + 1), name, r, g, b))
-
-                    if self.inputs.create_graphml:
-                        node_lines = ['{} \n'.format('    <node id="%i">' % (int(label + old_nlabel + 1))),
-                                      '{} \n'.format(
-                                          '      <data key="d0">%s</data>' % "cortical"),
-                                      '{} \n'.format(
-                                          '      <data key="d1">%s</data>' % name),
-                                      '{} \n'.format(
-                                          '      <data key="d2">%s</data>' % "left"),
-                                      '{} \n'.format(
-                                          '      <data key="d3">%i</data>' % (int(label + old_nlabel + 1))),
-                                      '{} \n'.format(
-                                          '      <data key="d4">%s</data>' % name),
-                                      '{} \n'.format(
-                                          '      <data key="d5">%i</data>' % (int(label + 1000 - old_nlabel))),
-                                      '{} \n'.format('    </node>')]
-                        f_graphml.writelines(node_lines)
-
-                if self.inputs.create_colorLUT:
-                    f_color_lut.write("\n")
-
-            # Relabelling Thalamic Nuclei
-            if thalamus_nuclei_defined:
-                if self.inputs.create_colorLUT:
-                    f_color_lut.write(
-                        "# Left Hemisphere. Subcortical Structures (Thalamic Nuclei) \n")
-
-                new_labels = np.arange(
-                    nlabel + 1, nlabel + 1 + left_thalNuclei.shape[0])
-                i = 0
-                for lab in left_thalNuclei:
-                    if self.inputs.verbose_level == 2:
-                        iflogger.info(
-                            "  > Update left thalamic nucleus label ({} -> {})".format(lab, new_labels[i]))
-
-                    if self.inputs.create_colorLUT:
-                        r = left_thalNuclei_colors_r[i]
-                        g = left_thalNuclei_colors_g[i]
-                        b = left_thalNuclei_colors_b[i]
-                        f_color_lut.write(
-                            '{:<4} {:<55} {:>3} {:>3} {:>3} 0 \n'.format(int(new_labels[i]), left_thalNuclei_names[i], r,
-                                                                         g, b))
-
-                    if self.inputs.create_graphml:
-                        node_lines = ['{} \n'.format('    <node id="%i">' % (int(new_labels[i]))),
-                                      '{} \n'.format(
-                                          '      <data key="d0">%s</data>' % "subcortical"),
-                                      '{} \n'.format(
-                                          '      <data key="d1">%s</data>' % "thalamus"),
-                                      '{} \n'.format(
-                                          '      <data key="d2">%s</data>' % "left"),
-                                      '{} \n'.format(
-                                          '      <data key="d3">%i</data>' % (int(new_labels[i]))),
-                                      '{} \n'.format(
-                                          '      <data key="d4">%s</data>' % (left_thalNuclei_names[i])),
-                                      '{} \n'.format(
-                                          '      <data key="d5">%i</data>' % (int(10))),
-                                      '{} \n'.format('    </node>')]
-                        f_graphml.writelines(node_lines)
-
-                    ind = np.where(img_data_thal == lab)
-                    img_data_out[ind] = new_labels[i]
-                    i += 1
-                nlabel = img_data_out.max()
-
-                if self.inputs.create_colorLUT:
-                    f_color_lut.write("\n")
-
-            # Relabelling Subcortical Structures
-            if self.inputs.create_colorLUT:
-                f_color_lut.write(
-                    "# Left Hemisphere. Subcortical Structures \n")
-
-            new_labels = np.arange(nlabel + 1, nlabel + 1 + left_subc_labels.shape[0])
-
-            i = 0
-            for lab in left_subc_labels:
-                if self.inputs.verbose_level == 2:
-                    iflogger.info(
-                        "  > Update left subcortical label ({} -> {})".format(lab, new_labels[i]))
-
-                if self.inputs.create_colorLUT:
-                    r = left_subc_ids_2018_colors_r[i]
-                    g = left_subc_ids_2018_colors_g[i]
-                    b = left_subc_ids_2018_colors_b[i]
-                    f_color_lut.write(
-                        '{:<4} {:<55} {:>3} {:>3} {:>3} 0 \n'.format(int(new_labels[i]), left_subcort_names[i], r, g, b))
-
-                if self.inputs.create_graphml:
-                    node_lines = ['{} \n'.format('    <node id="%i">' % (int(new_labels[i]))),
-                                  '{} \n'.format(
-                                      '      <data key="d0">%s</data>' % "subcortical"),
-                                  '{} \n'.format(
-                                      '      <data key="d1">%s</data>' % "subcortical"),
-                                  '{} \n'.format(
-                                      '      <data key="d2">%s</data>' % "left"),
-                                  '{} \n'.format(
-                                      '      <data key="d3">%i</data>' % (int(new_labels[i]))),
-                                  '{} \n'.format(
-                                      '      <data key="d4">%s</data>' % (left_subcort_names[i])),
-                                  '{} \n'.format(
-                                      '      <data key="d5">%i</data>' % (int(lab))),
-                                  '{} \n'.format('    </node>')]
-                    f_graphml.writelines(node_lines)
-
-                ind = np.where(img_data == lab)
-                img_data_out[ind] = new_labels[i]
-                i += 1
-            nlabel = img_data_out.max()
-
-            if self.inputs.create_colorLUT:
-                f_color_lut.write("\n")
-
-            # Relabelling Subfields
-            if lh_subfield_defined:
-                if self.inputs.create_colorLUT:
-                    f_color_lut.write(
-                        "# Left Hemisphere. Subcortical Structures (Hippocampal Subfields) \n")
-
-                new_labels = np.arange(
-                    nlabel + 1, nlabel + 1 + hippo_subf.shape[0])
-                i = 0
-                for lab in hippo_subf:
-                    if self.inputs.verbose_level == 2:
-                        iflogger.info(
-                            "  > Update left hippo subfield label ({} -> {})".format(lab, new_labels[i]))
-
-                    if self.inputs.create_colorLUT:
-                        r = hippo_subf_colors_r[i]
-                        g = hippo_subf_colors_g[i]
-                        b = hippo_subf_colors_b[i]
-                        f_color_lut.write(
-                            '{:<4} {:<55} {:>3} {:>3} {:>3} 0 \n'.format(int(new_labels[i]), left_hippo_subf_names[i], r,
-                                                                         g, b))
-
-                    if self.inputs.create_graphml:
-                        node_lines = ['{} \n'.format('    <node id="%i">' % (int(new_labels[i]))),
-                                      '{} \n'.format(
-                                          '      <data key="d0">%s</data>' % "subcortical"),
-                                      '{} \n'.format(
-                                          '      <data key="d1">%s</data>' % "hippocampus"),
-                                      '{} \n'.format(
-                                          '      <data key="d2">%s</data>' % "left"),
-                                      '{} \n'.format(
-                                          '      <data key="d3">%i</data>' % (int(new_labels[i]))),
-                                      '{} \n'.format(
-                                          '      <data key="d4">%s</data>' % (left_hippo_subf_names[i])),
-                                      '{} \n'.format(
-                                          '      <data key="d5">%i</data>' % (int(lab))),
-                                      '{} \n'.format('    </node>')]
-                        f_graphml.writelines(node_lines)
-
-                    ind = np.where(img_data_sublh == lab)
-                    img_data_out[ind] = new_labels[i]
-                    i += 1
-                nlabel = img_data_out.max()
-                # newIds_LH_subFields = new_labels
-
-                if self.inputs.create_colorLUT:
-                    f_color_lut.write("\n")
-
-            if thalamus_nuclei_defined or brainstem_defined or (lh_subfield_defined and rh_subfield_defined):
-                # Relabelling Left VentralDC
-                new_labels = np.arange(nlabel + 1, nlabel + 2)
-                if self.inputs.verbose_level == 2:
-                    iflogger.info(
-                        "  > Update left ventral DC label ({} -> {})".format(left_ventral, new_labels[0]))
-                ind = np.where(img_data == left_ventral)
-                img_data_out[ind] = new_labels[0]
-                nlabel = img_data_out.max()
-                # newIds_LH_ventralDC = new_labels
-
-                # ColorLUT (left ventral DC)
-                if self.inputs.create_colorLUT:
-                    f_color_lut.write(
-                        "# Left Hemisphere. Ventral Diencephalon \n")
-                    r = left_ventral_colors_r
-                    g = left_ventral_colors_g
-                    b = left_ventral_colors_b
-                    f_color_lut.write(
-                        '{:<4} {:<55} {:>3} {:>3} {:>3} 0 \n'.format(int(new_labels[0]), left_ventral_names[0], r, g, b))
-                    f_color_lut.write("\n")
-
-                if self.inputs.create_graphml:
-                    node_lines = ['{} \n'.format('    <node id="%i">' % (int(new_labels[0]))),
-                                  '{} \n'.format(
-                                      '      <data key="d0">%s</data>' % "subcortical"),
-                                  '{} \n'.format(
-                                      '      <data key="d1">%s</data>' % "ventral-diencephalon"),
-                                  '{} \n'.format(
-                                      '      <data key="d2">%s</data>' % "left"),
-                                  '{} \n'.format(
-                                      '      <data key="d3">%i</data>' % (int(new_labels[0]))),
-                                  '{} \n'.format(
-                                      '      <data key="d4">%s</data>' % (left_ventral_names[0])),
-                                  '{} \n'.format(
-                                      '      <data key="d5">%i</data>' % (int(left_ventral))),
-                                  '{} \n'.format('    </node>')]
-                    f_graphml.writelines(node_lines)
-
-            if thalamus_nuclei_defined or brainstem_defined or (lh_subfield_defined and rh_subfield_defined):
-                # Relabelling Left Hypothalamus
-                new_labels = np.arange(nlabel + 1, nlabel + 2)
-                if self.inputs.verbose_level == 2:
-                    iflogger.info(
-                        "  > Update left hypothalamus label ({} -> {})".format(-1, new_labels[0]))
-                img_data_out[indlhypothal] = new_labels[0]
-                nlabel = img_data_out.max()
-
-                # ColorLUT (right hypothalamus)
-                if self.inputs.create_colorLUT:
-                    f_color_lut.write("# Left Hemisphere. Hypothalamus \n")
-                    r = hypothal_colors_r
-                    g = hypothal_colors_g
-                    b = hypothal_colors_b
-                    f_color_lut.write(
-                        '{:<4} {:<55} {:>3} {:>3} {:>3} 0 \n'.format(int(new_labels[0]), left_hypothal_names[0], r, g,
-                                                                     b))
-                    f_color_lut.write("\n")
-
-                if self.inputs.create_graphml:
-                    node_lines = ['{} \n'.format('    <node id="%i">' % (int(new_labels[0]))),
-                                  '{} \n'.format(
-                                      '      <data key="d0">%s</data>' % "subcortical"),
-                                  '{} \n'.format(
-                                      '      <data key="d1">%s</data>' % "hypothalamus"),
-                                  '{} \n'.format(
-                                      '      <data key="d2">%s</data>' % "left"),
-                                  '{} \n'.format(
-                                      '      <data key="d3">%i</data>' % (int(new_labels[0]))),
-                                  '{} \n'.format(
-                                      '      <data key="d4">%s</data>' % (left_hypothal_names[0])),
-                                  '{} \n'.format(
-                                      '      <data key="d5">%i</data>' % (-1)),
-                                  '{} \n'.format('    </node>')]
-                    f_graphml.writelines(node_lines)
-
-            # Relabelling Brain Stem
-            if brainstem_defined:
-                if self.inputs.create_colorLUT:
-                    f_color_lut.write("# Brain Stem Structures \n")
-
-                new_labels = np.arange(
-                    nlabel + 1, nlabel + 1 + brainstem.shape[0])
-                i = 0
-                for lab in brainstem:
-                    if self.inputs.verbose_level == 2:
-                        iflogger.info(
-                            "  > Update brainstem parcellation label ({} -> {})".format(lab, new_labels[i]))
-
-                    if self.inputs.create_colorLUT:
-                        r = brainstem_colors_r[i]
-                        g = brainstem_colors_g[i]
-                        b = brainstem_colors_b[i]
-                        f_color_lut.write(
-                            '{:<4} {:<55} {:>3} {:>3} {:>3} 0 \n'.format(int(new_labels[i]), brainstem_names[i], r, g,
-                                                                         b))
-
-                    if self.inputs.create_graphml:
-                        node_lines = ['{} \n'.format('    <node id="%i">' % (int(new_labels[i]))),
-                                      '{} \n'.format(
-                                          '      <data key="d0">%s</data>' % "subcortical"),
-                                      '{} \n'.format(
-                                          '      <data key="d1">%s</data>' % "brainstem"),
-                                      '{} \n'.format(
-                                          '      <data key="d2">%s</data>' % "central"),
-                                      '{} \n'.format(
-                                          '      <data key="d3">%i</data>' % (int(new_labels[i]))),
-                                      '{} \n'.format(
-                                          '      <data key="d4">%s</data>' % (brainstem_names[i])),
-                                      '{} \n'.format(
-                                          '      <data key="d5">%i</data>' % (int(lab))),
-                                      '{} \n'.format('    </node>')]
-                        f_graphml.writelines(node_lines)
-
-                    ind = np.where(img_data_stem == lab)
-                    img_data_out[ind] = new_labels[i]
-                    i += 1
-                # nlabel = img_data_out.max()
-
-                if self.inputs.create_colorLUT:
-                    f_color_lut.write("\n")
-            else:
-                if self.inputs.create_colorLUT:
-                    f_color_lut.write("# Brain Stem \n")
-
-                new_labels = np.arange(nlabel + 1, nlabel + 2)
-                img_data_out[indrep] = new_labels[0]
-
-                if self.inputs.verbose_level == 2:
-                    iflogger.info(
-                        "  > Update brainstem parcellation label ({} -> {})".format(lab, new_labels[0]))
-
-                if self.inputs.create_colorLUT:
-                    r = 119
-                    g = 159
-                    b = 176
-                    f_color_lut.write(
-                        '{:<4} {:<55} {:>3} {:>3} {:>3} 0 \n'.format(int(new_labels[0]), 'brainstem', r, g, b))
-
-                    if self.inputs.create_graphml:
-                        node_lines = ['{} \n'.format('    <node id="%i">' % (int(new_labels[0]))),
-                                      '{} \n'.format(
-                                          '      <data key="d0">%s</data>' % "subcortical"),
-                                      '{} \n'.format(
-                                          '      <data key="d1">%s</data>' % "brainstem"),
-                                      '{} \n'.format(
-                                          '      <data key="d2">%s</data>' % "central"),
-                                      '{} \n'.format(
-                                          '      <data key="d3">%i</data>' % (int(new_labels[0]))),
-                                      '{} \n'.format(
-                                          '      <data key="d4">%s</data>' % "brainstem"),
-                                      '{} \n'.format(
-                                          '      <data key="d5">%i</data>' % (int(lab))),
-                                      '{} \n'.format('    </node>')]
-                        f_graphml.writelines(node_lines)
-
-                # nlabel = img_data_out.max()
-
-                if self.inputs.create_colorLUT:
-                    f_color_lut.write("\n")
-
-            # Fix negative values
-            img_data_out[img_data_out < 0] = 0
-
-            # Saving the new parcellation
-            outprefix_name = Path(roi).name.split(".")[0]
-            output_roi = op.abspath('{}_final.nii.gz'.format(outprefix_name))
-            hdr = img_v.get_header()
-            hdr2 = hdr.copy()
-            hdr2.set_data_dtype(np.int16)
-            iflogger.info("  > Save output image to {}".format(output_roi))
-            img = ni.Nifti1Image(img_data_out, img_v.get_affine(), hdr2)
-            ni.save(img, output_roi)
-            del img
-
-            if self.inputs.create_colorLUT:
-                f_color_lut.close()
-
-            if self.inputs.create_graphml:
-                bottom_lines = ['{} \n'.format('  </graph>'),
-                                '{} \n'.format('</graphml>'), ]
-                f_graphml.writelines(bottom_lines)
-                f_graphml.close()
+        n_workers = max(1, min(self.inputs.number_of_threads, len(self.inputs.input_rois)))
+        iflogger.info("  > Combine {} parcellation scales ({} concurrent)".format(
+            len(self.inputs.input_rois), n_workers))
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            futures = [
+                executor.submit(self._combine_scale, roi, sources,
+                                thalamus_nuclei_defined, lh_subfield_defined,
+                                rh_subfield_defined, brainstem_defined)
+                for roi in sorted(self.inputs.input_rois)
+            ]
+            # Propagate any exception raised while processing one of the scales
+            for future in futures:
+                future.result()
 
         orig = op.join(fs_dir, 'mri', 'rawavg.mgz')
         aparcaseg_fs = op.join(fs_dir, 'mri', 'aparc+aseg.mgz')
@@ -1516,54 +961,40 @@ class CombineParcellations(BaseInterface):
             # Thalamus (aparc+aseg labels: 10 and 49)
             if thalamus_nuclei_defined:
 
-                ind = np.where(img_data_aparcaseg == 10)
-                mask_aparc_lh = np.zeros(img_data_aparcaseg.shape)
-                mask_aparc_lh[ind] = 1
+                mask_aparc_lh = (img_data_aparcaseg == 10).astype(np.int8)
+                mask_aparc_rh = (img_data_aparcaseg == 49).astype(np.int8)
 
-                ind = np.where(img_data_aparcaseg == 49)
-                mask_aparc_rh = np.zeros(img_data_aparcaseg.shape)
-                mask_aparc_rh[ind] = 1
+                hdr_tmp = img_aparcaseg.get_header().copy()
+                hdr_tmp.set_data_dtype(np.int8)
 
-                mask_thal_lh = np.zeros(img_data_aparcaseg.shape)
-                for lab in left_thalNuclei:
-                    ind = np.where(img_data_thal == lab)
-                    mask_thal_lh[ind] = 1
+                mask_thal_lh = labels_mask(img_data_thal, left_thalNuclei).astype(np.int8)
 
                 # Identify voxels not included by thalamic Nuclei - should set to 2 (Gm) or 0
                 tmp = mask_aparc_lh - mask_thal_lh
-                ind = np.where(tmp > 0)
-                img_data_aparcaseg_new[ind] = 2
+                img_data_aparcaseg_new[tmp > 0] = 2
 
                 # Identify voxels not included by freesurfer thalamic mask
-                tmp = mask_aparc_lh - mask_thal_lh
-                ind = np.where(tmp < 0)
-                img_data_aparcaseg_new[ind] = 10
+                img_data_aparcaseg_new[tmp < 0] = 10
 
                 out_tmp = op.join(fs_dir, 'tmp', 'aparc-thal.lh.native.nii.gz')
                 iflogger.info("    ... Save tmp image to {}".format(out_tmp))
                 img_tmp = ni.Nifti1Image(
-                    tmp, img_aparcaseg.get_affine(), img_aparcaseg.get_header())
+                    tmp, img_aparcaseg.get_affine(), hdr_tmp)
                 ni.save(img_tmp, out_tmp)
 
-                mask_thal_rh = np.zeros(img_data_aparcaseg.shape)
-                for lab in right_thalNuclei:
-                    ind = np.where(img_data_thal == lab)
-                    mask_thal_rh[ind] = 1
+                mask_thal_rh = labels_mask(img_data_thal, right_thalNuclei).astype(np.int8)
 
                 # Identify voxels not included by thalamic Nuclei - should set to 41 (Gm) or 0
                 tmp = mask_aparc_rh - mask_thal_rh
-                ind = np.where(tmp > 0)
-                img_data_aparcaseg_new[ind] = 41
+                img_data_aparcaseg_new[tmp > 0] = 41
 
                 # Identify voxels not included by freesurfer thalamic mask
-                tmp = mask_aparc_rh - mask_thal_rh
-                ind = np.where(tmp < 0)
-                img_data_aparcaseg_new[ind] = 49
+                img_data_aparcaseg_new[tmp < 0] = 49
 
                 out_tmp = op.join(fs_dir, 'tmp', 'aparc-thal.rh.native.nii.gz')
                 iflogger.info("    ... Save tmp image to {}".format(out_tmp))
                 img_tmp = ni.Nifti1Image(
-                    tmp, img_aparcaseg.get_affine(), img_aparcaseg.get_header())
+                    tmp, img_aparcaseg.get_affine(), hdr_tmp)
                 ni.save(img_tmp, out_tmp)
 
             # Brainstem (aparc+aseg labels: 16)
@@ -1597,6 +1028,66 @@ class CombineParcellations(BaseInterface):
 
         return runtime
 
+    def _combine_scale(self, roi, sources, thalamus_nuclei_defined, lh_subfield_defined,
+                       rh_subfield_defined, brainstem_defined):
+        """Create the final parcellation image, colorLUT and graphml files of one scale."""
+        outprefix_name = Path(roi).name.split(".")[0]
+        for elem in outprefix_name.split("_"):
+            if "scale" in elem:
+                scale = elem
+
+        annots = {}
+        for hemi in ['rh', 'lh']:
+            annot_file = '{}.lausanne2018.{}.annot'.format(hemi, scale)
+            iflogger.info("  > Load {}".format(annot_file))
+            annots[hemi] = ni.freesurfer.io.read_annot(
+                op.join(self.inputs.subjects_dir, self.inputs.subject_id, 'label', annot_file))
+
+        table = get_lausanne2018_label_table(
+            annots['rh'], annots['lh'],
+            thalamus_nuclei=thalamus_nuclei_defined,
+            lh_hippocampal_subfields=lh_subfield_defined,
+            rh_hippocampal_subfields=rh_subfield_defined,
+            brainstem_structures=brainstem_defined
+        )
+
+        if self.inputs.verbose_level == 2:
+            for section in table:
+                for structure in section['structures']:
+                    iflogger.info("  > Update {} label ({} -> {})".format(
+                        structure['name'], structure['source_label'], structure['label']))
+
+        # Reading Cortical Parcellation
+        img_v = ni.load(roi)
+        scale_sources = dict(sources)
+        scale_sources['aseg'] = img_v.get_data()
+
+        # Note: the brain stem of the input parcellation (16) is only kept when the brainstem
+        # structures are not provided, as the label table then replaces it by its own parcellation
+        # (mismatch between both global volumes, mainly due to partial volume effect)
+        img_data_out = apply_label_table(table, scale_sources, dtype=np.int16)
+
+        # Saving the new parcellation
+        output_roi = op.abspath('{}_final.nii.gz'.format(outprefix_name))
+        hdr2 = img_v.get_header().copy()
+        hdr2.set_data_dtype(np.int16)
+        iflogger.info("  > Save output image to {}".format(output_roi))
+        img = ni.Nifti1Image(img_data_out, img_v.get_affine(), hdr2)
+        ni.save(img, output_roi)
+        del img
+
+        # colorLUT creation if enabled
+        if self.inputs.create_colorLUT:
+            color_lut_file = op.abspath('{}_FreeSurferColorLUT.txt'.format(outprefix_name))
+            iflogger.info("  > Create colorLUT file as %s" % color_lut_file)
+            write_freesurfer_colorlut(table, color_lut_file)
+
+        # Create GraphML if enabled
+        if self.inputs.create_graphml:
+            graphml_file = op.abspath('{}.graphml'.format(outprefix_name))
+            iflogger.info("  > Create graphml_file as {}".format(graphml_file))
+            write_node_description_graphml(table, graphml_file)
+
     def _list_outputs(self):
 
         fs_dir = op.join(self.inputs.subjects_dir, self.inputs.subject_id)
@@ -1639,6 +1130,11 @@ class ParcellateThalamusInputSpec(BaseInterfaceInputSpec):
 
     ants_precision_type = traits.Enum(['double', 'float'], desc="Precision type used during computation")
 
+    low_memory = traits.Bool(
+        False, usedefault=True,
+        desc="If `True`, correct the probability maps in float32 within their bounding box only "
+             "to reduce memory usage")
+
 
 class ParcellateThalamusOutputSpec(TraitedSpec):
     warped_image = File(desc='Template registered to T1w image (native)')
@@ -1761,53 +1257,19 @@ class ParcellateThalamus(BaseInterface):
         iflogger.info(proc_stdout)
 
         iflogger.info('Correcting the volumes after the interpolation ')
-        # Load jacobian file
-        img_data_jacob = ni.load(jacobian_file).get_data()  # numpy.ndarray
-
-        # Load probability maps in native space after applying estimated transform and deformation
-        img_spams = ni.load(output_maps)
-        img_data_vspams = img_spams.get_data()  # numpy.ndarray
-        img_data_vspams[img_data_vspams < 0] = 0
-        img_data_vspams[img_data_vspams > 1] = 1
-
-        # Creating max_prob
-        thresh = 0.05
-        img_data_spams = img_data_vspams.copy()
-        img_data_spams[img_data_spams < thresh] = 0
-        ind = np.where(np.sum(img_data_spams, axis=3) == 0)
-        max_prob = img_data_spams.argmax(axis=3) + 1
-        max_prob[ind] = 0
-        # ? max_prob = imfill(max_prob,'holes');
-
-        del img_data_spams
-
-        debug_file = op.abspath('{}_class-thalamus_dtissue_after_ants.nii.gz'.format(outprefix_name))
-        print("Save output image to %s" % debug_file)
-        img = ni.Nifti1Image(max_prob, img_atlas.get_affine(), hdr2)
-        ni.save(img, debug_file)
-        del img
-
-        # Take into account jacobian to correct the probability maps after interpolation
-        img_data_spams = np.zeros(img_data_vspams.shape)
-        for nuc in np.arange(img_data_vspams.shape[3]):
-            temp_image = img_data_vspams[:, :, :, nuc]
-            t = np.multiply(temp_image, img_data_jacob)
-            img_data_spams[:, :, :, nuc] = t / t.max()
-        del temp_image, t, img_data_vspams, img_data_jacob
+        if self.inputs.low_memory:
+            self._correct_probability_maps_low_memory(
+                output_maps, jacobian_file, img_atlas, img_data_atlas, outprefix_name)
+        else:
+            self._correct_probability_maps(
+                output_maps, jacobian_file, img_atlas, img_data_atlas, outprefix_name)
 
-        # Creating max_prob
-        img_data_spams[img_data_spams < thresh] = 0
-        ind = np.where(np.sum(img_data_spams, axis=3) == 0)
-        max_prob = img_data_spams.argmax(axis=3) + 1
-        max_prob[ind] = 0
-        # ? max_prob = imfill(max_prob,'holes');
+        iflogger.info('Done')
 
-        debug_file = op.abspath('{}_class-thalamus_dtissue_after_jacobiancorr.nii.gz'.format(outprefix_name))
-        print("Save output image to %s" % debug_file)
-        img = ni.Nifti1Image(max_prob, img_atlas.get_affine(), hdr2)
-        ni.save(img, debug_file)
-        del img
+        return runtime
 
+    def _create_thalamus_mask(self, img_atlas, img_data_atlas, outprefix_name):
+        """Create and save the left (1) / right (2) thalamus mask from FreeSurfer aparc+aseg."""
         iflogger.info('Creating Thalamus mask from FreeSurfer aparc+aseg ')
         iflogger.info('- New FreeSurfer SUBJECTS_DIR:\n  {}\n'.format(self.inputs.subjects_dir))
 
@@ -1881,6 +1343,63 @@ class ParcellateThalamus(BaseInterface):
 
         del hdr, hdr2, img_thal
 
+        return img_data_thal
+
+    def _correct_probability_maps(self, output_maps, jacobian_file, img_atlas, img_data_atlas, outprefix_name):
+        """Correct the probability maps with the jacobian and create the max probability label image."""
+        hdr = img_atlas.get_header()
+        hdr2 = hdr.copy()
+        hdr2.set_data_dtype(np.uint16)
+
+        # Load jacobian file
+        img_data_jacob = ni.load(jacobian_file).get_data()  # numpy.ndarray
+
+        # Load probability maps in native space after applying estimated transform and deformation
+        img_spams = ni.load(output_maps)
+        img_data_vspams = img_spams.get_data()  # numpy.ndarray
+        img_data_vspams[img_data_vspams < 0] = 0
+        img_data_vspams[img_data_vspams > 1] = 1
+
+        # Creating max_prob
+        thresh = 0.05
+        img_data_spams = img_data_vspams.copy()
+        img_data_spams[img_data_spams < thresh] = 0
+        ind = np.where(np.sum(img_data_spams, axis=3) == 0)
+        max_prob = img_data_spams.argmax(axis=3) + 1
+        max_prob[ind] = 0
+        # ? max_prob = imfill(max_prob,'holes');
+
+        del img_data_spams
+
+        debug_file = op.abspath('{}_class-thalamus_dtissue_after_ants.nii.gz'.format(outprefix_name))
+        print("Save output image to %s" % debug_file)
+        img = ni.Nifti1Image(max_prob, img_atlas.get_affine(), hdr2)
+        ni.save(img, debug_file)
+        del img
+
+        # Take into account jacobian to correct the probability maps after interpolation
+        img_data_spams = np.zeros(img_data_vspams.shape)
+        for nuc in np.arange(img_data_vspams.shape[3]):
+            temp_image = img_data_vspams[:, :, :, nuc]
+            t = np.multiply(temp_image, img_data_jacob)
+            img_data_spams[:, :, :, nuc] = t / t.max()
+        del temp_image, t, img_data_vspams, img_data_jacob
+
+        # Creating max_prob
+        img_data_spams[img_data_spams < thresh] = 0
+        ind = np.where(np.sum(img_data_spams, axis=3) == 0)
+        max_prob = img_data_spams.argmax(axis=3) + 1
+        max_prob[ind] = 0
+        # ? max_prob = imfill(max_prob,'holes');
+
+        debug_file = op.abspath('{}_class-thalamus_dtissue_after_jacobiancorr.nii.gz'.format(outprefix_name))
+        print("Save output image to %s" % debug_file)
+        img = ni.Nifti1Image(max_prob, img_atlas.get_affine(), hdr2)
+        ni.save(img, debug_file)
+        del img
+
+        img_data_thal = self._create_thalamus_mask(img_atlas, img_data_atlas, outprefix_name)
+
         nb_spams = img_data_spams.shape[3]
         thresh = 0.05
 
@@ -1976,9 +1495,99 @@ class ParcellateThalamus(BaseInterface):
 
         del hdr2, img, max_prob
 
-        iflogger.info('Done')
+    def _correct_probability_maps_low_memory(self, output_maps, jacobian_file, img_atlas, img_data_atlas,
+                                             outprefix_name):
+        """Memory-lean version of :meth:`_correct_probability_maps`.
 
-        return runtime
+        The probability maps are loaded one nucleus at a time in float32 and only
+        within the bounding box of their support, where the jacobian correction and
+        the masking are applied in place.
+        """
+        thresh = 0.05
+        hdr = img_atlas.get_header()
+        hdr2 = hdr.copy()
+        hdr2.set_data_dtype(np.uint16)
+
+        # Find the bounding box of the probability maps in native space
+        img_spams = ni.load(output_maps)
+        nb_spams = img_spams.shape[3]
+        # Shape of the volume (``img_spams`` is released before the last max_prob is saved)
+        volume_shape = img_spams.shape[:3]
+        support = np.zeros(volume_shape, dtype=bool)
+        for nuc in range(nb_spams):
+            support |= np.asarray(img_spams.dataobj[..., nuc], dtype=np.float32) > 0
+        bbox = _bounding_box(support)
+        del support
+        iflogger.info('  > Bounding box of the probability maps: {}'.format(
+            [(b.start, b.stop) for b in bbox]))
+
+        # Load probability maps within the bounding box
+        img_data_spams = np.empty(tuple(b.stop - b.start for b in bbox) + (nb_spams,), dtype=np.float32)
+        for nuc in range(nb_spams):
+            img_data_spams[..., nuc] = np.asarray(img_spams.dataobj[..., nuc], dtype=np.float32)[bbox]
+        np.clip(img_data_spams, 0, 1, out=img_data_spams)
+
+        def save_max_prob(max_prob_bbox, max_prob_file):
+            max_prob = np.zeros(volume_shape, dtype=np.uint16)
+            max_prob[bbox] = max_prob_bbox
+            print("Save output image to %s" % max_prob_file)
+            img = ni.Nifti1Image(max_prob, img_atlas.get_affine(), hdr2)
+            ni.save(img, max_prob_file)
+
+        # Creating max_prob
+        save_max_prob(
+            _max_probability_labels(img_data_spams, thresh),
+            op.abspath('{}_class-thalamus_dtissue_after_ants.nii.gz'.format(outprefix_name))
+        )
+
+        # Take into account jacobian to correct the probability maps after interpolation
+        img_data_jacob = np.asarray(ni.load(jacobian_file).dataobj[bbox], dtype=np.float32)
+        img_data_spams *= img_data_jacob[..., np.newaxis]
+        del img_data_jacob
+        nuclei_max = np.zeros(nb_spams, dtype=np.float32)
+        if img_data_spams.size:
+            nuclei_max = img_data_spams.max(axis=(0, 1, 2))
+        nuclei_max[nuclei_max <= 0] = 1
+        img_data_spams /= nuclei_max
+
+        # Creating max_prob
+        img_data_spams[img_data_spams < thresh] = 0
+        save_max_prob(
+            _max_probability_labels(img_data_spams, thresh),
+            op.abspath('{}_class-thalamus_dtissue_after_jacobiancorr.nii.gz'.format(outprefix_name))
+        )
+
+        img_data_thal = self._create_thalamus_mask(img_atlas, img_data_atlas, outprefix_name)[bbox]
+
+        # Mask probability maps using the left- and right-hemisphere thalamus masks
+        half = int(nb_spams / 2)
+        img_data_spams[..., 0:half] *= (img_data_thal == 1)[..., np.newaxis]
+        img_data_spams[..., half:nb_spams] *= (img_data_thal == 2)[..., np.newaxis]
+        del img_data_thal
+
+        # Creating max_prob (the masks of both hemispheres do not overlap)
+        max_prob = _max_probability_labels(img_data_spams, thresh)
+
+        # Save corrected probability maps of thalamic nuclei
+        # encoded in uint16 with a fixed scaling of 1 / 65535
+        np.clip(img_data_spams, 0, 1, out=img_data_spams)
+        img_data_maps = np.zeros(img_spams.shape, dtype=np.uint16)
+        img_data_maps[bbox] = np.rint(img_data_spams * 65535)
+        del img_data_spams
+        hdr = img_spams.get_header().copy()
+        hdr.set_data_dtype(np.uint16)
+        print("Save output image to %s" % output_maps)
+        img = ni.Nifti1Image(img_data_maps, img_spams.get_affine(), hdr)
+        img.header.set_slope_inter(1. / 65535, 0)
+        ni.save(img, output_maps)
+
+        del img, img_data_maps, img_spams
+
+        # Save Maxprob
+        save_max_prob(
+            max_prob,
+            op.abspath('{}_class-thalamus_probtissue_maxprob.nii.gz'.format(outprefix_name))
+        )
 
     def _list_outputs(self):
         outputs = self._outputs().get()
@@ -2009,6 +1618,9 @@ class ParcellateInputSpec(BaseInterfaceInputSpec):
 
     erode_masks = traits.Bool(False, desc="If `True` erode the masks")
 
+    number_of_threads = traits.Int(1, usedefault=True,
+                                   desc="Maximal number of FreeSurfer commands run concurrently")
+
 
 class ParcellateOutputSpec(TraitedSpec):
     white_matter_mask_file = File(desc='White matter (WM) mask file')
@@ -2077,7 +1689,8 @@ class Parcellate(BaseInterface):
             print("Parcellation scheme : Lausanne2018")
             create_T1_and_Brain(self.inputs.subject_id, self.inputs.subjects_dir)
             # create_annot_label(self.inputs.subject_id, self.inputs.subjects_dir)
-            create_roi(self.inputs.subject_id, self.inputs.subjects_dir)
+            create_roi(self.inputs.subject_id, self.inputs.subjects_dir,
+                       number_of_threads=self.inputs.number_of_threads)
             create_wm_mask(self.inputs.subject_id, self.inputs.subjects_dir)
             if self.inputs.erode_masks:
                 erode_mask(fsdir, op.join(fsdir, 'mri', 'fsmask_1mm.nii.gz'))
@@ -2269,6 +1882,234 @@ def extract(Z, shape, position, fill):
     return R
 
 
+def neighbourhood_distances(shape):
+    """Return the distances of the voxels of a neighbourhood to its center.
+
+    Parameters
+    ----------
+    shape : tuple
+        Neighbourhood dimensions (odd)
+
+    Returns
+    -------
+    dist : numpy.ndarray
+        Array of shape `shape` storing the euclidean distances (float32)
+    """
+    center = np.array(shape) // 2
+    offsets = np.indices(shape) - center.reshape((-1,) + (1,) * len(shape))
+    return np.sqrt(np.sum(offsets * offsets, axis=0)).astype('float32')
+
+
+def dilate_labels(rois, labels, voxels, dist):
+    """Assign to the unlabeled voxels of `rois` the closest label of `labels` in their neighbourhood.
+
+    For each voxel, the most frequent label among the closest labeled voxels
+    of its neighbourhood (of the shape of `dist`) is assigned.
+
+    Parameters
+    ----------
+    rois : numpy.ndarray
+        Label volume updated in-place
+
+    labels : numpy.ndarray
+        Label volume in which the neighbourhoods are extracted
+
+    voxels : tuple of numpy.ndarray
+        Indices of the voxels to process, as returned by `numpy.where`.
+        Only the voxels unlabeled in `rois` are updated.
+
+    dist : numpy.ndarray
+        Distances of the voxels of the neighbourhood to its center
+        (see :func:`neighbourhood_distances`)
+
+    Returns
+    -------
+    rois : numpy.ndarray
+        The updated label volume
+    """
+    shape = dist.shape
+    xx, yy, zz = voxels
+    for j in range(xx.size):
+        if rois[xx[j], yy[j], zz[j]] == 0:
+            local = extract(labels, shape, position=(
+                xx[j], yy[j], zz[j]), fill=0)
+            mask = local.copy()
+            mask[np.nonzero(local > 0)] = 1
+            thisdist = np.multiply(dist, mask)
+            thisdist[np.nonzero(thisdist == 0)] = np.amax(thisdist)
+            value = np.int_(
+                local[np.nonzero(thisdist == np.amin(thisdist))])
+            if value.size > 1:
+                counts = np.bincount(value)
+                value = np.argmax(counts)
+            rois[xx[j], yy[j], zz[j]] = value
+    return rois
+
+
+def _as_label_array(data):
+    """Return `data` as an integer array suitable for lookup-table indexing."""
+    data = np.asanyarray(data)
+    if not np.issubdtype(data.dtype, np.integer):
+        data = np.rint(data).astype(np.int32)
+    return data
+
+
+def _apply_lut(lut, data):
+    """Index the lookup table `lut` with the label array `data`.
+
+    Labels that fall outside of the table range are mapped to the
+    background value (``0`` / ``False``).
+    """
+    data = _as_label_array(data)
+    inside = (data >= 0) & (data < lut.size)
+    if inside.all():
+        return lut[data]
+    out = np.zeros(data.shape, dtype=lut.dtype)
+    out[inside] = lut[data[inside]]
+    return out
+
+
+def relabel(data, mapping, dtype=np.uint16, keep_unmapped=False):
+    """Relabel a label volume in a single pass using a lookup table.
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        Input label volume
+
+    mapping : dict
+        Dictionary mapping the old label values to the new ones
+
+    dtype : numpy.dtype
+        Data type of the output volume (Default: ``numpy.uint16``)
+
+    keep_unmapped : bool
+        If `True`, labels that are not in `mapping` keep their original
+        value, otherwise they are set to 0 (Default: `False`)
+
+    Returns
+    -------
+    out : numpy.ndarray
+        The relabeled volume
+    """
+    data = _as_label_array(data)
+    old_labels = np.asarray(list(mapping.keys()), dtype=np.int64)
+    new_labels = np.asarray(list(mapping.values()), dtype=dtype)
+    size = int(max(old_labels.max(initial=0), data.max(initial=0))) + 1
+    if keep_unmapped:
+        lut = np.arange(size).astype(dtype)
+    else:
+        lut = np.zeros(size, dtype=dtype)
+    lut[old_labels] = new_labels
+    return _apply_lut(lut, data)
+
+
+def labels_mask(data, labels):
+    """Return the mask of the voxels whose value is one of `labels`.
+
+    This is equivalent to ``numpy.isin(data, labels)`` but uses a boolean
+    lookup table, which requires a single pass over the volume.
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        Input label volume
+
+    labels : list of int
+        Label values to include in the mask
+
+    Returns
+    -------
+    mask : numpy.ndarray
+        Boolean mask with the same shape as `data`
+    """
+    labels = np.asarray(labels, dtype=np.int64).ravel()
+    lut = np.zeros(int(labels.max(initial=0)) + 1, dtype=bool)
+    lut[labels[labels >= 0]] = True
+    return _apply_lut(lut, data)
+
+
+def update_labels(out, data, mapping):
+    """Write the relabeled voxels of `data` into `out` in place.
+
+    Voxels of `data` whose label is a key of `mapping` are set in `out` to the
+    corresponding value, all the other voxels of `out` are left untouched.
+
+    Parameters
+    ----------
+    out : numpy.ndarray
+        Output label volume updated in place
+
+    data : numpy.ndarray
+        Input label volume with the same shape as `out`
+
+    mapping : dict
+        Dictionary mapping the labels of `data` to the new labels in `out`.
+        New labels must be strictly positive.
+    """
+    remapped = relabel(data, mapping, dtype=out.dtype)
+    mask = remapped > 0
+    out[mask] = remapped[mask]
+
+
+def erode_labels(data, labels, structure):
+    """Erode each label of a label volume separately in a single morphology pass.
+
+    A voxel is kept if all the voxels of its neighbourhood defined by
+    `structure` carry the same label, which is equivalent to a binary erosion
+    of each label mask taken separately (with a zero border).
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        Input label volume
+
+    labels : list of int
+        Labels to erode. Other labels are discarded.
+
+    structure : numpy.ndarray
+        Structuring element of the erosion
+
+    Returns
+    -------
+    eroded : numpy.ndarray
+        Label volume (``numpy.uint16``) with the eroded labels
+    """
+    footprint = np.asarray(structure) > 0
+    selected = np.where(labels_mask(data, labels), _as_label_array(data), 0).astype(np.uint16)
+    lower = ndimage.minimum_filter(selected, footprint=footprint, mode='constant', cval=0)
+    upper = ndimage.maximum_filter(selected, footprint=footprint, mode='constant', cval=0)
+    selected[lower != upper] = 0
+    return selected
+
+
+def _bounding_box(mask):
+    """Return the tuple of slices of the bounding box of the non-zero voxels of `mask`."""
+    bbox = []
+    for axis in range(mask.ndim):
+        other_axes = tuple(a for a in range(mask.ndim) if a != axis)
+        idx = np.flatnonzero(mask.any(axis=other_axes))
+        bbox.append(slice(int(idx[0]), int(idx[-1]) + 1) if idx.size else slice(0, 0))
+    return tuple(bbox)
+
+
+def _max_probability_labels(prob_maps, thresh):
+    """Return the label (1-based index of the 4th dimension) of maximal probability for each voxel.
+
+    Probabilities lower than `thresh` are ignored and voxels without any remaining
+    probability are set to 0. The maps are processed one at a time to avoid
+    allocating 4D temporaries.
+    """
+    max_prob = np.zeros(prob_maps.shape[:3], dtype=prob_maps.dtype)
+    labels = np.zeros(prob_maps.shape[:3], dtype=np.uint16)
+    for k in range(prob_maps.shape[3]):
+        prob = prob_maps[..., k]
+        update = (prob >= thresh) & (prob > max_prob)
+        max_prob[update] = prob[update]
+        labels[update] = k + 1
+    return labels
+
+
 def create_T1_and_Brain(subject_id, subjects_dir):
     """Generates T1, T1 masked and aseg+aparc Freesurfer images in NIFTI format.
 
@@ -2314,9 +2155,124 @@ def create_T1_and_Brain(subject_id, subjects_dir):
     print("[DONE]")
 
 
-def create_roi(subject_id, subjects_dir, v=True):
+def run_commands(commands, number_of_threads=1, env=None, log_dir=None, v=True):
+    """Run external commands as a bounded pool of concurrent subprocesses.
+
+    A command is started as soon as all the commands it depends on
+    have completed successfully and a slot of the pool is free.
+    Commands are started in the order they are given.
+
+    Parameters
+    ----------
+    commands : list of tuple
+        List of ``(name, cmd, depends_on)`` tuples where ``name`` is
+        a unique name, ``cmd`` is the command as a list of arguments,
+        and ``depends_on`` is the list of names of the commands that
+        have to complete before it is started
+
+    number_of_threads : int
+        Maximal number of commands running at the same time
+
+    env : dict
+        Environment of the subprocesses. If ``None``,
+        the environment of the current process is inherited.
+
+    log_dir : string
+        Directory where the standard output and error of each command
+        are written to ``<name>.log``. If ``None``, they are captured
+        in memory only.
+
+    v : Boolean or int
+        Verbose mode. If ``2``, the captured output of each command is printed.
+
+    Returns
+    -------
+    returncodes : dict
+        Dictionary mapping the name of each command to its exit code
+
+    Raises
+    ------
+    RuntimeError
+        If a command cannot be started or exits with a non-zero code.
+        Running commands are waited for and pending commands are not started.
+    """
+    names = [name for name, _, _ in commands]
+    if len(set(names)) != len(names):
+        raise ValueError('Command names must be unique')
+    for name, _, depends_on in commands:
+        unknown = set(depends_on) - set(names)
+        if unknown:
+            raise ValueError(f'Command {name} depends on unknown command(s): {sorted(unknown)}')
+
+    def _run(name, cmd):
+        start = perf_counter()
+        try:
+            if log_dir is not None:
+                log_file = op.join(log_dir, f'{name}.log')
+                with open(log_file, 'w') as f:
+                    proc = subprocess.run(cmd, env=env, stdout=f, stderr=subprocess.STDOUT)
+                with open(log_file, 'r') as f:
+                    output = f.read()
+            else:
+                proc = subprocess.run(cmd, env=env, stdout=subprocess.PIPE,
+                                      stderr=subprocess.STDOUT, universal_newlines=True)
+                output = proc.stdout
+            returncode = proc.returncode
+        except OSError as e:
+            returncode, output = 127, str(e)
+        return returncode, output, perf_counter() - start
+
+    pending = {name: (cmd, set(depends_on)) for name, cmd, depends_on in commands}
+    returncodes = {}
+    running = {}
+    failure = None
+    workers = max(1, int(number_of_threads))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while pending or running:
+            if failure is None:
+                for name in list(pending):
+                    cmd, depends_on = pending[name]
+                    if len(running) < workers and depends_on.issubset(returncodes):
+                        del pending[name]
+                        if v:  # pragma: no cover
+                            iflogger.info(f'     > run {name}: {" ".join(cmd)}')
+                        running[executor.submit(_run, name, cmd)] = name
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                returncode, output, duration = future.result()
+                if v == 2:  # pragma: no cover
+                    print(output)
+                if returncode != 0:
+                    if failure is None:
+                        failure = (name, returncode, output)
+                else:
+                    returncodes[name] = returncode
+                    if v:  # pragma: no cover
+                        iflogger.info(f'     ... {name} done in {duration:.1f}s')
+
+    if failure is not None:
+        name, returncode, output = failure
+        tail = '\n'.join(output.splitlines()[-20:])
+        raise RuntimeError(f'Command {name} failed with exit code {returncode}:\n{tail}')
+    if pending:
+        raise RuntimeError(f'Command(s) with cyclic dependencies: {sorted(pending)}')
+
+    return returncodes
+
+
+def create_roi(subject_id, subjects_dir, v=True, number_of_threads=1):
     """Iteratively creates the ROI_%s.nii.gz files using the given Lausanne2018 parcellation information from networks.
 
+    The FreeSurfer commands are run with :func:`run_commands`: the annotations
+    of all scales are resampled and converted to volumes concurrently first,
+    then the volumes are processed starting from scale5, which is used as
+    reference for the consistency correction of the cortical regions of
+    the other scales, and finally converted to ``.mgz`` concurrently.
+
     Parameters
     ----------
     subject_id : string
@@ -2328,6 +2284,10 @@ def create_roi(subject_id, subjects_dir, v=True):
 
     v : Boolean
         Verbose mode
+
+    number_of_threads : int
+        Maximal number of FreeSurfer commands run at the same time
+        (Default: 1)
     """
 
     freesurfer_subj = os.path.abspath(subjects_dir)
@@ -2381,26 +2341,20 @@ def create_roi(subject_id, subjects_dir, v=True):
     # initialize variables necessary for cortical ROIs dilation
     # dimensions of the neighbourhood for rois labels assignment (choose odd dimensions!)
     shape = (25, 25, 25)
-    center = np.array(shape) // 2
     # dist: distances from the center of the neighbourhood
-    dist = np.zeros(shape, dtype='float32')
-    for x in range(shape[0]):
-        for y in range(shape[1]):
-            for z in range(shape[2]):
-                distxyz = center - [x, y, z]
-                dist[x, y, z] = math.sqrt(
-                    np.sum(np.multiply(distxyz, distxyz)))
-
-        # Check existence of tmp folder in input subject folder
-        this_dir = os.path.join(subject_dir, 'tmp')
-        if not (os.path.isdir(this_dir)):
-            os.makedirs(this_dir)
+    dist = neighbourhood_distances(shape)
+
+    # Check existence of tmp folder in input subject folder
+    this_dir = os.path.join(subject_dir, 'tmp')
+    if not (os.path.isdir(this_dir)):
+        os.makedirs(this_dir)
 
     # Loop over parcellation scales
     if v:  # pragma: no cover
         print('Generate MULTISCALE PARCELLATION for input subject')
 
-    fs_string = 'export SUBJECTS_DIR=' + freesurfer_subj
+    fs_env = dict(os.environ, SUBJECTS_DIR=freesurfer_subj)
+    log_dir = os.path.join(subject_dir, 'tmp')
 
     # Multiscale parcellation - define annotation and segmentation variables
     rh_annot_files = ['rh.lausanne2018.scale1.annot', 'rh.lausanne2018.scale2.annot', 'rh.lausanne2018.scale3.annot',
@@ -2415,55 +2369,39 @@ def create_roi(subject_id, subjects_dir, v=True):
                     'ROIv_scale3_Lausanne2018.nii.gz', 'ROIv_scale4_Lausanne2018.nii.gz',
                     'ROIv_scale5_Lausanne2018.nii.gz']
 
-    FNULL = open(os.devnull, 'w')
-
+    # 1. Resample fsaverage CorticalSurface onto SUBJECT_ID CorticalSurface and map annotation for each scale
+    # 2. Generate Nifti volume from annotation
+    #    Note: change here --wmparc-dmax (FS default 5mm) to dilate cortical regions toward the WM
+    if v:  # pragma: no cover
+        print('     > resample fsaverage CorticalSurface to individual CorticalSurface'
+              ' and generate Nifti volume from annotation for all scales')
+    fs_commands = []
+    for i in reversed(list(range(0, nscales))):
+        for hemi, annot_files in [('lh', lh_annot_files), ('rh', rh_annot_files)]:
+            fs_commands.append((
+                f'mri_surf2surf_{hemi}_scale{i + 1}',
+                ['mri_surf2surf', '--srcsubject', 'fsaverage', '--trgsubject', subject_id,
+                 '--hemi', hemi,
+                 '--sval-annot', pkg_resources.resource_filename(
+                     'cmtklib', op.join('data', 'parcellation', 'lausanne2018', annot_files[i])),
+                 '--tval', os.path.join(subject_dir, 'label', annot_files[i])],
+                []
+            ))
+        fs_commands.append((
+            f'mri_aparc2aseg_scale{i + 1}',
+            ['mri_aparc2aseg', '--s', subject_id, '--annot', annot[i],
+             '--wmparc-dmax', '0', '--labelwm', '--hypo-as-wm', '--new-ribbon',
+             '--o', os.path.join(subject_dir, 'tmp', rois_output[i])],
+            [f'mri_surf2surf_lh_scale{i + 1}', f'mri_surf2surf_rh_scale{i + 1}']
+        ))
+    run_commands(fs_commands, number_of_threads=number_of_threads, env=fs_env, log_dir=log_dir, v=v)
+
+    convert_commands = []
     for i in reversed(list(range(0, nscales))):
 
         if v:  # pragma: no cover
             print(' ... working on multiscale parcellation, SCALE {}'.format(i + 1))
 
-        # 1. Resample fsaverage CorticalSurface onto SUBJECT_ID CorticalSurface and map annotation for current scale
-        # Left hemisphere
-        if v:  # pragma: no cover
-            print(
-                '     > resample fsaverage CorticalSurface to individual CorticalSurface')
-        mri_cmd = fs_string + '; mri_surf2surf --srcsubject fsaverage --trgsubject %s --hemi lh --sval-annot %s --tval %s' % (
-            subject_id,
-            pkg_resources.resource_filename('cmtklib',
-                                            op.join('data', 'parcellation', 'lausanne2018', lh_annot_files[i])),
-            os.path.join(subject_dir, 'label', lh_annot_files[i])
-        )
-        if v == 2:
-            subprocess.call(mri_cmd, shell=True)
-        else:
-            subprocess.call(mri_cmd, shell=True, stdout=FNULL, stderr=subprocess.STDOUT)
-
-        # Right hemisphere
-        mri_cmd = fs_string + '; mri_surf2surf --srcsubject fsaverage --trgsubject %s --hemi rh --sval-annot %s --tval %s' % (
-            subject_id,
-            pkg_resources.resource_filename('cmtklib',
-                                            op.join('data', 'parcellation', 'lausanne2018', rh_annot_files[i])),
-            os.path.join(subject_dir, 'label', rh_annot_files[i])
-        )
-        if v == 2:
-            subprocess.call(mri_cmd, shell=True)
-        else:
-            subprocess.call(mri_cmd, shell=True, stdout=FNULL, stderr=subprocess.STDOUT)
-
-        # 2. Generate Nifti volume from annotation
-        #    Note: change here --wmparc-dmax (FS default 5mm) to dilate cortical regions toward the WM
-        if v:  # pragma: no cover
-            print('     > generate Nifti volume from annotation')
-        mri_cmd = fs_string + '; mri_aparc2aseg --s %s --annot %s --wmparc-dmax 0 --labelwm --hypo-as-wm --new-ribbon --o %s' % (
-            subject_id,
-            annot[i],
-            os.path.join(subject_dir, 'tmp', rois_output[i])
-        )
-        if v == 2:
-            subprocess.call(mri_cmd, shell=True)
-        else:
-            subprocess.call(mri_cmd, shell=True, stdout=FNULL, stderr=subprocess.STDOUT)
-
         # 3. Update numerical IDs of cortical and subcortical regions
         # Load Nifti volume
         if v:  # pragma: no cover
@@ -2482,9 +2420,6 @@ def create_roi(subject_id, subjects_dir, v=True):
             print("     ... storing ROIs volume maximal resolution")
             roisMax = vol.copy()
             idxMax = np.where(roisMax > 0)
-            xxMax = idxMax[0]
-            yyMax = idxMax[1]
-            zzMax = idxMax[2]
         # correct cortical surfaces using as reference the roisMax volume (for consistency between resolutions)
         else:
             print("     > adapt cortical surfaces")
@@ -2498,20 +2433,7 @@ def create_roi(subject_id, subjects_dir, v=True):
                 if roisMax[xxRois[j], yyRois[j], zzRois[j]] == 0:
                     newrois[xxRois[j], yyRois[j], zzRois[j]] = 0
             # correct voxels not labeled in current resolution, but labeled in highest resolution
-            for j in range(xxMax.size):
-                if newrois[xxMax[j], yyMax[j], zzMax[j]] == 0:
-                    local = extract(vol, shape, position=(
-                        xxMax[j], yyMax[j], zzMax[j]), fill=0)
-                    mask = local.copy()
-                    mask[np.nonzero(local > 0)] = 1
-                    thisdist = np.multiply(dist, mask)
-                    thisdist[np.nonzero(thisdist == 0)] = np.amax(thisdist)
-                    value = np.int_(
-                        local[np.nonzero(thisdist == np.amin(thisdist))])
-                    if value.size > 1:
-                        counts = np.bincount(value)
-                        value = np.argmax(counts)
-                    newrois[xxMax[j], yyMax[j], zzMax[j]] = value
+            dilate_labels(newrois, vol, idxMax, dist)
 
         if v:  # pragma: no cover
             print('     ... save output volumes')
@@ -2524,20 +2446,7 @@ def create_roi(subject_id, subjects_dir, v=True):
         if v:  # pragma: no cover
             print("     > dilating cortical regions")
         # loop throughout all the voxels belonging to the aseg GM volume
-        for j in range(xx.size):
-            if newrois[xx[j], yy[j], zz[j]] == 0:
-                local = extract(vol, shape, position=(
-                    xx[j], yy[j], zz[j]), fill=0)
-                mask = local.copy()
-                mask[np.nonzero(local > 0)] = 1
-                thisdist = np.multiply(dist, mask)
-                thisdist[np.nonzero(thisdist == 0)] = np.amax(thisdist)
-                value = np.int_(
-                    local[np.nonzero(thisdist == np.amin(thisdist))])
-                if value.size > 1:
-                    counts = np.bincount(value)
-                    value = np.argmax(counts)
-                newrois[xx[j], yy[j], zz[j]] = value
+        dilate_labels(newrois, vol, (xx, yy, zz), dist)
 
         # 5. Save Nifti and mgz volumes
         if v:  # pragma: no cover
@@ -2547,14 +2456,12 @@ def create_roi(subject_id, subjects_dir, v=True):
         ni.save(img, this_out)
         del img
 
-        mri_cmd = fs_string + '; mri_convert -i %s -o %s' % (
-            this_out,
-            os.path.join(subject_dir, 'mri', roivs_output[i][0:-4] + '.mgz'))
-        if v == 2:
-            _ = subprocess.call(mri_cmd, shell=True)
-        else:
-            _ = subprocess.call(
-                mri_cmd, shell=True, stdout=FNULL, stderr=subprocess.STDOUT)
+        convert_commands.append((
+            f'mri_convert_scale{i + 1}',
+            ['mri_convert', '-i', this_out,
+             '-o', os.path.join(subject_dir, 'mri', roivs_output[i][0:-4] + '.mgz')],
+            []
+        ))
 
         # Create Gray Matter mask
         if i == 0:
@@ -2570,9 +2477,13 @@ def create_roi(subject_id, subjects_dir, v=True):
             ni.save(img, out_mask)
             del img
 
-    mri_cmd = ['mri_convert', '-i', op.join(subject_dir, 'mri', 'ribbon.mgz'), '-o',
-               op.join(subject_dir, 'mri', 'ribbon.nii.gz')]
-    subprocess.check_call(mri_cmd)
+    convert_commands.append((
+        'mri_convert_ribbon',
+        ['mri_convert', '-i', op.join(subject_dir, 'mri', 'ribbon.mgz'), '-o',
+         op.join(subject_dir, 'mri', 'ribbon.nii.gz')],
+        []
+    ))
+    run_commands(convert_commands, number_of_threads=number_of_threads, env=fs_env, log_dir=log_dir, v=v)
 
     print("[ DONE ]")
 
@@ -2606,8 +2517,6 @@ def create_wm_mask(subject_id, subjects_dir, v=True):
     fsmask = ni.load(op.join(fs_dir, 'mri', 'ribbon.nii.gz'))
     fsmaskd = fsmask.get_data()
 
-    wmmask = np.zeros(fsmask.get_data().shape)
-
     # these data is stored and could be extracted from fs_dir/stats/aseg.txt
 
     # FIXME understand when ribbon file has default value or has "aseg" value
@@ -2616,16 +2525,13 @@ def create_wm_mask(subject_id, subjects_dir, v=True):
         iflogger.info("    > Extract right and left wm")
     # Ribbon labels by default
     if fsmaskd.max() == 120:
-        idx_lh = np.where(fsmaskd == 120)
-        idx_rh = np.where(fsmaskd == 20)
+        wm_labels = [120, 20]
     # Ribbon label w.r.t aseg label
     else:
-        idx_lh = np.where(fsmaskd == 41)
-        idx_rh = np.where(fsmaskd == 2)
+        wm_labels = [41, 2]
 
     # extract right and left
-    wmmask[idx_lh] = 1
-    wmmask[idx_rh] = 1
+    wmmask = labels_mask(fsmaskd, wm_labels).astype(np.uint8)
 
     # remove subcortical nuclei from white matter mask
     if v:  # pragma: no cover
@@ -2633,19 +2539,11 @@ def create_wm_mask(subject_id, subjects_dir, v=True):
     aseg = ni.load(op.join(fs_dir, 'mri', 'aseg.nii.gz'))
     asegd = aseg.get_data()
 
-    try:
-        import scipy.ndimage.morphology as nd
-    except ImportError:
-        raise Exception(
-            '      ... ERROR: Need scipy for binary erosion of white matter mask')
-
     # need binary erosion function
     imerode = nd.binary_erosion
 
     # ventricle erosion
     iflogger.info("    > Ventricle erosion")
-    csfA = np.zeros(asegd.shape)
-    csfB = np.zeros(asegd.shape)
 
     # structuring elements for erosion
     se1 = np.zeros((3, 3, 5))
@@ -2659,19 +2557,13 @@ def create_wm_mask(subject_id, subjects_dir, v=True):
 
     # lateral ventricles, thalamus proper and caudate
     # the latter two removed for better erosion, but put back afterwards
-    idx = np.where((asegd == 4) |
-                   (asegd == 43) |
-                   (asegd == 11) |
-                   (asegd == 50) |
-                   (asegd == 31) |
-                   (asegd == 63) |
-                   (asegd == 10) |
-                   (asegd == 49))
-    csfA[idx] = 1
+    csfA = labels_mask(asegd, [4, 43, 11, 50, 31, 63, 10, 49])
 
     if v:  # pragma: no cover
         iflogger.info("    > Save CSF mask")
-    img = ni.Nifti1Image(csfA, aseg.get_affine(), aseg.get_header())
+    hdr = aseg.get_header().copy()
+    hdr.set_data_dtype(np.uint8)
+    img = ni.Nifti1Image(csfA.astype(np.uint8), aseg.get_affine(), hdr)
     ni.save(img, op.join(fs_dir, 'mri', 'csf_mask.nii.gz'))
     del img
 
@@ -2679,29 +2571,13 @@ def create_wm_mask(subject_id, subjects_dir, v=True):
 
     # thalamus proper and caudate are put back because
     # they are not lateral ventricles
-    idx = np.where((asegd == 11) |
-                   (asegd == 50) |
-                   (asegd == 10) |
-                   (asegd == 49))
-    csfA[idx] = 0
+    csfA[labels_mask(asegd, [11, 50, 10, 49])] = False
 
     # REST CSF, IE 3RD AND 4TH VENTRICULE
     # and EXTRACEREBRAL CSF
-    # idx = np.where((asegd == 5) |
-    #                (asegd == 14) |
-    #                (asegd == 15) |
-    #                (asegd == 24) |
-    #                (asegd == 44) |
-    #                (asegd == 72) |
-    #                (asegd == 75) |
-    #                (asegd == 76) |
-    #                (asegd == 213) |
-    #                (asegd == 221))
     # 43 ??, 4??  213?, 221?
     # more to discuss.
-    for i in [5, 14, 15, 24, 44, 72, 75, 76, 213, 221]:
-        idx = np.where(asegd == i)
-        csfB[idx] = 1
+    csfB = labels_mask(asegd, [5, 14, 15, 24, 44, 72, 75, 76, 213, 221])
 
     # do not remove the subthalamic nucleus for now from the wm mask
     # 23, 60
@@ -2710,34 +2586,20 @@ def create_wm_mask(subject_id, subjects_dir, v=True):
     # grey nuclei, either with or without erosion
     if v:  # pragma: no cover
         iflogger.info("    > Grey nuclei, either with or without erosion")
-    gr_ncl = np.zeros(asegd.shape)
-
-    # with erosion
-    for i in [10, 11, 12, 49, 50, 51]:
-        idx = np.where(asegd == i)
-        # temporary volume
-        tmp = np.zeros(asegd.shape)
-        tmp[idx] = 1
-        tmp = imerode(tmp, se)
-        idx = np.where(tmp == 1)
-        gr_ncl[idx] = 1
+
+    # with erosion (each nucleus is eroded separately)
+    gr_ncl = erode_labels(asegd, [10, 11, 12, 49, 50, 51], se) > 0
 
     # without erosion
-    for i in [13, 17, 18, 26, 52, 53, 54, 58]:
-        idx = np.where(asegd == i)
-        gr_ncl[idx] = 1
+    gr_ncl |= labels_mask(asegd, [13, 17, 18, 26, 52, 53, 54, 58])
 
     # remove remaining structure, e.g. brainstem
     if v:  # pragma: no cover
         iflogger.info("    > Remove remaining structure, e.g. brainstem")
-    remaining = np.zeros(asegd.shape)
-    idx = np.where(asegd == 16)
-    remaining[idx] = 1
+    remaining = asegd == 16
 
     # now remove all the structures from the white matter
-    idx = np.where((csfA != 0) | (csfB != 0) |
-                   (gr_ncl != 0) | (remaining != 0))
-    wmmask[idx] = 0
+    wmmask[csfA | csfB | gr_ncl | remaining] = 0
     if v:  # pragma: no cover
         iflogger.info(
             "    > Removing lateral ventricles and eroded grey nuclei and brainstem from white matter mask")
@@ -2760,7 +2622,9 @@ def create_wm_mask(subject_id, subjects_dir, v=True):
 
     # output white matter mask. crop and move it afterwards
     wm_out = op.join(fs_dir, 'mri', 'fsmask_1mm.nii.gz')
-    img = ni.Nifti1Image(wmmask, fsmask.get_affine(), fsmask.get_header())
+    hdr = fsmask.get_header().copy()
+    hdr.set_data_dtype(np.uint8)
+    img = ni.Nifti1Image(wmmask, fsmask.get_affine(), hdr)
     if v:  # pragma: no cover
         iflogger.info("    > Save white matter mask: %s" % wm_out)
     ni.save(img, wm_out)
@@ -0,0 +1,337 @@
+# Copyright (C) 2009-2022, Ecole Polytechnique Federale de Lausanne (EPFL) and
+# Hospital Center and University of Lausanne (UNIL-CHUV), Switzerland, and CMP3 contributors
+# All rights reserved.
+#
+#  This software is distributed under the open-source license Modified BSD.
+
+"""Module that defines CMTK functions to profile the execution of the Nipype nodes of the pipelines.
+
+For each node, the wall time, the CPU time, the peak memory (RSS) and the number
+of bytes read / written are recorded and saved per subject in
+``<output_dir>/cmp-<version>/sub-<label>(/ses-<label>)`` as
+``sub-<label>(_ses-<label>)_desc-<modality>_profile.tsv`` (and ``.json``).
+
+The CPU time and I/O counters are measured around :meth:`BaseInterface.run`
+in the process executing the node (children processes included), and the peak
+memory is sampled by the Nipype resource monitor when it is enabled
+(``--resource_monitor`` option flag).
+
+Nodes whose results are loaded from the cache of a previous execution are
+recorded with the status ``cached`` and without metrics.
+"""
+
+import os
+import json
+import time
+import logging
+import functools
+from contextlib import contextmanager
+from datetime import datetime
+from glob import glob
+
+import pandas as pd
+import psutil
+
+IFLOGGER = logging.getLogger("nipype.interface")
+
+PROFILE_COLUMNS = [
+    "node", "pipeline", "stage", "interface", "status",
+    "start", "end", "wall_time_s", "cpu_time_s", "cpu_percent",
+    "peak_rss_gb", "read_bytes", "write_bytes", "estimated_mem_gb", "n_procs",
+]
+
+
+def _cpu_time():
+    """Return the CPU time (user + system) of the process and its terminated children."""
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def _io_counters():
+    """Return the bytes read and written by the process (and its reaped children) or ``None``."""
+    try:
+        counters = psutil.Process().io_counters()
+    except (AttributeError, NotImplementedError, psutil.Error):
+        return None
+    return counters.read_bytes, counters.write_bytes
+
+
+def profile_run(run):
+    """Decorate :meth:`BaseInterface.run` to store CPU time and I/O counters in the runtime of the results.
+
+    Parameters
+    ----------
+    run : function
+        The `run()` method to decorate
+
+    Returns
+    -------
+    wrapper : function
+        The decorated method
+    """
+
+    @functools.wraps(run)
+    def wrapper(self, *args, **kwargs):
+        cpu_start = _cpu_time()
+        io_start = _io_counters()
+        results = run(self, *args, **kwargs)
+        runtime = getattr(results, "runtime", None)
+        if runtime is not None:
+            runtime.cpu_time = _cpu_time() - cpu_start
+            io_end = _io_counters()
+            if io_start is not None and io_end is not None:
+                runtime.read_bytes = io_end[0] - io_start[0]
+                runtime.write_bytes = io_end[1] - io_start[1]
+        return results
+
+    wrapper.__profiled__ = True
+    return wrapper
+
+
+@contextmanager
+def interface_profiling():
+    """Context manager that profiles the interfaces run by the nodes of a workflow.
+
+    The decorated :meth:`BaseInterface.run` is inherited by the worker
+    processes forked by the Nipype `MultiProc` plugin.
+    """
+    from nipype.interfaces.base.core import BaseInterface
+
+    original_run = BaseInterface.run
+    if not getattr(original_run, "__profiled__", False):
+        BaseInterface.run = profile_run(original_run)
+    try:
+        yield
+    finally:
+        BaseInterface.run = original_run
+
+
+def _runtimes(runtime):
+    """Return the runtimes of a node as a list (one per iteration for a `MapNode`)."""
+    return [rt for rt in (runtime if isinstance(runtime, list) else [runtime]) if rt is not None]
+
+
+def _started_before(runtime, since):
+    """Return `True` if a runtime started before ``since`` (naive UTC datetime), i.e. was loaded from the cache."""
+    start = getattr(runtime, "startTime", None)
+    if start is None:
+        return False
+    # Nipype records the start time in UTC, with or without time zone depending on its version
+    return datetime.fromisoformat(start).replace(tzinfo=None) < since
+
+
+def _runtime_metrics(runtime, since=None):
+    """Return the profiling metrics stored in a runtime or a list of runtimes (`MapNode`).
+
+    If ``since`` is given, the runtimes that started before it are ignored.
+    """
+    runtimes = [rt for rt in _runtimes(runtime) if since is None or not _started_before(rt, since)]
+
+    def values(name):
+        return [getattr(rt, name) for rt in runtimes if getattr(rt, name, None) is not None]
+
+    metrics = {
+        "start": min(values("startTime"), default=None),
+        "end": max(values("endTime"), default=None),
+    }
+    for column, name, reduce in [
+        ("wall_time_s", "duration", sum),
+        ("cpu_time_s", "cpu_time", sum),
+        ("cpu_percent", "cpu_percent", max),
+        ("peak_rss_gb", "mem_peak_gb", max),
+        ("read_bytes", "read_bytes", sum),
+        ("write_bytes", "write_bytes", sum),
+    ]:
+        node_values = values(name)
+        metrics[column] = reduce(node_values) if node_values else None
+    return metrics
+
+
+class NodeProfiler(object):
+    """Status callback of the Nipype plugins that collects the profile of the executed nodes.
+
+    Examples
+    --------
+    >>> profiler = NodeProfiler()
+    >>> flow.run(plugin="MultiProc",
+    ...          plugin_args={"status_callback": profiler})  # doctest: +SKIP
+    >>> profiler.save("sub-01_desc-anatomical_profile")  # doctest: +SKIP
+    """
+
+    def __init__(self):
+        self.records = []
+        # Results of the nodes that started before are loaded from the cache
+        self.start_time = datetime.utcnow()
+
+    def __call__(self, node, status):
+        """Record the profile of a node when it finishes or fails.
+
+        Nodes that were not run again because their results are cached get
+        the status ``"cached"``, without metrics, as they did not use any resources.
+
+        Parameters
+        ----------
+        node : nipype.pipeline.engine.Node
+            The node executed by the plugin
+
+        status : string
+            Status of the node: ``"start"``, ``"end"`` or ``"exception"``
+        """
+        if status == "start":
+            return
+        names = node.fullname.split(".")
+        record = {
+            "node": node.fullname,
+            "pipeline": names[0],
+            "stage": names[1] if len(names) > 2 else "",
+            "interface": type(node.interface).__name__,
+            "status": status,
+            "estimated_mem_gb": node.mem_gb,
+            "n_procs": node.n_procs,
+        }
+        try:
+            runtimes = _runtimes(node.result.runtime)
+        except Exception:  # pylint: disable=W0703
+            # The result file may be missing if the node crashed
+            IFLOGGER.debug(f"No runtime information available for node {node.fullname}")
+        else:
+            if status == "end" and runtimes and all(_started_before(rt, self.start_time) for rt in runtimes):
+                record["status"] = "cached"
+            else:
+                record.update(_runtime_metrics(runtimes, since=self.start_time))
+        self.records.append(record)
+
+    def to_dataframe(self):
+        """Return the collected profiles as a `pandas.DataFrame`."""
+        return pd.DataFrame(self.records, columns=PROFILE_COLUMNS)
+
+    def save(self, basename):
+        """Save the collected profiles to ``<basename>.tsv`` and ``<basename>.json``.
+
+        Parameters
+        ----------
+        basename : string
+            Path to the output files without extension
+
+        Returns
+        -------
+        out_files : list of string
+            Paths to the TSV and JSON files
+        """
+        df = self.to_dataframe()
+        tsv_file = f"{basename}.tsv"
+        json_file = f"{basename}.json"
+        df.to_csv(tsv_file, sep="\t", index=False, na_rep="n/a")
+        with open(json_file, "w") as f:
+            json.dump(
+                {
+                    "Created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                    "Nodes": json.loads(df.to_json(orient="records")),
+                },
+                f,
+                indent=4,
+            )
+        return [tsv_file, json_file]
+
+
+def get_profile_basename(cmp_deriv_subject_directory, pipeline_name):
+    """Return the basename of the profile files of a pipeline in the subject derivatives directory.
+
+    Parameters
+    ----------
+    cmp_deriv_subject_directory : string
+        Path to ``<output_dir>/cmp-<version>/sub-<label>(/ses-<label>)``
+
+    pipeline_name : string
+        Name of the pipeline (e.g. ``"anatomical_pipeline"``)
+
+    Returns
+    -------
+    basename : string
+        ``<cmp_deriv_subject_directory>/sub-<label>(_ses-<label>)_desc-<modality>_profile``
+    """
+    subject_dir = os.path.normpath(cmp_deriv_subject_directory)
+    prefix = os.path.basename(subject_dir)
+    if prefix.startswith("ses-"):
+        prefix = f"{os.path.basename(os.path.dirname(subject_dir))}_{prefix}"
+    modality = pipeline_name.split("_")[0]
+    return os.path.join(subject_dir, f"{prefix}_desc-{modality}_profile")
+
+
+def load_profiles(cmp_derivatives_dir):
+    """Load all the node profiles saved in a CMP derivatives directory.
+
+    Parameters
+    ----------
+    cmp_derivatives_dir : string
+        Path to ``<output_dir>/cmp-<version>``
+
+    Returns
+    -------
+    profiles : pandas.DataFrame
+        Concatenated profiles with an extra ``subject`` column, or `None` if no profile was found
+    """
+    profile_files = sorted(
+        glob(os.path.join(cmp_derivatives_dir, "sub-*", "*_profile.tsv"))
+        + glob(os.path.join(cmp_derivatives_dir, "sub-*", "ses-*", "*_profile.tsv"))
+    )
+    if not profile_files:
+        return None
+    profiles = []
+    for profile_file in profile_files:
+        df = pd.read_csv(profile_file, sep="\t", na_values="n/a")
+        # Nodes at the top level of a pipeline do not belong to a stage
+        df["stage"] = df["stage"].fillna("")
+        df.insert(0, "subject", os.path.basename(profile_file).split("_desc-")[0])
+        profiles.append(df)
+    return pd.concat(profiles, ignore_index=True)
+
+
+def create_html_profile_summary(cmp_derivatives_dir):
+    """Return an HTML section summarizing the node profiles per pipeline and stage.
+
+    Parameters
+    ----------
+    cmp_derivatives_dir : string
+        Path to ``<output_dir>/cmp-<version>``
+
+    Returns
+    -------
+    html : string
+        HTML ``<div>`` element with the summary table, or an empty string if no profile was found
+    """
+    profiles = load_profiles(cmp_derivatives_dir)
+    if profiles is None:
+        return ""
+    summary = profiles.groupby(["pipeline", "stage"], sort=False).agg(
+        nodes=("status", lambda x: (x != "cached").sum()),
+        cached=("status", lambda x: (x == "cached").sum()),
+        wall_time_s=("wall_time_s", "sum"),
+        cpu_time_s=("cpu_time_s", "sum"),
+        peak_rss_gb=("peak_rss_gb", "max"),
+        read_mb=("read_bytes", lambda x: x.sum() / 1024 ** 2),
+        write_mb=("write_bytes", lambda x: x.sum() / 1024 ** 2),
+    ).reset_index()
+    summary.columns = [
+        "Pipeline", "Stage", "Nodes", "Cached nodes", "Wall time (s)", "CPU time (s)",
+        "Peak RSS (GB)", "Read (MB)", "Written (MB)",
+    ]
+    table = summary.to_html(
+        index=False, float_format="{:.1f}".format, na_rep="n/a",
+        classes="table table-striped table-condensed", border=0,
+    )
+    return f"""
+    <div>
+      <h4>
+          Execution profile
+      </h4>
+      <p>
+          Resources used by the nodes of the pipelines for {profiles['subject'].nunique()} subject(s),
+          summed over the nodes of each stage (peak RSS is the maximum over the nodes).
+          Cached nodes, whose results were reused from a previous execution, are counted
+          separately and do not contribute to the resources.
+          Per-node profiles are saved in the <code>*_profile.tsv</code> files of the subject directories.
+      </p>
+      {table}
+    </div>
+    """
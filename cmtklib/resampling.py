@@ -0,0 +1,282 @@
+# Copyright (C) 2009-2022, Ecole Polytechnique Federale de Lausanne (EPFL) and
+# Hospital Center and University of Lausanne (UNIL-CHUV), Switzerland, and CMP3 contributors
+# All rights reserved.
+#
+#  This software is distributed under the open-source license Modified BSD.
+
+"""Module that defines CMTK functions to resample label volumes in-process.
+
+The transforms estimated by FSL `flirt`, ANTs `antsRegistration` and the
+template reslicing of MRtrix3 `mrtransform` are composed into a single
+mapping from the voxels of the target grid to the voxels of the input grid,
+which is computed once and then used to resample all the label volumes
+(e.g. the five scales of the Lausanne2018 parcellation) with
+nearest-neighbour interpolation.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import nibabel as nib
+import numpy as np
+from scipy import ndimage
+from scipy.io import loadmat
+
+# Flip between the RAS+ convention of nibabel and the LPS+ convention of ITK
+LPS_TO_RAS = np.diag([-1.0, -1.0, 1.0])
+
+
+def fsl_scaled_voxel_affine(img):
+    """Return the affine mapping voxel indices to FSL scaled-voxel coordinates.
+
+    Parameters
+    ----------
+    img : nibabel.Nifti1Image
+        Image defining the voxel grid
+
+    Returns
+    -------
+    affine : numpy.ndarray
+        4x4 affine matrix
+    """
+    zooms = np.asarray(img.header.get_zooms()[:3], dtype=np.float64)
+    affine = np.diag(np.append(zooms, 1.0))
+    # FSL uses a radiological voxel ordering, i.e. the x axis is flipped
+    # for images stored with a neurological (positive determinant) affine
+    if np.linalg.det(img.affine[:3, :3]) > 0:
+        affine[0, 0] = -zooms[0]
+        affine[0, 3] = (img.shape[0] - 1) * zooms[0]
+    return affine
+
+
+def flirt_voxel_map(xfm_file, in_img, ref_img):
+    """Return the affine mapping reference voxels to input voxels for a `flirt` transform.
+
+    Parameters
+    ----------
+    xfm_file : string
+        Path to the 4x4 text transform estimated by `flirt` (input to reference)
+
+    in_img : nibabel.Nifti1Image
+        Input (moving) image
+
+    ref_img : nibabel.Nifti1Image
+        Reference (target) image
+
+    Returns
+    -------
+    vox2vox : numpy.ndarray
+        4x4 affine matrix
+    """
+    xfm = np.loadtxt(xfm_file)
+    return (
+        np.linalg.inv(fsl_scaled_voxel_affine(in_img))
+        @ np.linalg.inv(xfm)
+        @ fsl_scaled_voxel_affine(ref_img)
+    )
+
+
+def load_itk_affine(mat_file):
+    """Load an ITK affine transform (`.mat`) written by ANTs as a RAS+ world affine.
+
+    Parameters
+    ----------
+    mat_file : string
+        Path to the ITK transform in MATLAB format
+
+    Returns
+    -------
+    affine : numpy.ndarray
+        4x4 affine matrix mapping fixed to moving world coordinates (RAS+ mm)
+    """
+    mat = loadmat(mat_file)
+    key = [k for k in mat.keys() if k.startswith("AffineTransform")]
+    if not key:
+        raise ValueError(f"No ITK affine transform found in {mat_file}")
+    params = np.asarray(mat[key[0]], dtype=np.float64).ravel()
+    center = np.asarray(mat["fixed"], dtype=np.float64).ravel()
+    matrix = params[:9].reshape(3, 3)
+    offset = params[9:12] + center - matrix @ center
+    affine = np.eye(4)
+    affine[:3, :3] = LPS_TO_RAS @ matrix @ LPS_TO_RAS
+    affine[:3, 3] = LPS_TO_RAS @ offset
+    return affine
+
+
+def apply_displacement_field(points, field_img):
+    """Displace world coordinates with an ITK displacement field written by ANTs.
+
+    Parameters
+    ----------
+    points : numpy.ndarray
+        ``(n_points, 3)`` array of world coordinates (RAS+ mm)
+
+    field_img : nibabel.Nifti1Image
+        Displacement field of shape ``(X, Y, Z, 1, 3)`` storing LPS+ vectors
+
+    Returns
+    -------
+    points : numpy.ndarray
+        ``(n_points, 3)`` array of displaced world coordinates (RAS+ mm)
+    """
+    field = np.asanyarray(field_img.dataobj).reshape(field_img.shape[:3] + (3,))
+    ijk = nib.affines.apply_affine(np.linalg.inv(field_img.affine), points).T
+    displacement = np.stack(
+        [
+            ndimage.map_coordinates(
+                field[..., i].astype(np.float64), ijk, order=1, mode="constant", cval=0.0
+            )
+            for i in range(3)
+        ],
+        axis=1,
+    )
+    return points + displacement @ LPS_TO_RAS
+
+
+def ants_voxel_map(transforms, in_img, ref_img):
+    """Return the input voxel coordinates of each reference voxel for a stack of ANTs transforms.
+
+    The transforms are listed in the order of the `-t` options of `antsApplyTransforms`
+    (e.g. ``[warp, affine]``). The reference points go through them in the order of the list:
+    the displacement field of a SyN registration is defined on the fixed grid and is
+    therefore sampled at the reference points, before the affine transform is applied.
+
+    Parameters
+    ----------
+    transforms : list of string
+        Paths to ITK affine (`.mat`) and displacement field (`.nii(.gz)`) transforms
+
+    in_img : nibabel.Nifti1Image
+        Input (moving) image
+
+    ref_img : nibabel.Nifti1Image
+        Reference (fixed) image
+
+    Returns
+    -------
+    coords : numpy.ndarray
+        ``(n_voxels, 3)`` array of input voxel coordinates, in the C-order of the reference grid
+    """
+    points = nib.affines.apply_affine(ref_img.affine, reference_grid(ref_img.shape[:3]))
+    for transform in transforms:
+        if transform.endswith(".mat"):
+            points = nib.affines.apply_affine(load_itk_affine(transform), points)
+        else:
+            points = apply_displacement_field(points, nib.load(transform))
+    return nib.affines.apply_affine(np.linalg.inv(in_img.affine), points)
+
+
+def is_supported_ants_transform(transform):
+    """Return ``True`` if the ANTs transform file can be applied in-process."""
+    return transform.endswith((".mat", ".nii", ".nii.gz"))
+
+
+def reference_grid(shape):
+    """Return the ``(n_voxels, 3)`` voxel indices of a grid in C-order."""
+    return np.indices(shape, dtype=np.float64).reshape(3, -1).T
+
+
+def nearest_indices(coords, shape):
+    """Convert voxel coordinates to flat nearest-neighbour indices into a grid.
+
+    Parameters
+    ----------
+    coords : numpy.ndarray
+        ``(n_voxels, 3)`` array of voxel coordinates
+
+    shape : tuple
+        Shape of the sampled grid
+
+    Returns
+    -------
+    indices : numpy.ndarray
+        Flat indices of the sampled voxels inside the grid
+
+    inside : numpy.ndarray
+        Boolean mask of the coordinates falling inside the grid
+    """
+    ijk = np.floor(coords + 0.5).astype(np.int64)
+    inside = np.all((ijk >= 0) & (ijk < np.asarray(shape[:3])), axis=1)
+    indices = np.ravel_multi_index(tuple(ijk[inside].T), shape[:3])
+    return indices, inside
+
+
+def resample_labels(in_files, out_files, ref_img, coords, in_shape, default_value=0):
+    """Resample label volumes sharing the same grid with one nearest-neighbour coordinate map.
+
+    Parameters
+    ----------
+    in_files : list of string
+        Label volumes defined on the same voxel grid
+
+    out_files : list of string
+        Output paths, one per input volume
+
+    ref_img : nibabel.Nifti1Image
+        Reference image defining the output grid
+
+    coords : numpy.ndarray
+        ``(n_voxels, 3)`` input voxel coordinates of each reference voxel
+
+    in_shape : tuple
+        Shape of the input voxel grid
+
+    default_value : number
+        Value assigned to the voxels mapped outside the input grid
+
+    Returns
+    -------
+    out_files : list of string
+        Absolute paths to the resampled volumes
+    """
+    out_shape = ref_img.shape[:3]
+    indices, inside = nearest_indices(coords, in_shape)
+    resampled = []
+    for in_file, out_file in zip(in_files, out_files):
+        img = nib.load(in_file)
+        labels = np.asanyarray(img.dataobj).reshape(-1)
+        out = np.full(inside.shape, default_value, dtype=labels.dtype)
+        out[inside] = labels[indices]
+        header = ref_img.header.copy()
+        header.set_data_dtype(labels.dtype)
+        nib.save(
+            nib.Nifti1Image(out.reshape(out_shape), ref_img.affine, header),
+            out_file,
+        )
+        resampled.append(os.path.abspath(out_file))
+    return resampled
+
+
+def same_grid(in_files):
+    """Return ``True`` if all the images share the same voxel grid."""
+    imgs = [nib.load(f) for f in in_files]
+    return all(
+        img.shape[:3] == imgs[0].shape[:3] and np.allclose(img.affine, imgs[0].affine)
+        for img in imgs[1:]
+    )
+
+
+def run_interfaces(interfaces, output_name, number_of_workers=1):
+    """Run nipype interfaces with a pool of workers and return their outputs in order.
+
+    Parameters
+    ----------
+    interfaces : list of nipype.interfaces.base.BaseInterface
+        Interfaces to run, each one producing one output file
+
+    output_name : string
+        Name of the output to collect
+
+    number_of_workers : int
+        Number of interfaces run concurrently
+
+    Returns
+    -------
+    out_files : list of string
+        Absolute paths to the output files, in the order of ``interfaces``
+    """
+    with ThreadPoolExecutor(max_workers=max(1, number_of_workers)) as executor:
+        results = list(executor.map(lambda interface: interface.run(), interfaces))
+    return [
+        os.path.abspath(getattr(result.outputs, output_name)) for result in results
+    ]
@@ -17,6 +17,7 @@ import os
 import warnings
 
 from glob import glob
+from concurrent.futures import ThreadPoolExecutor
 import numpy
 # import http.client
 # import urllib
@@ -39,6 +40,7 @@ from cmtklib.bids.io import (
     __nipype_directory__
 )
 from cmp.project import ProjectInfo, run_individual
+from cmtklib.bids.layout import get_bids_layout
 
 warnings.filterwarnings("ignore", message="numpy.dtype size changed")
 warnings.filterwarnings("ignore", message="numpy.ufunc size changed")
@@ -80,7 +82,8 @@ def report_usage(event_category, event_action, event_label, verbose=False):
           BColors.ENDC)
 
 
-def create_cmp_command(project, run_anat, run_dmri, run_fmri, number_of_threads=1):
+def create_cmp_command(project, run_anat, run_dmri, run_fmri, number_of_threads=1,
+                       concurrent_pipelines=False, memory_gb=None, resource_monitor=False):
     """Create the command to run the `connectomemapper3` python script.
 
     Parameters
@@ -101,6 +104,18 @@ def create_cmp_command(project, run_anat, run_dmri, run_fmri, number_of_threads=
         Number of threads used OpenMP-parallelized tools
         (Default: 1)
 
+    concurrent_pipelines : bool
+        If True, process the diffusion and fMRI pipelines concurrently
+        (Default: False)
+
+    memory_gb : float
+        If specified, memory (in GB) available to Nipype to schedule
+        the nodes of the pipelines
+
+    resource_monitor : bool
+        If True, enable the Nipype resource monitor to record the peak memory
+        of the nodes (Default: False)
+
     Returns
     -------
     Command : string
@@ -138,6 +153,16 @@ def create_cmp_command(project, run_anat, run_dmri, run_fmri, number_of_threads=
     cmd.append('--number_of_threads')
     cmd.append(str(number_of_threads))
 
+    if concurrent_pipelines:
+        cmd.append('--concurrent_pipelines')
+
+    if memory_gb:
+        cmd.append('--memory_gb')
+        cmd.append(str(memory_gb))
+
+    if resource_monitor:
+        cmd.append('--resource_monitor')
+
     return ' '.join(cmd)
 
 
@@ -157,17 +182,117 @@ def readLineByLine(filename):
             yield line.strip('\n')
 
 
-def manage_processes(proclist):
-    """Manages parallel processes.
+def estimate_participant_cost(bids_dir, subject, session, run_anat, run_dmri, run_fmri):
+    """Estimate the relative processing cost of a subject / session.
+
+    The cost is given by the pipelines to run, weighted by their usual
+    processing time (anatomical > diffusion > fMRI), and then by the size
+    of their input data.
+
+    Parameters
+    ----------
+    bids_dir : string
+        BIDS dataset root directory
+
+    subject : string
+        Subject label (``sub-XX``)
+
+    session : string
+        Session label (``ses-YY``) or empty string
+
+    run_anat, run_dmri, run_fmri : bool
+        Pipelines run for this subject / session
+
+    Returns
+    -------
+    cost : tuple
+        (Weighted number of pipelines, size in bytes of their input data)
+    """
+    weights = {"anat": (run_anat, 3), "dwi": (run_dmri, 2), "func": (run_fmri, 1)}
+    weight = 0
+    size = 0
+    for datatype, (enabled, datatype_weight) in weights.items():
+        if not enabled:
+            continue
+        weight += datatype_weight
+        for f in glob(os.path.join(bids_dir, subject, session, datatype, "*")):
+            if os.path.isfile(f):
+                size += os.path.getsize(f)
+    return weight, size
+
+
+def run_participant_jobs(jobs, max_parallel_jobs=1):
+    """Run the `connectomemapper3` commands of the subjects / sessions with a pool of subprocesses.
+
+    Exactly ``max_parallel_jobs`` commands are kept running as long as there are
+    jobs waiting. Jobs are started by decreasing estimated cost so that the longest
+    ones do not end up running alone at the end. Each worker blocks on the
+    completion of its subprocess instead of polling it.
+
+    Parameters
+    ----------
+    jobs : list of dict
+        Jobs described by their ``label``, ``cmd``, ``log_file`` and ``cost``
+
+    max_parallel_jobs : int
+        Maximal number of commands running in parallel
+
+    Returns
+    -------
+    jobs : list of dict
+        The jobs, in the order they were started, completed with their
+        ``start`` and ``end`` times and their ``exit_code``
+    """
+    def _run_job(job):
+        job["start"] = datetime.now()
+        print_blue(f'... Start {job["label"]}')
+        proc = run(command=job["cmd"], env={}, log_filename=job["log_file"])
+        job["exit_code"] = proc.wait()
+        job["end"] = datetime.now()
+        print(f'  .. INFO: {job["label"]} finished with exit code {job["exit_code"]} '
+              f'(duration: {job["end"] - job["start"]})')
+        return job
+
+    jobs = sorted(jobs, key=lambda job: job["cost"], reverse=True)
+    with ThreadPoolExecutor(max_workers=max(1, max_parallel_jobs)) as executor:
+        return list(executor.map(_run_job, jobs))
+
+
+def report_participant_jobs(jobs, report_file=None):
+    """Print and save the start / end times and the exit codes of the subject / session jobs.
 
     Parameters
     ----------
-    proclist : list
-        List of processes
+    jobs : list of dict
+        Jobs returned by :func:`run_participant_jobs`
+
+    report_file : string
+        If specified, path of the TSV file where the report is saved
     """
-    for proc in proclist:
-        if proc.poll() is not None:
-            proclist.remove(proc)
+    header = ["participant", "start", "end", "duration", "exit_code"]
+    rows = [
+        [
+            job["label"],
+            job["start"].isoformat(timespec="seconds"),
+            job["end"].isoformat(timespec="seconds"),
+            str(job["end"] - job["start"]),
+            str(job["exit_code"]),
+        ]
+        for job in jobs
+    ]
+    print("> Participant jobs report")
+    for row in rows:
+        print("\t" + "\t".join(row))
+    failed = [job["label"] for job in jobs if job["exit_code"] != 0]
+    if failed:
+        print_error(f'  .. ERROR: Processing failed for {", ".join(failed)} '
+                    '(see the log file of each participant)')
+    if report_file is not None:
+        with open(report_file, "w") as f:
+            f.write("\t".join(header) + "\n")
+            for row in rows:
+                f.write("\t".join(row) + "\n")
+        print(f"  .. INFO: Report saved as {report_file}")
 
 
 def remove_files(path, debug=False):
@@ -446,7 +571,22 @@ def main():
             report_usage('BIDS App', 'Run', __version__)
 
         maxprocs = parallel_number_of_subjects
-        processes = []
+        jobs = []
+
+        # Split the memory budget between the participants processed in parallel
+        memory_gb = 0
+        if args.memory_gb is not None and args.memory_gb > 0:
+            memory_gb = args.memory_gb / parallel_number_of_subjects
+            print(f'  * Memory available per participant set to {memory_gb:.1f} GB')
+
+        # Index the dataset once in the output directory so that the participant
+        # processes load the persisted layout instead of re-indexing the dataset
+        print('> Index BIDS dataset')
+        try:
+            get_bids_layout(args.bids_dir, args.output_dir)
+        except Exception as e:
+            print_error(f'  .. ERROR: Failed to index the BIDS dataset: {e}')
+            return 1
 
         # find all T1s and skullstrip them
         for subject_label in subjects_to_analyze:
@@ -495,10 +635,6 @@ def main():
 
             for session in project.subject_sessions:
 
-                if not args.coverage:
-                    while len(processes) == maxprocs:
-                        manage_processes(processes)
-
                 if session != "":
                     print('> Process session {}'.format(session))
 
@@ -575,33 +711,47 @@ def main():
                                            func_pipeline_config=(None
                                                                  if not run_fmri
                                                                  else project.fmri_config_file),
-                                           number_of_threads=number_of_threads)
+                                           number_of_threads=number_of_threads,
+                                           concurrent_pipelines=args.concurrent_pipelines,
+                                           memory_gb=memory_gb,
+                                           resource_monitor=args.resource_monitor)
                     else:
                         cmd = create_cmp_command(project=project,
                                                  run_anat=run_anat,
                                                  run_dmri=run_dmri,
                                                  run_fmri=run_fmri,
-                                                 number_of_threads=number_of_threads)
+                                                 number_of_threads=number_of_threads,
+                                                 concurrent_pipelines=args.concurrent_pipelines,
+                                                 memory_gb=memory_gb,
+                                                 resource_monitor=args.resource_monitor)
                         print_blue("... cmd : {}".format(cmd))
                         if project.subject_session != "":
                             log_file = '{}_{}_log.txt'.format(project.subject,
                                                               project.subject_session)
                         else:
                             log_file = '{}_log.txt'.format(project.subject)
-                        proc = run(command=cmd, env={},
-                                   log_filename=os.path.join(project.output_directory, __cmp_directory__,
-                                                             project.subject, project.subject_session,
-                                                             log_file)
-                                   )
-                        processes.append(proc)
+                        jobs.append({
+                            "label": (f'{project.subject}_{project.subject_session}'
+                                      if project.subject_session != "" else project.subject),
+                            "cmd": cmd,
+                            "log_file": os.path.join(project.output_directory, __cmp_directory__,
+                                                     project.subject, project.subject_session,
+                                                     log_file),
+                            "cost": estimate_participant_cost(args.bids_dir, project.subject,
+                                                              project.subject_session,
+                                                              run_anat, run_dmri, run_fmri),
+                        })
                 else:
                     print("... Error: at least anatomical configuration file "
                           "has to be specified (--anat_pipeline_config)")
                     return 1
 
         if not args.coverage:
-            while len(processes) > 0:
-                manage_processes(processes)
+            jobs = run_participant_jobs(jobs, max_parallel_jobs=maxprocs)
+            report_participant_jobs(
+                jobs,
+                report_file=os.path.join(args.output_dir, __cmp_directory__, 'participant_jobs.tsv')
+            )
 
         clean_cache(args.bids_dir)
 
@@ -63,6 +63,7 @@ packages = [
     "cmp.bidsappmanager.pipelines.diffusion",
     "cmp.bidsappmanager.pipelines.functional",
     "cmtklib",
+    "cmtklib.benchmark",
     "cmtklib.bids",
     "cmtklib.data.parcellation",
     "cmtklib.interfaces",
@@ -0,0 +1,70 @@
+"""Compare the vectorized Cartool ROI time course extraction with the original epoch-by-epoch implementation."""
+
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+mne = pytest.importorskip("mne")
+pytest.importorskip("pycartool")
+pytest.importorskip("nipype")
+
+from cmtklib.benchmark.synthetic import make_eeg_epochs  # noqa: E402
+from cmtklib.interfaces.pycartool import CartoolInverseSolutionROIExtraction  # noqa: E402
+
+
+def _extract_roi_time_courses_reference(epochs, K, rois, svd_params):
+    """Original implementation looping over the ROIs, the epochs and the solution points."""
+    n_rois = len(rois.names)
+    times = epochs.times
+    tstep = times[1] - times[0]
+    roi_tcs = np.zeros((n_rois, len(times), len(epochs.events)))
+    for r in range(n_rois):
+        spis_this_roi = rois.groups_of_indexes[r]
+        n_spi = len(spis_this_roi)
+        roi_stc = np.zeros((3, n_spi, len(times), len(epochs.events)))
+        for k, e in enumerate(epochs):
+            for i in range(3):
+                roi_stc[i, :, :, k] = K[i, spis_this_roi] @ e
+
+        stim_onset = np.where(times == 0)[0][0]
+        svd_t_begin = stim_onset + int(svd_params['toi_begin'] / tstep)
+        svd_t_end = stim_onset + int(svd_params['toi_end'] / tstep)
+
+        mean_roi_stc = np.mean(roi_stc[:, :, svd_t_begin:svd_t_end, :], axis=3)
+        u1, _, _ = np.linalg.svd(mean_roi_stc.reshape(3, -1))
+
+        tc_loc = np.zeros((len(times), n_spi, len(epochs.events)))
+        for k in range(n_spi):
+            for e in range(len(epochs.events)):
+                tc_loc[:, k, e] = u1[:, 0].reshape(1, 3) @ roi_stc[:, k, :, e]
+
+        roi_tcs[r, :, :] = np.mean(tc_loc, axis=1)
+
+    return roi_tcs.transpose(2, 0, 1)
+
+
+def _make_inputs():
+    eeg = make_eeg_epochs(n_epochs=12, n_channels=16, n_times=60, n_solution_points=120, n_rois=9,
+                          sfreq=100.0, n_baseline=10)
+    info = mne.create_info(eeg['data'].shape[1], eeg['sfreq'], ch_types='eeg')
+    epochs = mne.EpochsArray(eeg['data'], info, tmin=eeg['tmin'], verbose=False)
+    rois = SimpleNamespace(names=eeg['roi_names'], groups_of_indexes=eeg['groups_of_indexes'])
+    return epochs, eeg['K'], rois, {'toi_begin': 0, 'toi_end': 0.25}
+
+
+def test_extract_roi_time_courses():
+    epochs, K, rois, svd_params = _make_inputs()
+    expected = _extract_roi_time_courses_reference(epochs, K, rois, svd_params)
+    roi_tcs = CartoolInverseSolutionROIExtraction.extract_roi_time_courses(epochs, K, rois, svd_params)
+    assert roi_tcs.shape == (12, 9, 60)
+    np.testing.assert_allclose(roi_tcs, expected, rtol=1e-10, atol=1e-12 * np.abs(expected).max())
+
+
+def test_extract_roi_time_courses_float32():
+    epochs, K, rois, svd_params = _make_inputs()
+    expected = _extract_roi_time_courses_reference(epochs, K, rois, svd_params)
+    roi_tcs = CartoolInverseSolutionROIExtraction.extract_roi_time_courses(
+        epochs, K, rois, svd_params, dtype=np.float32)
+    assert roi_tcs.dtype == np.float32
+    np.testing.assert_allclose(roi_tcs, expected, atol=1e-5 * np.abs(expected).max())
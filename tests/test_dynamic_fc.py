@@ -0,0 +1,48 @@
+"""Compare the sliding-window correlation matrices with numpy.corrcoef computed window by window."""
+
+import numpy as np
+import pytest
+
+pytest.importorskip("nipype")
+
+from cmtklib.connectome import sliding_window_correlation  # noqa: E402
+
+
+def _sliding_window_corrcoef(ts, window_length, step):
+    """Reference: correlation matrices recomputed from scratch in each window."""
+    n_windows = (ts.shape[1] - window_length) // step + 1
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.array([
+            np.corrcoef(ts[:, k * step: k * step + window_length]) for k in range(n_windows)
+        ])
+
+
+@pytest.mark.parametrize("window_length,step", [(20, 1), (30, 7), (10, 25), (200, 1)])
+def test_sliding_window_correlation(window_length, step):
+    rng = np.random.default_rng(0)
+    # Correlated time-series with an offset and a slow drift
+    ts = rng.standard_normal((12, 200)).cumsum(axis=1) + 1000 * rng.standard_normal((12, 1))
+    ts[:6] += 0.5 * ts[6:]
+    dynamic_fc = sliding_window_correlation(ts, window_length, step=step)
+    expected = _sliding_window_corrcoef(ts, window_length, step)
+    assert dynamic_fc.dtype == np.float32
+    assert dynamic_fc.shape == expected.shape
+    np.testing.assert_allclose(dynamic_fc, expected, atol=1e-5)
+
+
+def test_sliding_window_correlation_out_file(tmp_path):
+    rng = np.random.default_rng(1)
+    ts = rng.standard_normal((5, 60))
+    # A node with a constant time-series has undefined correlations
+    ts[2] = 3.0
+    out_file = str(tmp_path / "dynamic_fc.npy")
+    dynamic_fc = sliding_window_correlation(ts, 15, step=3, out_file=out_file)
+    expected = _sliding_window_corrcoef(ts, 15, 3)
+    np.testing.assert_allclose(np.load(out_file, mmap_mode="r"), expected, atol=1e-5)
+    np.testing.assert_array_equal(np.isnan(dynamic_fc), np.isnan(expected))
+
+
+@pytest.mark.parametrize("window_length,step", [(1, 1), (61, 1), (10, 0)])
+def test_sliding_window_correlation_invalid_parameters(window_length, step):
+    with pytest.raises(ValueError):
+        sliding_window_correlation(np.zeros((3, 60)), window_length, step=step)
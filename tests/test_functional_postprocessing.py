@@ -0,0 +1,337 @@
+"""Check the fMRI post-processing functions and interfaces against the regressions they perform."""
+
+import os
+
+import numpy as np
+import pytest
+
+nib = pytest.importorskip("nibabel")
+pytest.importorskip("nipype")
+
+from cmtklib.functionalMRI import (  # noqa: E402
+    BandpassFiltering, Despiking, FunctionalPostProcessing, NuisanceRegression,
+    bandpass_filter, compcor_components, despike, motion_regressors, tcompcor_voxels
+)
+
+
+def _make_inputs(out_dir, shape=(8, 8, 6), tp=40, trend=0.0, seed=0):
+    """Write a synthetic 4D fMRI volume with an optional linear trend, brain and GM masks, and motion parameters."""
+    rng = np.random.default_rng(seed)
+    affine = np.diag([3.0, 3.0, 3.0, 1.0])
+    data = rng.normal(100, 5, size=shape + (tp,)) + trend * np.linspace(-1, 1, tp)
+    img = nib.Nifti1Image(data.astype(np.float32), affine)
+    img.header.set_zooms((3.0, 3.0, 3.0, 2.0))
+    in_file = os.path.join(out_dir, "bold.nii.gz")
+    nib.save(img, in_file)
+
+    brain = np.zeros(shape, dtype=np.uint8)
+    brain[1:-1, 1:-1, 1:-1] = 1
+    brainfile = os.path.join(out_dir, "brain.nii.gz")
+    nib.save(nib.Nifti1Image(brain, affine), brainfile)
+
+    gm = np.zeros(shape, dtype=np.int16)
+    gm[2:4, 2:6, 2:4], gm[4:6, 2:6, 2:4] = 1, 2
+    gm_file = os.path.join(out_dir, "gm.nii.gz")
+    nib.save(nib.Nifti1Image(gm, affine), gm_file)
+
+    motion_file = os.path.join(out_dir, "motion.par")
+    np.savetxt(motion_file, rng.normal(0, 0.01, size=(tp, 6)))
+    return in_file, brainfile, gm_file, motion_file
+
+
+def _create_interface(in_file, gm_file, **inputs):
+    postproc = FunctionalPostProcessing(in_file=in_file, gm_file=[gm_file])
+    steps = dict(
+        global_nuisance=False, csf_nuisance=False, wm_nuisance=False, motion_nuisance=False, scrubbing=False,
+    )
+    postproc.inputs.trait_set(**{**steps, **inputs})
+    return postproc
+
+
+def _residuals(data, regressors):
+    """Return the residuals of the least-squares fit of the time-series on a constant and the regressors."""
+    X = np.hstack((np.ones((data.shape[1], 1)), regressors))
+    beta = np.linalg.lstsq(X, data.T, rcond=None)[0]
+    return data - (X @ beta).T
+
+
+def _motion_expansion(motion, nb_reg):
+    """Return the 6, 12, 24 or 36 motion regressors (parameters, shifted by 0, 1 and 2 volumes, and squares)."""
+    motion = motion - motion.mean(axis=0)
+    shifted = [np.vstack((np.zeros((shift, 6)), motion[: len(motion) - shift])) for shift in range(3)]
+    columns = [shifted[0], shifted[0] ** 2, shifted[1], shifted[1] ** 2, shifted[2], shifted[2] ** 2]
+    return np.hstack(columns)[:, :nb_reg]
+
+
+@pytest.mark.parametrize("step, missing", [
+    ("global_nuisance", "'brainfile'"),
+    ("tcompcor", "'brainfile'"),
+    ("acompcor", "'csf_file', 'wm_file'"),
+    ("scrubbing", "'motion_file'"),
+])
+def test_missing_step_requires(tmp_path, monkeypatch, step, missing):
+    monkeypatch.chdir(tmp_path)
+    in_file, _, gm_file, _ = _make_inputs(str(tmp_path))
+    postproc = _create_interface(in_file, gm_file, **{step: True})
+    with pytest.raises(ValueError, match=f"{missing} because '{step}' is set"):
+        postproc.run()
+
+
+def test_default_steps(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    in_file, _, gm_file, motion_file = _make_inputs(str(tmp_path), trend=50.0)
+    # Only the mandatory inputs and the motion parameters used by scrubbing
+    result = FunctionalPostProcessing(in_file=in_file, gm_file=[gm_file], motion_file=motion_file).run()
+
+    gm = np.asanyarray(nib.load(gm_file).dataobj) > 0
+    out = nib.load(result.outputs.out_file).get_fdata()[gm]
+    # Detrending is enabled by default and removes the linear trend and the mean
+    t = np.linspace(-1, 1, out.shape[1])
+    np.testing.assert_allclose(out @ t, 0, atol=1e-2)
+    np.testing.assert_allclose(out.mean(axis=1), 0, atol=1e-3)
+
+    # Scrubbing is enabled by default
+    motion = np.loadtxt(motion_file)
+    FD = np.load(result.outputs.fd_npy)
+    np.testing.assert_allclose(FD[1:, 0], np.absolute(np.diff(motion[:-1], axis=0)).sum(axis=1))
+    assert np.load(result.outputs.dvars_npy).shape == FD.shape
+
+
+def test_motion_nuisance_default_regressors(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    in_file, _, gm_file, motion_file = _make_inputs(str(tmp_path), tp=120, trend=10.0)
+    # nuisance_motion_nb_reg is not set: the 36 motion regressors are used
+    result = _create_interface(in_file, gm_file, motion_file=motion_file, motion_nuisance=True).run()
+
+    gm = np.asanyarray(nib.load(gm_file).dataobj) > 0
+    out = nib.load(result.outputs.out_file).get_fdata()[gm]
+    data = nib.load(in_file).get_fdata()[gm]
+    detrended = _residuals(data, np.linspace(-1, 1, data.shape[1])[:, np.newaxis])
+    motion = np.loadtxt(motion_file)
+    np.testing.assert_allclose(out, _residuals(detrended, _motion_expansion(motion, 36)), atol=1e-3)
+    assert not np.allclose(out, _residuals(detrended, _motion_expansion(motion, 6)), atol=1e-3)
+
+
+def test_global_nuisance(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    in_file, brainfile, gm_file, motion_file = _make_inputs(str(tmp_path))
+    result = _create_interface(
+        in_file, gm_file, brainfile=brainfile, motion_file=motion_file,
+        global_nuisance=True, motion_nuisance=True, scrubbing=True,
+    ).run()
+    out = nib.load(result.outputs.out_file).get_fdata()
+    brain = np.asanyarray(nib.load(brainfile).dataobj) > 0
+    # The global signal is regressed out of every voxel
+    np.testing.assert_allclose(out[brain].mean(axis=0), 0, atol=1e-3)
+    assert np.all(out[~brain] == 0)
+    assert os.path.exists(result.outputs.fd_npy)
+
+
+def test_stage_fused_postprocessing_inputs():
+    pe = pytest.importorskip("nipype.pipeline.engine")
+    from nipype.interfaces.utility import IdentityInterface
+    from cmp.stages.functional.functionalMRI import FunctionalMRIStage
+
+    stage = FunctionalMRIStage(bids_dir="/bids_dir", output_dir="/output_dir")
+    stage.config.fused_postprocessing = True
+    flow = pe.Workflow(name="functional_stage")
+    inputnode = pe.Node(IdentityInterface(fields=stage.inputs), name="inputnode")
+    inputnode.inputs.motion_par_file = "/path/to/motion.par"
+    outputnode = pe.Node(IdentityInterface(fields=stage.outputs), name="outputnode")
+    stage.create_workflow(flow, inputnode, outputnode)
+
+    inputs = flow.get_node("postprocessing").inputs
+    assert inputs.motion_nuisance and inputs.nuisance_motion_nb_reg == 36
+    assert inputs.detrending and inputs.scrubbing
+
+
+def test_nuisance_regression_default_motion_regressors(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    in_file, _, _, motion_file = _make_inputs(str(tmp_path), tp=120)
+    # nuisance_motion_nb_reg is not set: the 36 motion regressors are used, as in the fused node
+    result = NuisanceRegression(
+        in_file=in_file, motion_file=motion_file, motion_nuisance=True,
+        global_nuisance=False, csf_nuisance=False, wm_nuisance=False,
+    ).run()
+
+    out = nib.load(result.outputs.out_file).get_fdata().reshape(-1, 120)
+    data = nib.load(in_file).get_fdata().reshape(-1, 120)
+    motion = np.loadtxt(motion_file)
+    np.testing.assert_allclose(out, _residuals(data, _motion_expansion(motion, 36)), atol=1e-3)
+    # The regressors are saved for the orthogonalization of the band-pass filter
+    np.testing.assert_array_equal(np.load(result.outputs.motion_npy), motion_regressors(motion_file, 36))
+
+
+def _align_signs(components, reference):
+    """Flip the components to have a positive dot product with the reference ones."""
+    return components * np.sign(np.sum(components * reference, axis=0))
+
+
+@pytest.mark.parametrize("standardize", [False, True])
+def test_compcor_components(standardize):
+    rng = np.random.default_rng(0)
+    # Voxels with a few shared temporal components, different means and scales, and a constant voxel
+    data = rng.normal(size=(300, 3)) @ rng.normal(size=(3, 60)) + rng.normal(scale=0.3, size=(300, 60))
+    data = data * rng.uniform(0.5, 4, size=(300, 1)) + rng.uniform(-50, 50, size=(300, 1))
+    data[0] = 7.0
+
+    components = compcor_components(data, n_components=5, standardize=standardize, chunk_size=64)
+
+    centered = data - data.mean(axis=1, keepdims=True)
+    if standardize:
+        std = centered.std(axis=1, keepdims=True)
+        centered /= np.where(std == 0, 1, std)
+    reference = np.linalg.svd(centered, full_matrices=False)[2][:5].T
+    assert components.shape == (60, 5)
+    np.testing.assert_allclose(_align_signs(components, reference), reference, atol=1e-8)
+
+
+def test_tcompcor_voxels():
+    rng = np.random.default_rng(0)
+    scales = rng.permutation(np.arange(1, 101, dtype=np.float64))
+    data = rng.standard_normal((100, 200))
+    data = (data - data.mean(axis=1, keepdims=True)) / data.std(axis=1, keepdims=True)
+    data = data * scales[:, np.newaxis] + 1000
+
+    np.testing.assert_array_equal(np.sort(tcompcor_voxels(data, fraction=0.05)), np.sort(np.argsort(scales)[-5:]))
+    # At least one voxel is selected
+    np.testing.assert_array_equal(tcompcor_voxels(data, fraction=0.001), [np.argmax(scales)])
+
+
+def _make_spiky_timeseries(n_voxels=40, tp=200, noise=1.0, seed=0):
+    """Return smooth time-series with gaussian noise, the same time-series with spikes, and the spike indices."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(tp) / tp
+    clean = (
+        100 + rng.uniform(-5, 5, size=(n_voxels, 1)) * np.sin(2 * np.pi * 2 * t)
+        + rng.normal(scale=noise, size=(n_voxels, tp))
+    )
+    spiky = clean.copy()
+    spikes = (np.arange(n_voxels), rng.integers(10, tp - 10, size=n_voxels))
+    spiky[spikes] += rng.choice([-1, 1], size=n_voxels) * 50 * noise
+    return clean, spiky, spikes
+
+
+def test_despike():
+    clean, spiky, spikes = _make_spiky_timeseries()
+    despiked = spiky.copy()
+    n_spikes = despike(despiked)
+
+    # The spikes (50 noise standard deviations) are compressed to at most 4 MADs of the fit
+    assert n_spikes >= len(spikes[0])
+    assert np.all(np.absolute(despiked[spikes] - clean[spikes]) < 6)
+    # The other samples are unchanged, or only slightly compressed in the tails of the noise
+    # (the cut of 2.5 MADs is about 2.1 standard deviations, as in 3dDespike)
+    others = np.ones(spiky.shape, dtype=bool)
+    others[spikes] = False
+    change = np.absolute(despiked - spiky)[others]
+    assert np.mean(change == 0) > 0.93
+    assert change.max() < 1 and change.mean() < 0.01
+
+
+def test_bandpass_filter_orthogonalize():
+    rng = np.random.default_rng(0)
+    tp, tr, highpass, lowpass = 128, 2.0, 0.01, 0.1
+    data = rng.normal(size=(30, tp))
+    regressors = rng.normal(size=(tp, 3))
+    bandpass_filter(data, tr, highpass, lowpass, regressors=regressors)
+
+    # The filtered time-series are orthogonal to the filtered regressors
+    filtered_regressors = regressors.T.copy()
+    bandpass_filter(filtered_regressors, tr, highpass, lowpass)
+    np.testing.assert_allclose(data @ filtered_regressors.T, 0, atol=1e-10)
+    # and have no power in the stop band
+    freqs = np.fft.rfftfreq(tp, d=tr)
+    stopband = (freqs < highpass) | (freqs > lowpass)
+    np.testing.assert_allclose(np.fft.rfft(data, axis=1)[:, stopband], 0, atol=1e-10)
+
+
+def _save_timeseries_image(out_dir, timeseries, shape=(5, 4, 2), tr=2.0):
+    """Save time-series in the first voxels of a 4D image whose other voxels are zero."""
+    volume = np.zeros((np.prod(shape), timeseries.shape[1]), dtype=np.float32)
+    volume[: timeseries.shape[0]] = timeseries
+    affine = np.diag([2.0, 2.0, 2.0, 1.0])
+    img = nib.Nifti1Image(volume.reshape(shape + (-1,)), affine)
+    img.header.set_zooms((2.0, 2.0, 2.0, tr))
+    in_file = os.path.join(out_dir, "bold.nii.gz")
+    nib.save(img, in_file)
+    return in_file
+
+
+def _check_round_trip(in_file, out_file, expected):
+    """Check that the output image has the geometry of the input and the expected time-series."""
+    in_img, out_img = nib.load(in_file), nib.load(out_file)
+    assert out_img.shape == in_img.shape
+    np.testing.assert_array_equal(out_img.affine, in_img.affine)
+    assert out_img.get_data_dtype() == np.float32
+    out = np.asanyarray(out_img.dataobj).reshape(-1, in_img.shape[-1])
+    np.testing.assert_allclose(out[: len(expected)], expected, rtol=1e-5, atol=1e-4)
+    # Voxels with only zero values are not processed
+    assert np.all(out[len(expected):] == 0)
+
+
+def test_despiking_interface(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _, spiky, _ = _make_spiky_timeseries(n_voxels=30)
+    in_file = _save_timeseries_image(str(tmp_path), spiky)
+    result = Despiking(in_file=in_file).run()
+
+    expected = spiky.astype(np.float32)
+    despike(expected)
+    _check_round_trip(in_file, result.outputs.out_file, expected)
+
+
+def test_bandpass_filtering_interface(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    rng = np.random.default_rng(0)
+    timeseries = 100 + rng.normal(size=(30, 128))
+    in_file = _save_timeseries_image(str(tmp_path), timeseries)
+    # Regressors given as `.npy` and text files
+    regressors = rng.normal(size=(128, 3))
+    np.save(str(tmp_path / "regressors.npy"), regressors[:, :2])
+    np.savetxt(str(tmp_path / "motion.par"), regressors[:, 2])
+    result = BandpassFiltering(
+        in_file=in_file, highpass=0.01, lowpass=0.1,
+        orthogonalize_file=[str(tmp_path / "regressors.npy"), str(tmp_path / "motion.par")],
+    ).run()
+
+    expected = timeseries.astype(np.float32)
+    # The repetition time is read from the header
+    bandpass_filter(expected, 2.0, 0.01, 0.1, regressors=regressors)
+    _check_round_trip(in_file, result.outputs.out_file, expected)
+
+
+def _create_stage_workflow(**config):
+    pe = pytest.importorskip("nipype.pipeline.engine")
+    from nipype.interfaces.utility import IdentityInterface
+    from cmp.stages.functional.functionalMRI import FunctionalMRIStage
+
+    stage = FunctionalMRIStage(bids_dir="/bids_dir", output_dir="/output_dir")
+    stage.config.trait_set(**config)
+    flow = pe.Workflow(name="functional_stage")
+    inputnode = pe.Node(IdentityInterface(fields=stage.inputs), name="inputnode")
+    inputnode.inputs.motion_par_file = "/path/to/motion.par"
+    outputnode = pe.Node(IdentityInterface(fields=stage.outputs), name="outputnode")
+    stage.create_workflow(flow, inputnode, outputnode)
+    return flow
+
+
+def test_stage_orthogonalize_regressors():
+    flow = _create_stage_workflow(bandpass_method="Native", bandpass_orthogonalize=True, acompcor=True)
+    nuisance, merge = flow.get_node("nuisance_regression"), flow.get_node("orthogonalize_regressors")
+    # The native filter is orthogonalized to the regressors of the nuisance regression,
+    # including the 36 motion regressors instead of the 6 motion parameters
+    assert sorted(src for src, _ in flow._graph.get_edge_data(nuisance, merge)["connect"]) == [
+        "acompcor_npy", "averageCSF_npy", "averageWM_npy", "motion_npy"
+    ]
+    assert not flow._graph.has_edge(flow.get_node("inputnode"), merge)
+
+
+def test_stage_orthogonalize_warning_with_afni(monkeypatch):
+    import cmp.stages.functional.functionalMRI as functional_stage
+
+    warnings = []
+    monkeypatch.setattr(functional_stage.iflogger, "warning", warnings.append)
+    flow = _create_stage_workflow(bandpass_method="AFNI", bandpass_orthogonalize=True)
+    assert flow.get_node("orthogonalize_regressors") is None
+    assert len(warnings) == 1 and "ignored with AFNI" in warnings[0]
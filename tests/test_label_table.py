@@ -0,0 +1,78 @@
+"""Check the Lausanne2018 label table and its application against a label-by-label reference."""
+
+import numpy as np
+import pytest
+
+pytest.importorskip("nipype")
+nx = pytest.importorskip("networkx")
+
+from cmtklib.parcellation import (  # noqa: E402
+    apply_label_table, get_lausanne2018_label_table,
+    write_freesurfer_colorlut, write_node_description_graphml
+)
+
+
+def _make_annot(n_regions, seed):
+    """Return a synthetic annotation as returned by :func:`nibabel.freesurfer.io.read_annot`."""
+    rng = np.random.default_rng(seed)
+    ctab = np.zeros((n_regions + 1, 5), dtype=np.int64)
+    ctab[:, :3] = rng.integers(0, 256, size=(n_regions + 1, 3))
+    names = [b'unknown'] + [f'region{k}'.encode() for k in range(n_regions)]
+    return None, ctab, names
+
+
+def _make_sources(table, shape=(24, 24, 24), seed=0):
+    """Fill each source image with random labels of the table and background."""
+    rng = np.random.default_rng(seed)
+    source_labels = {}
+    for section in table:
+        source_labels.setdefault(section['source'], set()).update(
+            s['source_label'] for s in section['structures'])
+    sources = {}
+    for source, labels in source_labels.items():
+        # Unknown labels and background must be ignored
+        choices = np.array(sorted(labels) + [0, 0, 0, 9999])
+        image = choices[rng.integers(0, choices.size, size=shape)]
+        # Keep a third of the volume empty so that the earlier sections are not always overridden
+        image[rng.random(shape) < 0.33] = 0
+        sources[source] = image.astype(np.int16)
+    return sources
+
+
+def _apply_label_table_reference(table, sources):
+    """Assign the labels one structure at a time following the order of the table."""
+    out = np.zeros(next(iter(sources.values())).shape, dtype=np.int16)
+    for section in table:
+        for structure in section['structures']:
+            out[sources[section['source']] == structure['source_label']] = structure['label']
+    return out
+
+
+@pytest.mark.parametrize("full", [True, False])
+def test_apply_label_table(tmp_path, full):
+    rh_annot, lh_annot = _make_annot(17, seed=1), _make_annot(15, seed=2)
+    table = get_lausanne2018_label_table(
+        rh_annot, lh_annot, thalamus_nuclei=full, lh_hippocampal_subfields=full,
+        rh_hippocampal_subfields=full, brainstem_structures=full)
+
+    labels = [s['label'] for section in table for s in section['structures']]
+    assert labels == list(range(1, len(labels) + 1))
+    cortical = [s for section in table if section['region'] == 'cortical' for s in section['structures']]
+    assert len(cortical) == 17 + 15
+    assert {s['fs_id'] for s in cortical if s['name'].startswith('ctx-lh-')} == set(range(1001, 1016))
+
+    sources = _make_sources(table)
+    out = apply_label_table(table, sources)
+    np.testing.assert_array_equal(out, _apply_label_table_reference(table, sources))
+
+    graphml_file = str(tmp_path / "atlas.graphml")
+    write_node_description_graphml(table, graphml_file)
+    graph = nx.read_graphml(graphml_file)
+    assert sorted(int(node) for node in graph.nodes) == labels
+    assert {graph.nodes[str(s['label'])]['dn_name'] for s in cortical} == {s['name'] for s in cortical}
+
+    color_lut_file = str(tmp_path / "atlas_FreeSurferColorLUT.txt")
+    write_freesurfer_colorlut(table, color_lut_file)
+    with open(color_lut_file) as f:
+        entries = [line.split() for line in f if line.strip() and not line.startswith('#')]
+    assert [int(entry[0]) for entry in entries] == labels
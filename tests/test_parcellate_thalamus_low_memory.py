@@ -0,0 +1,61 @@
+"""Compare the low-memory correction of the thalamic nuclei probability maps with the original one."""
+
+import os
+
+import numpy as np
+import pytest
+
+ni = pytest.importorskip("nibabel")
+pytest.importorskip("nipype")
+
+
+def _make_inputs(out_dir, shape=(16, 14, 12), nb_spams=4, seed=0):
+    """Create synthetic probability maps, jacobian and aparc+aseg volumes."""
+    rng = np.random.default_rng(seed)
+    affine = np.diag([2.0, 2.0, 2.0, 1.0])
+
+    # Left (10) and right (49) thalamus blobs
+    img_data_atlas = np.zeros(shape, dtype=np.int16)
+    img_data_atlas[3:7, 4:10, 3:9] = 10
+    img_data_atlas[9:13, 4:10, 3:9] = 49
+    img_atlas = ni.Nifti1Image(img_data_atlas, affine)
+
+    # Probability maps supported in a sub-volume only (bounding box smaller than the volume)
+    maps = np.zeros(shape + (nb_spams,), dtype=np.float32)
+    maps[2:14, 3:11, 2:10] = rng.uniform(-0.1, 1.1, size=(12, 8, 8, nb_spams))
+    output_maps = os.path.join(out_dir, "maps.nii.gz")
+    ni.save(ni.Nifti1Image(maps, affine), output_maps)
+
+    jacobian = rng.uniform(0.5, 1.5, size=shape).astype(np.float32)
+    jacobian_file = os.path.join(out_dir, "jacobian.nii.gz")
+    ni.save(ni.Nifti1Image(jacobian, affine), jacobian_file)
+
+    return output_maps, jacobian_file, img_atlas, img_data_atlas
+
+
+def test_correct_probability_maps_low_memory(tmp_path, monkeypatch):
+    from cmtklib.parcellation import ParcellateThalamus
+
+    results = {}
+    for low_memory in [False, True]:
+        out_dir = tmp_path / f"low_memory-{low_memory}"
+        out_dir.mkdir()
+        monkeypatch.chdir(out_dir)
+        inputs = _make_inputs(str(out_dir))
+        interface = ParcellateThalamus()
+        if low_memory:
+            interface._correct_probability_maps_low_memory(*inputs, "sub-01")
+        else:
+            interface._correct_probability_maps(*inputs, "sub-01")
+        results[low_memory] = {
+            suffix: np.asarray(ni.load(str(out_dir / f"sub-01_class-thalamus_{suffix}.nii.gz")).dataobj)
+            for suffix in ["dtissue_after_ants", "dtissue_after_jacobiancorr", "probtissue_maxprob"]
+        }
+        results[low_memory]["probtissue"] = ni.load(str(out_dir / "maps.nii.gz")).get_fdata()
+
+    reference, result = results[False], results[True]
+    assert np.any(reference["probtissue_maxprob"] > 0)
+    for suffix in ["dtissue_after_ants", "dtissue_after_jacobiancorr", "probtissue_maxprob"]:
+        np.testing.assert_array_equal(result[suffix], reference[suffix], err_msg=suffix)
+    # The low-memory maps are encoded in uint16 with a scaling of 1 / 65535
+    np.testing.assert_allclose(result["probtissue"], reference["probtissue"], atol=1e-4)
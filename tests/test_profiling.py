@@ -0,0 +1,74 @@
+"""Check that the nodes loaded from the cache are reported apart in the node profiles."""
+
+import os
+
+import pytest
+
+pytest.importorskip("nipype")
+pytest.importorskip("pandas")
+
+import nipype.pipeline.engine as pe  # noqa: E402
+from nipype.interfaces.utility import Function  # noqa: E402
+
+from cmtklib.profiling import (  # noqa: E402
+    NodeProfiler, create_html_profile_summary, get_profile_basename, interface_profiling
+)
+
+
+def _square(x):
+    return x ** 2
+
+
+def _create_workflow(base_dir):
+    """Create a two-stage workflow named like the pipelines (``<pipeline>.<stage>.<node>``)."""
+    flow = pe.Workflow(name="anatomical_pipeline", base_dir=base_dir)
+    previous = None
+    for stage in ["segmentation_stage", "parcellation_stage"]:
+        stage_flow = pe.Workflow(name=stage)
+        node = pe.Node(Function(input_names=["x"], output_names=["y"], function=_square), name="square")
+        stage_flow.add_nodes([node])
+        if previous is None:
+            node.inputs.x = 3
+            flow.add_nodes([stage_flow])
+        else:
+            flow.connect(previous, "square.y", stage_flow, "square.x")
+        previous = stage_flow
+    return flow
+
+
+def _run(flow, subject_dir):
+    profiler = NodeProfiler()
+    with interface_profiling():
+        flow.run(plugin="MultiProc", plugin_args={"n_procs": 2, "status_callback": profiler})
+    profiler.save(get_profile_basename(subject_dir, "anatomical_pipeline"))
+    return profiler.to_dataframe()
+
+
+def _run_twice(tmp_path):
+    """Run the workflow twice in the same working directory and return both profiles."""
+    subject_dir = str(tmp_path / "cmp" / "sub-01")
+    os.makedirs(subject_dir)
+    return [_run(_create_workflow(str(tmp_path / "work")), subject_dir) for _ in range(2)]
+
+
+def test_cached_nodes(tmp_path):
+    profile, cached_profile = _run_twice(tmp_path)
+    assert list(profile["status"]) == ["end", "end"]
+    assert profile["wall_time_s"].notna().all()
+    assert set(profile["stage"]) == {"segmentation_stage", "parcellation_stage"}
+
+    # The second execution reuses all the results of the first one
+    assert list(cached_profile["status"]) == ["cached", "cached"]
+    assert cached_profile[["wall_time_s", "cpu_time_s", "read_bytes"]].isna().all().all()
+
+    html = create_html_profile_summary(str(tmp_path / "cmp"))
+    assert "Cached nodes" in html
+
+
+def test_carbon_footprint_ignores_cached_nodes(tmp_path):
+    pytest.importorskip("codecarbon")
+    from cmtklib.carbonfootprint import compute_stage_carbon_footprint
+
+    _run_twice(tmp_path)
+    # Only the profile of the last execution, where all the nodes are cached, is kept
+    assert compute_stage_carbon_footprint(str(tmp_path / "cmp"), 1.0, 1.0) == []
@@ -0,0 +1,115 @@
+"""Check the in-process resampling of label volumes against the transforms it reproduces."""
+
+import os
+import shutil
+import subprocess
+
+import numpy as np
+import pytest
+
+nib = pytest.importorskip("nibabel")
+pytest.importorskip("scipy")
+
+from scipy.io import savemat  # noqa: E402
+
+from cmtklib.resampling import LPS_TO_RAS, ants_voxel_map, resample_labels  # noqa: E402
+
+
+def _rotation(angles):
+    """Return the 3x3 rotation matrix of the given Euler angles (radians)."""
+    rx, ry, rz = angles
+    cx, sx, cy, sy, cz, sz = np.cos(rx), np.sin(rx), np.cos(ry), np.sin(ry), np.cos(rz), np.sin(rz)
+    return (
+        np.array([[1, 0, 0], [0, cx, -sx], [0, sx, cx]])
+        @ np.array([[cy, 0, sy], [0, 1, 0], [-sy, 0, cy]])
+        @ np.array([[cz, -sz, 0], [sz, cz, 0], [0, 0, 1]])
+    )
+
+
+def _make_affine_and_warp(out_dir, ref_img):
+    """Write an ITK affine (fixed to moving, RAS+ ``affine``) and a displacement field on the reference grid."""
+    affine = np.eye(4)
+    affine[:3, :3] = _rotation((0.1, -0.05, 0.08)) * 1.05
+    affine[:3, 3] = [2.5, -3.0, 1.5]
+    # ITK stores the matrix and the translation in LPS+ coordinates
+    matrix = LPS_TO_RAS @ affine[:3, :3] @ LPS_TO_RAS
+    offset = LPS_TO_RAS @ affine[:3, 3]
+    center = np.array([4.0, -6.0, 2.0])
+    params = np.concatenate([matrix.ravel(), offset - center + matrix @ center])
+    mat_file = os.path.join(out_dir, "sub-01_0GenericAffine.mat")
+    savemat(mat_file, {
+        "AffineTransform_double_3_3": params[:, np.newaxis],
+        "fixed": center[:, np.newaxis],
+    }, format="4")
+
+    # Smooth, spatially varying displacements (LPS+ mm) so that the order of the transforms matters
+    i, j, k = np.indices(ref_img.shape[:3], dtype=np.float64)
+    displacement = np.stack([
+        3.0 * np.sin(j / 3.0),
+        2.0 * np.cos(i / 4.0),
+        1.5 * np.sin((i + k) / 5.0),
+    ], axis=-1)
+    field_img = nib.Nifti1Image(displacement[:, :, :, np.newaxis, :].astype(np.float32), ref_img.affine)
+    field_img.header.set_intent("vector")
+    warp_file = os.path.join(out_dir, "sub-01_1Warp.nii.gz")
+    nib.save(field_img, warp_file)
+    return mat_file, warp_file, affine, displacement
+
+
+def _make_images(out_dir, seed=0):
+    """Write a reference image and a label volume defined on another grid."""
+    rng = np.random.default_rng(seed)
+    ref_affine = np.diag([2.0, 2.0, 2.0, 1.0])
+    ref_affine[:3, 3] = [-20.0, -22.0, -18.0]
+    ref_img = nib.Nifti1Image(np.zeros((20, 22, 18), dtype=np.float32), ref_affine)
+    ref_file = os.path.join(out_dir, "ref.nii.gz")
+    nib.save(ref_img, ref_file)
+
+    in_affine = np.diag([1.5, 1.5, 1.5, 1.0])
+    in_affine[:3, 3] = [-30.0, -30.0, -28.0]
+    # Blocky labels so that nearest-neighbour sampling is robust to rounding
+    labels = np.kron(rng.integers(0, 50, size=(10, 10, 10)), np.ones((4, 4, 4))).astype(np.int16)
+    labels_file = os.path.join(out_dir, "labels.nii.gz")
+    nib.save(nib.Nifti1Image(labels, in_affine), labels_file)
+    return ref_file, labels_file
+
+
+def test_ants_voxel_map_transform_order(tmp_path):
+    ref_file, labels_file = _make_images(str(tmp_path))
+    ref_img, in_img = nib.load(ref_file), nib.load(labels_file)
+    mat_file, warp_file, affine, displacement = _make_affine_and_warp(str(tmp_path), ref_img)
+
+    # The warp field, defined on the fixed grid, is sampled at the reference voxels
+    # and the affine is then applied: moving = affine(x + warp(x))
+    points = nib.affines.apply_affine(ref_img.affine, np.indices(ref_img.shape).reshape(3, -1).T)
+    points = points + displacement.reshape(-1, 3) @ LPS_TO_RAS
+    expected = nib.affines.apply_affine(np.linalg.inv(in_img.affine) @ affine, points)
+
+    coords = ants_voxel_map([warp_file, mat_file], in_img, ref_img)
+    np.testing.assert_allclose(coords, expected, atol=1e-4)
+
+    # Affine only
+    points = nib.affines.apply_affine(ref_img.affine, np.indices(ref_img.shape).reshape(3, -1).T)
+    expected = nib.affines.apply_affine(np.linalg.inv(in_img.affine) @ affine, points)
+    np.testing.assert_allclose(ants_voxel_map([mat_file], in_img, ref_img), expected, atol=1e-6)
+
+
+@pytest.mark.skipif(shutil.which("antsApplyTransforms") is None, reason="ANTs is not installed")
+def test_ants_voxel_map_matches_antsApplyTransforms(tmp_path):
+    ref_file, labels_file = _make_images(str(tmp_path))
+    ref_img, in_img = nib.load(ref_file), nib.load(labels_file)
+    mat_file, warp_file, _, _ = _make_affine_and_warp(str(tmp_path), ref_img)
+
+    ants_file = str(tmp_path / "labels_ants.nii.gz")
+    subprocess.run(
+        ["antsApplyTransforms", "-d", "3", "-i", labels_file, "-r", ref_file, "-o", ants_file,
+         "-n", "NearestNeighbor", "-t", warp_file, "-t", mat_file],
+        check=True,
+    )
+    coords = ants_voxel_map([warp_file, mat_file], in_img, ref_img)
+    out_file, = resample_labels([labels_file], [str(tmp_path / "labels_cmtk.nii.gz")], ref_img, coords, in_img.shape)
+
+    expected = np.asanyarray(nib.load(ants_file).dataobj)
+    result = np.asanyarray(nib.load(out_file).dataobj)
+    # Only voxels sampled exactly half-way between two input voxels can be rounded differently
+    assert np.mean(result != expected) < 0.005